@@ -0,0 +1,262 @@
+"""
+適応的な受付制御
+
+同時に処理するリクエスト数の上限を AIMD（加算増加・乗算減少）で調整する。
+応答時間が目標以内なら上限を少しずつ上げ、目標を超えるか失敗したら一定の割合で下げる。
+上限に達している間は優先度付きの待ち行列で待たせる。待ち行列があふれた場合や、現在の上限と
+平均応答時間から見込んだ待ち時間が上限を超える場合は、待たせずに Overloaded を送出する
+（API では 503 と Retry-After で応答する）。
+待ち行列があふれたときは優先度の低いリクエストから断る
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+from rag_engine.metrics import REGISTRY
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ADMISSIONS = REGISTRY.counter("rag_admission_total", "Admission decisions per route", ["route", "decision"])
+
+
+class Priority(IntEnum):
+    """リクエストの優先度（大きいほど優先）"""
+    LOW = 0
+    NORMAL = 1
+    HIGH = 2
+
+
+class Overloaded(Exception):
+    """混雑のためリクエストを受け付けなかった"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("priority", "future")
+
+    def __init__(self, priority: Priority, future: asyncio.Future):
+        self.priority = priority
+        self.future = future
+
+
+class AdmissionController:
+    """AIMD で同時実行数の上限を調整する受付制御"""
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = settings.admission_initial_limit,
+        min_limit: float = settings.admission_min_limit,
+        max_limit: float = settings.admission_max_limit,
+        target_latency: float = settings.admission_target_latency,
+        backoff: float = 0.9,
+        max_queue: int = settings.admission_max_queue,
+        max_wait: float = settings.admission_max_wait,
+    ):
+        """
+        初期化
+
+        Args:
+            name: 対象の名前（メトリクスのラベル）
+            initial_limit: 同時実行数の初期上限
+            min_limit: 上限の下限
+            max_limit: 上限の上限
+            target_latency: 目標とする応答時間（秒、超えたら上限を下げる）
+            backoff: 上限を下げるときの倍率
+            max_queue: 待ち行列の長さの上限
+            max_wait: 待ち行列で待つ最大時間（秒）
+        """
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, _Waiter]] = []  # (-優先度, 到着順, 待ち) のヒープ
+        self._order = itertools.count()
+        self._last_decrease = 0.0
+        self._avg_latency = target_latency / 2
+        _controllers.append(self)
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.future.done())
+
+    def retry_after(self) -> int:
+        """再試行までの目安（秒）: 待ち行列が捌けるまでの見込み時間"""
+        estimate = self._avg_latency * (self.queued + 1) / max(self.limit, 1.0)
+        return min(30, max(1, math.ceil(estimate)))
+
+    def predicted_wait(self, priority: Priority = Priority.NORMAL) -> float:
+        """
+        いま待ち行列に入った場合に枠が空くまでの見込み時間（秒）
+
+        先に枠を渡される待ち（同じか高い優先度）の数と自分の分だけ処理が終わる必要があり、
+        処理は上限の数だけ並行して平均応答時間ごとに終わるものとして見積もる
+        """
+        ahead = sum(
+            1 for _, _, waiter in self._waiters if not waiter.future.done() and waiter.priority >= priority
+        )
+        return self._avg_latency * (ahead + 1) / max(self.limit, 1.0)
+
+    def _shed(self, decision: str) -> Overloaded:
+        ADMISSIONS.inc(route=self.name, decision=decision)
+        return Overloaded(self.retry_after())
+
+    def _evict_lowest(self, priority: Priority) -> bool:
+        """待ち行列で最も優先度が低く新しい待ちを、より優先度の高いリクエストのために断る"""
+        candidates = [entry for entry in self._waiters if not entry[2].future.done()]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda entry: (entry[0], entry[1]))
+        if victim[2].priority >= priority:
+            return False
+        victim[2].future.set_exception(self._shed("evicted"))
+        return True
+
+    async def acquire(self, priority: Priority = Priority.NORMAL):
+        """
+        実行枠を確保（空くまで待つ）
+
+        Raises:
+            Overloaded: 待ち行列があふれた、見込みの待ち時間が上限を超える、または実際に待った時間が
+                上限を超えた場合
+        """
+        if self.in_flight < int(self.limit) and not self.queued:
+            self.in_flight += 1
+            ADMISSIONS.inc(route=self.name, decision="admitted")
+            return
+
+        # 待っても間に合わないリクエストは、待たせてから断るのではなくすぐに断る
+        if self.predicted_wait(priority) > self.max_wait:
+            raise self._shed("predicted")
+        if self.queued >= self.max_queue and not self._evict_lowest(priority):
+            raise self._shed("rejected")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(priority, future)
+        heapq.heappush(self._waiters, (-int(priority), next(self._order), waiter))
+        try:
+            # 見込みが外れた場合の打ち切り
+            await asyncio.wait_for(asyncio.shield(future), self.max_wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # 枠を渡された直後にタイムアウトした場合は受け付けたものとして扱う
+                ADMISSIONS.inc(route=self.name, decision="admitted")
+                return
+            if not future.done():
+                future.cancel()
+            self._drain()
+            raise self._shed("timeout")
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release(0.0, ok=True, measured=False)
+            elif not future.done():
+                future.cancel()
+            self._drain()
+            raise
+        ADMISSIONS.inc(route=self.name, decision="admitted")
+
+    def release(self, latency: float, ok: bool = True, measured: bool = True):
+        """
+        実行枠を返し、応答時間に応じて上限を調整
+
+        Args:
+            latency: 処理にかかった時間（秒）
+            ok: 正常に処理できたか
+            measured: 上限の調整に使うか
+        """
+        self.in_flight -= 1
+        if measured:
+            self._adjust(latency, ok)
+        self._drain()
+
+    def _adjust(self, latency: float, ok: bool):
+        now = time.monotonic()
+        self._avg_latency += 0.1 * (latency - self._avg_latency)
+        if not ok or latency > self.target_latency:
+            # 1往復の間に何度も下げると上限が崩れるため、平均応答時間に1回までにする
+            if now - self._last_decrease >= self._avg_latency:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        elif self.in_flight + 1 >= self.limit / 2:
+            # 上限の半分以上を使っているときだけ増やす（余裕があるのに上限だけ膨らませない）
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _drain(self):
+        """空いた枠を優先度順に待ちへ渡す"""
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.future.done():
+                continue
+            self.in_flight += 1
+            waiter.future.set_result(None)
+        # 取り消し済みの待ちが先頭に残らないようにする
+        while self._waiters and self._waiters[0][2].future.done():
+            heapq.heappop(self._waiters)
+
+    @asynccontextmanager
+    async def admit(self, priority: Priority = Priority.NORMAL):
+        """
+        with 文の間、実行枠を確保する
+
+        Raises:
+            Overloaded: 受け付けられなかった場合
+        """
+        await self.acquire(priority)
+        started = time.monotonic()
+        ok = True
+        try:
+            yield
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        except Exception:
+            ok = False
+            raise
+        finally:
+            # クライアントの切断による中断は上限の調整に使わない
+            self.release(time.monotonic() - started, ok=bool(ok), measured=ok is not None)
+
+
+_controllers: List[AdmissionController] = []
+
+
+def _limits() -> Dict[Tuple[str, str], float]:
+    values: Dict[Tuple[str, str], float] = {}
+    for controller in _controllers:
+        values[(controller.name, "limit")] = controller.limit
+        values[(controller.name, "in_flight")] = controller.in_flight
+        values[(controller.name, "queued")] = controller.queued
+    return values
+
+
+REGISTRY.callback("rag_admission_state", "Concurrency limit, in-flight and queued requests per route", _limits, ["route", "state"])
+
+
+def request_priority(is_admin: bool, requested: Optional[str] = None) -> Priority:
+    """
+    リクエストの優先度を決める
+
+    管理者は高、その他は通常。クライアントは X-Request-Priority: low で自ら下げられる
+    （一括処理など）が、上げることはできない
+    """
+    priority = Priority.HIGH if is_admin else Priority.NORMAL
+    if requested and requested.lower() == "low":
+        priority = Priority.LOW
+    return priority
@@ -0,0 +1,80 @@
+"""
+設定管理
+
+環境変数（および .env）からAPIサーバーの設定を読み込む
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """APIサーバーの設定"""
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # アプリケーション
+    debug: bool = False
+    log_level: str = "INFO"
+    data_dir: str = "/data"
+    timezone: str = "Asia/Tokyo"  # 履歴の日付範囲などを解釈するタイムゾーン
+
+    # 認証
+    jwt_secret: str = "change-this-jwt-secret"
+    jwt_algorithm: str = "HS256"
+    session_timeout: int = 1800  # アクセストークンの有効期間（秒）
+    admin_username: str = "admin"
+    admin_password: str = ""  # 初回起動時に管理者ユーザーを作成する（空なら作成しない）
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2  # bcrypt を実行するスレッド数
+    password_hash_max_pending: int = 64  # これを超えるログインの待ちは 503 で断る
+    token_cache_size: int = 10000
+    token_revocation_refresh: float = 5.0  # 失効したトークンの一覧をストアから読み込み直す間隔（秒）
+
+    # 暗号化
+    encryption_key: str = ""
+
+    # データベース（"memory://" を指定するとテスト用のメモリ上ストアを使う）
+    mongodb_url: str = "mongodb://mongodb:27017"
+    mongodb_database: str = "secure_rag"
+    vector_db_url: str = "http://vectordb:6333"
+
+    # ドキュメント
+    max_upload_size: int = 104857600
+
+    # インジェスト
+    ingestion_workers: int = 2
+    ingestion_max_attempts: int = 3
+    ingestion_lease_seconds: int = 300  # ワーカーが応答しない場合に再投入するまでの秒数
+
+    # 質問の受付制御（同時実行数の上限を応答時間に応じて自動調整）
+    admission_initial_limit: int = 8
+    admission_min_limit: int = 1
+    admission_max_limit: int = 64
+    admission_target_latency: float = 20.0  # これを超える応答時間が続くと上限を下げる（秒）
+    admission_max_queue: int = 32  # 上限に達したときに待たせるリクエスト数
+    admission_max_wait: float = 5.0  # 待ち行列で待つ最大時間（秒、見込みがこれを超える場合はすぐに断る）
+
+    # 操作ログ（監査ログ）
+    audit_sink: str = "file,mongodb"  # 書き出し先（file, mongodb をカンマ区切りで指定）
+    audit_log_dir: str = "/data/logs/audit"
+    audit_rotate_bytes: int = 67108864  # 1ファイルのサイズの上限（超えたら新しいファイルに切り替える）
+    audit_queue_size: int = 10000
+    audit_batch_size: int = 500
+    audit_flush_interval: float = 1.0  # イベントを受け取ってから書き出すまでの最大の待ち時間（秒）
+    audit_full_policy: str = "block"  # キューがあふれた場合: block（空くまで待つ）または drop（捨てて数える）
+
+    # 表への質問（Excel の表の要約が検索された場合に、生成した SQL で集計して答える）
+    table_qa_enabled: bool = True
+    table_qa_max_tables: int = 2  # 1つの質問で SQL を実行する表（ドキュメント）の数の上限
+
+    # 起動時のウォームアップ（埋め込みモデル・権限索引などの読み込み）
+    warmup_enabled: bool = True
+    warmup_retry_interval: float = 5.0  # 失敗時に再試行するまでの最初の待ち時間（秒、倍々で伸ばす）
+    warmup_max_retry_interval: float = 60.0
+
+    # メトリクス
+    metrics_token: str = ""  # /metrics の Bearer トークン（空なら管理者のトークンで取得する）
+    metrics_port: int = 9100  # インジェストワーカーが /metrics を公開するポート
+
+
+settings = Settings()
@@ -0,0 +1,368 @@
+"""
+操作ログ（監査ログ）
+
+すべての API 操作とドキュメントへのアクセスを記録する。リクエストの処理中にファイルや
+MongoDB へ書き込むと毎回の応答が遅くなるため、イベントはメモリ上の上限付きキューに積むだけにし、
+バックグラウンドのタスクが件数または経過時間でまとめて書き出す。
+
+書き出し先:
+    - file: 日付ごとの gzip 圧縮 JSON Lines（まとめて書くごとに gzip のメンバーを追記し、
+      サイズが上限を超えたら新しいファイルに切り替える）
+    - mongodb: audit_logs コレクションへの一括挿入
+
+キューがあふれた場合は AUDIT_FULL_POLICY で、空きが出るまで待つ（block）か、
+捨てて件数を数える（drop）かを選ぶ。停止時はキューに残ったイベントをすべて書き出してから終了する
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from rag_engine.metrics import REGISTRY
+
+from core.config import settings
+from dependencies.db import get_database, use_in_memory_store
+
+logger = logging.getLogger(__name__)
+
+AUDIT_EVENTS = REGISTRY.counter("rag_audit_events_total", "Audit events by outcome", ["result"])
+
+_STOP = object()
+
+# 処理中のリクエストの監査イベントに追加する項目（AuditMiddleware が設定する）
+_audit_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("audit_context", default=None)
+
+
+def annotate(**details: Any):
+    """
+    処理中のリクエストの監査イベントに項目を追加（操作したユーザー、対象のドキュメントなど）
+
+    リクエストの外で呼ばれた場合は何もしない
+    """
+    context = _audit_context.get()
+    if context is not None:
+        context.update(details)
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class FileAuditSink:
+    """gzip 圧縮した JSON Lines のファイルへ書き出す"""
+
+    name = "file"
+
+    def __init__(self, directory: str, rotate_bytes: int = settings.audit_rotate_bytes, compress_level: int = 6):
+        """
+        初期化
+
+        Args:
+            directory: 保存先ディレクトリ
+            rotate_bytes: 1ファイルのサイズの上限（超えたら新しいファイルに切り替える）
+            compress_level: gzip の圧縮レベル
+        """
+        self.directory = Path(directory)
+        self.rotate_bytes = rotate_bytes
+        self.compress_level = compress_level
+        self._path: Optional[Path] = None
+        self._day = ""
+
+    def _current_path(self) -> Path:
+        day = f"{datetime.now(timezone.utc):%Y%m%d}"
+        if self._path is None or day != self._day or (
+            self._path.exists() and self._path.stat().st_size >= self.rotate_bytes
+        ):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # 同じ日に切り替えた場合は連番を付ける（再起動時は続きのファイルに追記する）
+            sequence = 0
+            while True:
+                path = self.directory / f"audit-{day}-{sequence:03d}.jsonl.gz"
+                if not path.exists() or path.stat().st_size < self.rotate_bytes:
+                    break
+                sequence += 1
+            self._path, self._day = path, day
+        return self._path
+
+    def _write(self, events: List[Dict[str, Any]]):
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=_json_default) + "\n" for event in events)
+        # gzip のメンバーを追記する（途中で止まっても書き終えたメンバーは gzip.open で読める）
+        data = gzip.compress(lines.encode("utf-8"), compresslevel=self.compress_level)
+        with open(self._current_path(), "ab") as f:
+            f.write(data)
+
+    async def write(self, events: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._write, events)
+
+    async def close(self):
+        pass
+
+
+class MongoAuditSink:
+    """MongoDB の audit_logs コレクションへ一括挿入する"""
+
+    name = "mongodb"
+
+    def __init__(self, database=None):
+        """
+        初期化
+
+        Args:
+            database: motorのデータベース（省略時は共有の接続）
+        """
+        self.collection = (database if database is not None else get_database())["audit_logs"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("timestamp", -1)])
+        await self.collection.create_index([("user", 1), ("timestamp", -1)])
+
+    async def write(self, events: List[Dict[str, Any]]):
+        # insert_many は _id を書き込むため、ファイル側と共有しないようコピーを渡す
+        await self.collection.insert_many([dict(event) for event in events], ordered=False)
+
+    async def close(self):
+        pass
+
+
+def create_audit_sinks() -> list:
+    """設定（AUDIT_SINK）に応じた書き出し先を作成"""
+    names = {name.strip() for name in settings.audit_sink.split(",") if name.strip()}
+    sinks = []
+    if "file" in names:
+        sinks.append(FileAuditSink(settings.audit_log_dir))
+    if "mongodb" in names and not use_in_memory_store():
+        sinks.append(MongoAuditSink())
+    return sinks
+
+
+class AuditLogger:
+    """監査イベントをキューに積み、まとめて書き出す"""
+
+    def __init__(
+        self,
+        sinks: Optional[list] = None,
+        max_queue: int = settings.audit_queue_size,
+        batch_size: int = settings.audit_batch_size,
+        flush_interval: float = settings.audit_flush_interval,
+        full_policy: str = settings.audit_full_policy,
+        max_retries: int = 5,
+    ):
+        """
+        初期化
+
+        Args:
+            sinks: 書き出し先（省略時は設定から作成）
+            max_queue: キューに積めるイベント数
+            batch_size: 一度に書き出すイベント数の上限
+            flush_interval: 最初のイベントを受け取ってから書き出すまでの最大の待ち時間（秒）
+            full_policy: キューがあふれた場合の動作（"block": 空くまで待つ、"drop": 捨てて数える）
+            max_retries: 書き出しに失敗した場合の再試行回数（超えたらそのまとまりを捨てる）
+        """
+        if full_policy not in ("block", "drop"):
+            raise ValueError(f"Unknown audit full policy: {full_policy}")
+        self._sinks = sinks
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.max_retries = max_retries
+        self.dropped = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self._last_drop_warning = 0.0
+
+    @property
+    def sinks(self) -> list:
+        if self._sinks is None:
+            self._sinks = create_audit_sinks()
+        return self._sinks
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """書き出しタスクを開始（実行中のイベントループで1回だけ呼ぶ）"""
+        if self._task is not None:
+            return
+        self._closed = False
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+        for sink in self.sinks:
+            if hasattr(sink, "ensure_indexes"):
+                try:
+                    await sink.ensure_indexes()
+                except Exception as e:
+                    logger.error(f"Failed to create audit log indexes: {e}")
+
+    async def record(self, action: str, user: Optional[str] = None, **details: Any):
+        """
+        監査イベントを記録（キューに積むだけで、書き出しは待たない）
+
+        Args:
+            action: 操作（"POST /api/query" など）
+            user: 操作したユーザー名（未認証なら None）
+            details: 対象や結果などの項目
+        """
+        event = {"timestamp": datetime.now(timezone.utc), "action": action, "user": user, **details}
+        if self._closed:
+            self._drop("Audit logger is stopped")
+            return
+        if self._task is None:
+            await self.start()
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.full_policy == "drop":
+                self._drop(f"Audit queue is full ({self.max_queue} events)")
+                return
+            await self._queue.put(event)
+
+    def _drop(self, reason: str):
+        self.dropped += 1
+        AUDIT_EVENTS.inc(result="dropped")
+        # あふれている間に毎回警告しないよう、10秒に1回にする
+        now = time.monotonic()
+        if now - self._last_drop_warning >= 10.0:
+            logger.warning(f"{reason}, dropping audit events (dropped so far: {self.dropped})")
+            self._last_drop_warning = now
+
+    async def _next_batch(self) -> List[Any]:
+        """最初のイベントを待ち、batch_size 件たまるか flush_interval が過ぎるまで集める"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            stopping = batch[-1] is _STOP
+            events = [event for event in batch if event is not _STOP]
+            if events:
+                await self._write(events)
+            if stopping:
+                return
+
+    async def _write(self, events: List[Dict[str, Any]]):
+        """各書き出し先へ書く（失敗した書き出し先だけ間隔を空けて再試行する）"""
+        pending = list(self.sinks)
+        for attempt in range(self.max_retries + 1):
+            failed = []
+            for sink in pending:
+                try:
+                    await sink.write(events)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(events)} audit events to {sink.name}: {e}")
+                    failed.append(sink)
+            if not failed:
+                AUDIT_EVENTS.inc(len(events), result="written")
+                return
+            pending = failed
+            if attempt < self.max_retries and not self._closed:
+                await asyncio.sleep(min(30.0, 0.5 * 2 ** attempt))
+        AUDIT_EVENTS.inc(len(events), result="failed")
+
+    async def stop(self, timeout: float = 30.0):
+        """
+        キューに残ったイベントをすべて書き出してから停止
+
+        Args:
+            timeout: 書き出しを待つ最大時間（秒）
+        """
+        if self._task is None:
+            return
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._stop(), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit logger did not flush within {timeout}s, {self.depth} events lost")
+            self._task.cancel()
+        for sink in self.sinks:
+            await sink.close()
+        self._task = None
+        self._queue = None
+
+    async def _stop(self):
+        await self._queue.put(_STOP)
+        await self._task
+
+
+audit_logger = AuditLogger()
+
+REGISTRY.callback("rag_audit_queue_depth", "Audit events waiting to be written", lambda: audit_logger.depth)
+
+
+def _param_names(query_string: bytes) -> List[str]:
+    """クエリ文字列のパラメーター名（値は記録しない）"""
+    pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+    return list(dict.fromkeys(name for name, _ in pairs))
+
+
+class AuditMiddleware:
+    """
+    API へのリクエストを監査ログに記録する ASGI ミドルウェア
+
+    応答を送り終えてから記録するため、応答時間には影響しない。ユーザー名や対象のドキュメントは
+    依存関係やルーターが annotate() で追加する。クエリ文字列の値（履歴の検索語など）は個人情報を
+    含み得るため、パラメーター名だけを記録する
+    """
+
+    def __init__(self, app, audit: Optional[AuditLogger] = None):
+        self.app = app
+        self.audit = audit or audit_logger
+
+    async def __call__(self, scope, receive, send):
+        # 死活監視やメトリクスの取得、API ドキュメントは記録しない
+        if scope["type"] != "http" or not scope["path"].startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        details: Dict[str, Any] = {}
+        token = _audit_context.set(details)
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _audit_context.reset(token)
+            client = scope.get("client")
+            params = _param_names(scope.get("query_string", b""))
+            await self.audit.record(
+                f"{scope['method']} {scope['path']}",
+                user=details.pop("user", None),
+                status=status_code,
+                duration_ms=round((time.perf_counter() - started) * 1000, 1),
+                client=client[0] if client else None,
+                **({"query_params": params} if params else {}),
+                **details,
+            )
@@ -0,0 +1,49 @@
+"""
+検索・ページングの共通処理
+
+日本語を分かち書きせずに部分一致検索するための文字バイグラムと、
+キーセット方式のページングで使うカーソルの符号化
+"""
+
+import base64
+import json
+import unicodedata
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+MAX_SEARCH_NGRAMS = 16  # 検索に使うバイグラムの上限（長い検索語でも索引の照合回数を抑える）
+
+
+def normalize_search_text(text: str) -> str:
+    """検索用に正規化（全角・半角と大文字・小文字を揃え、空白を除く）"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if not ch.isspace())
+
+
+def char_bigrams(normalized: str) -> List[str]:
+    """正規化した文字列の文字バイグラム（重複なし）"""
+    return sorted({normalized[i:i + 2] for i in range(len(normalized) - 1)})
+
+
+def encode_cursor(sort_value: datetime, item_id: str) -> str:
+    """ページの最後の行の (並び順の値, ID) をカーソルにする"""
+    payload = json.dumps({"t": sort_value.isoformat(), "id": item_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """
+    カーソルを復元
+
+    Raises:
+        ValueError: カーソルが不正な場合
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        sort_value = datetime.fromisoformat(payload["t"])
+        item_id = str(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("カーソルが不正です")
+    if sort_value.tzinfo is None:
+        sort_value = sort_value.replace(tzinfo=timezone.utc)
+    return sort_value, item_id
@@ -0,0 +1,196 @@
+"""
+セキュリティユーティリティ
+
+パスワードハッシュとJWTアクセストークンの発行・検証。
+bcrypt は専用のスレッドプールで実行してイベントループを止めないようにし、
+検証済みのトークンはクレームをキャッシュして毎回の署名検証を省く
+"""
+
+import asyncio
+import hashlib
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+from passlib.context import CryptContext
+
+from core.config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.bcrypt_rounds)
+
+
+def hash_password(password: str) -> str:
+    """パスワードをハッシュ化（同期版。リクエスト処理中は PasswordHasher を使う）"""
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """パスワードとハッシュを照合（同期版。リクエスト処理中は PasswordHasher を使う）"""
+    return pwd_context.verify(password, hashed_password)
+
+
+class HasherBusy(Exception):
+    """パスワードハッシュの待ちが上限を超えた"""
+
+
+class PasswordHasher:
+    """
+    bcrypt を専用のスレッドプールで実行する
+
+    同時に計算するのは workers 件まで、待ちは max_pending 件までとし、
+    ログインが集中しても他のリクエストを処理するイベントループやCPUを使い切らないようにする
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.password_hash_workers,
+        max_pending: int = settings.password_hash_max_pending,
+        inline: bool = False,
+    ):
+        """
+        初期化
+
+        Args:
+            workers: bcrypt を実行するスレッド数
+            max_pending: 実行中と待ちを合わせた上限（超えると HasherBusy）
+            inline: イベントループ上で直接計算する（ベンチマークでの比較用）
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.inline = inline
+        self._executor = None if inline else ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    async def _run(self, func, *args):
+        if self.inline:
+            return func(*args)
+        if self._pending >= self.max_pending:
+            raise HasherBusy()
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, password, hashed_password)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta] = None) -> str:
+    """
+    アクセストークンを発行
+
+    Args:
+        data: トークンに含めるクレーム（sub にユーザー名）
+        expires_delta: 有効期間（省略時は SESSION_TIMEOUT）
+
+    Returns:
+        JWT文字列（失効用に jti を含む）
+    """
+    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(seconds=settings.session_timeout))
+    claims = {**data, "exp": expire, "jti": uuid.uuid4().hex}
+    return jwt.encode(claims, settings.jwt_secret, algorithm=settings.jwt_algorithm)
+
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """
+    アクセストークンを検証してクレームを返す
+
+    Args:
+        token: JWT文字列
+
+    Returns:
+        クレーム
+
+    Raises:
+        jose.JWTError: 署名が不正、または期限切れの場合
+    """
+    return jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
+
+
+class TokenCache:
+    """
+    検証済みトークンのクレームのキャッシュ
+
+    トークン文字列そのものではなくSHA-256ハッシュをキーにし、有効期限の少し前に破棄する。
+    失効したトークンの jti は期限まで保持し、キャッシュの有無に関わらず拒否する
+    """
+
+    def __init__(self, max_entries: int = settings.token_cache_size, expiry_margin: float = 5.0):
+        """
+        初期化
+
+        Args:
+            max_entries: キャッシュするトークン数の上限（古いものから破棄）
+            expiry_margin: 有効期限の何秒前にキャッシュから外すか
+        """
+        self.max_entries = max_entries
+        self.expiry_margin = expiry_margin
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}  # jti → 有効期限（UNIX時刻）
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """
+        トークンを検証してクレームを返す（キャッシュにあれば署名検証を省く）
+
+        Raises:
+            jose.JWTError: 署名が不正、期限切れ、または失効済みの場合
+        """
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            claims = entry[0]
+        else:
+            self.misses += 1
+            if entry is not None:
+                self._entries.pop(key, None)
+            claims = decode_access_token(token)
+            cache_until = float(claims.get("exp", now)) - self.expiry_margin
+            if cache_until > now:
+                self._entries[key] = (claims, cache_until)
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        jti = claims.get("jti")
+        if jti is not None and jti in self._revoked:
+            raise JWTError("Token has been revoked")
+        return claims
+
+    def revoke(self, jti: str, expires_at: float):
+        """
+        トークンを失効させる
+
+        Args:
+            jti: トークンID
+            expires_at: トークンの有効期限（UNIX時刻。これを過ぎたら失効リストから外す）
+        """
+        self._revoked[jti] = expires_at
+        now = time.time()
+        if len(self._revoked) > 1024:
+            self._revoked = {j: exp for j, exp in self._revoked.items() if exp > now}
+
+    def clear(self):
+        self._entries.clear()
+
+
+token_cache = TokenCache()
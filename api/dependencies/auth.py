@@ -0,0 +1,64 @@
+"""
+認証依存関係
+
+リクエストのBearerトークンから認証済みユーザーを取得する。
+検証済みトークンのクレームはキャッシュし、失効済みのトークンは拒否する
+（失効したトークンの一覧は AuthService が定期的にストアから読み込み直す）
+"""
+
+import logging
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError
+
+from core.logging import annotate
+from models.user import User
+from services.auth_service import AuthService, get_auth_service
+
+logger = logging.getLogger(__name__)
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+
+_credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="認証情報が無効です",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    auth: AuthService = Depends(get_auth_service),
+) -> User:
+    """
+    トークンを検証して現在のユーザーを返す
+
+    Args:
+        token: Bearerトークン
+        auth: 認証サービス（失効したトークンの一覧を読み込み直す）
+
+    Returns:
+        認証済みユーザー
+
+    Raises:
+        HTTPException: トークンが無効、または失効済みの場合（401）
+    """
+    await auth.refresh_revocations()
+    try:
+        claims = auth.tokens.verify(token)
+    except JWTError:
+        raise _credentials_exception
+
+    username = claims.get("sub")
+    if not username:
+        raise _credentials_exception
+    annotate(user=username)
+    return User(username=username, role=claims.get("role", "user"), groups=claims.get("groups", []))
+
+
+async def require_admin(user: User = Depends(get_current_user)) -> User:
+    """管理者ユーザーのみ許可"""
+    if not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者権限が必要です")
+    return user
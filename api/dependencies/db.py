@@ -0,0 +1,43 @@
+"""
+データベース依存関係
+
+MongoDB（motor）への接続を管理する
+"""
+
+import logging
+from typing import Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[AsyncIOMotorClient] = None
+
+
+def use_in_memory_store() -> bool:
+    """MONGODB_URL が memory:// の場合はメモリ上のストアを使う（テスト用）"""
+    return settings.mongodb_url.startswith("memory://")
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """
+    データベースを取得（接続プールはプロセス内で共有）
+
+    Returns:
+        motorのデータベースオブジェクト
+    """
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(settings.mongodb_url, tz_aware=True)
+        logger.info(f"MongoDB client created for {settings.mongodb_url}")
+    return _client[settings.mongodb_database]
+
+
+def close_database():
+    """接続を閉じる"""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -0,0 +1,108 @@
+"""
+APIサーバー
+
+FastAPI アプリケーションの作成とルーターの登録
+
+起動を速くするため、埋め込みモデルや検索エンジンなどの重いモジュールはここでは読み込まず、
+起動後にバックグラウンドのウォームアップで読み込む。/health はプロセスが動いていれば 200 を
+返し（liveness）、/ready はウォームアップが終わるまで 503 を返す（readiness）
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from core.config import settings
+from core.logging import AuditMiddleware, audit_logger
+from dependencies.db import close_database
+from routers import admin, auth, documents, query
+from services.admin_service import register_metrics
+from services.auth_service import get_auth_service
+from services.document_service import get_document_service
+from services.query_service import get_query_service
+
+logging.basicConfig(level=settings.log_level, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+async def warm_up(app: FastAPI):
+    """
+    検索とLLMの準備ができるまで再試行し、終わったら ready にする
+
+    Args:
+        app: アプリケーション（状態を app.state に記録する）
+    """
+    delay = settings.warmup_retry_interval
+    while True:
+        app.state.warmup_attempts += 1
+        started = time.monotonic()
+        try:
+            await get_query_service().warm_up()
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            logger.warning(f"Warm-up failed (attempt {app.state.warmup_attempts}), retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, settings.warmup_max_retry_interval)
+            continue
+        app.state.warmup_error = None
+        app.state.ready = True
+        logger.info(f"Warm-up finished in {time.monotonic() - started:.1f}s")
+        return
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    register_metrics()
+    await audit_logger.start()
+    try:
+        await get_auth_service().ensure_indexes()
+        await get_document_service().ensure_indexes()
+        await get_query_service().ensure_indexes()
+    except Exception as e:
+        logger.error(f"Failed to create database indexes: {e}")
+
+    app.state.ready = not settings.warmup_enabled
+    app.state.warmup_attempts = 0
+    app.state.warmup_error = None
+    warmup_task = asyncio.create_task(warm_up(app)) if settings.warmup_enabled else None
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    get_auth_service().hasher.shutdown()
+    await audit_logger.stop()
+    close_database()
+
+
+app = FastAPI(title="Secure RAG Knowledge Base API", debug=settings.debug, lifespan=lifespan)
+app.add_middleware(AuditMiddleware)
+
+app.include_router(admin.router, tags=["admin"])
+app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
+app.include_router(documents.router, prefix="/api/documents", tags=["documents"])
+app.include_router(query.router, prefix="/api", tags=["query"])
+
+
+@app.get("/health")
+async def health():
+    """ヘルスチェック（プロセスが応答できるか）"""
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def ready():
+    """レディネスチェック（ウォームアップが終わり、質問に遅延なく答えられるか）"""
+    if getattr(app.state, "ready", False):
+        return {"status": "ready"}
+    return JSONResponse(
+        status_code=503,
+        content={
+            "status": "warming",
+            "attempts": getattr(app.state, "warmup_attempts", 0),
+            "error": getattr(app.state, "warmup_error", None),
+        },
+        headers={"Retry-After": str(max(1, int(settings.warmup_retry_interval)))},
+    )
@@ -0,0 +1,130 @@
+"""
+ドキュメントモデル
+"""
+
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+
+class JobStatus(str, Enum):
+    """インジェストジョブの状態"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class IngestionStage(str, Enum):
+    """インジェストの処理段階"""
+    QUEUED = "queued"
+    PARSING = "parsing"
+    CHUNKING = "chunking"
+    EMBEDDING = "embedding"
+    INDEXING = "indexing"
+    COMPLETED = "completed"
+
+
+class JobPriority(int, Enum):
+    """ジョブの優先度（大きいほど先に処理）"""
+    LOW = 0
+    NORMAL = 5
+    HIGH = 9
+
+
+class DocumentStatus(str, Enum):
+    """ドキュメントの状態"""
+    PROCESSING = "processing"
+    INDEXED = "indexed"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class UploadResponse(BaseModel):
+    """アップロード受付結果"""
+    document_id: str
+    job_id: str
+    status: JobStatus
+    duplicate: bool = Field(False, description="同じ内容の既存ドキュメントを返した場合は True")
+
+
+class UploadSessionCreate(BaseModel):
+    """分割アップロードの開始リクエスト"""
+    filename: str = Field(..., min_length=1, max_length=255)
+    size: int = Field(..., ge=1, description="ファイル全体のバイト数")
+    confidentiality: int = Field(1, ge=0, le=3)
+    tags: List[str] = []
+    description: str = ""
+    groups: List[str] = []
+    priority: JobPriority = JobPriority.NORMAL
+
+
+class UploadSession(BaseModel):
+    """分割アップロードの状態"""
+    upload_id: str
+    filename: str
+    size: int
+    offset: int = Field(..., description="受信済みのバイト数（次のパートはこの位置から送る）")
+    part_size: int = Field(..., description="推奨するパートのサイズ（バイト）")
+    expires_at: datetime
+    result: Optional[UploadResponse] = Field(None, description="全体を受信した後の登録結果")
+
+
+class JobProgress(BaseModel):
+    """インジェストジョブの進捗"""
+    job_id: str
+    document_id: str
+    filename: str
+    status: JobStatus
+    stage: IngestionStage
+    progress: float = Field(0.0, description="全体の進捗（0-100）")
+    bytes_per_second: float = Field(0.0, description="処理スループット（元ファイルのバイト数/秒）")
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class JobProgressList(BaseModel):
+    """複数ジョブの進捗"""
+    items: List[JobProgress]
+
+
+class DocumentSummary(BaseModel):
+    """ドキュメント一覧の1件"""
+    id: str
+    name: str
+    type: str
+    size: int
+    confidentiality: int
+    tags: List[str] = []
+    description: str = ""
+    uploaded_by: str
+    uploaded_at: datetime
+    status: DocumentStatus
+    job_id: Optional[str] = None
+
+
+class FacetCount(BaseModel):
+    """絞り込み項目の値ごとの件数"""
+    value: Union[str, int]
+    count: int
+
+
+class DocumentFacets(BaseModel):
+    """絞り込み項目ごとの件数（ページ位置に関係なく、条件に一致する全件で集計）"""
+    type: List[FacetCount]
+    confidentiality: List[FacetCount]
+    uploaded_by: List[FacetCount]
+
+
+class DocumentPage(BaseModel):
+    """ドキュメント一覧の1ページ"""
+    items: List[DocumentSummary]
+    next_cursor: Optional[str] = Field(None, description="次のページを取得するカーソル（最終ページでは None）")
+    total: Optional[int] = Field(None, description="条件に一致する件数（先頭ページのみ）")
+    facets: Optional[DocumentFacets] = Field(None, description="絞り込み項目ごとの件数（先頭ページのみ）")
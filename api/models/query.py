@@ -0,0 +1,62 @@
+"""
+質問・履歴モデル
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class QueryRequest(BaseModel):
+    """質問"""
+    query: str = Field(..., min_length=1, max_length=2000)
+    trace: bool = Field(False, description="処理段階ごとの所要時間を返す（管理者のみ）")
+
+
+class ContextChunk(BaseModel):
+    """回答の根拠になったチャンク"""
+    document: str
+    page: Optional[int] = None
+    text: str
+    score: float
+    sources: List[str] = []  # 同じ内容を含む、ほかのドキュメント（版）の引用
+
+
+class SpanTiming(BaseModel):
+    """処理段階の所要時間"""
+    name: str
+    start_ms: float = Field(..., description="リクエスト開始からの経過（ミリ秒）")
+    duration_ms: float
+    depth: int = Field(..., description="入れ子の深さ（0 がリクエスト全体）")
+    attributes: Dict[str, Any] = {}
+
+
+class QueryTrace(BaseModel):
+    """回答までの所要時間の内訳"""
+    trace_id: str
+    spans: List[SpanTiming]
+
+
+class QueryResponse(BaseModel):
+    """回答"""
+    answer: str
+    context: List[ContextChunk]
+    history_id: str
+    trace: Optional[QueryTrace] = None
+
+
+class HistoryItem(BaseModel):
+    """質問・回答履歴"""
+    id: str
+    query: str
+    answer: str
+    documents: List[str]
+    provider: Optional[str] = None
+    created_at: datetime
+
+
+class HistoryPage(BaseModel):
+    """履歴の1ページ"""
+    items: List[HistoryItem]
+    next_cursor: Optional[str] = Field(None, description="次のページを取得するカーソル（最終ページでは None）")
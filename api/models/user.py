@@ -0,0 +1,37 @@
+"""
+ユーザーモデル
+"""
+
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+class User(BaseModel):
+    """認証済みユーザー"""
+    username: str
+    role: str = "user"
+    groups: List[str] = []
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+class LoginRequest(BaseModel):
+    """ログイン"""
+    username: str = Field(..., min_length=1, max_length=100)
+    password: str = Field(..., min_length=1, max_length=256)
+
+
+class LoginUser(BaseModel):
+    """ログインしたユーザー"""
+    username: str
+    role: str
+
+
+class LoginResponse(BaseModel):
+    """ログイン結果"""
+    access_token: str
+    token_type: str = "bearer"
+    user: LoginUser
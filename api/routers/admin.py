@@ -0,0 +1,51 @@
+"""
+管理API
+
+Prometheus 向けの運用メトリクス
+"""
+
+import hmac
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+
+from rag_engine.metrics import CONTENT_TYPE
+
+from core.config import settings
+from dependencies.auth import get_current_user
+from services.admin_service import render_metrics
+from services.auth_service import AuthService, get_auth_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+async def authorize_scrape(
+    authorization: Optional[str] = Header(None),
+    auth: AuthService = Depends(get_auth_service),
+):
+    """METRICS_TOKEN が設定されていればそれを、なければ管理者のアクセストークンを要求する"""
+    token = ""
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+
+    if settings.metrics_token:
+        if not hmac.compare_digest(token.encode("utf-8"), settings.metrics_token.encode("utf-8")):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="認証情報が無効です",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return
+
+    user = await get_current_user(token, auth)
+    if not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="管理者権限が必要です")
+
+
+@router.get("/metrics", dependencies=[Depends(authorize_scrape)])
+async def metrics():
+    """運用メトリクス（Prometheus のテキスト形式）"""
+    return Response(content=await render_metrics(), headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,55 @@
+"""
+認証API
+
+ログイン（アクセストークンの発行）とログアウト（トークンの失効）
+"""
+
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from jose import JWTError
+
+from core.logging import annotate
+from core.security import HasherBusy
+from dependencies.auth import oauth2_scheme
+from models.user import LoginRequest, LoginResponse
+from services.auth_service import AuthService, get_auth_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.post("/login", response_model=LoginResponse)
+async def login(request: LoginRequest, service: AuthService = Depends(get_auth_service)):
+    """ユーザー名とパスワードでログイン"""
+    annotate(user=request.username)
+    try:
+        result = await service.login(request.username, request.password)
+    except HasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="ログインが混み合っています。しばらくしてから再度お試しください",
+            headers={"Retry-After": "1"},
+        )
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="ユーザー名またはパスワードが正しくありません",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return result
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme), service: AuthService = Depends(get_auth_service)):
+    """現在のトークンを失効させる"""
+    try:
+        await service.logout(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="認証情報が無効です",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,227 @@
+"""
+ドキュメントAPI
+
+ドキュメント一覧、アップロード（一括・再開可能な分割）の受付、インジェストジョブの進捗照会・キャンセル
+"""
+
+import logging
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, Form, Header, HTTPException, Query, Request, Response, UploadFile, status
+
+from core.logging import annotate
+from dependencies.auth import get_current_user
+from models.document import (
+    DocumentPage,
+    JobPriority,
+    JobProgress,
+    JobProgressList,
+    UploadResponse,
+    UploadSession,
+    UploadSessionCreate,
+)
+from models.user import User
+from services.document_service import (
+    DocumentService,
+    UploadOffsetConflict,
+    UploadSizeExceeded,
+    get_document_service,
+)
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _split(value: str) -> list:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+@router.get("", response_model=DocumentPage)
+async def list_documents(
+    response: Response,
+    name: Optional[str] = Query(None, max_length=200, description="ファイル名に含まれる文字列"),
+    type: Optional[str] = Query(None, description="種類（PDF, Word, Excel, Text）"),
+    confidentiality: Optional[int] = Query(None, ge=0, le=3),
+    uploaded_by: Optional[str] = Query(None),
+    cursor: Optional[str] = Query(None, description="前のページの next_cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """
+    参照できるドキュメントの一覧（キーセット方式のページング）
+
+    先頭ページには絞り込み項目ごとの件数を含む。ETag を返すので、If-None-Match を送ると
+    一覧に変更がない場合は 304 を返す
+    """
+    params = {
+        "name": name,
+        "type": type,
+        "confidentiality": confidentiality,
+        "uploaded_by": uploaded_by,
+        "cursor": cursor,
+        "limit": limit,
+    }
+    etag = await service.catalogue_etag(user, params)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        page = await service.list_documents(user, name, type, confidentiality, uploaded_by, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    annotate(results=len(page.items))
+    response.headers.update(headers)
+    return page
+
+
+@router.post("/upload", response_model=UploadResponse, status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(
+    file: UploadFile = File(...),
+    confidentiality: int = Form(1, ge=0, le=3),
+    tags: str = Form(""),
+    description: str = Form(""),
+    groups: str = Form(""),
+    priority: JobPriority = Form(JobPriority.NORMAL),
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """
+    ドキュメントをアップロード
+
+    ファイルを暗号化して保存し、インジェストジョブを登録して即座にジョブIDを返す。
+    処理の進捗は GET /jobs/{job_id} で取得する
+    """
+    metadata = {
+        "confidentiality": confidentiality,
+        "tags": _split(tags),
+        "description": description,
+        "groups": _split(groups),
+    }
+    try:
+        result = await service.upload(file, file.filename or "document", metadata, user, priority)
+        annotate(document_id=result.document_id, job_id=result.job_id, filename=file.filename)
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        await file.close()
+
+
+@router.post("/uploads", response_model=UploadSession, status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    request: UploadSessionCreate,
+    response: Response,
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """
+    分割アップロードを開始
+
+    返された upload_id に対して PATCH /uploads/{upload_id} でパートを順に送る。
+    各パートには Upload-Offset ヘッダーで開始位置を指定し、本文は生のバイト列
+    （application/offset+octet-stream）で送る。接続が切れた場合は GET で受信済みの位置を確認して再開する
+    """
+    try:
+        session = await service.create_upload(request, user)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    response.headers["Upload-Offset"] = str(session.offset)
+    return session
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload(
+    upload_id: str,
+    response: Response,
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """分割アップロードの受信済みの位置を取得"""
+    session = await service.get_upload(upload_id, user)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="アップロードが見つかりません")
+    response.headers["Upload-Offset"] = str(session.offset)
+    return session
+
+
+@router.patch("/uploads/{upload_id}", response_model=UploadSession)
+async def upload_part(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., ge=0),
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """パートを送信（本文はバッファリングせずに暗号化ファイルへ流し込む）"""
+    try:
+        session = await service.write_upload_part(upload_id, upload_offset, request.stream(), user)
+    except UploadOffsetConflict as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload-Offset が受信済みの位置と一致しません",
+            headers={"Upload-Offset": str(e.offset)},
+        )
+    except UploadSizeExceeded as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="アップロードが見つかりません")
+    if session.result is not None:
+        annotate(document_id=session.result.document_id, job_id=session.result.job_id, filename=session.filename)
+    response.headers["Upload-Offset"] = str(session.offset)
+    return session
+
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload(
+    upload_id: str,
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """分割アップロードを中止"""
+    try:
+        found = await service.abort_upload(upload_id, user)
+    except UploadOffsetConflict:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="パートの受信中は中止できません")
+    if not found:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="アップロードが見つかりません")
+
+
+@router.get("/jobs", response_model=JobProgressList)
+async def list_jobs(
+    ids: str = Query(..., description="カンマ区切りのジョブID"),
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """複数のインジェストジョブの進捗を一括取得"""
+    return JobProgressList(items=await service.list_progress(_split(ids)[:100], user))
+
+
+@router.get("/jobs/{job_id}", response_model=JobProgress)
+async def get_job(
+    job_id: str,
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """インジェストジョブの進捗（段階・進捗率・スループット）を取得"""
+    progress = await service.get_progress(job_id, user)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ジョブが見つかりません")
+    return progress
+
+
+@router.delete("/jobs/{job_id}", response_model=JobProgress)
+async def cancel_job(
+    job_id: str,
+    user: User = Depends(get_current_user),
+    service: DocumentService = Depends(get_document_service),
+):
+    """インジェストジョブをキャンセル（実行中の場合は次の進捗報告の時点で中断）"""
+    progress = await service.cancel(job_id, user)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="ジョブが見つかりません")
+    return progress
@@ -0,0 +1,147 @@
+"""
+質問・履歴API
+"""
+
+import asyncio
+import json
+import logging
+import time
+import weakref
+from datetime import date
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+
+from core.admission import AdmissionController, Overloaded, request_priority
+from core.logging import annotate
+
+from dependencies.auth import get_current_user
+from models.query import HistoryPage, QueryRequest, QueryResponse
+from models.user import User
+from services.query_service import QueryService, get_query_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+query_admission = AdmissionController("query")
+
+
+def _overloaded(e: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="混雑しています。しばらくしてから再度お試しください",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+class _AdmissionSlot:
+    """ストリーミング中に保持する受付制御の枠（1回だけ返す）"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self, ok: bool = True, measured: bool = True):
+        if not self.released:
+            self.released = True
+            query_admission.release(time.monotonic() - self.started, ok=ok, measured=measured)
+
+
+async def _stream_answer(events: AsyncIterator[Tuple[str, Dict[str, Any]]], slot: _AdmissionSlot) -> AsyncIterator[str]:
+    """回答のイベントを server-sent events に変換（受付制御の枠は送り終えるまで保持する）"""
+    ok: Optional[bool] = True
+    try:
+        async for event, data in events:
+            if event == "done":
+                annotate(history_id=data["history_id"], documents=sorted(data["documents"]))
+            yield _sse(event, data)
+    except asyncio.CancelledError:
+        # クライアントの切断による中断は上限の調整に使わない
+        ok = None
+        raise
+    except Exception as e:
+        ok = False
+        logger.error(f"Streaming answer failed: {e}")
+        yield _sse("error", {"detail": "回答の生成に失敗しました"})
+    finally:
+        slot.release(ok=bool(ok), measured=ok is not None)
+
+
+@router.post("/query", response_model=QueryResponse)
+async def query(
+    request: QueryRequest,
+    x_request_priority: Optional[str] = Header(None, description="low を指定すると混雑時に後回しにする（一括処理向け）"),
+    accept: Optional[str] = Header(None),
+    user: User = Depends(get_current_user),
+    service: QueryService = Depends(get_query_service),
+):
+    """
+    質問に回答（質問と回答は履歴に保存される。混雑時は 503 と Retry-After を返す）
+
+    Accept: text/event-stream を指定すると server-sent events で返す。検索が終わった時点で
+    context（根拠のチャンク）、生成中は token（回答の断片）、最後に done（履歴ID）を送る
+    """
+    if request.trace and not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="所要時間の内訳は管理者のみ取得できます")
+    priority = request_priority(user.is_admin, x_request_priority)
+
+    if accept and "text/event-stream" in accept:
+        try:
+            await query_admission.acquire(priority)
+        except Overloaded as e:
+            raise _overloaded(e)
+        slot = _AdmissionSlot()
+        body = _stream_answer(service.answer_stream(request.query, user, trace=request.trace), slot)
+        # 送信を始める前にクライアントが切断すると本文が読まれないため、破棄された時点で枠を返す
+        weakref.finalize(body, slot.release, False, False)
+        return StreamingResponse(
+            body,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        async with query_admission.admit(priority):
+            result = await service.answer(request.query, user, trace=request.trace)
+        # 回答の根拠として参照したドキュメント（質問文は履歴に保存されるため ID だけ記録する）
+        annotate(history_id=result.history_id, documents=sorted({chunk.document for chunk in result.context}))
+        return result
+    except Overloaded as e:
+        raise _overloaded(e)
+
+
+@router.get("/history", response_model=HistoryPage)
+async def history(
+    response: Response,
+    search: Optional[str] = Query(None, max_length=200, description="質問文に含まれる文字列"),
+    date_from: Optional[date] = Query(None, description="この日以降"),
+    date_to: Optional[date] = Query(None, description="この日まで（当日を含む）"),
+    cursor: Optional[str] = Query(None, description="前のページの next_cursor"),
+    limit: int = Query(20, ge=1, le=100),
+    if_none_match: Optional[str] = Header(None),
+    user: User = Depends(get_current_user),
+    service: QueryService = Depends(get_query_service),
+):
+    """
+    自分の質問・回答履歴を新しい順に取得（キーセット方式のページング）
+
+    ETag を返すので、If-None-Match を送ると履歴が増えていない場合は 304 を返す
+    """
+    params = {"search": search, "date_from": date_from, "date_to": date_to, "cursor": cursor, "limit": limit}
+    etag = await service.history_etag(user, params)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        page = await service.history(user, search, date_from, date_to, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    response.headers.update(headers)
+    return page
@@ -0,0 +1,79 @@
+"""
+管理サービス
+
+運用メトリクス（Prometheus）の収集。リクエストごとの所要時間などは各モジュールが
+rag_engine.metrics の指標に記録し、キューの長さやキャッシュの統計はここで登録する
+コールバックが /metrics の取得時に読み出す（記録側に追加のコストをかけない）
+"""
+
+import logging
+from typing import Dict, Tuple
+
+from rag_engine.metrics import REGISTRY
+
+from core.security import token_cache
+from services.auth_service import get_auth_service
+from services.document_service import get_document_service
+from services.query_service import get_query_service
+
+logger = logging.getLogger(__name__)
+
+
+async def _queue_depths() -> Dict[Tuple[str, str], float]:
+    depths: Dict[Tuple[str, str], float] = {}
+    for status, count in (await get_document_service().queue.depth()).items():
+        depths[("ingestion", status)] = count
+    depths[("password_hash", "pending")] = get_auth_service().hasher.pending
+
+    _, llm_router = get_query_service().components()
+    if llm_router is None:
+        return depths
+    from rag_engine.llm.router import LLMProvider
+
+    local = llm_router.clients.get(LLMProvider.LOCAL)
+    if local is not None:
+        depths[("local_llm", "queued")] = local.queue_depth
+        depths[("local_llm", "in_flight")] = local.in_flight
+    return depths
+
+
+def _cache_stats() -> Dict[str, Tuple[int, int]]:
+    """キャッシュごとの (ヒット数, ミス数)"""
+    stats = {"token": (token_cache.hits, token_cache.misses)}
+    searcher, _ = get_query_service().components()
+    if searcher is not None:
+        chunk_cache = searcher.cipher.chunk_cache
+        data_keys = searcher.cipher.data_key_cache
+        stats["decrypted_chunk"] = (chunk_cache.hits, chunk_cache.misses)
+        stats["data_key"] = (data_keys.hits, data_keys.misses)
+    return stats
+
+
+def _cache_lookups() -> Dict[Tuple[str, str], float]:
+    lookups: Dict[Tuple[str, str], float] = {}
+    for cache, (hits, misses) in _cache_stats().items():
+        lookups[(cache, "hit")] = hits
+        lookups[(cache, "miss")] = misses
+    return lookups
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str], float]:
+    return {
+        (cache,): hits / (hits + misses)
+        for cache, (hits, misses) in _cache_stats().items()
+        if hits + misses
+    }
+
+
+def register_metrics():
+    """公開時に値を読み出す指標を登録"""
+    REGISTRY.callback("rag_queue_depth", "Items waiting or in progress per queue", _queue_depths, ["queue", "state"])
+    REGISTRY.callback(
+        "rag_cache_lookups_total", "Cache lookups by result", _cache_lookups, ["cache", "result"], type_name="counter"
+    )
+    REGISTRY.callback("rag_cache_hit_ratio", "Cache hit ratio since process start", _cache_hit_ratios, ["cache"])
+
+
+async def render_metrics() -> str:
+    """Prometheus のテキスト形式で全指標を出力"""
+    return await REGISTRY.render()
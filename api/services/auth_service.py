@@ -0,0 +1,230 @@
+"""
+認証サービス
+
+ユーザーのパスワード照合、アクセストークンの発行と失効。
+bcrypt は PasswordHasher の専用スレッドプールで計算するため、ログインが集中しても
+質問応答など他のリクエストの応答時間に影響しない。
+失効したトークンの jti は有効期限まで保存し、トークンキャッシュへ定期的に読み込み直す
+（ほかのインスタンス・プロセスでログアウトしたトークンも数秒で拒否される）
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from core.security import PasswordHasher, TokenCache, create_access_token, token_cache
+from dependencies.db import get_database, use_in_memory_store
+from models.user import LoginResponse, LoginUser, User
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryUserStore:
+    """ユーザー・失効トークンストアのメモリ上の実装（テスト・開発用）"""
+
+    def __init__(self):
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._revoked: Dict[str, datetime] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def get(self, username: str) -> Optional[Dict[str, Any]]:
+        user = self._users.get(username)
+        return dict(user) if user else None
+
+    async def insert(self, user: Dict[str, Any]) -> bool:
+        if user["_id"] in self._users:
+            return False
+        self._users[user["_id"]] = dict(user)
+        return True
+
+    async def add_revoked(self, jti: str, expires_at: datetime):
+        self._revoked[jti] = expires_at
+
+    async def list_revoked(self) -> List[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return [{"_id": jti, "expires_at": exp} for jti, exp in self._revoked.items() if exp > now]
+
+
+class MongoUserStore:
+    """ユーザー・失効トークンストアの MongoDB 実装"""
+
+    def __init__(self, database):
+        self.users = database["users"]
+        self.revoked = database["revoked_tokens"]
+
+    async def ensure_indexes(self):
+        # 有効期限を過ぎた失効記録は TTL インデックスで自動削除する
+        await self.revoked.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self.users.find_one({"_id": username})
+
+    async def insert(self, user: Dict[str, Any]) -> bool:
+        result = await self.users.update_one({"_id": user["_id"]}, {"$setOnInsert": user}, upsert=True)
+        return result.upserted_id is not None
+
+    async def add_revoked(self, jti: str, expires_at: datetime):
+        await self.revoked.update_one({"_id": jti}, {"$set": {"expires_at": expires_at}}, upsert=True)
+
+    async def list_revoked(self) -> List[Dict[str, Any]]:
+        cursor = self.revoked.find({"expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return await cursor.to_list(length=None)
+
+
+class AuthService:
+    """ログイン・ログアウト"""
+
+    def __init__(self, store, hasher: Optional[PasswordHasher] = None, tokens: Optional[TokenCache] = None):
+        """
+        初期化
+
+        Args:
+            store: ユーザーストア（MongoUserStore または InMemoryUserStore）
+            hasher: パスワードハッシュ（省略時は設定に従って作成）
+            tokens: トークンキャッシュ（省略時は認証依存関係と共有のもの）
+        """
+        self.store = store
+        self.hasher = hasher or PasswordHasher()
+        self.tokens = tokens or token_cache
+        self._dummy_hash: Optional[str] = None
+        self._revocations_fresh_until = 0.0
+        self._revocations_lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        """インデックス作成、失効トークンの読み込み、初期管理者の作成"""
+        await self.store.ensure_indexes()
+        await self.refresh_revocations(force=True)
+        if settings.admin_password:
+            await self.create_user(settings.admin_username, settings.admin_password, role="admin")
+
+    async def refresh_revocations(self, force: bool = False):
+        """
+        失効したトークンの一覧をストアから読み込み直す（前回から settings.token_revocation_refresh 秒以内なら何もしない）
+
+        認証のたびに呼ばれるため、読み込みは同時に1つだけ行い、失敗した場合も次の間隔まで再試行しない
+
+        Args:
+            force: 間隔に関わらず読み込む（失敗時は例外を送出する）
+        """
+        if not force and time.monotonic() < self._revocations_fresh_until:
+            return
+        async with self._revocations_lock:
+            if not force and time.monotonic() < self._revocations_fresh_until:
+                return
+            try:
+                entries = await self.store.list_revoked()
+            except Exception as e:
+                if force:
+                    raise
+                logger.warning(f"Failed to refresh revoked tokens: {e}")
+                entries = []
+            for entry in entries:
+                self.tokens.revoke(entry["_id"], _to_timestamp(entry["expires_at"]))
+            self._revocations_fresh_until = time.monotonic() + settings.token_revocation_refresh
+
+    async def create_user(self, username: str, password: str, role: str = "user", groups: Optional[List[str]] = None) -> bool:
+        """
+        ユーザーを作成
+
+        Returns:
+            作成した場合 True（既に存在する場合 False）
+        """
+        if await self.store.get(username):
+            return False
+        created = await self.store.insert({
+            "_id": username,
+            "password_hash": await self.hasher.hash(password),
+            "role": role,
+            "groups": groups or [],
+            "disabled": False,
+            "created_at": datetime.now(timezone.utc),
+        })
+        if created:
+            logger.info(f"User created: {username} ({role})")
+        return created
+
+    async def authenticate(self, username: str, password: str) -> Optional[User]:
+        """
+        ユーザー名とパスワードを照合
+
+        Returns:
+            照合できたユーザー（失敗時は None）
+
+        Raises:
+            HasherBusy: パスワード照合の待ちが上限を超えた場合
+        """
+        record = await self.store.get(username)
+        if record is None or record.get("disabled"):
+            # 存在しないユーザーでも同じだけ時間をかけ、応答時間からユーザー名を推測させない
+            if self._dummy_hash is None:
+                self._dummy_hash = await self.hasher.hash("dummy-password")
+            await self.hasher.verify(password, self._dummy_hash)
+            return None
+        if not await self.hasher.verify(password, record["password_hash"]):
+            return None
+        return User(username=record["_id"], role=record.get("role", "user"), groups=record.get("groups", []))
+
+    async def login(self, username: str, password: str) -> Optional[LoginResponse]:
+        """
+        ログインしてアクセストークンを発行
+
+        Returns:
+            トークンとユーザー情報（認証失敗時は None）
+
+        Raises:
+            HasherBusy: パスワード照合の待ちが上限を超えた場合
+        """
+        user = await self.authenticate(username, password)
+        if user is None:
+            logger.info(f"Login failed: {username}")
+            return None
+        token = create_access_token({"sub": user.username, "role": user.role, "groups": user.groups})
+        return LoginResponse(access_token=token, user=LoginUser(username=user.username, role=user.role))
+
+    async def logout(self, token: str):
+        """
+        トークンを失効させる（以降そのトークンでは認証できない）
+
+        Raises:
+            jose.JWTError: トークンが無効な場合
+        """
+        claims = self.tokens.verify(token)
+        jti = claims.get("jti")
+        if not jti:
+            return
+        expires_at = _to_timestamp(claims["exp"])
+        self.tokens.revoke(jti, expires_at)
+        await self.store.add_revoked(jti, datetime.fromtimestamp(expires_at, timezone.utc))
+        logger.info(f"Token revoked for {claims.get('sub')}")
+
+
+def _to_timestamp(value) -> float:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return float(value)
+
+
+def create_auth_service() -> AuthService:
+    """設定に応じたストアでサービスを作成"""
+    if use_in_memory_store():
+        return AuthService(InMemoryUserStore())
+    return AuthService(MongoUserStore(get_database()))
+
+
+_service: Optional[AuthService] = None
+
+
+def get_auth_service() -> AuthService:
+    """共有のサービスを取得（FastAPI の依存関係としても使う）"""
+    global _service
+    if _service is None:
+        _service = create_auth_service()
+    return _service
+
@@ -0,0 +1,1424 @@
+"""
+ドキュメント処理サービス
+
+アップロードされたドキュメントを暗号化して保存し、インジェストジョブとして永続キューに登録する。
+キューは MongoDB（テスト時はメモリ上のストア）で管理され、rag_engine コンテナで動く
+ワーカープールが優先度順にジョブを取り出して解析・埋め込み・インデックス登録を行う。
+アップロードAPIはジョブIDを即座に返し、進捗はジョブAPIでポーリングする。
+大きなファイルは分割アップロード（パートごとに受信位置を指定する再開可能な方式）で受け付け、
+受信したデータをそのまま暗号化ファイルへ追記する
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from parsers import SUPPORTED_EXTENSIONS
+from rag_engine.metrics import INGESTION_JOBS, INGESTION_STAGE_SECONDS
+from rag_engine.security.encryption import EncryptedWriter, KeyRing
+
+from core.config import settings
+from core.search import MAX_SEARCH_NGRAMS, char_bigrams, decode_cursor, encode_cursor, normalize_search_text
+from dependencies.db import get_database, use_in_memory_store
+from models.document import (
+    DocumentPage,
+    DocumentStatus,
+    DocumentSummary,
+    IngestionStage,
+    JobPriority,
+    JobProgress,
+    JobStatus,
+    UploadResponse,
+    UploadSession,
+    UploadSessionCreate,
+)
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# 各段階が全体の進捗（%）のどの範囲を占めるか
+STAGE_RANGES = {
+    IngestionStage.QUEUED: (0.0, 0.0),
+    IngestionStage.PARSING: (0.0, 20.0),
+    IngestionStage.CHUNKING: (20.0, 25.0),
+    IngestionStage.EMBEDDING: (25.0, 85.0),
+    IngestionStage.INDEXING: (85.0, 100.0),
+    IngestionStage.COMPLETED: (100.0, 100.0),
+}
+
+# 拡張子ごとの表示用の種類（一覧の絞り込みに使う）
+DOCUMENT_TYPES = {".pdf": "PDF", ".docx": "Word", ".xlsx": "Excel", ".txt": "Text", ".md": "Text"}
+
+UPLOAD_READ_SIZE = 1024 * 1024
+UPLOAD_PART_SIZE = 8 * 1024 * 1024  # 分割アップロードで推奨するパートのサイズ
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+MAX_OPEN_UPLOADS = 64  # 書き込み中のまま保持する暗号化ファイルの上限
+PROGRESS_MIN_INTERVAL = 0.5  # 同一段階内で進捗を書き込む最小間隔（秒）
+RETRY_BASE_DELAY = 10.0  # 再試行までの待ち時間の基準（秒、試行ごとに倍増）
+
+_FINAL_STATUSES = {JobStatus.SUCCEEDED.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value}
+# 重複排除の対象にするドキュメントの状態（失敗・キャンセルしたものは再登録できる）
+_LIVE_DOCUMENT_STATUSES = {DocumentStatus.PROCESSING.value, DocumentStatus.INDEXED.value}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobCancelled(Exception):
+    """実行中のジョブにキャンセルが要求された"""
+
+
+# --------------------------------------------------
+# ストア
+# --------------------------------------------------
+class InMemoryJobStore:
+    """ジョブストアのメモリ上の実装（テスト・開発用）"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, job: Dict[str, Any]):
+        async with self._lock:
+            self._jobs[job["_id"]] = dict(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def get_many(self, job_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return [dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs]
+
+    async def claim(self, worker_id: str, now: datetime, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        async with self._lock:
+            ready = [
+                job for job in self._jobs.values()
+                if job["status"] == JobStatus.QUEUED.value and job["not_before"] <= now
+            ]
+            if not ready:
+                return None
+            job = min(ready, key=lambda j: (-j["priority"], j["created_at"]))
+            job.update(
+                status=JobStatus.RUNNING.value,
+                worker_id=worker_id,
+                lease_expires_at=lease_until,
+                started_at=now,
+                updated_at=now,
+                attempts=job["attempts"] + 1,
+            )
+            return dict(job)
+
+    async def update(
+        self,
+        job_id: str,
+        fields: Dict[str, Any],
+        statuses: Optional[Iterable[str]] = None,
+        inc: Optional[Dict[str, int]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        async with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or (statuses is not None and job["status"] not in statuses):
+                return None
+            job.update(fields)
+            for name, delta in (inc or {}).items():
+                job[name] = job.get(name, 0) + delta
+            return dict(job)
+
+    async def count_by_status(self, statuses: Iterable[str]) -> Dict[str, int]:
+        statuses = list(statuses)
+        counts = dict.fromkeys(statuses, 0)
+        for job in self._jobs.values():
+            if job["status"] in counts:
+                counts[job["status"]] += 1
+        return counts
+
+    async def requeue_expired(self, now: datetime) -> int:
+        count = 0
+        async with self._lock:
+            for job in self._jobs.values():
+                if job["status"] == JobStatus.RUNNING.value and job["lease_expires_at"] < now:
+                    exhausted = job["attempts"] >= job["max_attempts"]
+                    job.update(
+                        status=JobStatus.FAILED.value if exhausted else JobStatus.QUEUED.value,
+                        worker_id=None,
+                        error="worker lease expired",
+                        updated_at=now,
+                    )
+                    count += 1
+        return count
+
+
+class MongoJobStore:
+    """ジョブストアの MongoDB 実装"""
+
+    def __init__(self, database):
+        self.collection = database["ingestion_jobs"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("status", 1), ("priority", -1), ("created_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+        await self.collection.create_index("document_id")
+
+    async def insert(self, job: Dict[str, Any]):
+        await self.collection.insert_one(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def get_many(self, job_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return await self.collection.find({"_id": {"$in": list(job_ids)}}).to_list(length=None)
+
+    async def claim(self, worker_id: str, now: datetime, lease_until: datetime) -> Optional[Dict[str, Any]]:
+        from pymongo import ReturnDocument
+
+        # 条件付きの find_one_and_update で、複数ワーカーが同じジョブを取らないようにする
+        return await self.collection.find_one_and_update(
+            {"status": JobStatus.QUEUED.value, "not_before": {"$lte": now}},
+            {
+                "$set": {
+                    "status": JobStatus.RUNNING.value,
+                    "worker_id": worker_id,
+                    "lease_expires_at": lease_until,
+                    "started_at": now,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def update(
+        self,
+        job_id: str,
+        fields: Dict[str, Any],
+        statuses: Optional[Iterable[str]] = None,
+        inc: Optional[Dict[str, int]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        from pymongo import ReturnDocument
+
+        query: Dict[str, Any] = {"_id": job_id}
+        if statuses is not None:
+            query["status"] = {"$in": list(statuses)}
+        update: Dict[str, Any] = {"$set": fields}
+        if inc:
+            update["$inc"] = inc
+        return await self.collection.find_one_and_update(query, update, return_document=ReturnDocument.AFTER)
+
+    async def count_by_status(self, statuses: Iterable[str]) -> Dict[str, int]:
+        # 状態ごとに件数を数え、(status, ...) インデックスの範囲だけを走査する
+        return {status: await self.collection.count_documents({"status": status}) for status in statuses}
+
+    async def requeue_expired(self, now: datetime) -> int:
+        expired = {"status": JobStatus.RUNNING.value, "lease_expires_at": {"$lt": now}}
+        fields = {"worker_id": None, "error": "worker lease expired", "updated_at": now}
+        failed = await self.collection.update_many(
+            {**expired, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {**fields, "status": JobStatus.FAILED.value}},
+        )
+        requeued = await self.collection.update_many(expired, {"$set": {**fields, "status": JobStatus.QUEUED.value}})
+        return failed.modified_count + requeued.modified_count
+
+
+class CatalogueQuery:
+    """ドキュメント一覧の検索条件"""
+
+    def __init__(
+        self,
+        user: User,
+        name: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        confidentiality: Optional[int] = None,
+        uploaded_by: Optional[str] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 50,
+    ):
+        """
+        初期化
+
+        Args:
+            user: 一覧を見るユーザー（参照できるドキュメントだけを返す）
+            name: ファイル名に含まれる文字列
+            doc_type: 種類（PDF, Word, Excel, Text）
+            confidentiality: 機密レベル
+            uploaded_by: アップロードしたユーザー
+            after: 前のページの最後の (アップロード日時, ID)
+            limit: 件数
+        """
+        from rag_engine.security.content_filter import ROLE_CLEARANCE
+
+        self.user = user
+        self.clearance = ROLE_CLEARANCE.get(user.role, 0)
+        self.name = normalize_search_text(name) if name else ""
+        self.doc_type = doc_type
+        self.confidentiality = confidentiality
+        self.uploaded_by = uploaded_by
+        self.after = after
+        self.limit = limit
+
+    def visible(self, document: Dict[str, Any]) -> bool:
+        if document["status"] == DocumentStatus.CANCELLED.value:
+            return False
+        if self.user.is_admin or document["uploaded_by"] == self.user.username:
+            return True
+        return document["confidentiality"] <= self.clearance and (
+            not document["groups"] or bool(set(document["groups"]) & set(self.user.groups))
+        )
+
+    def matches(self, document: Dict[str, Any]) -> bool:
+        """メモリ上のストア用の判定（ページ位置を除き、Mongo のクエリと同じ条件）"""
+        if not self.visible(document):
+            return False
+        if self.name and self.name not in document["name_normalized"]:
+            return False
+        if self.doc_type and document["type"] != self.doc_type:
+            return False
+        if self.confidentiality is not None and document["confidentiality"] != self.confidentiality:
+            return False
+        if self.uploaded_by and document["uploaded_by"] != self.uploaded_by:
+            return False
+        return True
+
+    def after_cursor(self, document: Dict[str, Any]) -> bool:
+        return self.after is None or (document["uploaded_at"], document["_id"]) < self.after
+
+    def to_mongo(self) -> Dict[str, Any]:
+        """ページ位置を除いた条件"""
+        conditions: List[Dict[str, Any]] = [{"status": {"$ne": DocumentStatus.CANCELLED.value}}]
+        if not self.user.is_admin:
+            conditions.append({"$or": [
+                {"uploaded_by": self.user.username},
+                {
+                    "confidentiality": {"$lte": self.clearance},
+                    "$or": [{"groups": {"$size": 0}}, {"groups": {"$in": list(self.user.groups)}}],
+                },
+            ]})
+        if self.name:
+            ngrams = char_bigrams(self.name)
+            if ngrams:
+                conditions.append({"name_ngrams": {"$all": ngrams[:MAX_SEARCH_NGRAMS]}})
+            conditions.append({"name_normalized": {"$regex": re.escape(self.name)}})
+        if self.doc_type:
+            conditions.append({"type": self.doc_type})
+        if self.confidentiality is not None:
+            conditions.append({"confidentiality": self.confidentiality})
+        if self.uploaded_by:
+            conditions.append({"uploaded_by": self.uploaded_by})
+        return {"$and": conditions}
+
+    def after_mongo(self) -> Dict[str, Any]:
+        if self.after is None:
+            return {}
+        after_time, after_id = self.after
+        return {"$or": [
+            {"uploaded_at": {"$lt": after_time}},
+            {"uploaded_at": after_time, "_id": {"$lt": after_id}},
+        ]}
+
+
+# 件数を集計する項目（アップロードしたユーザーは件数の多い順に上位のみ）
+FACET_FIELDS = ("type", "confidentiality", "uploaded_by")
+MAX_FACET_VALUES = 20
+
+
+def _count_facets(documents: Iterable[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    facets: Dict[str, Dict[Any, int]] = {field: {} for field in FACET_FIELDS}
+    for document in documents:
+        for field in FACET_FIELDS:
+            counts = facets[field]
+            counts[document[field]] = counts.get(document[field], 0) + 1
+    return {
+        field: [
+            {"value": value, "count": count}
+            for value, count in sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))[:MAX_FACET_VALUES]
+        ]
+        for field, counts in facets.items()
+    }
+
+
+class InMemoryDocumentStore:
+    """ドキュメントメタデータのメモリ上の実装（テスト・開発用）"""
+
+    def __init__(self):
+        self._documents: Dict[str, Dict[str, Any]] = {}
+        self._version = 0
+
+    async def ensure_indexes(self):
+        pass
+
+    async def version(self) -> int:
+        return self._version
+
+    async def insert(self, document: Dict[str, Any]):
+        self._documents[document["_id"]] = dict(document)
+        self._version += 1
+
+    async def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        document = self._documents.get(document_id)
+        return dict(document) if document else None
+
+    async def update(self, document_id: str, fields: Dict[str, Any]):
+        if document_id in self._documents:
+            self._documents[document_id].update(fields)
+            self._version += 1
+
+    async def find_by_hash(self, content_hash: str, uploaded_by: str) -> Optional[Dict[str, Any]]:
+        for document in self._documents.values():
+            if (
+                document.get("content_hash") == content_hash
+                and document["uploaded_by"] == uploaded_by
+                and document["status"] in _LIVE_DOCUMENT_STATUSES
+            ):
+                return dict(document)
+        return None
+
+    async def find_page(
+        self, query: CatalogueQuery, with_facets: bool
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Optional[int]]:
+        matched = [document for document in self._documents.values() if query.matches(document)]
+        page = sorted(
+            (document for document in matched if query.after_cursor(document)),
+            key=lambda document: (document["uploaded_at"], document["_id"]),
+            reverse=True,
+        )[:query.limit]
+        if not with_facets:
+            return page, None, None
+        return page, _count_facets(matched), len(matched)
+
+
+class MongoDocumentStore:
+    """ドキュメントメタデータの MongoDB 実装"""
+
+    def __init__(self, database):
+        self.collection = database["documents"]
+        self.counters = database["counters"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("job_id")
+        await self.collection.create_index([("content_hash", 1), ("uploaded_by", 1)])
+        # 一覧の既定の並び順と、絞り込み条件ごとの並び順
+        await self.collection.create_index([("uploaded_at", -1), ("_id", -1)])
+        for field in ("type", "confidentiality", "uploaded_by", "name_ngrams"):
+            await self.collection.create_index([(field, 1), ("uploaded_at", -1), ("_id", -1)])
+
+    async def version(self) -> int:
+        counter = await self.counters.find_one({"_id": "documents"})
+        return counter["version"] if counter else 0
+
+    async def _bump_version(self):
+        # 書き込みの後に進めるので、古い内容が新しいバージョンで返ることはない
+        await self.counters.update_one({"_id": "documents"}, {"$inc": {"version": 1}}, upsert=True)
+
+    async def insert(self, document: Dict[str, Any]):
+        await self.collection.insert_one(document)
+        await self._bump_version()
+
+    async def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": document_id})
+
+    async def update(self, document_id: str, fields: Dict[str, Any]):
+        await self.collection.update_one({"_id": document_id}, {"$set": fields})
+        await self._bump_version()
+
+    async def find_by_hash(self, content_hash: str, uploaded_by: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({
+            "content_hash": content_hash,
+            "uploaded_by": uploaded_by,
+            "status": {"$in": list(_LIVE_DOCUMENT_STATUSES)},
+        })
+
+    async def find_page(
+        self, query: CatalogueQuery, with_facets: bool
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Optional[int]]:
+        items_pipeline = [
+            {"$match": query.after_mongo()},
+            {"$sort": {"uploaded_at": -1, "_id": -1}},
+            {"$limit": query.limit},
+            {"$project": {"name_ngrams": 0, "name_normalized": 0}},
+        ]
+        if not with_facets:
+            cursor = self.collection.aggregate([{"$match": query.to_mongo()}, *items_pipeline])
+            return await cursor.to_list(length=query.limit), None, None
+
+        # ページと件数の集計を1回のクエリで取得する
+        facet_stages: Dict[str, Any] = {"items": items_pipeline, "total": [{"$count": "count"}]}
+        for field in FACET_FIELDS:
+            facet_stages[field] = [
+                {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}},
+                {"$limit": MAX_FACET_VALUES},
+                {"$project": {"_id": 0, "value": "$_id", "count": 1}},
+            ]
+        cursor = self.collection.aggregate([{"$match": query.to_mongo()}, {"$facet": facet_stages}])
+        result = (await cursor.to_list(length=1))[0]
+        total = result["total"][0]["count"] if result["total"] else 0
+        return result["items"], {field: result[field] for field in FACET_FIELDS}, total
+
+
+class InMemoryUploadStore:
+    """分割アップロードのセッションのメモリ上の実装（テスト・開発用）"""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, session: Dict[str, Any]):
+        self._sessions[session["_id"]] = dict(session)
+
+    async def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        session = self._sessions.get(upload_id)
+        if session is None or session["expires_at"] < _now():
+            return None
+        return dict(session)
+
+    async def update(self, upload_id: str, fields: Dict[str, Any]):
+        if upload_id in self._sessions:
+            self._sessions[upload_id].update(fields)
+
+    async def delete(self, upload_id: str):
+        self._sessions.pop(upload_id, None)
+
+
+class MongoUploadStore:
+    """分割アップロードのセッションの MongoDB 実装（期限切れは TTL インデックスで削除）"""
+
+    def __init__(self, database):
+        self.collection = database["upload_sessions"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def insert(self, session: Dict[str, Any]):
+        await self.collection.insert_one(session)
+
+    async def get(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": upload_id, "expires_at": {"$gte": _now()}})
+
+    async def update(self, upload_id: str, fields: Dict[str, Any]):
+        await self.collection.update_one({"_id": upload_id}, {"$set": fields})
+
+    async def delete(self, upload_id: str):
+        await self.collection.delete_one({"_id": upload_id})
+
+
+# --------------------------------------------------
+# キュー
+# --------------------------------------------------
+class IngestionQueue:
+    """優先度・再試行・キャンセルに対応したインジェストジョブのキュー"""
+
+    def __init__(
+        self,
+        store,
+        max_attempts: int = settings.ingestion_max_attempts,
+        lease_seconds: int = settings.ingestion_lease_seconds,
+    ):
+        """
+        初期化
+
+        Args:
+            store: ジョブストア（MongoJobStore または InMemoryJobStore）
+            max_attempts: 1ジョブの最大試行回数
+            lease_seconds: 進捗報告が途絶えたジョブを再投入するまでの秒数
+        """
+        self.store = store
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+
+    async def enqueue(
+        self,
+        document_id: str,
+        filename: str,
+        storage_path: str,
+        size: int,
+        metadata: Dict[str, Any],
+        uploaded_by: str,
+        priority: int = JobPriority.NORMAL,
+    ) -> Dict[str, Any]:
+        """
+        ジョブを登録
+
+        Returns:
+            登録したジョブ
+        """
+        now = _now()
+        job = {
+            "_id": uuid.uuid4().hex,
+            "document_id": document_id,
+            "filename": filename,
+            "storage_path": storage_path,
+            "size": size,
+            "metadata": metadata,
+            "uploaded_by": uploaded_by,
+            "priority": int(priority),
+            "status": JobStatus.QUEUED.value,
+            "stage": IngestionStage.QUEUED.value,
+            "progress": 0.0,
+            "bytes_per_second": 0.0,
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "cancel_requested": False,
+            "error": None,
+            "worker_id": None,
+            "not_before": now,
+            "lease_expires_at": None,
+            "created_at": now,
+            "updated_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.store.insert(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.store.get(job_id)
+
+    async def get_many(self, job_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        return await self.store.get_many(job_ids)
+
+    async def depth(self) -> Dict[str, int]:
+        """待ち・処理中のジョブ数"""
+        return await self.store.count_by_status([JobStatus.QUEUED.value, JobStatus.RUNNING.value])
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        ジョブをキャンセル
+
+        待機中のジョブは即座にキャンセルし、実行中のジョブにはキャンセルを要求する
+        （ワーカーは次の進捗報告の時点で処理を中断する）
+
+        Returns:
+            更新後のジョブ（存在しない場合は None）
+        """
+        now = _now()
+        job = await self.store.update(
+            job_id,
+            {"status": JobStatus.CANCELLED.value, "finished_at": now, "updated_at": now},
+            statuses=[JobStatus.QUEUED.value],
+        )
+        if job is None:
+            job = await self.store.update(
+                job_id, {"cancel_requested": True, "updated_at": now}, statuses=[JobStatus.RUNNING.value]
+            )
+        return job or await self.store.get(job_id)
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        実行可能なジョブを優先度順に1件取得して実行中にする
+
+        Args:
+            worker_id: ワーカーID
+
+        Returns:
+            取得したジョブ（なければ None）
+        """
+        now = _now()
+        requeued = await self.store.requeue_expired(now)
+        if requeued:
+            logger.warning(f"Requeued {requeued} ingestion jobs with expired leases")
+        return await self.store.claim(worker_id, now, now + timedelta(seconds=self.lease_seconds))
+
+    async def report(
+        self, job_id: str, stage: IngestionStage, progress: float, bytes_per_second: float
+    ) -> Optional[Dict[str, Any]]:
+        """進捗を記録し、リースを延長する"""
+        now = _now()
+        return await self.store.update(
+            job_id,
+            {
+                "stage": stage.value,
+                "progress": round(progress, 1),
+                "bytes_per_second": bytes_per_second,
+                "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                "updated_at": now,
+            },
+            statuses=[JobStatus.RUNNING.value],
+        )
+
+    async def complete(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.store.update(
+            job_id,
+            {
+                "status": JobStatus.SUCCEEDED.value,
+                "stage": IngestionStage.COMPLETED.value,
+                "progress": 100.0,
+                "error": None,
+                "finished_at": now,
+                "updated_at": now,
+            },
+            statuses=[JobStatus.RUNNING.value],
+        )
+
+    async def fail(self, job_id: str, error: str) -> Optional[Dict[str, Any]]:
+        """
+        失敗を記録し、試行回数が残っていれば待ち時間を置いて再投入する
+
+        Returns:
+            更新後のジョブ
+        """
+        job = await self.store.get(job_id)
+        if job is None:
+            return None
+        now = _now()
+        if job["attempts"] < job["max_attempts"] and not job.get("cancel_requested"):
+            delay = RETRY_BASE_DELAY * 2 ** (job["attempts"] - 1)
+            logger.warning(f"Ingestion job {job_id} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {error}")
+            return await self.store.update(
+                job_id,
+                {
+                    "status": JobStatus.QUEUED.value,
+                    "stage": IngestionStage.QUEUED.value,
+                    "progress": 0.0,
+                    "error": error,
+                    "worker_id": None,
+                    "not_before": now + timedelta(seconds=delay),
+                    "updated_at": now,
+                },
+                statuses=[JobStatus.RUNNING.value],
+            )
+
+        logger.error(f"Ingestion job {job_id} failed permanently: {error}")
+        return await self.store.update(
+            job_id,
+            {"status": JobStatus.FAILED.value, "error": error, "finished_at": now, "updated_at": now},
+            statuses=[JobStatus.RUNNING.value],
+        )
+
+    async def mark_cancelled(self, job_id: str) -> Optional[Dict[str, Any]]:
+        now = _now()
+        return await self.store.update(
+            job_id,
+            {"status": JobStatus.CANCELLED.value, "finished_at": now, "updated_at": now},
+            statuses=[JobStatus.RUNNING.value],
+        )
+
+    async def release(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """ワーカー停止時に実行中のジョブを試行回数に数えずにキューへ戻す"""
+        return await self.store.update(
+            job_id,
+            {
+                "status": JobStatus.QUEUED.value,
+                "stage": IngestionStage.QUEUED.value,
+                "progress": 0.0,
+                "worker_id": None,
+                "updated_at": _now(),
+            },
+            statuses=[JobStatus.RUNNING.value],
+            inc={"attempts": -1},
+        )
+
+
+# --------------------------------------------------
+# ワーカープール
+# --------------------------------------------------
+class ProgressReporter:
+    """パイプラインからの進捗通知をキューに記録し、キャンセル要求を伝える"""
+
+    def __init__(self, queue: IngestionQueue, job: Dict[str, Any]):
+        self.queue = queue
+        self.job = job
+        self._started = time.monotonic()
+        self._last_stage: Optional[IngestionStage] = None
+        self._last_write = 0.0
+        self._stage_started = self._started
+
+    async def __call__(self, stage: str, fraction: float):
+        """
+        進捗を通知
+
+        Args:
+            stage: 段階名（IngestionStage の値）
+            fraction: 段階内の進捗（0.0-1.0）
+
+        Raises:
+            JobCancelled: キャンセルが要求されている場合
+        """
+        stage = IngestionStage(stage)
+        now = time.monotonic()
+        if stage != self._last_stage:
+            self._observe_stage(now)
+            self._stage_started = now
+        elif fraction < 1.0 and now - self._last_write < PROGRESS_MIN_INTERVAL:
+            return
+
+        low, high = STAGE_RANGES[stage]
+        progress = low + (high - low) * min(max(fraction, 0.0), 1.0)
+        elapsed = max(now - self._started, 1e-6)
+        bytes_per_second = self.job["size"] * progress / 100.0 / elapsed
+
+        job = await self.queue.report(self.job["_id"], stage, progress, bytes_per_second)
+        self._last_stage = stage
+        self._last_write = now
+        if job is None or job.get("cancel_requested"):
+            raise JobCancelled(self.job["_id"])
+
+    def _observe_stage(self, now: float):
+        if self._last_stage is not None:
+            INGESTION_STAGE_SECONDS.observe(now - self._stage_started, stage=self._last_stage.value)
+
+    def finish(self):
+        """パイプラインの完了時に最後の段階と全体の所要時間を記録"""
+        now = time.monotonic()
+        self._observe_stage(now)
+        INGESTION_STAGE_SECONDS.observe(now - self._started, stage="total")
+
+
+# パイプライン: (ジョブ, 進捗通知) を受け取り、失敗時は例外を送出する
+Pipeline = Callable[[Dict[str, Any], ProgressReporter], Awaitable[Any]]
+
+
+class IngestionWorkerPool:
+    """キューからジョブを取り出して並列に処理するワーカープール"""
+
+    def __init__(
+        self,
+        queue: IngestionQueue,
+        pipeline: Pipeline,
+        concurrency: int = settings.ingestion_workers,
+        poll_interval: float = 1.0,
+        on_finished: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            queue: インジェストキュー
+            pipeline: ジョブを処理するコルーチン関数
+            concurrency: 同時に処理するジョブ数
+            poll_interval: キューが空のときの待機間隔（秒）
+            on_finished: ジョブが最終状態になったときに呼ぶコールバック
+        """
+        self.queue = queue
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.on_finished = on_finished
+        self.worker_prefix = f"{os.uname().nodename}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """ワーカーを起動"""
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self._run(f"{self.worker_prefix}-{n}")) for n in range(self.concurrency)
+        ]
+        logger.info(f"Ingestion worker pool started with {self.concurrency} workers")
+
+    async def stop(self):
+        """ワーカーを停止（実行中のジョブはキューへ戻す）"""
+        self._stopping.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(worker_id)
+            except Exception as e:
+                logger.error(f"Failed to claim ingestion job: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._execute(job)
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["_id"]
+        logger.info(f"Processing ingestion job {job_id} ({job['filename']}, attempt {job['attempts']})")
+        progress = ProgressReporter(self.queue, job)
+        try:
+            await self.pipeline(job, progress)
+        except JobCancelled:
+            logger.info(f"Ingestion job {job_id} cancelled")
+            INGESTION_JOBS.inc(result="cancelled")
+            result = await self.queue.mark_cancelled(job_id)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.queue.release(job_id))
+            raise
+        except Exception as e:
+            result = await self.queue.fail(job_id, f"{type(e).__name__}: {e}")
+            INGESTION_JOBS.inc(result="failed" if result and result["status"] == JobStatus.FAILED.value else "retry")
+        else:
+            progress.finish()
+            INGESTION_JOBS.inc(result="succeeded")
+            result = await self.queue.complete(job_id)
+
+        if result and result["status"] in _FINAL_STATUSES and self.on_finished:
+            try:
+                await self.on_finished(result)
+            except Exception as e:
+                logger.error(f"Error in ingestion completion handler for job {job_id}: {e}")
+
+
+# --------------------------------------------------
+# サービス
+# --------------------------------------------------
+def _to_progress(job: Dict[str, Any]) -> JobProgress:
+    return JobProgress(
+        job_id=job["_id"],
+        document_id=job["document_id"],
+        filename=job["filename"],
+        status=job["status"],
+        stage=job["stage"],
+        progress=job["progress"],
+        bytes_per_second=job["bytes_per_second"],
+        attempts=job["attempts"],
+        error=job["error"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"],
+    )
+
+
+def _to_summary(document: Dict[str, Any]) -> DocumentSummary:
+    return DocumentSummary(
+        id=document["_id"],
+        name=document["name"],
+        type=document["type"],
+        size=document["size"],
+        confidentiality=document["confidentiality"],
+        tags=document["tags"],
+        description=document["description"],
+        uploaded_by=document["uploaded_by"],
+        uploaded_at=document["uploaded_at"],
+        status=document["status"],
+        job_id=document.get("job_id"),
+    )
+
+
+def _to_upload_session(session: Dict[str, Any], offset: int) -> UploadSession:
+    return UploadSession(
+        upload_id=session["_id"],
+        filename=session["filename"],
+        size=session["size"],
+        offset=offset,
+        part_size=UPLOAD_PART_SIZE,
+        expires_at=session["expires_at"],
+        result=session["result"],
+    )
+
+
+def _write_and_hash(writer: EncryptedWriter, hasher, data: bytes):
+    hasher.update(data)
+    writer.write(data)
+
+
+class UploadOffsetConflict(Exception):
+    """パートの開始位置が受信済みのバイト数と一致しない"""
+
+    def __init__(self, offset: int):
+        super().__init__(f"upload offset is {offset}")
+        self.offset = offset
+
+
+class UploadSizeExceeded(Exception):
+    """宣言したファイルサイズを超えるデータを受信した"""
+
+    def __init__(self, size: int):
+        super().__init__("宣言したファイルサイズを超えるデータを受信しました")
+        self.size = size
+
+
+class _OpenUpload:
+    """書き込み中の分割アップロード（暗号化ファイル・暗号化の状態・ハッシュの途中経過）"""
+
+    def __init__(self, file: BinaryIO, writer: EncryptedWriter, hasher):
+        self.file = file
+        self.writer = writer
+        self.hasher = hasher
+        self.lock = asyncio.Lock()
+
+    @property
+    def offset(self) -> int:
+        return self.writer.bytes_written
+
+
+class DocumentService:
+    """ドキュメントのアップロード受付とインジェストジョブの管理"""
+
+    def __init__(
+        self,
+        queue: IngestionQueue,
+        documents,
+        uploads,
+        storage_dir: Optional[str] = None,
+        key_ring: Optional[KeyRing] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            queue: インジェストキュー
+            documents: ドキュメントメタデータのストア
+            uploads: 分割アップロードのセッションのストア
+            storage_dir: 暗号化ドキュメントの保存先
+            key_ring: 暗号化に使うキーリング（省略時は環境変数から読み込む）
+        """
+        self.queue = queue
+        self.documents = documents
+        self.uploads = uploads
+        self.storage_dir = Path(storage_dir or os.path.join(settings.data_dir, "documents"))
+        self.key_ring = key_ring or KeyRing.from_env()
+        self._open_uploads: "OrderedDict[str, _OpenUpload]" = OrderedDict()
+
+    async def ensure_indexes(self):
+        await self.queue.store.ensure_indexes()
+        await self.documents.ensure_indexes()
+        await self.uploads.ensure_indexes()
+
+    async def _store_encrypted(self, file, path: Path) -> Tuple[int, str]:
+        """アップロードされたファイルを1MBずつ読みながら暗号化して保存し、平文のハッシュを計算する"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(path, "wb") as dst:
+                writer = EncryptedWriter(dst, self.key_ring)
+                while True:
+                    block = await file.read(UPLOAD_READ_SIZE)
+                    if not block:
+                        break
+                    size += len(block)
+                    if size > settings.max_upload_size:
+                        raise ValueError(f"ファイルサイズが上限（{settings.max_upload_size} バイト）を超えています")
+                    await asyncio.to_thread(_write_and_hash, writer, hasher, block)
+                await asyncio.to_thread(writer.close)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        return size, hasher.hexdigest()
+
+    @staticmethod
+    def _validate_filename(filename: str) -> str:
+        suffix = Path(filename).suffix.lower()
+        if suffix not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"未対応のファイル形式です: {suffix}")
+        return suffix
+
+    async def upload(
+        self,
+        file,
+        filename: str,
+        metadata: Dict[str, Any],
+        user: User,
+        priority: int = JobPriority.NORMAL,
+    ) -> UploadResponse:
+        """
+        ドキュメントを保存してインジェストジョブを登録
+
+        Args:
+            file: 非同期の read(size) を持つアップロードファイル
+            filename: 元のファイル名
+            metadata: confidentiality, tags, description, groups
+            user: アップロードしたユーザー
+            priority: ジョブの優先度
+
+        Returns:
+            ドキュメントIDとジョブID
+
+        Raises:
+            ValueError: 未対応の形式、またはサイズ上限を超えた場合
+        """
+        self._validate_filename(filename)
+        document_id = uuid.uuid4().hex
+        path = self.storage_dir / f"{document_id}.enc"
+        size, content_hash = await self._store_encrypted(file, path)
+        return await self._register(document_id, filename, path, size, content_hash, metadata, user, priority)
+
+    async def _register(
+        self,
+        document_id: str,
+        filename: str,
+        path: Path,
+        size: int,
+        content_hash: str,
+        metadata: Dict[str, Any],
+        user: User,
+        priority: int,
+    ) -> UploadResponse:
+        """保存済みのファイルをドキュメントとして登録し、ジョブを投入する（同じ内容の登録済みドキュメントがあればそれを返す）"""
+        existing = await self.documents.find_by_hash(content_hash, user.username)
+        if existing is not None:
+            path.unlink(missing_ok=True)
+            job = await self.queue.get(existing["job_id"]) if existing.get("job_id") else None
+            logger.info(f"Upload of {filename} is a duplicate of document {existing['_id']}")
+            return UploadResponse(
+                document_id=existing["_id"],
+                job_id=existing.get("job_id") or "",
+                status=job["status"] if job else JobStatus.SUCCEEDED,
+                duplicate=True,
+            )
+
+        name_normalized = normalize_search_text(filename)
+        await self.documents.insert({
+            "_id": document_id,
+            "name": filename,
+            "name_normalized": name_normalized,
+            "name_ngrams": char_bigrams(name_normalized),
+            "type": DOCUMENT_TYPES[Path(filename).suffix.lower()],
+            "size": size,
+            "content_hash": content_hash,
+            "confidentiality": metadata.get("confidentiality", 1),
+            "tags": metadata.get("tags", []),
+            "description": metadata.get("description", ""),
+            "groups": metadata.get("groups", []),
+            "uploaded_by": user.username,
+            "uploaded_at": _now(),
+            "storage_path": str(path),
+            "status": DocumentStatus.PROCESSING.value,
+            "job_id": None,
+        })
+        job = await self.queue.enqueue(document_id, filename, str(path), size, metadata, user.username, priority)
+        await self.documents.update(document_id, {"job_id": job["_id"]})
+        logger.info(f"Document {document_id} ({filename}, {size} bytes) queued as job {job['_id']}")
+        return UploadResponse(document_id=document_id, job_id=job["_id"], status=JobStatus.QUEUED)
+
+    # ---- 分割アップロード ----
+
+    async def create_upload(self, request: UploadSessionCreate, user: User) -> UploadSession:
+        """
+        分割アップロードを開始
+
+        Args:
+            request: ファイル名・サイズ・メタデータ
+            user: アップロードするユーザー
+
+        Returns:
+            アップロードセッション（offset=0）
+
+        Raises:
+            ValueError: 未対応の形式、またはサイズ上限を超える場合
+        """
+        self._validate_filename(request.filename)
+        if request.size > settings.max_upload_size:
+            raise ValueError(f"ファイルサイズが上限（{settings.max_upload_size} バイト）を超えています")
+
+        document_id = uuid.uuid4().hex
+        part_path = self.storage_dir / f"{document_id}.enc.part"
+        part_path.parent.mkdir(parents=True, exist_ok=True)
+        now = _now()
+        session = {
+            "_id": uuid.uuid4().hex,
+            "document_id": document_id,
+            "filename": request.filename,
+            "size": request.size,
+            "metadata": {
+                "confidentiality": request.confidentiality,
+                "tags": request.tags,
+                "description": request.description,
+                "groups": request.groups,
+            },
+            "priority": int(request.priority),
+            "uploaded_by": user.username,
+            "part_path": str(part_path),
+            "offset": 0,
+            "result": None,
+            "created_at": now,
+            "expires_at": now + UPLOAD_SESSION_TTL,
+        }
+
+        def create_file() -> _OpenUpload:
+            file = open(part_path, "w+b")
+            return _OpenUpload(file, EncryptedWriter(file, self.key_ring), hashlib.sha256())
+
+        self._cache_upload(session["_id"], await asyncio.to_thread(create_file))
+        await self.uploads.insert(session)
+        return _to_upload_session(session, 0)
+
+    def _cache_upload(self, upload_id: str, state: "_OpenUpload"):
+        self._open_uploads[upload_id] = state
+        self._open_uploads.move_to_end(upload_id)
+        # 使われていないものから閉じる（閉じたものは次のパートで暗号化ファイルから再開できる）
+        for idle_id in list(self._open_uploads):
+            if len(self._open_uploads) <= MAX_OPEN_UPLOADS:
+                break
+            if not self._open_uploads[idle_id].lock.locked():
+                self._open_uploads.pop(idle_id).file.close()
+
+    def _drop_upload(self, upload_id: str):
+        state = self._open_uploads.pop(upload_id, None)
+        if state is not None and not state.file.closed:
+            state.file.close()
+
+    async def _open_upload(self, session: Dict[str, Any]) -> "_OpenUpload":
+        """書き込み中の状態を取得（なければ暗号化ファイルの末尾から再開する）"""
+        upload_id = session["_id"]
+        state = self._open_uploads.get(upload_id)
+        # 書き込み中のものは、保存済みの受信位置より先に進んでいるので手元の状態が正しい
+        if state is not None and (state.lock.locked() or state.offset == session["offset"]):
+            self._open_uploads.move_to_end(upload_id)
+            return state
+        # 別プロセスで書き進められた、またはプロセスが再起動した場合はファイルから再開する
+        self._drop_upload(upload_id)
+
+        def resume() -> _OpenUpload:
+            file = open(session["part_path"], "r+b")
+            hasher = hashlib.sha256()
+            try:
+                writer = EncryptedWriter.resume(file, self.key_ring, hasher)
+            except BaseException:
+                file.close()
+                raise
+            return _OpenUpload(file, writer, hasher)
+
+        state = await asyncio.to_thread(resume)
+        logger.info(f"Resumed upload {upload_id} at offset {state.offset}")
+        self._cache_upload(upload_id, state)
+        return state
+
+    async def _get_own_upload(self, upload_id: str, user: User) -> Optional[Dict[str, Any]]:
+        session = await self.uploads.get(upload_id)
+        if session is None or session["uploaded_by"] != user.username:
+            return None
+        return session
+
+    async def get_upload(self, upload_id: str, user: User) -> Optional[UploadSession]:
+        """分割アップロードの状態（再開位置）を取得"""
+        session = await self._get_own_upload(upload_id, user)
+        if session is None:
+            return None
+        if session["result"] is not None:
+            return _to_upload_session(session, session["size"])
+        state = await self._open_upload(session)
+        return _to_upload_session(session, state.offset)
+
+    async def write_upload_part(
+        self, upload_id: str, offset: int, chunks: AsyncIterator[bytes], user: User
+    ) -> Optional[UploadSession]:
+        """
+        パートを受信して暗号化ファイルへ追記
+
+        受信したデータは最大1MBずつまとめて暗号化・ハッシュ計算するため、ファイルサイズに関わらず
+        メモリ使用量は一定。接続が途中で切れても受信済みの分は保存され、次のパートはその位置から送れる。
+        全体を受信するとドキュメントを登録してジョブを投入する
+
+        Args:
+            upload_id: アップロードID
+            offset: パートの開始位置（現在の受信済みバイト数と一致する必要がある）
+            chunks: パートの本文
+            user: アップロードしたユーザー
+
+        Returns:
+            更新後のセッション（存在しない場合は None）
+
+        Raises:
+            UploadOffsetConflict: 開始位置が一致しない、または同じアップロードに並行して書き込んだ場合
+            UploadSizeExceeded: 宣言したサイズを超えるデータを受信した場合
+        """
+        session = await self._get_own_upload(upload_id, user)
+        if session is None:
+            return None
+        if session["result"] is not None:
+            return _to_upload_session(session, session["size"])
+
+        state = await self._open_upload(session)
+        if state.lock.locked() or offset != state.offset:
+            raise UploadOffsetConflict(state.offset)
+
+        async with state.lock:
+            buffer = bytearray()
+            try:
+                async for chunk in chunks:
+                    if state.offset + len(buffer) + len(chunk) > session["size"]:
+                        raise UploadSizeExceeded(session["size"])
+                    buffer += chunk
+                    if len(buffer) >= UPLOAD_READ_SIZE:
+                        await asyncio.to_thread(_write_and_hash, state.writer, state.hasher, bytes(buffer))
+                        buffer.clear()
+                        # 他のプロセスから参照しても古い受信位置にならないよう、書き込むたびに記録する
+                        await self.uploads.update(upload_id, {"offset": state.offset})
+            finally:
+                # 接続が切れた場合も受信済みの分は書き込んでおき、続きから再開できるようにする
+                if buffer:
+                    await asyncio.shield(
+                        asyncio.to_thread(_write_and_hash, state.writer, state.hasher, bytes(buffer))
+                    )
+                await asyncio.shield(self.uploads.update(upload_id, {"offset": state.offset}))
+
+            if state.offset == session["size"]:
+                return await self._complete_upload(session, state)
+        session["offset"] = state.offset
+        return _to_upload_session(session, state.offset)
+
+    async def _complete_upload(self, session: Dict[str, Any], state: "_OpenUpload") -> UploadSession:
+        def finish():
+            state.writer.close()
+            state.file.flush()
+            os.fsync(state.file.fileno())
+            state.file.close()
+
+        await asyncio.to_thread(finish)
+        self._open_uploads.pop(session["_id"], None)
+        path = Path(session["part_path"]).with_suffix("")
+        os.replace(session["part_path"], path)
+
+        user = User(username=session["uploaded_by"])
+        result = await self._register(
+            session["document_id"],
+            session["filename"],
+            path,
+            session["size"],
+            state.hasher.hexdigest(),
+            session["metadata"],
+            user,
+            session["priority"],
+        )
+        session["result"] = result.model_dump(mode="json")
+        session["offset"] = session["size"]
+        await self.uploads.update(session["_id"], {"result": session["result"], "offset": session["size"]})
+        return _to_upload_session(session, session["size"])
+
+    async def abort_upload(self, upload_id: str, user: User) -> bool:
+        """分割アップロードを中止して受信済みのデータを削除"""
+        session = await self._get_own_upload(upload_id, user)
+        if session is None:
+            return False
+        state = self._open_uploads.get(upload_id)
+        if state is not None and state.lock.locked():
+            raise UploadOffsetConflict(state.offset)
+        self._drop_upload(upload_id)
+        if session["result"] is None:
+            Path(session["part_path"]).unlink(missing_ok=True)
+        await self.uploads.delete(upload_id)
+        return True
+
+    # ---- 一覧 ----
+
+    async def catalogue_etag(self, user: User, params: Dict[str, Any]) -> str:
+        """
+        一覧のETagを求める
+
+        ドキュメントの追加・更新のたびに進むバージョンと、ユーザーの参照範囲・検索条件から作るため、
+        一覧そのものを検索せずに変更の有無を判定できる
+        """
+        version = await self.documents.version()
+        key = json.dumps(
+            [version, user.username, user.role, sorted(user.groups), sorted(params.items())],
+            default=str,
+        )
+        return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+    async def list_documents(
+        self,
+        user: User,
+        name: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        confidentiality: Optional[int] = None,
+        uploaded_by: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> DocumentPage:
+        """
+        参照できるドキュメントをアップロード日時の新しい順に1ページ取得
+
+        先頭ページ（cursor なし）では件数と絞り込み項目ごとの件数も同じクエリで集計する
+
+        Args:
+            user: ユーザー
+            name: ファイル名に含まれる文字列
+            doc_type: 種類
+            confidentiality: 機密レベル
+            uploaded_by: アップロードしたユーザー
+            cursor: 前のページの next_cursor
+            limit: 件数
+
+        Returns:
+            ドキュメントの1ページ
+
+        Raises:
+            ValueError: カーソルが不正な場合
+        """
+        after = decode_cursor(cursor) if cursor else None
+        # 1件多く取得して次のページの有無を判定する
+        query = CatalogueQuery(user, name, doc_type, confidentiality, uploaded_by, after, limit + 1)
+        documents, facets, total = await self.documents.find_page(query, with_facets=after is None)
+
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = encode_cursor(documents[-1]["uploaded_at"], documents[-1]["_id"])
+        return DocumentPage(
+            items=[_to_summary(document) for document in documents],
+            next_cursor=next_cursor,
+            total=total,
+            facets=facets,
+        )
+
+    @staticmethod
+    def _visible(job: Optional[Dict[str, Any]], user: User) -> bool:
+        return job is not None and (user.is_admin or job["uploaded_by"] == user.username)
+
+    async def get_progress(self, job_id: str, user: User) -> Optional[JobProgress]:
+        """ジョブの進捗を取得（本人または管理者のみ）"""
+        job = await self.queue.get(job_id)
+        return _to_progress(job) if self._visible(job, user) else None
+
+    async def list_progress(self, job_ids: List[str], user: User) -> List[JobProgress]:
+        """複数ジョブの進捗を一括取得（ドキュメント一覧のポーリング用）"""
+        jobs = await self.queue.get_many(job_ids)
+        return [_to_progress(job) for job in jobs if self._visible(job, user)]
+
+    async def cancel(self, job_id: str, user: User) -> Optional[JobProgress]:
+        """ジョブをキャンセル（本人または管理者のみ）"""
+        job = await self.queue.get(job_id)
+        if not self._visible(job, user):
+            return None
+        job = await self.queue.cancel(job_id)
+        if job and job["status"] == JobStatus.CANCELLED.value:
+            await self.on_job_finished(job)
+        return _to_progress(job)
+
+    async def on_job_finished(self, job: Dict[str, Any]):
+        """ジョブの最終状態をドキュメントの状態に反映する"""
+        status = {
+            JobStatus.SUCCEEDED.value: DocumentStatus.INDEXED,
+            JobStatus.FAILED.value: DocumentStatus.FAILED,
+            JobStatus.CANCELLED.value: DocumentStatus.CANCELLED,
+        }[job["status"]]
+        await self.documents.update(job["document_id"], {"status": status.value})
+
+
+def create_document_service() -> DocumentService:
+    """設定に応じたストアでサービスを作成"""
+    if use_in_memory_store():
+        return DocumentService(IngestionQueue(InMemoryJobStore()), InMemoryDocumentStore(), InMemoryUploadStore())
+    database = get_database()
+    return DocumentService(
+        IngestionQueue(MongoJobStore(database)), MongoDocumentStore(database), MongoUploadStore(database)
+    )
+
+
+_service: Optional[DocumentService] = None
+
+
+def get_document_service() -> DocumentService:
+    """共有のサービスを取得（FastAPI の依存関係としても使う）"""
+    global _service
+    if _service is None:
+        _service = create_document_service()
+    return _service
+
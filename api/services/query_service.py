@@ -0,0 +1,463 @@
+"""
+質問応答サービス
+
+権限を考慮した検索で根拠となるチャンクを集めてLLMで回答を生成し、質問と回答を履歴として保存する。
+履歴は (ユーザー, 作成日時) の複合インデックスと質問文の文字バイグラムの索引で検索でき、
+キーセット（カーソル）方式のページングで履歴の総量に関わらず1ページのコストが一定になる
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from rag_engine.metrics import QUERY_STAGE_SECONDS
+from rag_engine.tracing import span, start_trace
+
+from core.config import settings
+from core.search import MAX_SEARCH_NGRAMS, char_bigrams, decode_cursor, encode_cursor, normalize_search_text
+from dependencies.db import get_database, use_in_memory_store
+from models.query import ContextChunk, HistoryItem, HistoryPage, QueryResponse, QueryTrace, SpanTiming
+from models.user import User
+
+if TYPE_CHECKING:
+    # 埋め込み・検索・LLM のモジュールは numpy などを読み込むため、起動時ではなく
+    # ウォームアップ（または最初の質問）で読み込む
+    from rag_engine.llm.router import LLMRouter
+    from rag_engine.retriever.hybrid_search import HybridSearcher
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class HistoryQuery:
+    """履歴の検索条件"""
+
+    def __init__(
+        self,
+        user: str,
+        search: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+        limit: int = 20,
+    ):
+        """
+        初期化
+
+        Args:
+            user: ユーザー名
+            search: 質問文に含まれる文字列
+            start: 作成日時の下限（含む）
+            end: 作成日時の上限（含まない）
+            after: 前のページの最後の (作成日時, ID)
+            limit: 件数
+        """
+        self.user = user
+        self.search = normalize_search_text(search) if search else ""
+        self.start = start
+        self.end = end
+        self.after = after
+        self.limit = limit
+
+    def matches(self, entry: Dict[str, Any]) -> bool:
+        """メモリ上のストア用の判定（Mongo のクエリと同じ条件）"""
+        if entry["user"] != self.user:
+            return False
+        if self.search and self.search not in entry["query_normalized"]:
+            return False
+        if self.start and entry["created_at"] < self.start:
+            return False
+        if self.end and entry["created_at"] >= self.end:
+            return False
+        if self.after and (entry["created_at"], entry["_id"]) >= self.after:
+            return False
+        return True
+
+    def to_mongo(self) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"user": self.user}
+        if self.search:
+            ngrams = char_bigrams(self.search)
+            if ngrams:
+                # バイグラムの索引で候補を絞り、連続して含むかは正規表現で確認する
+                query["query_ngrams"] = {"$all": ngrams[:MAX_SEARCH_NGRAMS]}
+            query["query_normalized"] = {"$regex": re.escape(self.search)}
+        created_at: Dict[str, Any] = {}
+        if self.start:
+            created_at["$gte"] = self.start
+        if self.end:
+            created_at["$lt"] = self.end
+        if created_at:
+            query["created_at"] = created_at
+        if self.after:
+            after_time, after_id = self.after
+            query["$or"] = [
+                {"created_at": {"$lt": after_time}},
+                {"created_at": after_time, "_id": {"$lt": after_id}},
+            ]
+        return query
+
+
+class InMemoryHistoryStore:
+    """履歴ストアのメモリ上の実装（テスト・開発用）"""
+
+    def __init__(self):
+        self._entries: List[Dict[str, Any]] = []
+
+    async def ensure_indexes(self):
+        pass
+
+    async def insert(self, entry: Dict[str, Any]):
+        self._entries.append(dict(entry))
+
+    async def find(self, query: HistoryQuery) -> List[Dict[str, Any]]:
+        matched = [entry for entry in self._entries if query.matches(entry)]
+        matched.sort(key=lambda entry: (entry["created_at"], entry["_id"]), reverse=True)
+        return matched[:query.limit]
+
+
+class MongoHistoryStore:
+    """履歴ストアの MongoDB 実装"""
+
+    def __init__(self, database):
+        self.collection = database["query_history"]
+
+    async def ensure_indexes(self):
+        await self.collection.create_index([("user", 1), ("created_at", -1), ("_id", -1)])
+        await self.collection.create_index([("user", 1), ("query_ngrams", 1), ("created_at", -1)])
+
+    async def insert(self, entry: Dict[str, Any]):
+        await self.collection.insert_one(entry)
+
+    async def find(self, query: HistoryQuery) -> List[Dict[str, Any]]:
+        cursor = (
+            self.collection.find(query.to_mongo(), projection={"query_ngrams": False, "query_normalized": False})
+            .sort([("created_at", -1), ("_id", -1)])
+            .limit(query.limit)
+        )
+        return await cursor.to_list(length=query.limit)
+
+
+def _to_history_item(entry: Dict[str, Any]) -> HistoryItem:
+    return HistoryItem(
+        id=entry["_id"],
+        query=entry["query"],
+        answer=entry["answer"],
+        documents=entry["documents"],
+        provider=entry.get("provider"),
+        created_at=entry["created_at"],
+    )
+
+
+def _citation(filename: str, page: Optional[int]) -> str:
+    return f"{filename} p.{page}" if page else filename
+
+
+def _source_citations(chunk) -> List[str]:
+    """重複として代表チャンクにまとめられた、ほかのドキュメント（版）の引用"""
+    return list(dict.fromkeys(_citation(source["filename"], source.get("page")) for source in chunk.sources))
+
+
+def _cited_documents(chunks: list) -> List[str]:
+    """回答の根拠になったドキュメント名（代表チャンクにまとめられた版も含む）"""
+    return list(dict.fromkeys(
+        name for chunk in chunks for name in [chunk.filename, *(source["filename"] for source in chunk.sources)]
+    ))
+
+
+def _context_chunks(chunks: list) -> List[ContextChunk]:
+    return [
+        ContextChunk(
+            document=chunk.filename,
+            page=chunk.page,
+            text=chunk.text,
+            score=chunk.score,
+            sources=_source_citations(chunk),
+        )
+        for chunk in chunks
+    ]
+
+
+def _query_trace(root) -> QueryTrace:
+    return QueryTrace(
+        trace_id=root.trace.trace_id,
+        spans=[SpanTiming(**row) for row in root.trace.breakdown()],
+    )
+
+
+class QueryService:
+    """質問応答と履歴の管理"""
+
+    def __init__(
+        self,
+        history,
+        searcher: Optional["HybridSearcher"] = None,
+        llm_router: Optional["LLMRouter"] = None,
+        top_k: int = 5,
+    ):
+        """
+        初期化
+
+        Args:
+            history: 履歴ストア（MongoHistoryStore または InMemoryHistoryStore）
+            searcher: 検索エンジン（省略時は初回の質問で共有のものを使う）
+            llm_router: LLMルーター（省略時は初回の質問で作成）
+            top_k: 回答に使うチャンク数
+        """
+        self.history_store = history
+        self._searcher = searcher
+        self._llm_router = llm_router
+        self._table_qa = None
+        self.top_k = top_k
+
+    @property
+    def searcher(self) -> "HybridSearcher":
+        if self._searcher is None:
+            from rag_engine.retriever.hybrid_search import get_searcher
+
+            self._searcher = get_searcher()
+        return self._searcher
+
+    @property
+    def llm_router(self) -> "LLMRouter":
+        if self._llm_router is None:
+            from rag_engine.llm.router import LLMRouter
+
+            self._llm_router = LLMRouter()
+        return self._llm_router
+
+    def components(self) -> Tuple[Optional["HybridSearcher"], Optional["LLMRouter"]]:
+        """作成済みの検索エンジンとLLMルーター（メトリクスの収集用。未作成なら None）"""
+        return self._searcher, self._llm_router
+
+    async def ensure_indexes(self):
+        await self.history_store.ensure_indexes()
+
+    async def warm_up(self):
+        """
+        検索とLLMの準備（モジュールの読み込み、埋め込みモデル・権限索引の読み込み、初回の推論）
+
+        最初の質問でこれらの待ち時間が発生しないよう、起動直後にバックグラウンドで実行する
+
+        Raises:
+            Exception: 準備に失敗した場合（呼び出し側で再試行する）
+        """
+        searcher = await asyncio.to_thread(lambda: self.searcher)
+        await asyncio.to_thread(lambda: searcher.permission_index)
+        await asyncio.to_thread(searcher.embedding_model.embed_query, "warm up")
+        await asyncio.to_thread(lambda: searcher.vector_store.client)
+        await asyncio.to_thread(lambda: searcher.section_store.client)
+        await asyncio.to_thread(lambda: self.llm_router)
+
+    async def _retrieve(self, query: str, user: User) -> Tuple[list, str, str]:
+        """
+        回答の根拠になるチャンクを検索
+
+        Returns:
+            (チャンク, LLMに渡すコンテキスト, LLMプロバイダー)
+        """
+        from rag_engine.llm.router import LLMProvider
+        from rag_engine.security.content_filter import AccessContext
+
+        provider = str(self.llm_router.get_active_provider() or LLMProvider.LOCAL.value)
+        context = AccessContext(role=user.role, groups=frozenset(user.groups))
+        with span("retrieve", top_k=self.top_k), QUERY_STAGE_SECONDS.time(stage="retrieve"):
+            chunks = await self.searcher.search(query, context, provider, limit=self.top_k)
+
+        # 表の要約が検索された場合は、表に SQL を実行した結果を要約の後ろに付ける
+        # （要約のチャンクは権限の判定を通っているため、同じドキュメントの表を参照してよい）
+        table_results = await self._query_tables(query, chunks) if settings.table_qa_enabled else {}
+
+        context_text = "\n\n".join(
+            f"[{', '.join([_citation(chunk.filename, chunk.page), *_source_citations(chunk)])}]\n{chunk.text}"
+            + (f"\n\n{table_results[chunk.chunk_id]}" if chunk.chunk_id in table_results else "")
+            for chunk in chunks
+        )
+        return chunks, context_text, provider
+
+    async def _query_tables(self, query: str, chunks: list) -> Dict[str, str]:
+        """
+        表の要約チャンクのドキュメントに SQL で問い合わせる
+
+        Returns:
+            チャンクID → 実行した SQL と結果
+        """
+        # ドキュメントごとに最も順位の高い要約チャンクだけを使う
+        first: Dict[str, Any] = {}
+        for chunk in chunks:
+            if getattr(chunk, "table", None) and chunk.doc_id not in first:
+                first[chunk.doc_id] = chunk
+        table_chunks = list(first.values())[:settings.table_qa_max_tables]
+        if not table_chunks:
+            return {}
+
+        from rag_engine.retriever.table_qa import TableQuestionAnswerer
+
+        if self._table_qa is None:
+            self._table_qa = TableQuestionAnswerer()
+        answers = await asyncio.gather(
+            *(self._table_qa.answer_context(query, chunk.doc_id, self.llm_router) for chunk in table_chunks)
+        )
+        return {chunk.chunk_id: answer for chunk, answer in zip(table_chunks, answers) if answer}
+
+    async def answer(self, query: str, user: User, trace: bool = False) -> QueryResponse:
+        """
+        質問に回答して履歴に保存
+
+        Args:
+            query: 質問
+            user: 質問したユーザー
+            trace: 処理段階ごとの所要時間を応答に含める
+
+        Returns:
+            回答と根拠のチャンク
+        """
+        with start_trace("query", force=trace, user=user.username) as root, QUERY_STAGE_SECONDS.time(stage="total"):
+            chunks, context_text, provider = await self._retrieve(query, user)
+            with QUERY_STAGE_SECONDS.time(stage="llm"):
+                answer = await self.llm_router.generate_response(query, context_text)
+
+            documents = _cited_documents(chunks)
+            with span("history.record"), QUERY_STAGE_SECONDS.time(stage="history"):
+                history_id = await self.record(user, query, answer, documents, provider)
+
+        response = QueryResponse(answer=answer, context=_context_chunks(chunks), history_id=history_id)
+        if trace:
+            response.trace = _query_trace(root)
+        return response
+
+    async def answer_stream(self, query: str, user: User, trace: bool = False) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        質問に回答しながら、進み具合をイベントとして返す
+
+        検索が終わった時点で根拠のチャンク（"context"）を返し、続いて生成された回答の断片
+        （"token"）を順に返す。最後に履歴に保存して "done" を返す
+
+        Args:
+            query: 質問
+            user: 質問したユーザー
+            trace: 処理段階ごとの所要時間を "done" に含める
+
+        Yields:
+            (イベント名, データ)
+        """
+        with start_trace("query", force=trace, user=user.username, stream=True) as root, \
+                QUERY_STAGE_SECONDS.time(stage="total"):
+            chunks, context_text, provider = await self._retrieve(query, user)
+            yield "context", {"context": [chunk.model_dump() for chunk in _context_chunks(chunks)]}
+
+            parts: List[str] = []
+            with QUERY_STAGE_SECONDS.time(stage="llm"):
+                async for text in self.llm_router.stream_response(query, context_text):
+                    parts.append(text)
+                    yield "token", {"text": text}
+
+            documents = _cited_documents(chunks)
+            with span("history.record"), QUERY_STAGE_SECONDS.time(stage="history"):
+                history_id = await self.record(user, query, "".join(parts), documents, provider)
+
+        done: Dict[str, Any] = {"history_id": history_id, "documents": documents}
+        if trace:
+            done["trace"] = _query_trace(root).model_dump()
+        yield "done", done
+
+    async def record(self, user: User, query: str, answer: str, documents: List[str], provider: str) -> str:
+        """
+        質問と回答を履歴に保存
+
+        Returns:
+            履歴ID
+        """
+        normalized = normalize_search_text(query)
+        entry = {
+            "_id": uuid.uuid4().hex,
+            "user": user.username,
+            "query": query,
+            "query_normalized": normalized,
+            "query_ngrams": char_bigrams(normalized),
+            "answer": answer,
+            "documents": documents,
+            "provider": provider,
+            "created_at": _now(),
+        }
+        await self.history_store.insert(entry)
+        return entry["_id"]
+
+    async def history_etag(self, user: User, params: Dict[str, Any]) -> str:
+        """
+        履歴のページのETagを求める
+
+        履歴は追加されるだけなので、ユーザーの最新の履歴と検索条件から作る（インデックスで1件引くだけで済む）
+        """
+        latest = await self.history_store.find(HistoryQuery(user.username, limit=1))
+        version = [latest[0]["created_at"], latest[0]["_id"]] if latest else None
+        key = json.dumps([version, user.username, sorted(params.items())], default=str)
+        return '"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+    async def history(
+        self,
+        user: User,
+        search: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+    ) -> HistoryPage:
+        """
+        履歴を新しい順に1ページ取得
+
+        Args:
+            user: ユーザー
+            search: 質問文に含まれる文字列（全角・半角、大文字・小文字を区別しない）
+            date_from: この日以降（settings.timezone の日付）
+            date_to: この日まで（同上、当日を含む）
+            cursor: 前のページの next_cursor
+            limit: 件数
+
+        Returns:
+            履歴と次のページのカーソル
+
+        Raises:
+            ValueError: カーソルが不正な場合
+        """
+        tz = ZoneInfo(settings.timezone)
+        start = datetime.combine(date_from, time.min, tzinfo=tz) if date_from else None
+        end = datetime.combine(date_to + timedelta(days=1), time.min, tzinfo=tz) if date_to else None
+        after = decode_cursor(cursor) if cursor else None
+
+        # 1件多く取得して次のページの有無を判定する
+        query = HistoryQuery(user.username, search, start, end, after, limit + 1)
+        entries = await self.history_store.find(query)
+
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            last = entries[-1]
+            next_cursor = encode_cursor(last["created_at"], last["_id"])
+        return HistoryPage(items=[_to_history_item(entry) for entry in entries], next_cursor=next_cursor)
+
+
+def create_query_service() -> QueryService:
+    """設定に応じたストアでサービスを作成"""
+    if use_in_memory_store():
+        return QueryService(InMemoryHistoryStore())
+    return QueryService(MongoHistoryStore(get_database()))
+
+
+_service: Optional[QueryService] = None
+
+
+def get_query_service() -> QueryService:
+    """共有のサービスを取得（FastAPI の依存関係としても使う）"""
+    global _service
+    if _service is None:
+        _service = create_query_service()
+    return _service
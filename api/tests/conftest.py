@@ -0,0 +1,34 @@
+"""
+APIのテストの共通設定
+
+設定（core.config.settings）はインポート時に環境変数から読み込まれるため、テスト対象を
+インポートする前にメモリ上のストアと一時ディレクトリを使う設定にしておく
+"""
+
+import os
+import sys
+import tempfile
+
+_API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (_API_DIR, os.path.dirname(_API_DIR)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="secure-rag-test-")
+for name, value in {
+    "MONGODB_URL": "memory://",
+    "DATA_DIR": _DATA_DIR,
+    "ENCRYPTION_KEY": "test-encryption-key-0123456789abcdef",
+    "JWT_SECRET": "test-jwt-secret",
+    "BCRYPT_ROUNDS": "4",
+    "AUDIT_SINK": "file",
+    "AUDIT_LOG_DIR": os.path.join(_DATA_DIR, "logs", "audit"),
+    "WARMUP_ENABLED": "false",
+    "TRACE_LOG_DIR": os.path.join(_DATA_DIR, "logs"),
+    "DATA_KEY_STORE_PATH": os.path.join(_DATA_DIR, "keys", "data_keys.json"),
+    "TABLE_STORE_DIR": os.path.join(_DATA_DIR, "tables"),
+    "PERMISSION_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "permissions"),
+    "DEDUP_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "minhash"),
+    "PII_NAME_DICTIONARY": os.path.join(_DATA_DIR, "settings", "pii_names.txt"),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from core.config import settings
+from core.security import PasswordHasher, TokenCache
+from routers import admin
+from services.auth_service import AuthService, InMemoryUserStore, get_auth_service
+
+
+def _app(service):
+    app = FastAPI()
+    app.include_router(admin.router)
+    app.dependency_overrides[get_auth_service] = lambda: service
+    return app
+
+
+def _scrape(app, *tokens):
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [
+                await client.get("/metrics", headers={"Authorization": f"Bearer {token}"} if token else {})
+                for token in tokens
+            ]
+
+    return asyncio.run(scenario())
+
+
+def test_metrics_require_the_scrape_token(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "scrape-secret")
+    service = AuthService(InMemoryUserStore(), PasswordHasher(inline=True), TokenCache())
+
+    ok, wrong, missing = _scrape(_app(service), "scrape-secret", "guess", None)
+    assert ok.status_code == 200 and ok.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE rag_query_stage_seconds histogram" in ok.text
+    assert wrong.status_code == 401 and missing.status_code == 401
+
+
+def test_metrics_fall_back_to_admin_tokens(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_token", "")
+    service = AuthService(InMemoryUserStore(), PasswordHasher(inline=True), TokenCache())
+
+    async def tokens():
+        await service.create_user("root", "admin-password", role="admin")
+        await service.create_user("alice", "user-password")
+        return (
+            (await service.login("root", "admin-password")).access_token,
+            (await service.login("alice", "user-password")).access_token,
+        )
+
+    admin_token, user_token = asyncio.run(tokens())
+    ok, forbidden, missing = _scrape(_app(service), admin_token, user_token, None)
+    assert ok.status_code == 200
+    assert forbidden.status_code == 403
+    assert missing.status_code == 401
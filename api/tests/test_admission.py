@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+
+from core.admission import AdmissionController, Overloaded, Priority, request_priority
+
+
+def _controller(avg_latency: float, limit: int = 1, max_wait: float = 5.0) -> AdmissionController:
+    # 平均応答時間の初期値は目標の半分
+    return AdmissionController(
+        "test", initial_limit=limit, min_limit=limit, max_limit=limit,
+        target_latency=avg_latency * 2, max_queue=8, max_wait=max_wait,
+    )
+
+
+def test_rejects_immediately_when_predicted_wait_exceeds_max_wait():
+    controller = _controller(avg_latency=10.0)
+
+    async def scenario():
+        await controller.acquire()
+        start = time.monotonic()
+        with pytest.raises(Overloaded) as excinfo:
+            await controller.acquire()
+        return time.monotonic() - start, excinfo.value
+
+    elapsed, error = asyncio.run(scenario())
+    assert elapsed < 0.5
+    assert error.retry_after >= 1
+    assert controller.queued == 0
+
+
+def test_queues_when_slot_is_expected_in_time():
+    controller = _controller(avg_latency=0.5)
+
+    async def scenario():
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        controller.release(0.01)
+        await waiting
+        return controller.in_flight
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_lower_priority_waiters_do_not_count_towards_prediction():
+    controller = _controller(avg_latency=2.0, max_wait=5.0)
+
+    async def scenario():
+        await controller.acquire()
+        low = [asyncio.create_task(controller.acquire(Priority.LOW)) for _ in range(2)]
+        await asyncio.sleep(0)
+        # 3件目の LOW は前に2件いるので見込みが 6 秒になり断られる
+        with pytest.raises(Overloaded):
+            await controller.acquire(Priority.LOW)
+        assert controller.predicted_wait(Priority.HIGH) == pytest.approx(2.0)
+        high = asyncio.create_task(controller.acquire(Priority.HIGH))
+        await asyncio.sleep(0)
+        controller.release(0.01)
+        await high
+        for task in low:
+            task.cancel()
+        await asyncio.gather(*low, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_limit_grows_additively_and_backs_off_multiplicatively():
+    controller = AdmissionController("aimd", initial_limit=2, min_limit=1, max_limit=3, target_latency=1.0)
+
+    async def scenario():
+        for _ in range(4):
+            async with controller.admit():
+                pass
+        grown = controller.limit
+        with pytest.raises(RuntimeError):
+            async with controller.admit():
+                raise RuntimeError("llm down")
+        return grown, controller.limit
+
+    grown, backed_off = asyncio.run(scenario())
+    # 2 → 2.5 と増えた後は上限の半分も使っていないので増やさない
+    assert grown == pytest.approx(2.5)
+    assert backed_off == pytest.approx(2.25)
+
+
+def test_full_queue_evicts_lowest_priority_waiter():
+    controller = AdmissionController(
+        "evict", initial_limit=1, min_limit=1, max_limit=1, target_latency=0.2, max_queue=2, max_wait=5.0,
+    )
+
+    async def scenario():
+        await controller.acquire()
+        normal = asyncio.create_task(controller.acquire(Priority.NORMAL))
+        low = asyncio.create_task(controller.acquire(Priority.LOW))
+        await asyncio.sleep(0)
+        high = asyncio.create_task(controller.acquire(Priority.HIGH))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await low
+        # 待ち行列に同じか高い優先度しかいなければ新しいリクエストのほうを断る
+        with pytest.raises(Overloaded):
+            await controller.acquire(Priority.LOW)
+        controller.release(0.01)
+        await high
+        assert not normal.done()
+        controller.release(0.01)
+        await normal
+
+    asyncio.run(scenario())
+
+
+def test_request_priority_can_only_be_lowered():
+    assert request_priority(is_admin=True) == Priority.HIGH
+    assert request_priority(is_admin=False, requested="high") == Priority.NORMAL
+    assert request_priority(is_admin=True, requested="LOW") == Priority.LOW
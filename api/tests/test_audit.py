@@ -0,0 +1,140 @@
+import asyncio
+import gzip
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from core.logging import AuditLogger, AuditMiddleware, FileAuditSink, annotate
+
+
+def _app(audit: AuditLogger) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/history")
+    async def history(search: str = "", limit: int = 20):
+        annotate(user="alice", results=0)
+        return {"items": []}
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.add_middleware(AuditMiddleware, audit=audit)
+    return app
+
+
+def _events(directory):
+    events = []
+    for path in sorted(directory.glob("*.gz")):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            events.extend(json.loads(line) for line in f)
+    return events
+
+
+def test_audit_records_parameter_names_only(tmp_path):
+    audit = AuditLogger(sinks=[FileAuditSink(str(tmp_path))], flush_interval=0.01)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=_app(audit))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.get("/api/history", params={"search": "山田太郎 090-1234-5678", "limit": 5})
+            await client.get("/health")
+        await audit.stop()
+
+    asyncio.run(scenario())
+    events = _events(tmp_path)
+    assert len(events) == 1
+    event = events[0]
+    assert (event["action"], event["user"], event["status"], event["results"]) == ("GET /api/history", "alice", 200, 0)
+    assert event["query_params"] == ["search", "limit"]
+    assert "山田" not in json.dumps(event, ensure_ascii=False)
+
+
+class _Sink:
+    name = "memory"
+
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        self.failures = failures
+        self.delay = delay
+        self.batches = []
+
+    async def write(self, events):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("mongodb is down")
+        self.batches.append([event["action"] for event in events])
+
+    async def close(self):
+        pass
+
+
+def test_events_are_batched_and_flushed_on_stop():
+    sink = _Sink()
+    audit = AuditLogger(sinks=[sink], batch_size=3, flush_interval=60.0)
+
+    async def scenario():
+        for i in range(5):
+            await audit.record(f"GET /api/documents/{i}", user="alice")
+        await asyncio.sleep(0.01)
+        written = list(sink.batches)
+        await audit.stop()
+        # 停止後の記録は書き出せないので捨てる
+        await audit.record("GET /late")
+        return written
+
+    written = asyncio.run(scenario())
+    assert written == [["GET /api/documents/0", "GET /api/documents/1", "GET /api/documents/2"]]
+    assert sink.batches[1:] == [["GET /api/documents/3", "GET /api/documents/4"]]
+    assert audit.dropped == 1
+
+
+def test_drop_policy_counts_events_while_sink_is_slow():
+    sink = _Sink(delay=0.2)
+    audit = AuditLogger(sinks=[sink], max_queue=2, batch_size=1, flush_interval=0.01, full_policy="drop")
+
+    async def scenario():
+        for i in range(10):
+            await audit.record(f"GET /{i}")
+        await audit.stop()
+
+    asyncio.run(scenario())
+    # 記録は書き出しを待たないので、書き出しタスクが動く前にキューの2件を超えた分は捨てる
+    assert audit.dropped == 8
+    assert sink.batches == [["GET /0"], ["GET /1"]]
+
+
+def test_failed_sink_is_retried(monkeypatch):
+    sink = _Sink(failures=2)
+    audit = AuditLogger(sinks=[sink], flush_interval=0.01)
+    sleeps = []
+    real_sleep = asyncio.sleep
+
+    async def fast_sleep(delay):
+        sleeps.append(delay)
+        await real_sleep(0)
+
+    async def scenario():
+        await audit.record("POST /api/query")
+        await real_sleep(0.05)
+        await audit.stop()
+
+    monkeypatch.setattr(asyncio, "sleep", fast_sleep)
+    asyncio.run(scenario())
+    assert sink.batches == [["POST /api/query"]]
+    assert sleeps[:2] == [0.5, 1.0]
+
+
+def test_file_sink_rotates_when_file_is_full(tmp_path):
+    sink = FileAuditSink(str(tmp_path), rotate_bytes=1)
+
+    async def scenario():
+        await sink.write([{"action": "GET /1"}])
+        await sink.write([{"action": "GET /2"}])
+
+    asyncio.run(scenario())
+    names = sorted(path.name for path in tmp_path.glob("*.gz"))
+    assert [name[-12:] for name in names] == ["000.jsonl.gz", "001.jsonl.gz"]
+    assert [event["action"] for event in _events(tmp_path)] == ["GET /1", "GET /2"]
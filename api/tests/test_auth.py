@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+from jose import JWTError
+
+from core import security
+from core.config import settings
+from core.security import PasswordHasher, TokenCache, create_access_token
+from dependencies.auth import get_current_user
+from routers import auth as auth_router
+from services.auth_service import AuthService, InMemoryUserStore, get_auth_service
+
+
+def _services(store, count=2):
+    return [AuthService(store, PasswordHasher(inline=True), TokenCache()) for _ in range(count)]
+
+
+def test_login_and_logout():
+    service, = _services(InMemoryUserStore(), 1)
+
+    async def scenario():
+        await service.ensure_indexes()
+        await service.create_user("alice", "correct-password", groups=["sales"])
+        assert await service.login("alice", "wrong-password") is None
+        response = await service.login("alice", "correct-password")
+        user = await get_current_user(response.access_token, service)
+        await service.logout(response.access_token)
+        return user, response.access_token
+
+    user, token = asyncio.run(scenario())
+    assert (user.username, user.groups) == ("alice", ["sales"])
+    with pytest.raises(JWTError):
+        service.tokens.verify(token)
+
+
+def test_logout_on_another_instance_is_honoured(monkeypatch):
+    monkeypatch.setattr(settings, "token_revocation_refresh", 0.05)
+    store = InMemoryUserStore()
+    first, second = _services(store)
+
+    async def scenario():
+        for service in (first, second):
+            await service.ensure_indexes()
+        await first.create_user("alice", "correct-password")
+        token = (await first.login("alice", "correct-password")).access_token
+        # 2つ目のインスタンスでは検証済みのトークンとしてキャッシュされている
+        await get_current_user(token, second)
+        await first.logout(token)
+        await asyncio.sleep(0.1)
+        await get_current_user(token, second)
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 401
+
+
+def test_token_cache_skips_signature_check_for_known_tokens():
+    cache = TokenCache()
+    token = create_access_token({"sub": "alice"})
+
+    assert cache.verify(token)["sub"] == "alice"
+    assert cache.verify(token)["sub"] == "alice"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    header, payload, signature = token.split(".")
+    with pytest.raises(JWTError):
+        cache.verify(".".join([header, payload, signature[::-1]]))
+
+    cache.revoke(cache.verify(token)["jti"], time.time() + 60)
+    with pytest.raises(JWTError):
+        cache.verify(token)
+
+
+def test_login_rejected_with_503_when_hasher_is_saturated(monkeypatch):
+    service = AuthService(InMemoryUserStore(), PasswordHasher(workers=1, max_pending=1), TokenCache())
+    app = FastAPI()
+    app.include_router(auth_router.router, prefix="/api/auth")
+    app.dependency_overrides[get_auth_service] = lambda: service
+    release = threading.Event()
+
+    def slow_verify(password, hashed_password):
+        release.wait(5)
+        return True
+
+    async def scenario():
+        await service.create_user("alice", "correct-password")
+        monkeypatch.setattr(security.pwd_context, "verify", slow_verify)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            body = {"username": "alice", "password": "correct-password"}
+            first = asyncio.create_task(client.post("/api/auth/login", json=body))
+            while service.hasher.pending == 0:
+                await asyncio.sleep(0.001)
+            rejected = await client.post("/api/auth/login", json=body)
+            release.set()
+            return await first, rejected
+
+    try:
+        accepted, rejected = asyncio.run(scenario())
+    finally:
+        release.set()
+        service.hasher.shutdown()
+    assert accepted.status_code == 200
+    assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "1"
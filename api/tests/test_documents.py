@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi import FastAPI
+
+from core.search import char_bigrams, normalize_search_text
+from dependencies.auth import get_current_user
+from models.user import User
+from routers import documents
+from services.document_service import (
+    DocumentService,
+    IngestionQueue,
+    InMemoryDocumentStore,
+    InMemoryJobStore,
+    InMemoryUploadStore,
+)
+
+ALICE = User(username="alice", role="user", groups=["sales"])
+START = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def _service(tmp_path) -> DocumentService:
+    return DocumentService(
+        IngestionQueue(InMemoryJobStore()), InMemoryDocumentStore(), InMemoryUploadStore(), storage_dir=str(tmp_path)
+    )
+
+
+def _add(service, n, name, doc_type="PDF", confidentiality=1, uploaded_by="bob", groups=(), status="indexed"):
+    normalized = normalize_search_text(name)
+    asyncio.run(service.documents.insert({
+        "_id": f"doc{n:02d}",
+        "name": name,
+        "name_normalized": normalized,
+        "name_ngrams": char_bigrams(normalized),
+        "type": doc_type,
+        "size": 100,
+        "confidentiality": confidentiality,
+        "tags": [],
+        "description": "",
+        "groups": list(groups),
+        "uploaded_by": uploaded_by,
+        "uploaded_at": START + timedelta(hours=n),
+        "storage_path": "",
+        "status": status,
+        "job_id": None,
+    }))
+
+
+def _catalogue(tmp_path):
+    service = _service(tmp_path)
+    _add(service, 1, "就業規則.pdf")
+    _add(service, 2, "営業資料.docx", doc_type="Word", groups=["sales"])
+    _add(service, 3, "人事評価.xlsx", doc_type="Excel", groups=["hr"])
+    _add(service, 4, "役員会議事録.pdf", confidentiality=3)
+    _add(service, 5, "自分のMemo.txt", doc_type="Text", confidentiality=3, uploaded_by="alice")
+    _add(service, 6, "取り消し.pdf", status="cancelled")
+    return service
+
+
+def test_catalogue_lists_only_visible_documents(tmp_path):
+    service = _catalogue(tmp_path)
+    page = asyncio.run(service.list_documents(ALICE))
+
+    assert [item.id for item in page.items] == ["doc05", "doc02", "doc01"]
+    assert page.total == 3
+    assert page.facets.type[0].model_dump() == {"value": "PDF", "count": 1}
+    assert {facet.value: facet.count for facet in page.facets.uploaded_by} == {"bob": 2, "alice": 1}
+
+    admin = asyncio.run(service.list_documents(User(username="root", role="admin")))
+    assert admin.total == 5
+
+
+def test_catalogue_filters_and_pages(tmp_path):
+    service = _catalogue(tmp_path)
+    admin = User(username="root", role="admin")
+
+    assert [item.name for item in asyncio.run(service.list_documents(admin, name="ｍｅｍｏ")).items] == ["自分のMemo.txt"]
+    assert [item.name for item in asyncio.run(service.list_documents(admin, name="議事")).items] == ["役員会議事録.pdf"]
+    assert asyncio.run(service.list_documents(admin, doc_type="PDF", confidentiality=1)).total == 1
+
+    first = asyncio.run(service.list_documents(admin, limit=2))
+    second = asyncio.run(service.list_documents(admin, cursor=first.next_cursor, limit=2))
+    third = asyncio.run(service.list_documents(admin, cursor=second.next_cursor, limit=2))
+    ids = [item.id for page in (first, second, third) for item in page.items]
+    assert ids == ["doc05", "doc04", "doc03", "doc02", "doc01"]
+    assert third.next_cursor is None
+    # 件数と絞り込み項目の集計は先頭ページだけ
+    assert second.total is None and second.facets is None
+
+
+def test_catalogue_etag_returns_not_modified(tmp_path):
+    service = _catalogue(tmp_path)
+    app = FastAPI()
+    app.include_router(documents.router, prefix="/api/documents")
+    app.dependency_overrides[get_current_user] = lambda: ALICE
+    app.dependency_overrides[documents.get_document_service] = lambda: service
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get("/api/documents")
+            etag = first.headers["ETag"]
+            unchanged = await client.get("/api/documents", headers={"If-None-Match": etag})
+            other_filter = await client.get("/api/documents?type=PDF", headers={"If-None-Match": etag})
+            await service.documents.update("doc01", {"description": "改訂"})
+            changed = await client.get("/api/documents", headers={"If-None-Match": etag})
+            bad_cursor = await client.get("/api/documents?cursor=broken")
+        return first, unchanged, other_filter, changed, bad_cursor
+
+    first, unchanged, other_filter, changed, bad_cursor = asyncio.run(scenario())
+    assert first.status_code == 200 and first.json()["total"] == 3
+    assert unchanged.status_code == 304
+    assert other_filter.status_code == 200
+    assert changed.status_code == 200 and changed.headers["ETag"] != first.headers["ETag"]
+    assert bad_cursor.status_code == 400
@@ -0,0 +1,164 @@
+import asyncio
+import io
+
+from models.document import JobPriority, JobStatus
+from models.user import User
+from services import document_service
+from services.document_service import (
+    DocumentService,
+    IngestionQueue,
+    IngestionWorkerPool,
+    InMemoryDocumentStore,
+    InMemoryJobStore,
+    InMemoryUploadStore,
+)
+
+ALICE = User(username="alice")
+
+
+class UploadFile:
+    def __init__(self, data: bytes):
+        self._data = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self._data.read(size)
+
+
+def _service(tmp_path, max_attempts: int = 3) -> DocumentService:
+    return DocumentService(
+        IngestionQueue(InMemoryJobStore(), max_attempts=max_attempts),
+        InMemoryDocumentStore(),
+        InMemoryUploadStore(),
+        storage_dir=str(tmp_path),
+    )
+
+
+async def _wait_for(service: DocumentService, job_id: str, status: str):
+    for _ in range(500):
+        job = await service.queue.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} is {job['status']}, expected {status}")
+
+
+def test_jobs_are_claimed_by_priority(tmp_path):
+    queue = _service(tmp_path).queue
+
+    async def scenario():
+        for name, priority in (("low", JobPriority.LOW), ("normal", JobPriority.NORMAL), ("high", JobPriority.HIGH)):
+            await queue.enqueue(name, f"{name}.txt", "/dev/null", 1, {}, "alice", priority)
+        claimed = [await queue.claim("w") for _ in range(4)]
+        return [job and job["document_id"] for job in claimed]
+
+    assert asyncio.run(scenario()) == ["high", "normal", "low", None]
+
+
+def test_worker_pool_processes_uploaded_document(tmp_path):
+    service = _service(tmp_path)
+    reported = []
+
+    async def pipeline(job, progress):
+        for stage in ("parsing", "chunking", "embedding", "indexing"):
+            await progress(stage, 1.0)
+            reported.append((await service.queue.get(job["_id"]))["progress"])
+
+    async def scenario():
+        response = await service.upload(UploadFile(b"hello" * 100), "a.txt", {"confidentiality": 1}, ALICE)
+        assert response.status == JobStatus.QUEUED
+        pool = IngestionWorkerPool(service.queue, pipeline, concurrency=2, poll_interval=0.01,
+                                   on_finished=service.on_job_finished)
+        pool.start()
+        try:
+            await _wait_for(service, response.job_id, JobStatus.SUCCEEDED.value)
+        finally:
+            await pool.stop()
+        duplicate = await service.upload(UploadFile(b"hello" * 100), "copy.txt", {}, ALICE)
+        return (
+            response, duplicate,
+            await service.get_progress(response.job_id, ALICE),
+            await service.documents.get(response.document_id),
+        )
+
+    response, duplicate, progress, document = asyncio.run(scenario())
+    assert reported == [20.0, 25.0, 85.0, 100.0]
+    assert progress.progress == 100.0 and progress.attempts == 1
+    assert document["status"] == "indexed"
+    assert duplicate.duplicate and duplicate.document_id == response.document_id
+    # ほかのユーザーのジョブは見えない
+    assert asyncio.run(service.get_progress(response.job_id, User(username="bob"))) is None
+
+
+def test_failed_job_is_retried_then_marked_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_service, "RETRY_BASE_DELAY", 0.0)
+    service = _service(tmp_path, max_attempts=2)
+    attempts = []
+
+    async def pipeline(job, progress):
+        attempts.append(job["attempts"])
+        raise RuntimeError("parser crashed")
+
+    async def scenario():
+        response = await service.upload(UploadFile(b"data"), "a.txt", {}, ALICE)
+        pool = IngestionWorkerPool(service.queue, pipeline, poll_interval=0.01, on_finished=service.on_job_finished)
+        pool.start()
+        try:
+            job = await _wait_for(service, response.job_id, JobStatus.FAILED.value)
+        finally:
+            await pool.stop()
+        return job, await service.documents.get(response.document_id)
+
+    job, document = asyncio.run(scenario())
+    assert attempts == [1, 2]
+    assert job["error"] == "RuntimeError: parser crashed"
+    assert document["status"] == "failed"
+
+
+def test_cancel_running_job(tmp_path):
+    service = _service(tmp_path)
+    started = asyncio.Event()
+
+    async def pipeline(job, progress):
+        await progress("parsing", 0.0)
+        started.set()
+        while True:
+            await asyncio.sleep(0.01)
+            await progress("parsing", 1.0)
+
+    async def scenario():
+        response = await service.upload(UploadFile(b"data"), "a.txt", {}, ALICE)
+        pool = IngestionWorkerPool(service.queue, pipeline, poll_interval=0.01, on_finished=service.on_job_finished)
+        pool.start()
+        try:
+            await started.wait()
+            requested = await service.cancel(response.job_id, ALICE)
+            job = await _wait_for(service, response.job_id, JobStatus.CANCELLED.value)
+        finally:
+            await pool.stop()
+        return requested, job, await service.documents.get(response.document_id)
+
+    requested, job, document = asyncio.run(scenario())
+    assert requested.status == JobStatus.RUNNING
+    assert job["status"] == JobStatus.CANCELLED.value
+    assert document["status"] == "cancelled"
+
+
+def test_stopping_pool_requeues_running_job(tmp_path):
+    service = _service(tmp_path)
+    started = asyncio.Event()
+
+    async def pipeline(job, progress):
+        started.set()
+        await asyncio.Event().wait()
+
+    async def scenario():
+        response = await service.upload(UploadFile(b"data"), "a.txt", {}, ALICE)
+        pool = IngestionWorkerPool(service.queue, pipeline, poll_interval=0.01)
+        pool.start()
+        await started.wait()
+        await pool.stop()
+        return await service.queue.get(response.job_id)
+
+    job = asyncio.run(scenario())
+    assert job["status"] == JobStatus.QUEUED.value
+    assert job["attempts"] == 0
@@ -0,0 +1,103 @@
+import ast
+import asyncio
+import os
+import re
+import subprocess
+import sys
+
+import httpx
+
+import main
+from core.config import settings
+
+
+class _QueryService:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+
+    async def warm_up(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("qdrant is not up yet")
+
+
+def _get(*paths):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path) for path in paths]
+
+    return asyncio.run(scenario())
+
+
+def test_ready_reports_warming_until_warm_up_finishes(monkeypatch):
+    monkeypatch.setattr(settings, "warmup_retry_interval", 0.0)
+    service = _QueryService(failures=2)
+    monkeypatch.setattr(main, "get_query_service", lambda: service)
+    monkeypatch.setattr(main.app.state, "ready", False, raising=False)
+    monkeypatch.setattr(main.app.state, "warmup_attempts", 2, raising=False)
+    monkeypatch.setattr(main.app.state, "warmup_error", "qdrant is not up yet", raising=False)
+
+    health, warming = _get("/health", "/ready")
+    assert health.status_code == 200
+    assert warming.status_code == 503 and warming.headers["Retry-After"] == "1"
+    assert warming.json() == {"status": "warming", "attempts": 2, "error": "qdrant is not up yet"}
+
+    main.app.state.warmup_attempts = 0
+    asyncio.run(main.warm_up(main.app))
+    ready, = _get("/ready")
+    assert service.calls == 3 and main.app.state.warmup_attempts == 3
+    assert main.app.state.warmup_error is None
+    assert ready.status_code == 200 and ready.json() == {"status": "ready"}
+
+
+def test_startup_does_not_import_heavy_modules():
+    # 新しいプロセスで読み込み、ほかのテストが読み込んだモジュールの影響を受けないようにする
+    script = (
+        "import sys, main; "
+        "print(' '.join(m for m in sys.modules if m.split('.')[0] in ('numpy', 'torch', 'qdrant_client') "
+        "or m.startswith(('rag_engine.indexer', 'rag_engine.retriever', 'rag_engine.llm'))))"
+    )
+    api_dir = os.path.dirname(os.path.abspath(main.__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([api_dir, os.path.dirname(api_dir)]))
+    result = subprocess.run([sys.executable, "-c", script], cwd=api_dir, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
+
+
+# import 名とパッケージ名が異なるもの
+DISTRIBUTIONS = {"jose": "python-jose", "multipart": "python-multipart", "dotenv": "python-dotenv"}
+
+
+def test_api_requirements_cover_warm_up_imports():
+    # API のイメージは api/requirements.txt だけを入れるため、ウォームアップと質問の処理で読み込むモジュールが
+    # （関数内の遅延 import も含めて）使う外部パッケージは、すべてそこに含まれている必要がある
+    script = (
+        "import sys, main, services.query_service, rag_engine.retriever.hybrid_search, rag_engine.llm.router; "
+        "print('\\n'.join(m.__file__ for m in list(sys.modules.values()) if getattr(m, '__file__', None)))"
+    )
+    api_dir = os.path.dirname(os.path.abspath(main.__file__))
+    root = os.path.dirname(api_dir)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([api_dir, root]))
+    result = subprocess.run([sys.executable, "-c", script], cwd=api_dir, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    imported = set()
+    for path in result.stdout.split():
+        if not path.startswith(root + os.sep) or os.sep + "tests" + os.sep in path:
+            continue
+        with open(path, encoding="utf-8") as f:
+            for node in ast.walk(ast.parse(f.read())):
+                if isinstance(node, ast.Import):
+                    imported.update(alias.name.split(".")[0] for alias in node.names)
+                elif isinstance(node, ast.ImportFrom) and not node.level:
+                    imported.add(node.module.split(".")[0])
+    local = {name.split(".")[0] for name in os.listdir(api_dir)} | {"rag_engine", "parsers"}
+    third_party = imported - set(sys.stdlib_module_names) - local
+
+    with open(os.path.join(api_dir, "requirements.txt")) as f:
+        required = {re.split(r"[=<>\[]", line.strip())[0].lower() for line in f if line.strip()}
+    missing = {name for name in third_party if DISTRIBUTIONS.get(name, name.replace("_", "-")) not in required}
+    assert "sentence_transformers" in third_party
+    assert missing == set()
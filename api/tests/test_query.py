@@ -0,0 +1,190 @@
+import asyncio
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from dependencies.auth import get_current_user
+from models.user import User
+from rag_engine.retriever.hybrid_search import RetrievedChunk
+from rag_engine.tracing import current_trace
+from routers import query as query_router
+from services import query_service
+from services.query_service import HistoryQuery, InMemoryHistoryStore, QueryService, get_query_service
+
+
+class FakeSearcher:
+    async def search(self, query, context, provider, limit):
+        return [RetrievedChunk("c1", "d1", "規程.pdf", 3, None, "保管期間は30日", 0.9)]
+
+
+class FakeRouter:
+    def __init__(self):
+        self.closed = False
+
+    def get_active_provider(self):
+        return "local"
+
+    async def stream_response(self, query, context):
+        try:
+            for text in ("保管期間は", "30日です"):
+                yield text
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+
+def _service(router=None) -> QueryService:
+    return QueryService(InMemoryHistoryStore(), searcher=FakeSearcher(), llm_router=router or FakeRouter())
+
+
+def test_stream_query_events():
+    service = _service()
+
+    async def collect():
+        return [event async for event in service.answer_stream("保管期間は?", User(username="alice"), trace=True)]
+
+    events = asyncio.run(collect())
+    assert [name for name, _ in events] == ["context", "token", "token", "done"]
+    assert events[0][1]["context"][0]["document"] == "規程.pdf"
+    done = events[-1][1]
+    assert done["documents"] == ["規程.pdf"]
+    assert [span["name"] for span in done["trace"]["spans"]][:2] == ["query", "retrieve"]
+
+
+def test_abandoned_stream_closed_from_another_task():
+    router = FakeRouter()
+    service = _service(router)
+
+    async def scenario():
+        stream = service.answer_stream("保管期間は?", User(username="alice"), trace=True)
+
+        async def first_events():
+            return [await stream.__anext__(), await stream.__anext__()]
+
+        # レスポンスを送るタスクで読み始め、切断後にサーバーが別のタスクからジェネレーターを閉じる
+        received = await asyncio.create_task(first_events())
+        await stream.aclose()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [name for name, _ in received] == ["context", "token"]
+    assert router.closed
+    assert current_trace() is None
+
+
+def _record_at(service, monkeypatch, when, query, user="alice"):
+    monkeypatch.setattr(query_service, "_now", lambda: when)
+    return asyncio.run(service.record(User(username=user), query, "回答", [], "local"))
+
+
+def test_history_pages_with_cursor(monkeypatch):
+    service = _service()
+    same_time = datetime(2024, 5, 1, 3, 0, tzinfo=timezone.utc)
+    ids = [_record_at(service, monkeypatch, same_time + timedelta(minutes=n // 2), f"質問{n}") for n in range(5)]
+    _record_at(service, monkeypatch, same_time, "他人の質問", user="bob")
+    alice = User(username="alice")
+
+    seen, cursor = [], None
+    while True:
+        page = asyncio.run(service.history(alice, cursor=cursor, limit=2))
+        seen.extend(item.id for item in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    expected = sorted(zip([same_time + timedelta(minutes=n // 2) for n in range(5)], ids), reverse=True)
+    assert seen == [entry_id for _, entry_id in expected]
+    with pytest.raises(ValueError):
+        asyncio.run(service.history(alice, cursor="not-a-cursor"))
+
+
+def test_history_search_and_date_range(monkeypatch):
+    service = _service()
+    # 2024-05-01 16:00 UTC は日本時間では 5月2日
+    _record_at(service, monkeypatch, datetime(2024, 5, 1, 16, 0, tzinfo=timezone.utc), "ＶＰＮ の 設定方法")
+    _record_at(service, monkeypatch, datetime(2024, 5, 1, 14, 0, tzinfo=timezone.utc), "vpn 申請")
+    _record_at(service, monkeypatch, datetime(2024, 5, 3, 1, 0, tzinfo=timezone.utc), "経費精算")
+    alice = User(username="alice")
+
+    def queries(**params):
+        return [item.query for item in asyncio.run(service.history(alice, **params)).items]
+
+    assert queries(search="vpnの設定") == ["ＶＰＮ の 設定方法"]
+    assert queries(search="VPN") == ["ＶＰＮ の 設定方法", "vpn 申請"]
+    assert queries(date_from=date(2024, 5, 2), date_to=date(2024, 5, 2)) == ["ＶＰＮ の 設定方法"]
+    assert queries(date_from=date(2024, 5, 2)) == ["経費精算", "ＶＰＮ の 設定方法"]
+
+
+def test_history_query_uses_ngram_index_and_keyset():
+    after = (datetime(2024, 5, 1, tzinfo=timezone.utc), "abc")
+    query = HistoryQuery("alice", search="設定方法", after=after).to_mongo()
+
+    assert query["query_ngrams"] == {"$all": ["定方", "方法", "設定"]}
+    assert query["$or"] == [
+        {"created_at": {"$lt": after[0]}},
+        {"created_at": after[0], "_id": {"$lt": "abc"}},
+    ]
+
+
+def test_history_etag_changes_when_history_grows(monkeypatch):
+    service = _service()
+    alice = User(username="alice")
+    before = asyncio.run(service.history_etag(alice, {"limit": 20}))
+    _record_at(service, monkeypatch, datetime(2024, 5, 1, tzinfo=timezone.utc), "質問")
+    after = asyncio.run(service.history_etag(alice, {"limit": 20}))
+
+    assert before != after
+    assert asyncio.run(service.history_etag(alice, {"limit": 20})) == after
+    assert asyncio.run(service.history_etag(alice, {"limit": 10})) != after
+
+
+class FailingRouter(FakeRouter):
+    async def stream_response(self, query, context):
+        yield "保管期間は"
+        raise ConnectionError("llm server went away")
+
+
+def _post_stream(service):
+    app = FastAPI()
+    app.include_router(query_router.router, prefix="/api")
+    app.dependency_overrides[get_current_user] = lambda: User(username="alice")
+    app.dependency_overrides[get_query_service] = lambda: service
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/query", json={"query": "保管期間は?"}, headers={"Accept": "text/event-stream"}
+            )
+
+    return asyncio.run(scenario())
+
+
+def _events(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_query_endpoint_streams_server_sent_events():
+    response = _post_stream(_service())
+
+    assert response.headers["Content-Type"].startswith("text/event-stream")
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["context", "token", "token", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "保管期間は30日です"
+    assert query_router.query_admission.in_flight == 0
+
+
+def test_failed_stream_ends_with_error_event():
+    response = _post_stream(_service(FailingRouter()))
+
+    events = _events(response.text)
+    assert [name for name, _ in events] == ["context", "token", "error"]
+    assert events[-1][1] == {"detail": "回答の生成に失敗しました"}
+    assert query_router.query_admission.in_flight == 0
@@ -0,0 +1,119 @@
+import asyncio
+import io
+import os
+
+import pytest
+
+from rag_engine.security.encryption import DEFAULT_SEGMENT_SIZE, decrypt_stream
+
+from models.document import UploadSessionCreate
+from models.user import User
+from services.document_service import (
+    UPLOAD_READ_SIZE,
+    DocumentService,
+    IngestionQueue,
+    InMemoryDocumentStore,
+    InMemoryJobStore,
+    InMemoryUploadStore,
+    UploadOffsetConflict,
+    UploadSizeExceeded,
+)
+
+
+def _service(tmp_path) -> DocumentService:
+    return DocumentService(
+        IngestionQueue(InMemoryJobStore()), InMemoryDocumentStore(), InMemoryUploadStore(), storage_dir=str(tmp_path)
+    )
+
+
+def test_get_upload_during_write_keeps_state(tmp_path):
+    service = _service(tmp_path)
+    user = User(username="alice")
+    size = 3 * UPLOAD_READ_SIZE + 100
+    data = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+
+    async def scenario():
+        session = await service.create_upload(UploadSessionCreate(filename="a.txt", size=size), user)
+        upload_id = session.upload_id
+        offsets = []
+        persisted = []
+
+        async def chunks():
+            for start in range(0, size, 256 * 1024):
+                yield data[start:start + 256 * 1024]
+                # 書き込みの途中で状態を参照する
+                await asyncio.sleep(0)
+                await asyncio.sleep(0)
+                persisted.append((await service.uploads.get(upload_id))["offset"])
+
+        async def poll(done: asyncio.Event):
+            while not done.is_set():
+                current = await service.get_upload(upload_id, user)
+                offsets.append(current.offset)
+                await asyncio.sleep(0)
+
+        done = asyncio.Event()
+        poller = asyncio.create_task(poll(done))
+        try:
+            result = await service.write_upload_part(upload_id, 0, chunks(), user)
+        finally:
+            done.set()
+            await poller
+        return result, offsets, persisted
+
+    result, offsets, persisted = asyncio.run(scenario())
+
+    assert result.offset == size
+    assert offsets and offsets == sorted(offsets)
+    # 1MB ずつ書き込むたびに受信位置が保存される
+    assert persisted[-2] >= 3 * UPLOAD_READ_SIZE
+    assert (tmp_path / f"{result.result.document_id}.enc").exists()
+
+
+def test_part_exceeding_declared_size(tmp_path):
+    service = _service(tmp_path)
+    user = User(username="alice")
+
+    async def chunks():
+        yield b"a" * 60
+        yield b"b" * 60
+
+    async def scenario():
+        session = await service.create_upload(UploadSessionCreate(filename="a.txt", size=100), user)
+        with pytest.raises(UploadSizeExceeded):
+            await service.write_upload_part(session.upload_id, 0, chunks(), user)
+        return await service.get_upload(session.upload_id, user)
+
+    # 上限を超える前に受信した分は残り、続きから送り直せる
+    assert asyncio.run(scenario()).offset == 60
+
+
+def test_upload_resumes_in_another_process(tmp_path):
+    first = _service(tmp_path)
+    user = User(username="alice")
+    size = 200_000
+    data = os.urandom(size)
+
+    async def part(start, end):
+        yield data[start:end]
+
+    async def scenario():
+        session = await first.create_upload(UploadSessionCreate(filename="a.txt", size=size), user)
+        await first.write_upload_part(session.upload_id, 0, part(0, 150_000), user)
+
+        # 再起動後のプロセスは、暗号化ファイルの完全なセグメントの末尾から受信を再開する
+        second = DocumentService(first.queue, first.documents, first.uploads, storage_dir=str(tmp_path))
+        offset = (await second.get_upload(session.upload_id, user)).offset
+        with pytest.raises(UploadOffsetConflict):
+            await second.write_upload_part(session.upload_id, 150_000, part(150_000, size), user)
+        done = await second.write_upload_part(session.upload_id, offset, part(offset, size), user)
+        return offset, done
+
+    offset, done = asyncio.run(scenario())
+    assert offset == 2 * DEFAULT_SEGMENT_SIZE
+    assert done.offset == size and done.result is not None
+
+    out = io.BytesIO()
+    with open(tmp_path / f"{done.result.document_id}.enc", "rb") as f:
+        decrypt_stream(f, out)
+    assert out.getvalue() == data
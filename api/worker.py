@@ -0,0 +1,46 @@
+"""
+インジェストのワーカー
+
+rag_engine コンテナで起動し、APIと共有するジョブキューからインジェストジョブを取り出して
+解析・埋め込み・インデックス登録を行う。停止シグナル（SIGINT/SIGTERM）を受けると
+処理中のジョブをキューに戻してから終了する
+"""
+
+import asyncio
+import logging
+import signal
+from typing import Any, Dict
+
+from rag_engine.metrics import serve_metrics
+
+from core.config import settings
+from services.document_service import IngestionWorkerPool, ProgressReporter, get_document_service
+
+
+async def run_worker_pool():
+    """ワーカープールを起動し、停止シグナルまで処理を続ける"""
+    from rag_engine.indexer.document_processor import DocumentProcessor
+
+    service = get_document_service()
+    await service.ensure_indexes()
+    processor = DocumentProcessor()
+
+    async def pipeline(job: Dict[str, Any], progress: ProgressReporter):
+        await processor.process(job["document_id"], job["storage_path"], job["filename"], job["metadata"], progress)
+
+    pool = IngestionWorkerPool(service.queue, pipeline, on_finished=service.on_job_finished)
+    pool.start()
+    metrics_server = await serve_metrics(settings.metrics_port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    metrics_server.close()
+    await pool.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    asyncio.run(run_worker_pool())
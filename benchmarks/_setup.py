@@ -0,0 +1,31 @@
+"""
+ベンチマークスクリプトの共通設定
+
+リポジトリのルート（rag_engine, parsers）と api ディレクトリ（core, services など）を import できるようにし、
+API の設定をメモリ上のストアと一時ディレクトリで読み込めるようにする
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "api"), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="secure-rag-bench-")
+for name, value in {
+    "MONGODB_URL": "memory://",
+    "DATA_DIR": _DATA_DIR,
+    "ENCRYPTION_KEY": "benchmark-encryption-key-0123456789",
+    "JWT_SECRET": "benchmark-jwt-secret",
+    "AUDIT_SINK": "file",
+    "AUDIT_LOG_DIR": os.path.join(_DATA_DIR, "logs", "audit"),
+    "TRACE_LOG_DIR": os.path.join(_DATA_DIR, "logs"),
+    "DATA_KEY_STORE_PATH": os.path.join(_DATA_DIR, "keys", "data_keys.json"),
+    "TABLE_STORE_DIR": os.path.join(_DATA_DIR, "tables"),
+    "PERMISSION_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "permissions"),
+    "DEDUP_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "minhash"),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,89 @@
+"""
+適応的な受付制御の効果（api/core/admission.py）
+
+処理能力を超える負荷をかけ、受付制御なし・ありで受け付けたリクエストの応答時間と
+優先度ごとの成功率を比較する。擬似バックエンドは同時実行数が CAPACITY を超えると
+処理時間がそれに比例して伸びる（CPU・LLMサーバーの飽和を模す）
+"""
+
+import asyncio
+import random
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+import _setup  # noqa: F401
+from core.admission import AdmissionController, Overloaded, Priority
+
+CAPACITY = 8
+SERVICE_TIME = 0.05
+ARRIVAL_RATE = 300.0  # 1秒あたりの到着数（処理能力は CAPACITY / SERVICE_TIME = 160/s）
+DURATION = 5.0
+
+
+async def run(controlled: bool) -> Dict[str, float]:
+    controller = AdmissionController(
+        "bench", initial_limit=4, max_limit=64, target_latency=SERVICE_TIME * 2, max_queue=32, max_wait=0.5,
+    )
+    active = 0
+    latencies: List[float] = []
+    outcomes: Dict[Tuple[Priority, bool], int] = {}
+
+    async def backend():
+        nonlocal active
+        active += 1
+        try:
+            await asyncio.sleep(SERVICE_TIME * max(1.0, active / CAPACITY))
+        finally:
+            active -= 1
+
+    async def request(priority: Priority):
+        start = time.monotonic()
+        try:
+            if controlled:
+                async with controller.admit(priority):
+                    await backend()
+            else:
+                await backend()
+        except Overloaded:
+            outcomes[(priority, False)] = outcomes.get((priority, False), 0) + 1
+            return
+        latencies.append(time.monotonic() - start)
+        outcomes[(priority, True)] = outcomes.get((priority, True), 0) + 1
+
+    tasks = []
+    random.seed(1)
+    end = time.monotonic() + DURATION
+    while time.monotonic() < end:
+        priority = random.choices(list(Priority), weights=[3, 6, 1])[0]
+        tasks.append(asyncio.create_task(request(priority)))
+        await asyncio.sleep(random.expovariate(ARRIVAL_RATE))
+    await asyncio.gather(*tasks)
+
+    latencies.sort()
+    result = {
+        "served": len(latencies),
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "limit": controller.limit,
+    }
+    for priority in Priority:
+        ok = outcomes.get((priority, True), 0)
+        total = ok + outcomes.get((priority, False), 0)
+        result[f"{priority.name.lower()}_success"] = ok / total if total else 0.0
+    return result
+
+
+def main():
+    for controlled in (False, True):
+        result = asyncio.run(run(controlled))
+        print(
+            f"{'aimd' if controlled else 'none':<5} served={result['served']:<5} "
+            f"p50={result['p50_ms']:.0f}ms p99={result['p99_ms']:.0f}ms limit={result['limit']:.1f} "
+            f"success high={result['high_success']:.0%} normal={result['normal_success']:.0%} "
+            f"low={result['low_success']:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
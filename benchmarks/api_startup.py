@@ -0,0 +1,79 @@
+"""
+API の起動時の import 時間（api/main.py）
+
+python -X importtime で "import main" にかかる時間を計測し、累積時間の大きいモジュールを表示する。
+起動時に読み込まないはずの重いモジュールが読み込まれているか、合計が予算を超えた場合は
+終了コード 1 で終わる（CI で遅延 import の退行を検知する）
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+import _setup
+
+IMPORT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", "2000"))
+TOP = 15
+# ウォームアップまで読み込まないモジュール
+FORBIDDEN = (
+    "numpy",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "qdrant_client",
+    "rag_engine.indexer",
+    "rag_engine.retriever",
+    "rag_engine.llm",
+    "rag_engine.security.content_filter",
+)
+
+
+def main():
+    here = os.path.join(_setup.ROOT, "api")
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [here, os.path.dirname(here), env.get("PYTHONPATH", "")]))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=here, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(result.returncode)
+
+    # "import time: self [us] | cumulative | imported package" の行を読む
+    pattern = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = pattern.match(line)
+        if match:
+            rows.append((int(match.group(2)) / 1000, int(match.group(1)) / 1000, len(match.group(3)), match.group(4)))
+    total_ms = sum(row[1] for row in rows)
+    imported = {row[3] for row in rows}
+    # パッケージごとの累積時間（最初に読み込まれたときの値がサブモジュールを含む）
+    packages = {}
+    for cumulative, _, _, name in rows:
+        if name == "main":
+            continue
+        package = name.split(".")[0]
+        packages[package] = max(packages.get(package, 0.0), cumulative)
+
+    print(f"import main: {total_ms:.0f}ms in {len(rows)} modules (budget {IMPORT_BUDGET_MS:.0f}ms)")
+    for package, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:TOP]:
+        print(f"{cumulative:9.1f}ms  {package}")
+
+    violations = sorted(
+        name for name in imported if any(name == f or name.startswith(f + ".") for f in FORBIDDEN)
+    )
+    failed = False
+    if violations:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(violations)}")
+        failed = True
+    if total_ms > IMPORT_BUDGET_MS:
+        print(f"FAIL: import time {total_ms:.0f}ms exceeds budget {IMPORT_BUDGET_MS:.0f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
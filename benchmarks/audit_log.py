@@ -0,0 +1,96 @@
+"""
+監査ログの記録で待つ時間（api/core/logging.py）
+
+1件ごとにファイルへ追記して flush する同期方式と、キューに積んでまとめて書き出す方式で、
+記録する側（リクエスト処理）が待つ時間を比較する。あわせて書き出し先が詰まった場合に
+drop 方式で捨てた件数を確認する
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+import _setup  # noqa: F401
+from core.logging import AuditLogger, FileAuditSink, _json_default
+
+EVENTS = 20000
+EVENT = {"status": 200, "duration_ms": 12.3, "client": "10.0.0.1", "document_id": "d" * 32}
+
+
+def report(label: str, waits: List[float], elapsed: float):
+    waits.sort()
+    print(
+        f"{label:<10} p50={statistics.median(waits) * 1e6:7.1f}us "
+        f"p99={waits[int(len(waits) * 0.99)] * 1e6:8.1f}us throughput={len(waits) / elapsed:9.0f}/s"
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        waits = []
+        started = time.perf_counter()
+        with open(os.path.join(directory, "sync.jsonl"), "a", encoding="utf-8") as f:
+            for i in range(EVENTS):
+                t = time.perf_counter()
+                record = {"timestamp": datetime.now(timezone.utc), "action": "POST /api/query", "user": f"u{i % 50}", **EVENT}
+                f.write(json.dumps(record, ensure_ascii=False, default=_json_default) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+                waits.append(time.perf_counter() - t)
+        report("sync", waits, time.perf_counter() - started)
+
+        async def batched():
+            audit = AuditLogger(sinks=[FileAuditSink(directory)], max_queue=EVENTS, batch_size=500, flush_interval=0.2)
+            await audit.start()
+            waits = []
+            started = time.perf_counter()
+            for i in range(EVENTS):
+                t = time.perf_counter()
+                await audit.record("POST /api/query", user=f"u{i % 50}", **EVENT)
+                waits.append(time.perf_counter() - t)
+                if i % 100 == 0:
+                    await asyncio.sleep(0)  # リクエストの合間に書き出しタスクが動く
+            report("batched", waits, time.perf_counter() - started)
+            await audit.stop()
+            written = 0
+            for path in Path(directory).glob("audit-*.jsonl.gz"):
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    written += sum(1 for _ in f)
+            print(f"batched: {written}/{EVENTS} events on disk after stop()")
+
+        class SlowSink:
+            name = "slow"
+
+            async def write(self, events):
+                await asyncio.sleep(0.5)
+
+            async def close(self):
+                pass
+
+        async def overloaded():
+            audit = AuditLogger(sinks=[SlowSink()], max_queue=1000, batch_size=100, flush_interval=0.05, full_policy="drop")
+            await audit.start()
+            waits = []
+            started = time.perf_counter()
+            for i in range(EVENTS):
+                t = time.perf_counter()
+                await audit.record("GET /api/documents", user="u")
+                waits.append(time.perf_counter() - t)
+                await asyncio.sleep(0)
+            report("drop", waits, time.perf_counter() - started)
+            print(f"drop: {audit.dropped} of {EVENTS} events dropped while the sink was slow")
+            await audit.stop()
+
+        asyncio.run(batched())
+        asyncio.run(overloaded())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+ログイン集中時の応答時間（api/services/auth_service.py, api/core/security.py）
+
+ログインを集中させながら認証付きの軽いリクエストを流し続け、その応答時間の p99 を
+bcrypt をイベントループ上で計算する場合と専用スレッドプールで計算する場合とで比較する
+"""
+
+import asyncio
+import time
+from typing import Dict, List
+
+import httpx
+from fastapi import Depends, FastAPI
+
+import _setup  # noqa: F401
+from core.security import PasswordHasher, TokenCache, create_access_token
+from dependencies.auth import get_current_user
+from models.user import User
+from routers import auth as auth_router
+from services.auth_service import AuthService, InMemoryUserStore, get_auth_service
+
+LOGINS = 40
+LOGIN_CONCURRENCY = 20
+PROBE_INTERVAL = 0.01
+
+
+async def run_scenario(inline: bool) -> Dict[str, float]:
+    service = AuthService(InMemoryUserStore(), PasswordHasher(inline=inline), TokenCache())
+    await service.create_user("bench", "bench-password")
+    token = create_access_token({"sub": "bench", "role": "user"})
+
+    app = FastAPI()
+    app.include_router(auth_router.router, prefix="/api/auth")
+    # ログインAPIと認証依存関係（失効トークンの読み込み）の両方がこのサービスを使う
+    app.dependency_overrides[get_auth_service] = lambda: service
+
+    @app.get("/probe")
+    async def probe(user: User = Depends(get_current_user)):
+        return {"user": user.username}
+
+    latencies: List[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(LOGIN_CONCURRENCY)
+
+        async def login_once():
+            async with semaphore:
+                await client.post("/api/auth/login", json={"username": "bench", "password": "bench-password"})
+
+        async def probe_loop(done: asyncio.Event):
+            # 一定間隔で送る予定時刻から計測し、イベントループが止まっていた時間も応答時間に含める
+            headers = {"Authorization": f"Bearer {token}"}
+            scheduled = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+                await client.get("/probe", headers=headers)
+                latencies.append(time.perf_counter() - scheduled)
+                scheduled += PROBE_INTERVAL
+
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe_loop(done))
+        start = time.perf_counter()
+        await asyncio.gather(*(login_once() for _ in range(LOGINS)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await prober
+    service.hasher.shutdown()
+
+    latencies.sort()
+    return {
+        "logins_per_sec": LOGINS / elapsed,
+        "probe_count": len(latencies),
+        "probe_p50_ms": latencies[len(latencies) // 2] * 1000,
+        "probe_p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def main():
+    for inline in (True, False):
+        result = asyncio.run(run_scenario(inline))
+        label = "inline " if inline else "offload"
+        print(
+            f"{label}: {result['logins_per_sec']:.1f} logins/s, probes={result['probe_count']}, "
+            f"p50={result['probe_p50_ms']:.1f}ms, p99={result['probe_p99_ms']:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+保存ファイルの暗号化・復号の速度とメモリ使用量（rag_engine/security/encryption.py）
+
+64MB のファイルについて、ファイル全体を読み込んで暗号化する場合とチャンク単位のストリーム暗号化、
+ストリーム復号、スレッド並列の暗号化を比べ、暗号化済みファイルの一部だけを復号する時間を測る
+"""
+
+import os
+import tempfile
+import time
+import tracemalloc
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+import _setup  # noqa: F401
+from rag_engine.security.encryption import (
+    EncryptedReader,
+    KeyRing,
+    decrypt_stream,
+    encrypt_file_parallel,
+    encrypt_stream,
+)
+
+SIZE_MB = 64
+
+
+def main():
+    ring = KeyRing({"bench": b"benchmark-master-key"}, "bench")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "plain.bin")
+        with open(plain_path, "wb") as f:
+            for _ in range(SIZE_MB):
+                f.write(os.urandom(1024 * 1024))
+
+        def measure(label, fn):
+            tracemalloc.start()
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"{label:<28}{SIZE_MB / elapsed:>10.1f} MB/s{peak / (1024 * 1024):>10.1f} MB peak")
+
+        def whole_file():
+            with open(plain_path, "rb") as f:
+                data = f.read()
+            ciphertext = AESGCM(AESGCM.generate_key(256)).encrypt(os.urandom(12), data, None)
+            with open(os.path.join(tmp, "whole.bin"), "wb") as f:
+                f.write(ciphertext)
+
+        def streaming():
+            with open(plain_path, "rb") as src, open(os.path.join(tmp, "stream.bin"), "wb") as dst:
+                encrypt_stream(src, dst, ring)
+
+        def streaming_decrypt():
+            with open(os.path.join(tmp, "stream.bin"), "rb") as src, open(os.devnull, "wb") as dst:
+                decrypt_stream(src, dst, ring)
+
+        def parallel():
+            encrypt_file_parallel(plain_path, os.path.join(tmp, "parallel.bin"), ring)
+
+        def random_access():
+            with open(os.path.join(tmp, "stream.bin"), "rb") as src:
+                EncryptedReader(src, ring).read_range(SIZE_MB * 512 * 1024, 4096)
+
+        print(f"{SIZE_MB} MB file")
+        measure("whole-file encrypt", whole_file)
+        measure("streaming encrypt", streaming)
+        measure("streaming decrypt", streaming_decrypt)
+        measure(f"parallel encrypt ({os.cpu_count()} thr)", parallel)
+        start = time.perf_counter()
+        random_access()
+        print(f"{'read_range 4 KiB':<28}{(time.perf_counter() - start) * 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+クエリ時のチャンク復号のコスト（rag_engine/security/encryption.py）
+
+top-k のチャンクを返すたびにマスター鍵から鍵を導出する場合と、エンベロープ暗号化
+（データ鍵のキャッシュと復号済みチャンクのキャッシュ）で復号する場合の1クエリあたりの時間を比べる
+"""
+
+import time
+
+import _setup  # noqa: F401
+from rag_engine.security.encryption import DataKeyStore, EnvelopeCipher, KeyRing, _derive_file_key
+
+TOP_K = 10
+QUERIES = 200
+
+
+def main():
+    ring = KeyRing({"bench": b"benchmark-master-key"}, "bench")
+    chunks = [(f"doc{i % 5}", f"chunk{i}", "仕様書の本文。" * 100) for i in range(TOP_K)]
+
+    start = time.perf_counter()
+    for _ in range(QUERIES):
+        for doc_id, chunk_id, text in chunks:
+            _derive_file_key(ring.active_key, doc_id.encode(), ring.active_key_id)
+    per_call = (time.perf_counter() - start) / QUERIES
+
+    envelope = EnvelopeCipher(ring, DataKeyStore())
+    encrypted = [(doc_id, chunk_id, envelope.encrypt_chunk(doc_id, chunk_id, text)) for doc_id, chunk_id, text in chunks]
+    start = time.perf_counter()
+    for _ in range(QUERIES):
+        for doc_id, chunk_id, ciphertext in encrypted:
+            envelope.lazy(doc_id, chunk_id, ciphertext).text
+    cached = (time.perf_counter() - start) / QUERIES
+    print(f"top-{TOP_K} key derivation only      {per_call * 1000:.3f} ms/query")
+    print(f"top-{TOP_K} envelope decrypt (cached) {cached * 1000:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
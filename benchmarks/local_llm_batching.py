@@ -0,0 +1,81 @@
+"""
+ローカルLLMのリクエストのバッチ化（rag_engine/llm/local_client.py）
+
+CPU 1台で推論を同時に1パスしか処理できないローカルLLMを模したスタブサーバーに対して、
+同時ユーザー数を変えながら1件ずつ送る場合とまとめて送る場合の待ち時間とスループットを比べる
+"""
+
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import _setup  # noqa: F401
+from rag_engine.llm.local_client import MAX_BATCH_SIZE, LocalLLMClient
+
+# スタブサーバーの処理コスト: 1回の推論パスの固定コスト + プロンプトあたりのコスト
+STUB_PASS_COST = 0.040
+STUB_PROMPT_COST = 0.004
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """CPU 1台のローカルLLMを模したスタブ（推論は同時に1パスのみ）"""
+    engine_lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        with self.engine_lock:
+            time.sleep(STUB_PASS_COST + STUB_PROMPT_COST * len(prompts))
+        data = json.dumps({
+            "choices": [{"index": i, "text": f"answer:{p[-8:]}"} for i, p in enumerate(prompts)]
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+async def run_users(client: LocalLLMClient, users: int, requests_per_user: int):
+    latencies = []
+
+    async def user(uid: int):
+        for i in range(requests_per_user):
+            start = time.perf_counter()
+            await client.generate(f"質問 {uid}-{i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return latencies, elapsed
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'mode':<10}{'users':>6}{'p50 ms':>10}{'p95 ms':>10}{'req/s':>10}")
+    for users in (1, 8, 32):
+        for mode, batch_size in (("single", 1), ("batched", MAX_BATCH_SIZE)):
+            client = LocalLLMClient(api_url=url, max_batch_size=batch_size)
+            latencies, elapsed = asyncio.run(run_users(client, users, 8))
+            latencies.sort()
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(
+                f"{mode:<10}{users:>6}{statistics.median(latencies) * 1000:>10.1f}"
+                f"{p95 * 1000:>10.1f}{len(latencies) / elapsed:>10.1f}"
+            )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
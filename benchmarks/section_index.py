@@ -0,0 +1,73 @@
+"""
+粗い検索 → 細かい検索の速度と再現率（rag_engine/retriever/section_index.py）
+
+ドキュメント → 節 → チャンクの順に話題が近い埋め込みを合成し、全チャンクを走査する場合と、
+要約索引で選んだドキュメントのチャンクだけを走査する場合の1質問あたりの時間と再現率を比べる
+"""
+
+import time
+
+import numpy as np
+
+import _setup  # noqa: F401
+from rag_engine.retriever.section_index import COARSE_CANDIDATES, rank_documents
+
+
+def main():
+    # 合成データ: ドキュメント → 節 → チャンクの順に話題が近い埋め込み
+    rng = np.random.default_rng(0)
+    dim, docs, sections, chunks_per_section = 128, 1000, 10, 20
+
+    def normalize(x):
+        return (x / np.linalg.norm(x, axis=-1, keepdims=True)).astype(np.float32)
+
+    def around(centers, spread, shape=None):
+        """centers の近くの単位ベクトル（spread は中心からのずれの大きさ）"""
+        shape = shape or centers.shape
+        return normalize(centers + spread * rng.standard_normal(shape) / np.sqrt(dim))
+
+    doc_centers = normalize(rng.standard_normal((docs, dim)))
+    section_centers = around(doc_centers[:, None, :], 1.0, (docs, sections, dim))
+    chunk_vectors = around(section_centers[:, :, None, :], 0.8, (docs, sections, chunks_per_section, dim))
+    chunk_vectors = chunk_vectors.reshape(-1, dim)
+    # 要約の埋め込みは話題の近似（見出しと冒頭だけから作るので、ずれを加える）
+    summary_vectors = np.concatenate([around(doc_centers, 0.8), around(section_centers, 0.8).reshape(-1, dim)])
+    summary_doc = np.concatenate([np.arange(docs), np.repeat(np.arange(docs), sections)])
+    doc_rows = {d: np.arange(d * sections * chunks_per_section, (d + 1) * sections * chunks_per_section) for d in range(docs)}
+
+    queries = 200
+    targets = rng.integers(0, len(chunk_vectors), queries)
+    query_vectors = around(chunk_vectors[targets], 1.0)
+    k = 5
+
+    def flat(query):
+        scores = chunk_vectors @ query
+        top = np.argpartition(-scores, k)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def coarse_to_fine(query, documents):
+        scores = summary_vectors @ query
+        top = np.argpartition(-scores, COARSE_CANDIDATES)[:COARSE_CANDIDATES]
+        hits = [{"payload": {"doc_id": int(summary_doc[i])}} for i in top[np.argsort(-scores[top])]]
+        rows = np.concatenate([doc_rows[d] for d in rank_documents(hits, documents)])
+        scores = chunk_vectors[rows] @ query
+        top = np.argpartition(-scores, k)[:k]
+        return rows[top[np.argsort(-scores[top])]]
+
+    start = time.perf_counter()
+    expected = [set(flat(q)) for q in query_vectors]
+    flat_ms = (time.perf_counter() - start) / queries * 1e3
+    print(f"{len(chunk_vectors)} chunks, {len(summary_vectors)} summaries, exhaustive scan (dim={dim})")
+    print(f"flat: {flat_ms:.2f} ms/query, target chunk found {np.mean([t in e for t, e in zip(targets, expected)]):.3f}")
+    for documents in (1, 3, 5, 10):
+        start = time.perf_counter()
+        found = [set(coarse_to_fine(q, documents)) for q in query_vectors]
+        elapsed = (time.perf_counter() - start) / queries * 1e3
+        recall = np.mean([len(f & e) / k for f, e in zip(found, expected)])
+        target_hit = np.mean([t in f for t, f in zip(targets, found)])
+        print(f"coarse-to-fine ({documents} documents): {elapsed:.2f} ms/query, "
+              f"recall@{k} vs flat {recall:.3f}, target chunk found {target_hit:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+表データストアと行の埋め込みの比較（rag_engine/retriever/table_store.py）
+
+合成したテストケース表（TABLE_BENCH_ROWS 行）について、従来の行を埋め込む方式と表データストアの方式で
+インデックスの大きさと集計の質問に答えるまでの時間を比べる。埋め込みモデルは読み込まず、ベクトルは
+multilingual-e5-small の次元数（384）の float32 として大きさを見積もる
+"""
+
+import os
+import random
+import tempfile
+import time
+
+import _setup  # noqa: F401
+from parsers.utils.tables import detect_table, summarize_table
+from rag_engine.indexer.chunking import split_text
+from rag_engine.retriever.table_store import TableStore
+from rag_engine.security.encryption import EnvelopeCipher, KeyRing
+
+ROWS = int(os.environ.get("TABLE_BENCH_ROWS", "5000"))
+DIMENSION = 384
+ROWS_PER_SECTION = 50  # parsers.excel_parser の行テキストの節の大きさ
+TOP_K = 5
+
+
+def main():
+    random.seed(0)
+    header = ["ID", "テスト名", "機能", "担当者", "状態", "優先度", "工数"]
+    rows = [header] + [
+        [
+            i,
+            f"ケース{i:05d} ログイン後の画面遷移を確認する",
+            random.choice(["認証", "検索", "アップロード", "管理"]),
+            random.choice(["佐藤", "鈴木", "高橋", "田中"]),
+            random.choices(["完了", "未完了", "保留"], weights=[6, 3, 1])[0],
+            random.choice(["高", "中", "低"]),
+            round(random.uniform(0.5, 8.0), 1),
+        ]
+        for i in range(1, ROWS + 1)
+    ]
+    expected = sum(1 for row in rows[1:] if row[4] == "未完了")
+
+    # 従来の方式：行を「列名: 値」のテキストにして節ごとにチャンク分割し、すべて埋め込む
+    row_chunks = []
+    for start in range(1, len(rows), ROWS_PER_SECTION):
+        lines = [" / ".join(f"{name}: {value}" for name, value in zip(header, row)) for row in rows[start:start + ROWS_PER_SECTION]]
+        row_chunks.extend(split_text("\n".join([" | ".join(header)] + lines)))
+    cipher = EnvelopeCipher(KeyRing.from_env())
+    row_payload = sum(len(cipher.encrypt_chunk("bench", f"c{i}", text)) * 4 // 3 for i, text in enumerate(row_chunks))
+    row_index = len(row_chunks) * DIMENSION * 4 + row_payload
+    visible_rows = sum(text.count("\n") for text in row_chunks[:TOP_K])
+
+    # 表データストアの方式：要約だけを埋め込み、行は暗号化した SQLite に格納する
+    table = detect_table("テストケース", rows)
+    summary = split_text(summarize_table(table, "テスト計画書.xlsx"))
+    with tempfile.TemporaryDirectory() as root:
+        store = TableStore(root)
+        started = time.perf_counter()
+        plain_size = store.save("bench", [table])
+        save_ms = (time.perf_counter() - started) * 1000
+        stored = store._path("bench").stat().st_size
+        sql = 'SELECT COUNT(*) FROM "テストケース" WHERE "状態" = \'未完了\''
+        started = time.perf_counter()
+        cold = store.query("bench", sql)
+        cold_ms = (time.perf_counter() - started) * 1000
+        warm = []
+        for _ in range(20):
+            started = time.perf_counter()
+            store.query("bench", sql)
+            warm.append((time.perf_counter() - started) * 1000)
+        warm.sort()
+    table_index = len(summary) * DIMENSION * 4 + sum(len(text.encode()) for text in summary)
+
+    print(f"rows={ROWS}  question: 未完了のテストケースは何件？ (正解 {expected})")
+    print(f"row embeddings : {len(row_chunks):5d} chunks, vector index ~{row_index / 1024:8.0f} KiB; "
+          f"top-{TOP_K} context shows {visible_rows} of {ROWS} rows, so the count cannot be derived")
+    print(f"table store    : {len(summary):5d} chunks, vector index ~{table_index / 1024:8.0f} KiB "
+          f"+ SQLite {plain_size / 1024:.0f} KiB ({stored / 1024:.0f} KiB encrypted), save {save_ms:.0f}ms")
+    print(f"table query    : answer {cold.rows[0][0]}, cold {cold_ms:.1f}ms (decrypt + load), "
+          f"warm p50 {warm[len(warm) // 2]:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
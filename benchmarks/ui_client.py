@@ -0,0 +1,102 @@
+"""
+UI の API クライアントの接続の使い回しと応答のキャッシュ（ui/utils/api_client.py）
+
+ローカルのスタブAPIに対して、1回ごとに httpx.AsyncClient を作る従来の方式と、接続プールを
+使い回す APIClient で GET の所要時間を比較する。
+従来の方式は呼び出しごとに asyncio.run し、APIClient は UI と同じく run() で実行する。
+あわせて応答のキャッシュ（期限内のヒットと ETag による再検証）の所要時間も計測する
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+import _setup
+
+sys.path.insert(0, os.path.join(_setup.ROOT, "ui"))
+from utils.api_client import TIMEOUT, APIClient  # noqa: E402
+from utils.async_runtime import run  # noqa: E402
+
+REQUESTS = 300
+connections = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    disable_nagle_algorithm = True  # ヘッダーと本文の書き込みが遅延ACKで待たされないようにする
+    failures = 0
+
+    def do_GET(self):
+        connections.add(self.client_address)
+        if self.path.startswith("/api/flaky") and StubHandler.failures < 2:
+            StubHandler.failures += 1
+            status, body = 503, b'{"detail": "busy"}'
+        elif self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+        else:
+            status, body = 200, json.dumps({"items": [], "next_cursor": None}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(label: str, call):
+    connections.clear()
+    latencies = []
+    for _ in range(REQUESTS):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(
+        f"{label:<10} p50={statistics.median(latencies) * 1000:6.2f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99)] * 1000:6.2f}ms connections={len(connections)}"
+    )
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    async def per_call_client():
+        async with httpx.AsyncClient(timeout=TIMEOUT) as http:
+            response = await http.get(f"{base_url}/api/history", params={"limit": 20})
+            response.raise_for_status()
+            return response.json()
+
+    pooled = APIClient(base_url=base_url)
+    measure("per-call", lambda: asyncio.run(per_call_client()))
+    measure("pooled", lambda: run(pooled._make_request("GET", "/api/history", params={"limit": 20})))
+
+    # キャッシュ：TTL 内は問い合わせず、期限切れ後は If-None-Match で再検証する（304）
+    pooled.token = "benchmark"
+    measure("cached", lambda: run(pooled._make_request("GET", "/api/history", params={"limit": 20}, cache_ttl=60)))
+    pooled.invalidate("/api/history")
+    run(pooled._make_request("GET", "/api/history", params={"limit": 20}, cache_ttl=0))
+    measure("etag-304", lambda: run(pooled._make_request("GET", "/api/history", params={"limit": 20}, cache_ttl=0)))
+    print(f"cache hits={pooled.cache.hits} revalidated={pooled.cache.revalidated} misses={pooled.cache.misses}")
+    pooled.invalidate("/api/history")
+    pooled.token = None
+
+    started = time.perf_counter()
+    run(pooled._make_request("GET", "/api/flaky"))
+    print(f"flaky GET succeeded after {StubHandler.failures} retried 503s in {(time.perf_counter() - started) * 1000:.0f}ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
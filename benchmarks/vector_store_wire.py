@@ -0,0 +1,124 @@
+"""
+Qdrant との通信内容の大きさと変換時間（rag_engine/retriever/vector_store.py）
+
+検索（50件、復号前のペイロード付き）とインジェスト時の128件の登録について、REST の JSON 本文と
+gRPC で実際に送受信する protobuf メッセージ（qdrant_client の変換処理で組み立てたもの）の
+大きさとエンコード・デコードの時間を比べる。
+
+あわせて、埋め込みを Python の list にしてから渡す場合（vector_store の現在の実装）と
+float32 の配列のまま protobuf に渡す場合の変換時間を比べる
+"""
+
+import base64
+import json
+import time
+import uuid
+from typing import Any, Callable, Dict
+
+import numpy as np
+
+import _setup  # noqa: F401
+from qdrant_client import grpc as qdrant_grpc
+from qdrant_client.conversions.conversion import RestToGrpc
+from qdrant_client.http import models
+
+DIMENSION = 384
+SEARCH_LIMIT = 50
+UPSERT_BATCH = 128
+
+rng = np.random.default_rng(0)
+
+
+def payload(index: int) -> Dict[str, Any]:
+    return {
+        "doc_id": uuid.uuid4().hex,
+        "filename": "情報セキュリティ規程_v1.1.pdf",
+        "chunk_index": index,
+        "page": index // 3 + 1,
+        "heading": "第3章 アクセス管理",
+        "table": None,
+        "confidentiality": 1,
+        "ciphertext": base64.b64encode(rng.bytes(600 * 3 + 60)).decode("ascii"),
+        "sources": [],
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int = 20) -> float:
+    """1回あたりの時間（ミリ秒）"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+query = rng.standard_normal(DIMENSION).astype(np.float32)
+vectors = rng.standard_normal((UPSERT_BATCH, DIMENSION)).astype(np.float32)
+hits = [
+    models.ScoredPoint(id=str(uuid.uuid4()), version=1, score=float(rng.random()), payload=payload(i))
+    for i in range(SEARCH_LIMIT)
+]
+points = [
+    models.PointStruct(id=str(uuid.uuid4()), vector=vector.tolist(), payload=payload(i))
+    for i, vector in enumerate(vectors)
+]
+
+messages = {
+    "search request": (
+        {"vector": query.tolist(), "limit": SEARCH_LIMIT, "with_payload": True},
+        qdrant_grpc.SearchPoints(
+            collection_name="chunks",
+            vector=query.tolist(),
+            limit=SEARCH_LIMIT,
+            with_payload=qdrant_grpc.WithPayloadSelector(enable=True),
+        ),
+    ),
+    "search response": (
+        {"result": [hit.model_dump() for hit in hits], "status": "ok", "time": 0.001},
+        qdrant_grpc.SearchResponse(result=[RestToGrpc.convert_scored_point(hit) for hit in hits], time=0.001),
+    ),
+    f"upsert ({UPSERT_BATCH} chunks)": (
+        {"points": [point.model_dump() for point in points]},
+        qdrant_grpc.UpsertPoints(
+            collection_name="chunks",
+            wait=True,
+            points=[RestToGrpc.convert_point_struct(point) for point in points],
+        ),
+    ),
+}
+
+print("message                JSON KiB  protobuf KiB  ratio  JSON enc+dec ms  protobuf enc+dec ms")
+for kind, (body, message) in messages.items():
+    json_bytes = json.dumps(body, ensure_ascii=False).encode()
+    proto_bytes = message.SerializeToString()
+    json_ms = timed(lambda: json.loads(json.dumps(body, ensure_ascii=False).encode()))
+    proto_ms = timed(lambda: type(message).FromString(message.SerializeToString()))
+    print(f"{kind:<22} {len(json_bytes) / 1024:8.1f}  {len(proto_bytes) / 1024:12.1f}  "
+          f"{len(json_bytes) / len(proto_bytes):5.1f}  {json_ms:15.2f}  {proto_ms:19.2f}")
+
+# 埋め込みから protobuf のメッセージを組み立てるまで
+ids = [str(point.id) for point in points]
+conversions = {
+    "PointStruct(vector=tolist()) -> gRPC (current)": lambda: [
+        RestToGrpc.convert_point_struct(models.PointStruct(id=point_id, vector=vector.tolist(), payload={}))
+        for point_id, vector in zip(ids, vectors)
+    ],
+    "grpc.Vector(data=tolist())": lambda: [
+        qdrant_grpc.PointStruct(
+            id=qdrant_grpc.PointId(uuid=point_id),
+            vectors=qdrant_grpc.Vectors(vector=qdrant_grpc.Vector(data=vector.tolist())),
+        )
+        for point_id, vector in zip(ids, vectors)
+    ],
+    "grpc.Vector(data=float32 ndarray)": lambda: [
+        qdrant_grpc.PointStruct(
+            id=qdrant_grpc.PointId(uuid=point_id),
+            vectors=qdrant_grpc.Vectors(vector=qdrant_grpc.Vector(data=vector)),
+        )
+        for point_id, vector in zip(ids, vectors)
+    ],
+}
+print()
+print(f"building {UPSERT_BATCH}x{DIMENSION} points")
+for name, build in conversions.items():
+    print(f"  {name:<48} {timed(build):6.2f} ms")
@@ -0,0 +1,44 @@
+"""
+ドキュメントパーサー
+
+ファイル形式に応じたパーサーを選択してテキストを抽出する
+"""
+
+from pathlib import Path
+
+from .utils.text_extraction import ParsedDocument, TextSection
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".xlsx", ".txt", ".md"}
+
+
+def parse_document(path: str, filename: str = None) -> ParsedDocument:
+    """
+    ファイル形式に応じて解析
+
+    Args:
+        path: ファイルパス
+        filename: 元のファイル名（拡張子の判定に使う。省略時は path から判定）
+
+    Returns:
+        解析結果
+
+    Raises:
+        ValueError: 未対応の形式の場合
+    """
+    suffix = Path(filename or path).suffix.lower()
+    if suffix == ".pdf":
+        from .pdf_parser import parse_pdf
+        return parse_pdf(path)
+    if suffix == ".docx":
+        from .word_parser import parse_word
+        return parse_word(path)
+    if suffix == ".xlsx":
+        from .excel_parser import parse_excel
+        return parse_excel(path)
+    if suffix in (".txt", ".md"):
+        from .text_parser import parse_text
+        return parse_text(path)
+    raise ValueError(f"Unsupported document type: {suffix}")
+
+
+__all__ = ["ParsedDocument", "TextSection", "SUPPORTED_EXTENSIONS", "parse_document"]
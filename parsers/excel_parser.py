@@ -0,0 +1,84 @@
+"""
+Excelパーサー
+
+シートごとに、見出し行の列名を付けた行テキストとして抽出する。表とみなせるシート
+（見出し行と十分な数のデータ行があるもの）は行テキストにせず、表データと要約テキストだけを返す
+"""
+
+import logging
+from typing import List
+
+from openpyxl import load_workbook
+
+from .utils.tables import TableData, cell_value, detect_table, summarize_table
+from .utils.text_extraction import ParsedDocument, TextSection, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 1節にまとめる最大行数
+ROWS_PER_SECTION = 50
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    return str(value).strip()
+
+
+def parse_excel(path: str, detect_tables: bool = True) -> ParsedDocument:
+    """
+    Excelファイル（.xlsx）を解析
+
+    Args:
+        path: ファイルパス
+        detect_tables: 表とみなせるシートを表データとして返す（False なら全シートを行テキストにする）
+
+    Returns:
+        解析結果（節の page にはシート番号が入る。表のシートは tables と、metadata に "table" を持つ要約の節になる）
+    """
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    sheet_names = list(workbook.sheetnames)
+    sections: List[TextSection] = []
+    tables: List[TableData] = []
+
+    try:
+        for sheet_number, sheet in enumerate(workbook.worksheets, start=1):
+            values = [
+                [cell_value(value) for value in row]
+                for row in sheet.iter_rows(values_only=True)
+                if any(value is not None for value in row)
+            ]
+            if not values:
+                continue
+
+            table = detect_table(sheet.title, values, page=sheet_number) if detect_tables else None
+            if table is not None:
+                tables.append(table)
+                sections.append(TextSection(
+                    normalize_text(summarize_table(table)),
+                    page=sheet_number,
+                    heading=sheet.title,
+                    metadata={"sheet": sheet.title, "table": sheet.title},
+                ))
+                continue
+
+            rows = [[_cell_text(value) for value in row] for row in values]
+            header = rows[0]
+            for start in range(1, max(len(rows), 2), ROWS_PER_SECTION):
+                lines = []
+                for row in rows[start:start + ROWS_PER_SECTION]:
+                    pairs = [f"{name}: {value}" if name else value for name, value in zip(header, row) if value]
+                    lines.append(" / ".join(pairs))
+                text = normalize_text("\n".join([" | ".join(header)] + lines))
+                if text:
+                    sections.append(
+                        TextSection(text, page=sheet_number, heading=sheet.title, metadata={"sheet": sheet.title})
+                    )
+    finally:
+        workbook.close()
+
+    return ParsedDocument(
+        sections=sections,
+        metadata={"format": "excel", "sheets": sheet_names, "tables": [table.name for table in tables]},
+        tables=tables,
+    )
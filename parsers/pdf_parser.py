@@ -0,0 +1,39 @@
+"""
+PDFパーサー
+
+ページごとにテキストを抽出し、ページ番号付きの節として返す
+"""
+
+import logging
+
+from pypdf import PdfReader
+
+from .utils.text_extraction import ParsedDocument, normalize_text, split_by_headings
+
+logger = logging.getLogger(__name__)
+
+
+def parse_pdf(path: str) -> ParsedDocument:
+    """
+    PDFファイルを解析
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        解析結果（節にはページ番号が付く）
+    """
+    reader = PdfReader(path)
+    sections = []
+    for page_number, page in enumerate(reader.pages, start=1):
+        try:
+            text = normalize_text(page.extract_text() or "")
+        except Exception as e:
+            logger.warning(f"Failed to extract text from page {page_number} of {path}: {e}")
+            continue
+        sections.extend(split_by_headings(text, page=page_number))
+
+    metadata = {"format": "pdf", "pages": len(reader.pages)}
+    if reader.metadata and reader.metadata.title:
+        metadata["title"] = reader.metadata.title
+    return ParsedDocument(sections=sections, metadata=metadata)
@@ -0,0 +1,49 @@
+"""
+テキストパーサー
+
+プレーンテキスト（.txt, .md）を見出し単位の節に分割する
+"""
+
+import logging
+from pathlib import Path
+
+from .utils.text_extraction import ParsedDocument, normalize_text, split_by_headings
+
+logger = logging.getLogger(__name__)
+
+# 社内文書で使われる文字コードを順に試す
+ENCODINGS = ("utf-8-sig", "cp932", "euc-jp")
+
+
+def read_text(path: str) -> str:
+    """
+    文字コードを推定してテキストファイルを読み込む
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        テキスト
+    """
+    data = Path(path).read_bytes()
+    for encoding in ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    logger.warning(f"Could not detect encoding of {path}, decoding with replacement")
+    return data.decode("utf-8", errors="replace")
+
+
+def parse_text(path: str) -> ParsedDocument:
+    """
+    テキストファイルを解析
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        解析結果
+    """
+    text = normalize_text(read_text(path))
+    return ParsedDocument(sections=split_by_headings(text), metadata={"format": "text"})
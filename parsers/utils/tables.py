@@ -0,0 +1,138 @@
+"""
+表データの判定と要約
+
+スプレッドシートのシートが表（見出し行と同じ形の行の並び）かどうかを判定し、集計の質問に
+答えるために列の型を推定する。表の行はそのまま埋め込まず、スキーマと値の分布をまとめた
+要約テキストだけを検索対象にする
+"""
+
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, time
+from typing import Any, List, Optional, Sequence
+
+TABLE_MIN_ROWS = int(os.environ.get("TABLE_MIN_ROWS", "20"))  # 表として扱う最小のデータ行数
+TABLE_MIN_FILL = 0.5  # データ行で値が入っている列の割合の下限（平均）
+SUMMARY_TOP_VALUES = 5  # 要約に載せる、値の種類が少ない列の頻出値の数
+CATEGORY_MAX_DISTINCT = 30  # 頻出値を載せる列の値の種類の上限
+
+_SPACES = re.compile(r"\s+")
+
+
+@dataclass
+class TableData:
+    """シートから取り出した表"""
+    name: str
+    columns: List[str]
+    rows: List[List[Any]]
+    types: List[str] = field(default_factory=list)  # 列ごとの型（INTEGER, REAL, TEXT）
+    page: Optional[int] = None
+
+
+def cell_value(value: Any) -> Any:
+    """セルの値を表に格納する値にする（日付は ISO 形式の文字列、空文字は None）"""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _column_names(header: Sequence[Any]) -> List[str]:
+    """見出し行から重複しない列名を作る（空の見出しは列番号にする）"""
+    names: List[str] = []
+    seen: Counter = Counter()
+    for number, value in enumerate(header, start=1):
+        name = _SPACES.sub(" ", str(value).strip()) if value is not None else ""
+        name = name or f"列{number}"
+        seen[name] += 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def infer_type(values: Sequence[Any]) -> str:
+    """列の値から SQLite の型を推定"""
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool) or isinstance(value, int):
+            kinds.add("INTEGER")
+        elif isinstance(value, float):
+            kinds.add("INTEGER" if value.is_integer() else "REAL")
+        else:
+            return "TEXT"
+    if not kinds:
+        return "TEXT"
+    return "REAL" if "REAL" in kinds else "INTEGER"
+
+
+def detect_table(name: str, rows: List[List[Any]], page: Optional[int] = None) -> Optional[TableData]:
+    """
+    シートの行が表かどうかを判定し、表なら TableData にする
+
+    先頭行が文字列の見出しで、データ行が TABLE_MIN_ROWS 行以上あり、各行に値が十分入っている場合に表とみなす
+
+    Args:
+        name: 表の名前（シート名）
+        rows: 空行を除いたセルの値（cell_value で変換済み）
+        page: シート番号
+
+    Returns:
+        表（表でなければ None）
+    """
+    if len(rows) <= TABLE_MIN_ROWS:
+        return None
+    header = rows[0]
+    labelled = [value for value in header if value is not None]
+    if len(labelled) < 2 or not all(isinstance(value, str) for value in labelled):
+        return None
+
+    # 見出しのある列の範囲だけを使う（右端の注記などを除く）
+    width = max(i for i, value in enumerate(header) if value is not None) + 1
+    data = [list(row[:width]) + [None] * (width - len(row)) for row in rows[1:]]
+    fill = sum(sum(value is not None for value in row) for row in data) / (len(data) * width)
+    if fill < TABLE_MIN_FILL:
+        return None
+
+    columns = _column_names(header[:width])
+    types = [infer_type([row[i] for row in data]) for i in range(width)]
+    return TableData(name=name, columns=columns, rows=data, types=types, page=page)
+
+
+def summarize_table(table: TableData, document: str = "") -> str:
+    """
+    表の要約テキスト（検索用）
+
+    行の内容は含めず、列名・型・値の範囲や頻出値だけを書く。集計の質問がこの要約に一致すると、
+    回答時に表に対して SQL を実行する
+
+    Args:
+        table: 表
+        document: ドキュメント名（オプション）
+
+    Returns:
+        要約テキスト
+    """
+    title = f"{document} の表「{table.name}」" if document else f"表「{table.name}」"
+    lines = [f"{title}（{len(table.rows)} 行、{len(table.columns)} 列）"]
+    for i, (column, column_type) in enumerate(zip(table.columns, table.types)):
+        values = [row[i] for row in table.rows if row[i] is not None]
+        if not values:
+            lines.append(f"- {column}: 空")
+            continue
+        if column_type in ("INTEGER", "REAL"):
+            lines.append(f"- {column}（数値）: {min(values)} 〜 {max(values)}")
+            continue
+        counts = Counter(str(value) for value in values)
+        if len(counts) <= CATEGORY_MAX_DISTINCT:
+            top = "、".join(f"{value} {count}件" for value, count in counts.most_common(SUMMARY_TOP_VALUES))
+            lines.append(f"- {column}（{len(counts)} 種類）: {top}")
+        else:
+            lines.append(f"- {column}（文字列、{len(counts)} 種類）: 例 {str(values[0])[:30]}")
+    return "\n".join(lines)
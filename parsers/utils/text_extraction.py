@@ -0,0 +1,101 @@
+"""
+テキスト抽出共通関数
+
+各パーサーが返す解析結果の型と、テキスト整形の共通処理
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# 見出しとみなす行のパターン（第1章、1. 概要、1.2 目的、■概要、【概要】など）
+_HEADING_PATTERN = re.compile(
+    r"^(?:第[0-9０-９一二三四五六七八九十]+[章節部]|[0-9０-９]+(?:[.．][0-9０-９]+)*[.．]?\s|[■□◆◇●]|【[^】]{1,30}】$)"
+)
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_SPACES = re.compile(r"[ \t　]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+@dataclass
+class TextSection:
+    """ドキュメントの一区画（ページ、見出し単位の節、シートなど）"""
+    text: str
+    page: Optional[int] = None
+    heading: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class ParsedDocument:
+    """パーサーの解析結果"""
+    sections: List[TextSection]
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    tables: List[Any] = field(default_factory=list)  # 表として取り出したシート（parsers.utils.tables.TableData）
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(section.text for section in self.sections if section.text)
+
+
+def normalize_text(text: str) -> str:
+    """
+    抽出テキストを整形
+
+    制御文字の除去、連続する空白・空行の圧縮を行う。全角英数字は検索のため NFKC で半角に揃える
+
+    Args:
+        text: 抽出されたテキスト
+
+    Returns:
+        整形後のテキスト
+    """
+    text = unicodedata.normalize("NFKC", text)
+    text = _CONTROL_CHARS.sub("", text)
+    text = _SPACES.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.splitlines())
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def is_heading(line: str) -> bool:
+    """
+    見出し行かどうかを推定
+
+    Args:
+        line: 1行分のテキスト
+
+    Returns:
+        見出しらしければ True
+    """
+    line = line.strip()
+    return 0 < len(line) <= 60 and bool(_HEADING_PATTERN.match(line))
+
+
+def split_by_headings(text: str, page: Optional[int] = None) -> List[TextSection]:
+    """
+    見出し行でテキストを節に分割
+
+    Args:
+        text: 整形済みテキスト
+        page: ページ番号（オプション）
+
+    Returns:
+        節のリスト
+    """
+    sections: List[TextSection] = []
+    heading: Optional[str] = None
+    lines: List[str] = []
+
+    for line in text.splitlines():
+        if is_heading(line):
+            if lines:
+                sections.append(TextSection("\n".join(lines).strip(), page=page, heading=heading))
+            heading = line.strip()
+            lines = [line]
+        else:
+            lines.append(line)
+
+    if lines and "\n".join(lines).strip():
+        sections.append(TextSection("\n".join(lines).strip(), page=page, heading=heading))
+    return sections
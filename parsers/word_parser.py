@@ -0,0 +1,60 @@
+"""
+Wordパーサー
+
+段落の見出しスタイルを使って節に分割する。表はタブ区切りのテキストとして含める
+"""
+
+import logging
+from typing import List, Optional
+
+from docx import Document
+
+from .utils.text_extraction import ParsedDocument, TextSection, is_heading, normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+def _is_heading_style(style_name: str) -> bool:
+    return style_name.startswith("Heading") or style_name.startswith("見出し") or style_name == "Title"
+
+
+def parse_word(path: str) -> ParsedDocument:
+    """
+    Wordファイル（.docx）を解析
+
+    Args:
+        path: ファイルパス
+
+    Returns:
+        解析結果
+    """
+    document = Document(path)
+    sections: List[TextSection] = []
+    heading: Optional[str] = None
+    lines: List[str] = []
+
+    def flush():
+        text = normalize_text("\n".join(lines))
+        if text:
+            sections.append(TextSection(text, heading=heading))
+
+    for paragraph in document.paragraphs:
+        text = paragraph.text.strip()
+        if not text:
+            continue
+        style_name = paragraph.style.name if paragraph.style is not None else ""
+        if _is_heading_style(style_name) or is_heading(text):
+            flush()
+            heading = text
+            lines = [text]
+        else:
+            lines.append(text)
+    flush()
+
+    for table_number, table in enumerate(document.tables, start=1):
+        rows = ["\t".join(cell.text.strip() for cell in row.cells) for row in table.rows]
+        text = normalize_text("\n".join(rows))
+        if text:
+            sections.append(TextSection(text, heading=f"表{table_number}", metadata={"table": table_number}))
+
+    return ParsedDocument(sections=sections, metadata={"format": "word", "tables": len(document.tables)})
@@ -2,6 +2,55 @@
 RAGエンジンパッケージ
 
 ドキュメントの処理、インデクシング、検索、LLM連携を担当するモジュール
+
+埋め込み・検索・LLM のモジュールは numpy や sentence-transformers などの重いライブラリを
+読み込むため、パッケージの import では読み込まない。主要なクラスはここから参照できるが、
+実際のモジュールは最初に属性を参照したときに読み込む（PEP 562）
 """
 
-__version__ = "0.1.0"
\ No newline at end of file
+import importlib
+from typing import TYPE_CHECKING, Any
+
+__version__ = "0.1.0"
+
+# 公開名 -> 定義しているモジュール
+_LAZY_EXPORTS = {
+    "DocumentProcessor": ".indexer.document_processor",
+    "EmbeddingModel": ".indexer.embedding",
+    "get_embedding_model": ".indexer.embedding",
+    "HybridSearcher": ".retriever.hybrid_search",
+    "RetrievedChunk": ".retriever.hybrid_search",
+    "get_searcher": ".retriever.hybrid_search",
+    "VectorStore": ".retriever.vector_store",
+    "get_vector_store": ".retriever.vector_store",
+    "LLMProvider": ".llm.router",
+    "LLMRouter": ".llm.router",
+    "AccessContext": ".security.content_filter",
+    "PermissionIndex": ".security.content_filter",
+    "EnvelopeCipher": ".security.encryption",
+    "KeyRing": ".security.encryption",
+}
+
+__all__ = sorted(_LAZY_EXPORTS)
+
+if TYPE_CHECKING:
+    from .indexer.document_processor import DocumentProcessor
+    from .indexer.embedding import EmbeddingModel, get_embedding_model
+    from .llm.router import LLMProvider, LLMRouter
+    from .retriever.hybrid_search import HybridSearcher, RetrievedChunk, get_searcher
+    from .retriever.vector_store import VectorStore, get_vector_store
+    from .security.content_filter import AccessContext, PermissionIndex
+    from .security.encryption import EnvelopeCipher, KeyRing
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value  # 2回目以降は通常の属性参照で済ませる
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
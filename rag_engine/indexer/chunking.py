@@ -0,0 +1,106 @@
+"""
+チャンキング
+
+解析済みドキュメントを、文の区切りを尊重しながら一定の文字数のチャンクに分割する
+"""
+
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "600"))  # 文字数
+CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "100"))
+
+# チャンクIDの名前空間（ドキュメントIDとチャンク番号から決定的に生成する）
+_CHUNK_NAMESPACE = uuid.UUID("6f1c5a52-3b1e-4d8e-9a57-2a4c3e1b9d10")
+_SENTENCE_END = re.compile(r"(?<=[。．！？!?\n])")
+
+
+@dataclass
+class Chunk:
+    """インデックス対象のチャンク"""
+    chunk_id: str
+    doc_id: str
+    index: int
+    text: str
+    page: Optional[int] = None
+    heading: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+def make_chunk_id(doc_id: str, index: int) -> str:
+    """ドキュメントIDとチャンク番号からチャンクID（UUID文字列）を生成"""
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f"{doc_id}:{index}"))
+
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    テキストを文単位でまとめてチャンクに分割
+
+    1文が chunk_size を超える場合はその文を文字数で分割する
+
+    Args:
+        text: 対象テキスト
+        chunk_size: チャンクの最大文字数
+        overlap: 前のチャンクと重複させる文字数
+
+    Returns:
+        チャンクのテキスト
+    """
+    sentences = [s for s in _SENTENCE_END.split(text) if s.strip()]
+    chunks: List[str] = []
+    current = ""
+
+    for sentence in sentences:
+        while len(sentence) > chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:chunk_size])
+            sentence = sentence[chunk_size - overlap:]
+        if len(current) + len(sentence) > chunk_size and current:
+            chunks.append(current)
+            current = current[-overlap:] if overlap else ""
+        current += sentence
+
+    if current.strip():
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+
+def chunk_document(
+    doc_id: str,
+    parsed,
+    chunk_size: int = CHUNK_SIZE,
+    overlap: int = CHUNK_OVERLAP,
+) -> List[Chunk]:
+    """
+    解析済みドキュメントをチャンクに分割
+
+    チャンクは節（ページ・見出し）をまたがない
+
+    Args:
+        doc_id: ドキュメントID
+        parsed: parsers.ParsedDocument
+        chunk_size: チャンクの最大文字数
+        overlap: 重複文字数
+
+    Returns:
+        チャンクのリスト
+    """
+    chunks: List[Chunk] = []
+    for section in parsed.sections:
+        for text in split_text(section.text, chunk_size, overlap):
+            index = len(chunks)
+            chunks.append(Chunk(
+                chunk_id=make_chunk_id(doc_id, index),
+                doc_id=doc_id,
+                index=index,
+                text=text,
+                page=section.page,
+                heading=section.heading,
+                metadata=dict(section.metadata),
+            ))
+    return chunks
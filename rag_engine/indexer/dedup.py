@@ -0,0 +1,488 @@
+"""
+重複チャンクの検出
+
+版違いのドキュメント（v1.0 / v1.1 / 最終版 など）は大部分の段落が同じか、わずかに違うだけになる。
+チャンクの文字シングルの MinHash 署名を LSH（帯分割）で索引し、推定 Jaccard 類似度がしきい値以上の
+チャンクは最初に登録されたチャンク（代表チャンク）1つだけを埋め込んでベクトルストアに格納する。
+重複したチャンクのドキュメント・番号・ページは代表チャンクの参照元（sources）として残し、
+検索結果の引用に使う。
+
+重複とみなすのは権限（機密レベル・許可グループ・送信許可プロバイダー）が同じドキュメントの
+チャンクだけに限る。代表チャンクは元のドキュメントの権限で判定されるため、権限の違うドキュメント
+同士をまとめると参照範囲が変わってしまう
+"""
+
+import json
+import logging
+import os
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.85"))  # 重複とみなす推定 Jaccard 類似度
+DEDUP_NUM_PERM = int(os.environ.get("DEDUP_NUM_PERM", "128"))  # MinHash 署名の長さ
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", "16"))  # LSH の帯の数（DEDUP_NUM_PERM の約数）
+DEDUP_SHINGLE = int(os.environ.get("DEDUP_SHINGLE", "5"))  # シングルの文字数
+DEDUP_INDEX_PATH = os.environ.get("DEDUP_INDEX_PATH", "/data/indexes/minhash")
+DEDUP_MIN_CHARS = 50  # これより短いチャンクは重複判定しない（見出しだけのチャンクなど）
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SHINGLE_BASE = np.uint64(1000003)
+_SEED = 1
+_INITIAL_CAPACITY = 1024
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(ch for ch in text if not ch.isspace())
+
+
+def shingle_hashes(text: str, size: int = DEDUP_SHINGLE) -> np.ndarray:
+    """
+    文字シングル（連続する size 文字）の 32bit ハッシュ（分かち書きなしで日本語に使える）
+
+    Args:
+        text: 対象テキスト
+        size: シングルの文字数
+
+    Returns:
+        重複を除いたハッシュ値（uint64 の配列、値は 32bit の範囲）
+    """
+    text = _normalize(text)
+    if not text:
+        return np.zeros(0, dtype=np.uint64)
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        codes = np.concatenate([codes, np.zeros(size - len(codes), dtype=np.uint64)])
+    # 多項式ローリングハッシュ（2^64 での桁あふれは下位 32bit に影響しない）
+    windows = np.lib.stride_tricks.sliding_window_view(codes, size)
+    powers = _SHINGLE_BASE ** np.arange(size - 1, -1, -1, dtype=np.uint64)
+    hashes = (windows * powers).sum(axis=1, dtype=np.uint64) & _MAX_HASH
+    # 近い値に偏らないよう、ビットを混ぜる（murmur3 の finalizer）
+    hashes ^= hashes >> np.uint64(16)
+    hashes = (hashes * np.uint64(0x85EBCA6B)) & _MAX_HASH
+    hashes ^= hashes >> np.uint64(13)
+    hashes = (hashes * np.uint64(0xC2B2AE35)) & _MAX_HASH
+    hashes ^= hashes >> np.uint64(16)
+    return np.unique(hashes)
+
+
+class MinHasher:
+    """文字シングルの MinHash 署名を計算する"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, shingle: int = DEDUP_SHINGLE, seed: int = _SEED):
+        """
+        初期化
+
+        Args:
+            num_perm: 署名の長さ（ハッシュ関数の数）
+            shingle: シングルの文字数
+            seed: ハッシュ関数の係数の乱数シード（保存済みの署名と揃える必要がある）
+        """
+        self.num_perm = num_perm
+        self.shingle = shingle
+        rng = np.random.RandomState(seed)
+        # (a * x + b) mod p。x と a, b が 32bit に収まるので、積と和は uint64 であふれない
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        テキストの MinHash 署名
+
+        Args:
+            text: 対象テキスト
+
+        Returns:
+            shape=(num_perm,) の uint32 配列
+        """
+        hashes = shingle_hashes(text, self.shingle)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, 0xFFFFFFFF, dtype=np.uint32)
+        permuted = ((self._a * hashes[None, :] + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        複数テキストの MinHash 署名
+
+        Args:
+            texts: 対象テキスト
+
+        Returns:
+            shape=(len(texts), num_perm) の uint32 配列
+        """
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for i, text in enumerate(texts):
+            signatures[i] = self.signature(text)
+        return signatures
+
+
+def acl_key(metadata: Dict[str, Any]) -> str:
+    """重複判定で同じ権限とみなすためのキー（機密レベル・許可グループ・送信許可プロバイダー）"""
+    providers = metadata.get("allowed_providers")
+    return json.dumps([
+        int(metadata.get("confidentiality", 1)),
+        sorted(metadata.get("groups") or []),
+        sorted(providers) if providers is not None else None,
+    ])
+
+
+class NearDuplicateIndex:
+    """代表チャンクの MinHash 署名の LSH 索引と、重複したチャンクの参照元"""
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS, threshold: float = DEDUP_THRESHOLD):
+        """
+        初期化
+
+        Args:
+            num_perm: 署名の長さ
+            bands: LSH の帯の数（帯ごとの行数は num_perm / bands）
+            threshold: 重複とみなす推定 Jaccard 類似度
+
+        Raises:
+            ValueError: bands が num_perm の約数でない場合
+        """
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_BANDS ({bands}) must divide DEDUP_NUM_PERM ({num_perm})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+        # 代表チャンク（行番号で対応）
+        self._chunk_ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._owners: List[str] = []
+        self._acls: List[str] = []
+        self._signatures = np.zeros((_INITIAL_CAPACITY, num_perm), dtype=np.uint32)
+        self._active = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+
+        # 帯ごとのバケット（署名の一部のバイト列 → 行番号）
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        # 代表チャンクID → 重複したチャンクの参照元
+        self._sources: Dict[str, List[Dict[str, Any]]] = {}
+
+    def __len__(self) -> int:
+        return int(self._active[:len(self._chunk_ids)].sum())
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            start = band * self.rows_per_band
+            yield band, signature[start:start + self.rows_per_band].tobytes()
+
+    def _grow(self, needed: int):
+        capacity = len(self._active)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        signatures = np.zeros((new_capacity, self.num_perm), dtype=np.uint32)
+        signatures[:capacity] = self._signatures
+        active = np.zeros(new_capacity, dtype=bool)
+        active[:capacity] = self._active
+        self._signatures, self._active = signatures, active
+
+    def _find(self, signature: np.ndarray, acl: str) -> Optional[int]:
+        """同じ権限の代表チャンクのうち、推定類似度がしきい値以上で最も近いものの行番号"""
+        candidates: Set[int] = set()
+        for band, key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        candidates = [row for row in candidates if self._active[row] and self._acls[row] == acl]
+        if not candidates:
+            return None
+        rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._signatures[rows] == signature).mean(axis=1)
+        best = int(similarity.argmax())
+        return int(rows[best]) if similarity[best] >= self.threshold else None
+
+    def _record_row(self, journal: Optional[List[tuple]], row: Optional[int], chunk_id: str):
+        if journal is None:
+            return
+        if row is None:
+            journal.append(("row", chunk_id, None))
+        else:
+            state = (self._owners[row], self._acls[row], self._signatures[row].copy(), bool(self._active[row]))
+            journal.append(("row", chunk_id, state))
+
+    def _add(
+        self, chunk_id: str, doc_id: str, acl: str, signature: np.ndarray, journal: Optional[List[tuple]] = None
+    ):
+        row = self._rows.get(chunk_id)
+        self._record_row(journal, row, chunk_id)
+        if row is None:
+            row = len(self._chunk_ids)
+            self._grow(row + 1)
+            self._chunk_ids.append(chunk_id)
+            self._owners.append(doc_id)
+            self._acls.append(acl)
+            self._rows[chunk_id] = row
+        else:
+            self._drop_from_buckets(row)
+            self._owners[row] = doc_id
+            self._acls[row] = acl
+        self._signatures[row] = signature
+        self._active[row] = True
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(row)
+
+    def _drop_from_buckets(self, row: int):
+        for band, key in self._band_keys(self._signatures[row]):
+            bucket = self._buckets[band].get(key)
+            if bucket is not None and row in bucket:
+                bucket.remove(row)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def claim(
+        self,
+        chunk_id: str,
+        doc_id: str,
+        acl: str,
+        signature: np.ndarray,
+        source: Dict[str, Any],
+        journal: Optional[List[tuple]] = None,
+    ) -> Optional[str]:
+        """
+        チャンクの重複を判定し、重複なら代表チャンクの参照元に加え、重複でなければ代表チャンクとして登録
+
+        Args:
+            chunk_id: チャンクID
+            doc_id: ドキュメントID
+            acl: acl_key() で作った権限のキー
+            signature: MinHash 署名
+            source: 重複だった場合に参照元として残す情報（doc_id, filename, chunk_index, page）
+            journal: 変更を取り消すための記録の追記先（rollback() に渡す）
+
+        Returns:
+            重複なら代表チャンクのID（重複でなければ None）
+        """
+        with self._lock:
+            row = self._find(signature, acl)
+            if row is None:
+                self._add(chunk_id, doc_id, acl, signature, journal)
+                return None
+            canonical = self._chunk_ids[row]
+            self._add_refs(canonical, [dict(source)], journal)
+            return canonical
+
+    def _add_refs(self, chunk_id: str, refs: List[Dict[str, Any]], journal: Optional[List[tuple]]):
+        self._sources.setdefault(chunk_id, []).extend(refs)
+        if journal is not None:
+            journal.append(("refs_added", chunk_id, refs))
+
+    def _remove_refs(self, chunk_id: str, doc_id: str, journal: Optional[List[tuple]]) -> List[Dict[str, Any]]:
+        """参照元から doc_id のものを取り除き、残りを返す"""
+        refs = self._sources.pop(chunk_id, [])
+        kept = [ref for ref in refs if ref["doc_id"] != doc_id]
+        if kept:
+            self._sources[chunk_id] = kept
+        if journal is not None and len(kept) != len(refs):
+            journal.append(("refs_removed", chunk_id, [ref for ref in refs if ref["doc_id"] == doc_id]))
+        return kept
+
+    def sources(self, chunk_id: str) -> List[Dict[str, Any]]:
+        """
+        代表チャンクの参照元
+
+        Args:
+            chunk_id: 代表チャンクのID
+
+        Returns:
+            重複したチャンクの参照元（doc_id, filename, chunk_index, page）
+        """
+        with self._lock:
+            return list(self._sources.get(chunk_id, []))
+
+    def owner(self, chunk_id: str) -> Optional[str]:
+        """
+        代表チャンクを格納しているドキュメント
+
+        Args:
+            chunk_id: 代表チャンクのID
+
+        Returns:
+            ドキュメントID（代表チャンクでなければ None）
+        """
+        with self._lock:
+            row = self._rows.get(chunk_id)
+            return self._owners[row] if row is not None and self._active[row] else None
+
+    def remove_document(self, doc_id: str, journal: Optional[List[tuple]] = None) -> Tuple[Dict[str, Any], Set[str]]:
+        """
+        ドキュメントの代表チャンクと参照元を取り除く（再インジェストの前に呼ぶ）
+
+        Args:
+            doc_id: ドキュメントID
+            journal: 変更を取り消すための記録の追記先（rollback() に渡す）
+
+        Returns:
+            (ほかのドキュメントから参照されていた代表チャンクの署名と参照元（reattach() に渡す）,
+             参照元が減った、ほかのドキュメントの代表チャンクのID)
+        """
+        orphans: Dict[str, Any] = {}
+        touched: Set[str] = set()
+        with self._lock:
+            for row, owner in enumerate(self._owners):
+                if owner != doc_id or not self._active[row]:
+                    continue
+                chunk_id = self._chunk_ids[row]
+                self._record_row(journal, row, chunk_id)
+                self._active[row] = False
+                self._drop_from_buckets(row)
+                refs = self._sources.pop(chunk_id, [])
+                if journal is not None and refs:
+                    journal.append(("refs_removed", chunk_id, refs))
+                refs = [ref for ref in refs if ref["doc_id"] != doc_id]
+                if refs:
+                    orphans[chunk_id] = (self._signatures[row].copy(), self._acls[row], refs)
+
+            for chunk_id, refs in list(self._sources.items()):
+                if any(ref["doc_id"] == doc_id for ref in refs):
+                    self._remove_refs(chunk_id, doc_id, journal)
+                    touched.add(chunk_id)
+        return orphans, touched
+
+    def reattach(self, orphans: Dict[str, Any], journal: Optional[List[tuple]] = None) -> Set[str]:
+        """
+        再インジェストで代表チャンクが入れ替わったあと、ほかのドキュメントからの参照元を新しい代表チャンクに付け替える
+
+        新しい版に近いチャンクが見つからない参照元は失われる（そのドキュメントは再インジェストが必要）
+
+        Args:
+            orphans: remove_document() が返した代表チャンクの署名と参照元
+            journal: 変更を取り消すための記録の追記先（rollback() に渡す）
+
+        Returns:
+            参照元を付け替えた代表チャンクのID
+        """
+        touched: Set[str] = set()
+        with self._lock:
+            for old_id, (signature, acl, refs) in orphans.items():
+                row = self._find(signature, acl)
+                if row is None:
+                    documents = sorted({ref["doc_id"] for ref in refs})
+                    logger.warning(
+                        f"Chunk {old_id} was shared by {documents} but has no near-duplicate after re-ingestion; "
+                        "re-ingest those documents to restore it"
+                    )
+                    continue
+                canonical = self._chunk_ids[row]
+                self._add_refs(canonical, list(refs), journal)
+                touched.add(canonical)
+        return touched
+
+    def rollback(self, journal: List[tuple]):
+        """
+        remove_document()・claim()・reattach() の変更を取り消す（インジェストが失敗した場合）
+
+        ほかのドキュメントの並行したインジェストによる変更は残したまま、journal に記録した変更だけを
+        新しいものから順に元に戻す
+
+        Args:
+            journal: 変更を記録したリスト
+        """
+        with self._lock:
+            for kind, chunk_id, value in reversed(journal):
+                if kind == "refs_added":
+                    added = {id(ref) for ref in value}
+                    kept = [ref for ref in self._sources.get(chunk_id, []) if id(ref) not in added]
+                    if kept:
+                        self._sources[chunk_id] = kept
+                    else:
+                        self._sources.pop(chunk_id, None)
+                elif kind == "refs_removed":
+                    self._sources.setdefault(chunk_id, []).extend(value)
+                else:
+                    row = self._rows[chunk_id]
+                    if self._active[row]:
+                        self._drop_from_buckets(row)
+                    if value is None:
+                        self._active[row] = False
+                        continue
+                    self._owners[row], self._acls[row], self._signatures[row], self._active[row] = value
+                    if self._active[row]:
+                        for band, key in self._band_keys(self._signatures[row]):
+                            self._buckets[band].setdefault(key, []).append(row)
+            journal.clear()
+
+    # --------------------------------------------------
+    # 永続化
+    # --------------------------------------------------
+    def save(self, path: str = DEDUP_INDEX_PATH):
+        """
+        索引を保存（署名は .npz、ID対応表と参照元は .json）
+
+        一時ファイルに書いてから .npz、.json の順に置き換える（行は追加されるだけなので、途中で止まっても
+        .json に載っている行はすべて .npz にある）
+
+        Args:
+            path: 拡張子を除いた保存先パス
+        """
+        base = Path(path)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            count = len(self._chunk_ids)
+            tmp_path = base.with_suffix(".npz.tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(f, signatures=self._signatures[:count], active=self._active[:count])
+            os.replace(tmp_path, base.with_suffix(".npz"))
+            tmp_path = base.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({
+                    "num_perm": self.num_perm,
+                    "chunk_ids": self._chunk_ids,
+                    "owners": self._owners,
+                    "acls": self._acls,
+                    "sources": self._sources,
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, base.with_suffix(".json"))
+
+    @classmethod
+    def load(cls, path: str = DEDUP_INDEX_PATH) -> "NearDuplicateIndex":
+        """
+        保存した索引を読み込む（存在しない・署名の長さが違う場合は空の索引）
+
+        Args:
+            path: 拡張子を除いた保存先パス
+
+        Returns:
+            索引
+        """
+        index = cls()
+        base = Path(path)
+        if not base.with_suffix(".npz").exists():
+            return index
+
+        with open(base.with_suffix(".json"), "r") as f:
+            ids = json.load(f)
+        if ids["num_perm"] != index.num_perm:
+            logger.warning(
+                f"Near-duplicate index at {path} uses {ids['num_perm']} permutations "
+                f"(DEDUP_NUM_PERM={index.num_perm}); starting with an empty index"
+            )
+            return index
+        arrays = np.load(base.with_suffix(".npz"))
+
+        index._chunk_ids = ids["chunk_ids"]
+        index._rows = {chunk_id: row for row, chunk_id in enumerate(index._chunk_ids)}
+        index._owners = ids["owners"]
+        index._acls = ids["acls"]
+        index._sources = ids["sources"]
+        count = len(index._chunk_ids)
+        index._grow(count)
+        # .npz が .json より新しい場合は、.json に載っている行まで使う
+        index._signatures[:count] = arrays["signatures"][:count]
+        index._active[:count] = arrays["active"][:count]
+        for row in np.flatnonzero(index._active[:count]):
+            for band, key in index._band_keys(index._signatures[row]):
+                index._buckets[band].setdefault(key, []).append(int(row))
+        logger.info(f"Loaded near-duplicate index with {len(index)} canonical chunks")
+        return index
@@ -0,0 +1,356 @@
+"""
+ドキュメント処理
+
+保存済み（暗号化済み）のドキュメントを解析し、チャンク分割・個人情報マスキング・埋め込み生成を経て
+ベクトルストアに登録するインジェストパイプライン
+
+Excel の表のシートは行を埋め込まず、表データストア（SQLite）に格納して要約だけを埋め込む。
+既存のチャンクとほぼ同じ内容のチャンク（版違いのドキュメントなど）は埋め込まず、代表チャンクの
+参照元として記録する（dedup モジュールを参照）。
+検索で候補のドキュメントを先に選べるよう、ドキュメント・節単位の要約も別のコレクションに登録する
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from parsers import ParsedDocument, parse_document
+
+from ..metrics import INGESTION_CHUNKS
+from ..retriever.section_index import SectionSummary, get_section_store, summarize_sections
+from ..retriever.table_store import TableStore, get_table_store
+from ..retriever.vector_store import VectorStore, get_vector_store
+from ..security.content_filter import PermissionIndex
+from ..security.encryption import EnvelopeCipher, KeyRing, decrypt_stream
+from ..security.pii_detection import PIIDetector, get_detector, scan_many
+from .chunking import Chunk, chunk_document
+from .dedup import DEDUP_ENABLED, DEDUP_INDEX_PATH, DEDUP_MIN_CHARS, MinHasher, NearDuplicateIndex, acl_key
+from .embedding import EmbeddingModel, get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+PII_MASKING_ENABLED = os.environ.get("PII_MASKING_ENABLED", "true").lower() == "true"
+# 個人情報の検出に使うプロセス数（1 なら同じプロセスで実行。大きなドキュメントの一括インジェスト向け）
+PII_SCAN_PROCESSES = int(os.environ.get("PII_SCAN_PROCESSES", "1"))
+UPSERT_BATCH_SIZE = 128
+
+# 進捗通知: (ステージ名, ステージ内の進捗 0.0-1.0)
+ProgressCallback = Callable[[str, float], Awaitable[None]]
+
+
+async def _no_progress(stage: str, fraction: float):
+    pass
+
+
+class DocumentProcessor:
+    """インジェストパイプライン"""
+
+    def __init__(
+        self,
+        embedding_model: Optional[EmbeddingModel] = None,
+        vector_store: Optional[VectorStore] = None,
+        cipher: Optional[EnvelopeCipher] = None,
+        permission_index: Optional[PermissionIndex] = None,
+        pii_detector: Optional[PIIDetector] = None,
+        key_ring: Optional[KeyRing] = None,
+        table_store: Optional[TableStore] = None,
+        dedup_index: Optional[NearDuplicateIndex] = None,
+        dedup_enabled: bool = DEDUP_ENABLED,
+        section_store: Optional[VectorStore] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            embedding_model: 埋め込みモデル
+            vector_store: ベクトルストア
+            cipher: チャンク本文のエンベロープ暗号化
+            permission_index: 権限索引
+            pii_detector: 個人情報検出エンジン
+            key_ring: 保存ファイルの復号に使うキーリング
+            table_store: 表データストア
+            dedup_index: 重複チャンクの索引
+            dedup_enabled: 重複チャンクを格納せずに代表チャンクの参照元にするか
+            section_store: ドキュメント・節単位の要約索引
+        """
+        self.key_ring = key_ring or KeyRing.from_env()
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.vector_store = vector_store or get_vector_store()
+        self.cipher = cipher or EnvelopeCipher(self.key_ring)
+        self.permission_index = permission_index or PermissionIndex.load()
+        self.pii_detector = pii_detector or get_detector()
+        self.table_store = table_store or get_table_store()
+        self.section_store = section_store or get_section_store()
+        self.dedup_index: Optional[NearDuplicateIndex] = None
+        if dedup_enabled:
+            self.dedup_index = dedup_index or NearDuplicateIndex.load()
+            self.min_hasher = MinHasher(self.dedup_index.num_perm)
+
+    def _parse(self, path: str, filename: str) -> ParsedDocument:
+        """暗号化ファイルを一時ファイルに復号してから解析する"""
+        suffix = Path(filename).suffix
+        with tempfile.NamedTemporaryFile(suffix=suffix) as plain:
+            with open(path, "rb") as src:
+                decrypt_stream(src, plain, self.key_ring)
+            plain.flush()
+            return parse_document(plain.name, filename)
+
+    def _mask_chunks(self, chunks: List[Chunk]):
+        """チャンクの個人情報をマスキング（PII_SCAN_PROCESSES > 1 ならプロセスプールで検出する）"""
+        texts = [chunk.text for chunk in chunks]
+        for chunk, matches in zip(chunks, scan_many(texts, self.pii_detector, PII_SCAN_PROCESSES)):
+            chunk.text = self.pii_detector.mask(chunk.text, matches)
+
+    def _deduplicate(
+        self,
+        doc_id: str,
+        filename: str,
+        metadata: Dict[str, Any],
+        chunks: List[Chunk],
+        journal: List[tuple],
+    ) -> Tuple[Dict[str, str], Set[str]]:
+        """
+        既存の代表チャンクとほぼ同じチャンクを判定し、代表チャンクの参照元に記録する
+
+        索引への変更は journal に記録し、登録が失敗した場合は NearDuplicateIndex.rollback() で取り消す
+
+        Returns:
+            (重複したチャンクID → 代表チャンクID, 参照元が変わった代表チャンクのID)
+        """
+        # 再インジェストでは前回の登録を取り除いてから判定し直す
+        orphans, touched = self.dedup_index.remove_document(doc_id, journal)
+        acl = acl_key(metadata)
+        # 表の要約は表データストアのドキュメントIDに結び付いているので、まとめない
+        candidates = [
+            chunk for chunk in chunks
+            if len(chunk.text) >= DEDUP_MIN_CHARS and not chunk.metadata.get("table")
+        ]
+        signatures = self.min_hasher.signatures([chunk.text for chunk in candidates])
+
+        duplicates: Dict[str, str] = {}
+        for chunk, signature in zip(candidates, signatures):
+            source = {"doc_id": doc_id, "filename": filename, "chunk_index": chunk.index, "page": chunk.page}
+            canonical = self.dedup_index.claim(chunk.chunk_id, doc_id, acl, signature, source, journal)
+            if canonical is not None:
+                duplicates[chunk.chunk_id] = canonical
+                touched.add(canonical)
+        touched |= self.dedup_index.reattach(orphans, journal)
+        return duplicates, touched
+
+    async def process(
+        self,
+        doc_id: str,
+        path: str,
+        filename: str,
+        metadata: Dict[str, Any],
+        progress: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
+        """
+        ドキュメントをインデックスに登録
+
+        Args:
+            doc_id: ドキュメントID
+            path: 暗号化されたドキュメントのパス
+            filename: 元のファイル名
+            metadata: メタデータ（confidentiality, groups など）
+            progress: 進捗通知（例外を送出すると処理を中断できる）
+
+        Returns:
+            処理結果のサマリー
+        """
+        report = progress or _no_progress
+
+        await report("parsing", 0.0)
+        parsed = await asyncio.to_thread(self._parse, path, filename)
+        await report("parsing", 1.0)
+
+        chunks = chunk_document(doc_id, parsed)
+        if PII_MASKING_ENABLED:
+            await asyncio.to_thread(self._mask_chunks, chunks)
+
+        journal: List[tuple] = []
+        try:
+            return await self._process_chunks(doc_id, filename, metadata, parsed, chunks, report, journal)
+        except BaseException:
+            # 格納に失敗した（中断された）ドキュメントの重複判定を取り消し、次の試行で判定し直す
+            if journal:
+                self.dedup_index.rollback(journal)
+                self.dedup_index.save(DEDUP_INDEX_PATH)
+            raise
+
+    async def _process_chunks(
+        self,
+        doc_id: str,
+        filename: str,
+        metadata: Dict[str, Any],
+        parsed: ParsedDocument,
+        chunks: List[Chunk],
+        report: ProgressCallback,
+        journal: List[tuple],
+    ) -> Dict[str, Any]:
+        duplicates: Dict[str, str] = {}
+        touched: Set[str] = set()
+        if self.dedup_index is not None:
+            dedup = asyncio.ensure_future(
+                asyncio.to_thread(self._deduplicate, doc_id, filename, metadata, chunks, journal)
+            )
+            try:
+                duplicates, touched = await asyncio.shield(dedup)
+            except asyncio.CancelledError:
+                # スレッドは止められないので、索引への変更が出そろってから取り消す
+                await asyncio.wait([dedup])
+                raise
+        stored = [chunk for chunk in chunks if chunk.chunk_id not in duplicates]
+
+        summaries = summarize_sections(doc_id, filename, parsed)
+        if PII_MASKING_ENABLED:
+            for summary in summaries:
+                summary.text = self.pii_detector.mask(summary.text)
+        await report("chunking", 1.0)
+
+        # 表は行ごとに埋め込まず、SQL で集計できるよう表データストアに格納する
+        if parsed.tables:
+            if PII_MASKING_ENABLED:
+                for table in parsed.tables:
+                    table.rows = [
+                        [self.pii_detector.mask(value) if isinstance(value, str) else value for value in row]
+                        for row in table.rows
+                    ]
+            await asyncio.to_thread(self.table_store.save, doc_id, parsed.tables)
+        else:
+            await asyncio.to_thread(self.table_store.delete, doc_id)
+
+        vectors = []
+        batch_size = self.embedding_model.batch_size * 4
+        for start in range(0, len(stored), batch_size):
+            texts = [chunk.text for chunk in stored[start:start + batch_size]]
+            vectors.extend(await asyncio.to_thread(self.embedding_model.embed_documents, texts))
+            await report("embedding", min(1.0, (start + batch_size) / len(stored)))
+        section_vectors = await asyncio.to_thread(
+            self.embedding_model.embed_documents, [summary.text for summary in summaries]
+        )
+
+        # 重複としてまとめた本文は代表チャンクのドキュメントIDで格納されているので、絞り込みの対象に加える
+        owners = {self.dedup_index.owner(canonical) for canonical in set(duplicates.values())}
+        chunk_doc_ids = sorted(owner for owner in owners if owner and owner != doc_id)
+        await self._index_sections(doc_id, filename, summaries, section_vectors, chunk_doc_ids)
+        await self._index(doc_id, filename, metadata, stored, vectors, report, touched)
+        INGESTION_CHUNKS.inc(len(stored), result="stored")
+        INGESTION_CHUNKS.inc(len(duplicates), result="duplicate")
+        logger.info(
+            f"Indexed document {doc_id} ({filename}): {len(stored)} chunks stored, "
+            f"{len(duplicates)} near-duplicates of existing chunks"
+        )
+        return {
+            "sections": len(parsed.sections),
+            "chunks": len(chunks),
+            "duplicates": len(duplicates),
+            "tables": len(parsed.tables),
+        }
+
+    async def _index(
+        self,
+        doc_id: str,
+        filename: str,
+        metadata: Dict[str, Any],
+        chunks: List[Chunk],
+        vectors: list,
+        report: ProgressCallback,
+        touched: Set[str],
+    ):
+        confidentiality = int(metadata.get("confidentiality", 1))
+        await report("indexing", 0.0)
+        if chunks:
+            await asyncio.to_thread(self.vector_store.ensure_collection, len(vectors[0]))
+        # 再試行時に古いチャンクが残らないよう、先に既存のチャンクを削除する
+        await asyncio.to_thread(self.vector_store.delete_document, doc_id)
+
+        for start in range(0, len(chunks), UPSERT_BATCH_SIZE):
+            batch = chunks[start:start + UPSERT_BATCH_SIZE]
+            payloads = [
+                {
+                    "doc_id": doc_id,
+                    "filename": filename,
+                    "chunk_index": chunk.index,
+                    "page": chunk.page,
+                    "heading": chunk.heading,
+                    "table": chunk.metadata.get("table"),
+                    "confidentiality": confidentiality,
+                    # この代表チャンクと重複した、ほかのドキュメント（版）のチャンク
+                    "sources": self.dedup_index.sources(chunk.chunk_id) if self.dedup_index else [],
+                    "ciphertext": base64.b64encode(
+                        self.cipher.encrypt_chunk(doc_id, chunk.chunk_id, chunk.text)
+                    ).decode("ascii"),
+                }
+                for chunk in batch
+            ]
+            await asyncio.to_thread(
+                self.vector_store.upsert,
+                [chunk.chunk_id for chunk in batch],
+                vectors[start:start + UPSERT_BATCH_SIZE],
+                payloads,
+            )
+            await report("indexing", min(1.0, (start + UPSERT_BATCH_SIZE) / len(chunks)))
+
+        self.permission_index.upsert_document(
+            doc_id,
+            confidentiality=confidentiality,
+            groups=metadata.get("groups"),
+            allowed_providers=metadata.get("allowed_providers"),
+        )
+        self.permission_index.add_chunks(doc_id, [chunk.chunk_id for chunk in chunks])
+        await asyncio.to_thread(self.permission_index.save)
+
+        if self.dedup_index is not None:
+            await self._update_sources(touched - {chunk.chunk_id for chunk in chunks})
+            await asyncio.to_thread(self.dedup_index.save, DEDUP_INDEX_PATH)
+        await report("indexing", 1.0)
+
+    async def _index_sections(
+        self,
+        doc_id: str,
+        filename: str,
+        summaries: List[SectionSummary],
+        vectors: list,
+        chunk_doc_ids: List[str],
+    ):
+        """ドキュメント・節単位の要約を要約索引に登録し直す"""
+        await asyncio.to_thread(self.section_store.ensure_collection, len(vectors[0]))
+        await asyncio.to_thread(self.section_store.delete_document, doc_id)
+        payloads = [
+            {
+                "doc_id": doc_id,
+                "filename": filename,
+                "level": summary.level,
+                "heading": summary.heading,
+                "page": summary.page,
+                "chunk_doc_ids": chunk_doc_ids,
+            }
+            for summary in summaries
+        ]
+        for start in range(0, len(summaries), UPSERT_BATCH_SIZE):
+            await asyncio.to_thread(
+                self.section_store.upsert,
+                [summary.point_id for summary in summaries[start:start + UPSERT_BATCH_SIZE]],
+                vectors[start:start + UPSERT_BATCH_SIZE],
+                payloads[start:start + UPSERT_BATCH_SIZE],
+            )
+
+    async def _update_sources(self, chunk_ids: Set[str]):
+        """ほかのドキュメントの代表チャンクのペイロードの参照元を、重複の索引に合わせる"""
+        ids = sorted(chunk_ids)
+        for start in range(0, len(ids), UPSERT_BATCH_SIZE):
+            payloads = {
+                chunk_id: {"sources": self.dedup_index.sources(chunk_id)}
+                for chunk_id in ids[start:start + UPSERT_BATCH_SIZE]
+            }
+            try:
+                await asyncio.to_thread(self.vector_store.set_payloads, payloads)
+            except Exception as e:
+                # 代表チャンクのドキュメントがまだインジェスト中の場合など。本文の検索には影響せず、
+                # 引用に出る参照元だけが次にそのドキュメントを登録するまで古いままになる
+                logger.warning(f"Failed to update sources of {len(payloads)} shared chunks: {e}")
@@ -0,0 +1,99 @@
+"""
+埋め込み生成
+
+sentence-transformers のモデルでチャンクと質問の埋め込みベクトルを生成する
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "intfloat/multilingual-e5-small")
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+
+
+class EmbeddingModel:
+    """埋め込みモデル（初回使用時に読み込む）"""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE):
+        """
+        初期化
+
+        Args:
+            model_name: sentence-transformers のモデル名またはパス
+            batch_size: 一度に埋め込むテキスト数
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+        self._lock = threading.Lock()
+        # e5 系モデルは用途を示す接頭辞を付けて入力する
+        self._uses_prefix = "e5" in model_name.lower()
+
+    def _load(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+
+                    logger.info(f"Loading embedding model {self.model_name}")
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self._load().get_sentence_embedding_dimension()
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        チャンクの埋め込みを生成
+
+        Args:
+            texts: チャンクのテキスト
+
+        Returns:
+            正規化済みの埋め込み（float32, shape=(len(texts), dimension)）
+        """
+        if self._uses_prefix:
+            texts = [f"passage: {text}" for text in texts]
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        質問の埋め込みを生成
+
+        Args:
+            text: 質問
+
+        Returns:
+            正規化済みの埋め込み（float32, shape=(dimension,)）
+        """
+        if self._uses_prefix:
+            text = f"query: {text}"
+        return self._encode([text])[0]
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = self._load().encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return vectors.astype(np.float32, copy=False)
+
+
+_model: Optional[EmbeddingModel] = None
+
+
+def get_embedding_model() -> EmbeddingModel:
+    """共有の埋め込みモデルを取得"""
+    global _model
+    if _model is None:
+        _model = EmbeddingModel()
+    return _model
@@ -0,0 +1,346 @@
+"""
+ローカルLLMクライアント
+
+docker-compose の local_llm サービス（OpenAI互換の /v1/completions エンドポイント）に接続する。
+同時に届いたプロンプトをマイクロバッチにまとめ、1回のHTTPリクエストで送信することで
+共有サーバーの空き時間を減らし、スループットを向上させる
+"""
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from ..metrics import LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# バッチ設定（環境変数で上書き可能）
+MAX_BATCH_SIZE = int(os.environ.get("LOCAL_LLM_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.environ.get("LOCAL_LLM_MAX_WAIT_MS", "5"))
+PARALLEL_SLOTS = int(os.environ.get("LOCAL_LLM_PARALLEL_SLOTS", "2"))
+TIMEOUT = 300.0  # リクエストタイムアウト（秒）
+
+# バッチ（プロンプトのリスト）を受け付けないサーバーが返すステータスコード
+_BATCH_UNSUPPORTED_STATUS = {400, 404, 422}
+
+
+@dataclass
+class _PendingPrompt:
+    """バッチ送信待ちのプロンプト"""
+    prompt: str
+    future: asyncio.Future
+
+
+class LocalLLMClient:
+    """
+    ローカルLLMサーバーへのバッチングクライアント
+
+    ディスパッチャーとHTTP接続は最初に使ったイベントループに結び付く。別のループで使う場合は
+    先に close() を呼ぶ
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        model: str = "local",
+        max_tokens: int = 1024,
+        temperature: float = 0.2,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        parallel_slots: int = PARALLEL_SLOTS,
+        timeout: float = TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            api_url: ローカルLLMサーバーのベースURL
+            model: モデル名
+            max_tokens: 生成する最大トークン数
+            temperature: 生成温度
+            max_batch_size: 1リクエストにまとめるプロンプトの最大数
+            max_wait_ms: 処理中のバッチがあるときに後続のプロンプトを待ち合わせる最大時間（ミリ秒）
+            parallel_slots: サーバーへ同時に送信するリクエスト数の上限
+            timeout: HTTPタイムアウト（秒）
+            transport: HTTPのトランスポート（省略時は接続プールを使う）
+        """
+        self.api_url = api_url.rstrip("/")
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.parallel_slots = max(1, parallel_slots)
+        self.timeout = timeout
+        self.transport = transport
+
+        # サーバーがプロンプトのリストを受け付けるか（None は未確認）
+        self._batch_supported: Optional[bool] = None
+
+        # イベントループに紐づく状態（最初の generate 呼び出し時に作成）
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight = 0
+        self._http: Optional[httpx.AsyncClient] = None
+
+        self.stats = {"requests": 0, "prompts": 0, "fallback_requests": 0}
+
+    @property
+    def queue_depth(self) -> int:
+        """送信待ちのプロンプト数"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def in_flight(self) -> int:
+        """サーバーで処理中のバッチ数"""
+        return self._in_flight
+
+    def _build_prompt(self, prompt: str, context: Optional[str]) -> str:
+        """コンテキストと質問からサーバーに送るプロンプトを組み立てる"""
+        if not context:
+            return prompt
+        return (
+            "以下のコンテキストに基づいて質問に回答してください。\n\n"
+            f"コンテキスト:\n{context}\n\n"
+            f"質問: {prompt}\n\n"
+            "回答:"
+        )
+
+    def _ensure_started(self):
+        """
+        現在のイベントループ上でディスパッチャーとHTTPクライアントを準備する
+
+        Raises:
+            RuntimeError: close() せずに別のイベントループから呼び出した場合
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._dispatcher and not self._dispatcher.done():
+            return
+        if self._loop is not None and self._loop is not loop:
+            # 接続は前のループに結び付いていて、このループからは閉じられない
+            raise RuntimeError("LocalLLMClient is bound to another event loop; call close() on that loop first")
+        if self._http is not None:
+            # ディスパッチャーが止まっていた場合。同じループなので古い接続はここで閉じる
+            loop.create_task(self._http.aclose())
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.parallel_slots)
+        self._in_flight = 0
+        self._http = httpx.AsyncClient(
+            base_url=self.api_url,
+            timeout=self.timeout,
+            transport=self.transport,
+            limits=httpx.Limits(
+                max_connections=self.parallel_slots * 2,
+                max_keepalive_connections=self.parallel_slots * 2,
+            ),
+        )
+        self._dispatcher = loop.create_task(self._dispatch_loop())
+
+    async def generate(self, prompt: str, context: Optional[str] = None) -> str:
+        """
+        レスポンスを生成
+
+        同時に呼び出された他のプロンプトとまとめてサーバーに送信される
+
+        Args:
+            prompt: プロンプト
+            context: コンテキスト（オプション）
+
+        Returns:
+            生成されたテキスト
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put(_PendingPrompt(self._build_prompt(prompt, context), future))
+        return await future
+
+    async def _dispatch_loop(self):
+        """キューからプロンプトを集めてバッチを作り、空きスロットに送り出す"""
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+                # サーバーが空いていれば待たずに送信し、処理中のバッチがある間だけ後続を待ち合わせる
+                wait = self.max_wait if self._in_flight else 0.0
+                deadline = self._loop.time() + wait
+
+                while len(batch) < self.max_batch_size:
+                    # すでに溜まっている分は待たずに取り込む
+                    try:
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    except asyncio.QueueEmpty:
+                        pass
+
+                    remaining = deadline - self._loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                self._slots.release()
+                raise
+
+            # キャンセル済みの呼び出しは送信しない
+            batch = [item for item in batch if not item.future.done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            self._in_flight += 1
+            self._loop.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[_PendingPrompt]):
+        """バッチを送信し、結果を各呼び出し元に返す"""
+        try:
+            if self._batch_supported is not False and len(batch) > 1:
+                try:
+                    texts = await self._complete([item.prompt for item in batch])
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in _BATCH_UNSUPPORTED_STATUS:
+                        raise
+                    logger.info(
+                        f"Local LLM server rejected batched prompts ({e.response.status_code}), "
+                        "falling back to parallel single requests"
+                    )
+                    self._batch_supported = False
+                    texts = await self._complete_individually(batch)
+                else:
+                    self._batch_supported = True
+            elif len(batch) > 1:
+                texts = await self._complete_individually(batch)
+            else:
+                texts = await self._complete([batch[0].prompt])
+
+            for item, text in zip(batch, texts):
+                if not item.future.done():
+                    item.future.set_result(text)
+        except Exception as e:
+            logger.error(f"Error generating response with local LLM: {e}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            self._in_flight -= 1
+            self._slots.release()
+
+    async def stream(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        レスポンスを生成しながら少しずつ返す
+
+        トークンごとに返すためバッチにはまとめず、1プロンプトずつ stream=true で送信する
+        （同時に送信する数は parallel_slots で制限する）
+
+        Args:
+            prompt: プロンプト
+            context: コンテキスト（オプション）
+
+        Yields:
+            生成されたテキストの断片
+        """
+        self._ensure_started()
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": self._build_prompt(prompt, context),
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True,
+        }
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                async with self._http.stream("POST", "/v1/completions", json=payload) as response:
+                    response.raise_for_status()
+                    self.stats["requests"] += 1
+                    self.stats["prompts"] += 1
+                    async for line in response.aiter_lines():
+                        # OpenAI 互換の server-sent events: "data: {...}" の行と最後の "data: [DONE]"
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        body = json.loads(data)
+                        usage = body.get("usage") or {}
+                        if usage.get("prompt_tokens"):
+                            LLM_TOKENS.inc(usage["prompt_tokens"], provider="local", kind="prompt")
+                        if usage.get("completion_tokens"):
+                            LLM_TOKENS.inc(usage["completion_tokens"], provider="local", kind="completion")
+                        for choice in body.get("choices", []):
+                            if choice.get("text"):
+                                yield choice["text"]
+            finally:
+                self._in_flight -= 1
+
+    async def _complete_individually(self, batch: List[_PendingPrompt]) -> List[str]:
+        """バッチ非対応サーバー向けに、プロンプトごとのリクエストを並列送信する"""
+        self.stats["fallback_requests"] += len(batch)
+        results = await asyncio.gather(*(self._complete([item.prompt]) for item in batch))
+        return [texts[0] for texts in results]
+
+    async def _complete(self, prompts: List[str]) -> List[str]:
+        """
+        /v1/completions にプロンプトを送信
+
+        Args:
+            prompts: プロンプトのリスト
+
+        Returns:
+            プロンプトと同じ順序の生成テキスト
+
+        Raises:
+            httpx.HTTPStatusError: サーバーがエラーを返した場合
+            ValueError: レスポンスの件数がプロンプト数と一致しない場合
+        """
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "prompt": prompts if len(prompts) > 1 else prompts[0],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+        response = await self._http.post("/v1/completions", json=payload)
+        response.raise_for_status()
+        self.stats["requests"] += 1
+        self.stats["prompts"] += len(prompts)
+
+        body = response.json()
+        usage = body.get("usage") or {}
+        if usage.get("prompt_tokens"):
+            LLM_TOKENS.inc(usage["prompt_tokens"], provider="local", kind="prompt")
+        if usage.get("completion_tokens"):
+            LLM_TOKENS.inc(usage["completion_tokens"], provider="local", kind="completion")
+
+        choices = body.get("choices", [])
+        if len(choices) != len(prompts):
+            raise ValueError(f"Expected {len(prompts)} completions, got {len(choices)}")
+
+        # index フィールドがあればそれに従って並べ替える
+        choices = sorted(choices, key=lambda c: c.get("index", 0))
+        return [choice.get("text", "") for choice in choices]
+
+    async def close(self):
+        """ディスパッチャーとHTTP接続を終了"""
+        if self._dispatcher and not self._dispatcher.done():
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        if self._http:
+            await self._http.aclose()
+        self._dispatcher = None
+        self._http = None
+        self._loop = None
+
@@ -5,12 +5,16 @@ LLMプロバイダールーター
 """
 
 from enum import Enum
-from typing import Dict, Optional, List, Any
+from typing import AsyncIterator, Dict, Optional, List, Any
 import os
 import json
 from pathlib import Path
 import logging
 import asyncio
+import time
+
+from ..metrics import LLM_REQUEST_SECONDS
+from ..tracing import span
 
 logger = logging.getLogger(__name__)
 
@@ -109,12 +113,58 @@ class LLMRouter:
             raise ValueError("No active LLM provider configured")
         
         client = self.clients[self.active_provider]
-        try:
-            return await client.generate(prompt, context)
-        except Exception as e:
-            logger.error(f"Error generating response with {self.active_provider}: {e}")
-            return f"エラーが発生しました: {str(e)}"
+        provider = LLMProvider(self.active_provider).value
+        started = time.perf_counter()
+        with span("llm.generate", provider=provider, prompt_chars=len(prompt), context_chars=len(context or "")) as current:
+            try:
+                response = await client.generate(prompt, context)
+            except Exception as e:
+                logger.error(f"Error generating response with {self.active_provider}: {e}")
+                current.set_attribute("error", str(e))
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider, outcome="error")
+                return f"エラーが発生しました: {str(e)}"
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider, outcome="ok")
+        return response
     
+    async def stream_response(self, prompt: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        LLMでレスポンスを生成しながら少しずつ返す
+
+        ストリーミングに対応していないクライアントは、生成し終えた全文を1回で返す
+
+        Args:
+            prompt: プロンプト
+            context: コンテキスト（オプション）
+
+        Yields:
+            生成されたテキストの断片（失敗した場合はエラーメッセージ）
+
+        Raises:
+            ValueError: アクティブなLLMプロバイダーが設定されていない場合
+        """
+        client = self.clients.get(self.active_provider) if self.active_provider else None
+        if client is None or not hasattr(client, "stream"):
+            yield await self.generate_response(prompt, context)
+            return
+
+        provider = LLMProvider(self.active_provider).value
+        started = time.perf_counter()
+        outcome = "ok"
+        with span("llm.generate", provider=provider, prompt_chars=len(prompt), context_chars=len(context or ""), stream=True) as current:
+            try:
+                async for text in client.stream(prompt, context):
+                    yield text
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            except Exception as e:
+                logger.error(f"Error streaming response with {self.active_provider}: {e}")
+                current.set_attribute("error", str(e))
+                outcome = "error"
+                yield f"エラーが発生しました: {str(e)}"
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - started, provider=provider, outcome=outcome)
+
     def update_settings(self, settings: Dict):
         """
         LLM設定を更新
@@ -0,0 +1,329 @@
+"""
+メトリクス
+
+Prometheus のテキスト形式（0.0.4）で公開するカウンター・ヒストグラムと、公開時に値を読み出す
+コールバック。値はスレッドごとのシャードに書き込むため、記録側はロックを取らない
+（各シャードの書き込みは1スレッドだけなので競合しない）。公開時に全シャードを合算する。
+ラベルの組み合わせは指標ごとに上限を設け、超えた分は "other" にまとめて系列数の増加を防ぐ
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+METRICS_MAX_LABEL_SETS = int(os.environ.get("METRICS_MAX_LABEL_SETS", "64"))
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """スレッドごとのシャードに値を持つ指標の共通部分"""
+
+    type_name = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), max_label_sets: int = METRICS_MAX_LABEL_SETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.max_label_sets = max_label_sets
+        self._shards: Dict[int, Dict[LabelValues, Any]] = {}
+        self._label_sets: set = set()
+        self._overflowed = False
+        self._lock = threading.Lock()  # 新しいシャード・ラベルの組み合わせの登録時だけ使う
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        if key in self._label_sets:
+            return key
+        with self._lock:
+            if key not in self._label_sets:
+                if len(self._label_sets) >= self.max_label_sets:
+                    if not self._overflowed:
+                        logger.warning(f"Metric {self.name} exceeded {self.max_label_sets} label sets, folding into 'other'")
+                        self._overflowed = True
+                    key = ("other",) * len(self.label_names)
+                self._label_sets.add(key)
+        return key
+
+    def _shard(self) -> Dict[LabelValues, Any]:
+        ident = threading.get_ident()
+        shard = self._shards.get(ident)
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(ident, {})
+        return shard
+
+    def _snapshots(self) -> List[Dict[LabelValues, Any]]:
+        with self._lock:
+            shards = list(self._shards.values())
+        return [shard.copy() for shard in shards]
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    """単調増加するカウンター"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """所要時間などの分布"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        max_label_sets: int = METRICS_MAX_LABEL_SETS,
+    ):
+        super().__init__(name, help, labels, max_label_sets)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # [各バケットの件数（非累積）..., +Inf の件数, 合計, 件数]
+            state = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def time(self, **labels: Any) -> _Timer:
+        """with 文の所要時間（秒）を記録"""
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        totals: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshots():
+            for key, state in shard.items():
+                total = totals.setdefault(key, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+
+        lines = self._header()
+        names = self.label_names + ("le",)
+        for key, state in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{labels} {int(state[-1])}")
+        return lines
+
+
+# コールバックの戻り値: ラベルなしの値、または {ラベル値のタプル: 値}
+CallbackResult = Union[float, Dict[LabelValues, float]]
+
+
+class CallbackMetric:
+    """公開時にコールバックで値を読み出す指標（キューの長さ、キャッシュの統計など）"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Union[CallbackResult, Awaitable[CallbackResult]]],
+        labels: Sequence[str] = (),
+        type_name: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.label_names = tuple(labels)
+        self.type_name = type_name
+
+    async def collect(self) -> Dict[LabelValues, float]:
+        result = self.callback()
+        if inspect.isawaitable(result):
+            result = await result
+        if isinstance(result, dict):
+            return result
+        return {(): float(result)}
+
+    async def render(self) -> List[str]:
+        try:
+            values = await self.collect()
+        except Exception as e:
+            logger.warning(f"Failed to collect metric {self.name}: {e}")
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """プロセス内の指標の登録先（同じ名前で登録すると既存のものを返す）"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, name: str, factory: Callable[[], Any]):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = factory()
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, labels, buckets))
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Any],
+        labels: Sequence[str] = (),
+        type_name: str = "gauge",
+    ) -> CallbackMetric:
+        """コールバックの指標を登録（同じ名前なら差し替える）"""
+        metric = CallbackMetric(name, help, callback, labels, type_name)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    async def render(self) -> str:
+        """Prometheus のテキスト形式で出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            if isinstance(metric, CallbackMetric):
+                lines.extend(await metric.render())
+            else:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# 各モジュールで共有する指標（ラベルの値は段階名・プロバイダー名などの固定の集合に限る）
+QUERY_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_query_stage_seconds", "Time spent in each stage of answering a query", ["stage"]
+)
+INGESTION_STAGE_SECONDS = REGISTRY.histogram(
+    "rag_ingestion_stage_seconds", "Time spent in each stage of ingesting a document", ["stage"],
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0),
+)
+INGESTION_JOBS = REGISTRY.counter("rag_ingestion_jobs_total", "Finished ingestion attempts", ["result"])
+INGESTION_CHUNKS = REGISTRY.counter(
+    "rag_ingestion_chunks_total", "Chunks produced at ingestion by outcome (stored or near-duplicate)", ["result"]
+)
+LLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_llm_request_seconds", "LLM generation latency", ["provider", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0),
+)
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "Tokens reported by the LLM server", ["provider", "kind"])
+VECTOR_DB_SECONDS = REGISTRY.histogram("rag_vector_db_seconds", "Vector database call latency", ["operation"])
+
+
+async def serve_metrics(port: int, registry: MetricsRegistry = REGISTRY, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """
+    GET /metrics だけに応答する最小限のHTTPサーバーを起動（APIを持たないワーカープロセス用）
+
+    Args:
+        port: 待ち受けポート
+        registry: 公開する指標
+        host: 待ち受けアドレス
+
+    Returns:
+        起動したサーバー（close() で停止）
+    """
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5.0)
+            while (await asyncio.wait_for(reader.readline(), 5.0)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type, body = "200 OK", CONTENT_TYPE, (await registry.render()).encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Metrics endpoint listening on {host}:{port}/metrics")
+    return server
@@ -0,0 +1,248 @@
+"""
+ハイブリッド検索
+
+ベクトル検索で候補を取り、権限索引で参照できないチャンクを除外してから、
+復号した本文の文字バイグラム一致度とベクトルの類似度を合わせて並べ替える。
+並べ替えるのはベクトルの類似度の上位（返す件数の RERANK_FACTOR 倍）だけで、チャンクは暗号文のまま
+持ち、一致度の計算と返すチャンクに必要な分だけを復号する。
+
+チャンクの検索の前に、ドキュメント・節単位の要約索引で候補のドキュメントを選び、チャンクの検索を
+そのドキュメントに絞る（section_index を参照）。要約索引にないドキュメントがある間は全体を検索する
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import unicodedata
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ..indexer.embedding import EmbeddingModel, get_embedding_model
+from ..security.content_filter import PERMISSION_INDEX_PATH, AccessContext, PermissionIndex
+from ..metrics import QUERY_STAGE_SECONDS
+from ..security.encryption import EnvelopeCipher
+from ..tracing import span
+from .section_index import (
+    COARSE_CANDIDATES,
+    COARSE_DOCUMENTS,
+    DOCUMENT_LEVEL,
+    chunk_documents,
+    get_section_store,
+    rank_documents,
+)
+from .vector_store import VectorStore, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CANDIDATES = int(os.environ.get("RETRIEVAL_CANDIDATES", "50"))
+KEYWORD_WEIGHT = float(os.environ.get("KEYWORD_WEIGHT", "0.3"))
+RERANK_FACTOR = int(os.environ.get("RERANK_FACTOR", "3"))
+
+
+@dataclass
+class RetrievedChunk:
+    """検索結果のチャンク"""
+    chunk_id: str
+    doc_id: str
+    filename: str
+    page: Optional[int]
+    heading: Optional[str]
+    text: str
+    score: float
+    table: Optional[str] = None  # 表の要約チャンクの場合は表の名前（表データストアで SQL を実行できる）
+    # 同じ内容を含む、ほかのドキュメント（版）のチャンク（doc_id, filename, chunk_index, page）
+    sources: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _bigrams(text: str) -> set:
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(ch for ch in text if not ch.isspace())
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def keyword_score(query: str, text: str) -> float:
+    """質問の文字バイグラムのうち本文に含まれる割合（分かち書きなしで日本語に使える）"""
+    query_grams = _bigrams(query)
+    if not query_grams:
+        return 0.0
+    return len(query_grams & _bigrams(text)) / len(query_grams)
+
+
+class HybridSearcher:
+    """権限を考慮したハイブリッド検索"""
+
+    def __init__(
+        self,
+        embedding_model: Optional[EmbeddingModel] = None,
+        vector_store: Optional[VectorStore] = None,
+        cipher: Optional[EnvelopeCipher] = None,
+        permission_index_path: str = PERMISSION_INDEX_PATH,
+        candidates: int = RETRIEVAL_CANDIDATES,
+        keyword_weight: float = KEYWORD_WEIGHT,
+        section_store: Optional[VectorStore] = None,
+        coarse_documents: int = COARSE_DOCUMENTS,
+        rerank_factor: int = RERANK_FACTOR,
+    ):
+        """
+        初期化
+
+        Args:
+            embedding_model: 埋め込みモデル
+            vector_store: ベクトルストア
+            cipher: チャンク本文の復号に使うエンベロープ暗号化
+            permission_index_path: 権限索引の保存先（インジェスト側の更新を検知して読み直す）
+            candidates: ベクトル検索で取得する候補数
+            keyword_weight: 並べ替えでのキーワード一致度の重み（0.0-1.0）
+            section_store: ドキュメント・節単位の要約索引
+            coarse_documents: チャンクを検索するドキュメント数（0 なら常に全体を検索）
+            rerank_factor: キーワード一致度で並べ替える候補数（返す件数に対する倍率）
+        """
+        self.embedding_model = embedding_model or get_embedding_model()
+        self.vector_store = vector_store or get_vector_store()
+        self.cipher = cipher or EnvelopeCipher()
+        self.permission_index_path = permission_index_path
+        self.candidates = candidates
+        self.keyword_weight = keyword_weight
+        self.rerank_factor = rerank_factor
+        self._permission_index: Optional[PermissionIndex] = None
+        self._permission_mtime: Optional[float] = None
+        self.section_store = section_store or get_section_store()
+        self.coarse_documents = coarse_documents
+        self._coarse_ready: Optional[bool] = None
+
+    @property
+    def permission_index(self) -> PermissionIndex:
+        """権限索引（ファイルが更新されていれば読み直す）"""
+        try:
+            mtime = Path(self.permission_index_path).with_suffix(".json").stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if self._permission_index is None or mtime != self._permission_mtime:
+            self._permission_index = PermissionIndex.load(self.permission_index_path)
+            self._permission_mtime = mtime
+            self._coarse_ready = None
+        return self._permission_index
+
+    def _coarse_available(self) -> bool:
+        """要約索引がすべてのドキュメントを含んでいるか（要約索引の導入前に取り込んだドキュメントがあれば False）"""
+        index = self.permission_index
+        if self._coarse_ready is None:
+            try:
+                indexed = self.section_store.count({"level": DOCUMENT_LEVEL})
+            except Exception as e:
+                logger.warning(f"Section index unavailable, searching all chunks: {e}")
+                indexed = -1
+            self._coarse_ready = indexed >= index.document_count
+            if not self._coarse_ready:
+                logger.info(
+                    f"Section index covers {max(indexed, 0)} of {index.document_count} documents; "
+                    "searching all chunks until the rest are re-ingested"
+                )
+        return self._coarse_ready
+
+    async def _select_documents(self, vector, context: AccessContext, provider: str) -> Optional[List[str]]:
+        """
+        要約索引で候補のドキュメントを選ぶ
+
+        Returns:
+            チャンクの検索を絞り込むドキュメントID（要約索引が使えない・候補がない場合は None）
+        """
+        if self.coarse_documents <= 0 or not await asyncio.to_thread(self._coarse_available):
+            return None
+        with span("retrieve.coarse_search", candidates=COARSE_CANDIDATES) as current, \
+                QUERY_STAGE_SECONDS.time(stage="coarse_search"):
+            hits = await asyncio.to_thread(self.section_store.search, vector, COARSE_CANDIDATES)
+            doc_ids = list(dict.fromkeys(hit["payload"]["doc_id"] for hit in hits))
+            allowed = self.permission_index.allowed_documents(doc_ids, context, provider)
+            visible = {doc_id for doc_id, ok in zip(doc_ids, allowed) if ok}
+            hits = [hit for hit in hits if hit["payload"]["doc_id"] in visible]
+            selected = rank_documents(hits, self.coarse_documents)
+            current.set_attribute("documents", len(selected))
+        return chunk_documents(hits, selected) if selected else None
+
+    async def search(self, query: str, context: AccessContext, provider: str, limit: int = 5) -> List[RetrievedChunk]:
+        """
+        質問に関連するチャンクを検索
+
+        Args:
+            query: 質問
+            context: ユーザー情報
+            provider: 回答生成に使うLLMプロバイダー（送信可否の判定に使う）
+            limit: 返す件数
+
+        Returns:
+            スコア降順のチャンク
+        """
+        with span("retrieve.embed"), QUERY_STAGE_SECONDS.time(stage="embed"):
+            vector = await asyncio.to_thread(self.embedding_model.embed_query, query)
+        doc_ids = await self._select_documents(vector, context, provider)
+        with span("retrieve.vector_search", candidates=self.candidates, coarse=doc_ids is not None) as current, \
+                QUERY_STAGE_SECONDS.time(stage="vector_search"):
+            hits = await asyncio.to_thread(self.vector_store.search, vector, self.candidates, doc_ids)
+            current.set_attribute("hits", len(hits))
+        if not hits:
+            return []
+
+        with QUERY_STAGE_SECONDS.time(stage="permission_filter"):
+            allowed = self.permission_index.allowed_mask([hit["id"] for hit in hits], context, provider)
+        # ベクトルの類似度の上位だけを並べ替えの候補にする（候補のチャンクは暗号文のまま持つ）
+        hits = sorted((hit for hit, ok in zip(hits, allowed) if ok), key=lambda hit: hit["score"], reverse=True)
+        hits = hits[:max(limit, limit * self.rerank_factor)]
+
+        ranked = []  # (スコア, 検索結果, 遅延復号の本文) のスコア降順
+        with span("retrieve.decrypt_rank", candidates=len(hits)) as current, \
+                QUERY_STAGE_SECONDS.time(stage="decrypt_rank"):
+            for hit in hits:
+                vector_score = (1.0 - self.keyword_weight) * hit["score"]
+                # キーワード一致度は 1 以下なので、上位に入る見込みがなくなったら残りは復号しない
+                if len(ranked) >= limit and vector_score + self.keyword_weight <= ranked[limit - 1][0]:
+                    break
+                payload = hit["payload"]
+                text = self.cipher.lazy(payload["doc_id"], hit["id"], base64.b64decode(payload["ciphertext"]))
+                score = vector_score
+                if self.keyword_weight:
+                    score += self.keyword_weight * keyword_score(query, text.text)
+                ranked.append((score, hit, text))
+                ranked.sort(key=lambda entry: entry[0], reverse=True)
+
+            results = []
+            for score, hit, text in ranked[:limit]:
+                payload = hit["payload"]
+                results.append(RetrievedChunk(
+                    chunk_id=hit["id"],
+                    doc_id=payload["doc_id"],
+                    filename=payload.get("filename", ""),
+                    page=payload.get("page"),
+                    heading=payload.get("heading"),
+                    text=text.text,
+                    score=score,
+                    table=payload.get("table"),
+                    sources=payload.get("sources") or [],
+                ))
+            current.set_attribute("decrypted", sum(1 for _, _, text in ranked if text.is_decrypted))
+
+        self._filter_sources(results, context, provider)
+        return results
+
+    def _filter_sources(self, chunks: List[RetrievedChunk], context: AccessContext, provider: str):
+        """参照元のうち、ユーザーが参照できないドキュメントのものを除く（登録後に権限が変わった場合など）"""
+        doc_ids = list({source["doc_id"] for chunk in chunks for source in chunk.sources})
+        if not doc_ids:
+            return
+        allowed = self.permission_index.allowed_documents(doc_ids, context, provider)
+        visible = {doc_id for doc_id, ok in zip(doc_ids, allowed) if ok}
+        for chunk in chunks:
+            chunk.sources = [source for source in chunk.sources if source["doc_id"] in visible]
+
+
+_searcher: Optional[HybridSearcher] = None
+
+
+def get_searcher() -> HybridSearcher:
+    """共有の検索エンジンを取得"""
+    global _searcher
+    if _searcher is None:
+        _searcher = HybridSearcher()
+    return _searcher
@@ -0,0 +1,138 @@
+"""
+ドキュメント・節単位の要約索引
+
+チャンク数が増えると、質問ごとにすべてのチャンクを検索するのは無駄が大きい（多くの質問は1〜2件の
+ドキュメントに関するもの）。インジェスト時にドキュメントの見出しの一覧と、節ごとの見出し・冒頭の
+文章から作った要約を埋め込んで別のコレクションに格納しておき、検索時はまずこの小さな索引で候補の
+ドキュメントを選び、チャンクの検索はそのドキュメントに絞って行う（粗い検索 → 細かい検索）
+"""
+
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from .vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+SECTION_COLLECTION = os.environ.get("VECTOR_SECTION_COLLECTION", "sections")
+SECTION_SUMMARY_CHARS = int(os.environ.get("SECTION_SUMMARY_CHARS", "300"))  # 節の要約に使う冒頭の文字数
+COARSE_DOCUMENTS = int(os.environ.get("COARSE_DOCUMENTS", "5"))  # チャンクを検索するドキュメント数（0 で常に全体を検索）
+COARSE_CANDIDATES = int(os.environ.get("COARSE_CANDIDATES", "50"))  # 要約索引から取得する候補数
+OUTLINE_MAX_HEADINGS = 50  # ドキュメント単位の要約に並べる見出しの数
+
+# 要約のIDの名前空間（ドキュメントIDと節の番号から決定的に生成する）
+_SECTION_NAMESPACE = uuid.UUID("0b7e3d6a-8f42-4c1e-b5a9-6d2f1e8c4a37")
+
+DOCUMENT_LEVEL = "document"
+SECTION_LEVEL = "section"
+
+
+@dataclass
+class SectionSummary:
+    """要約索引に登録する1件（ドキュメント全体または節）"""
+    point_id: str
+    level: str
+    text: str
+    heading: Optional[str] = None
+    page: Optional[int] = None
+
+
+def make_section_id(doc_id: str, index: int) -> str:
+    """ドキュメントIDと節の番号から要約のID（UUID文字列）を生成（-1 はドキュメント全体）"""
+    return str(uuid.uuid5(_SECTION_NAMESPACE, f"{doc_id}:{index}"))
+
+
+def summarize_sections(doc_id: str, filename: str, parsed, max_chars: int = SECTION_SUMMARY_CHARS) -> List[SectionSummary]:
+    """
+    解析済みドキュメントから要約索引に登録する要約を作る
+
+    ドキュメント全体はファイル名と見出しの一覧、節は見出しと冒頭の文章を要約とする
+
+    Args:
+        doc_id: ドキュメントID
+        filename: ファイル名
+        parsed: parsers.ParsedDocument
+        max_chars: 節の要約に使う冒頭の文字数
+
+    Returns:
+        要約（先頭がドキュメント全体）
+    """
+    headings = list(OrderedDict.fromkeys(s.heading for s in parsed.sections if s.heading))
+    outline = "\n".join(headings[:OUTLINE_MAX_HEADINGS])
+    lead = parsed.text[:max_chars]
+    summaries = [SectionSummary(
+        point_id=make_section_id(doc_id, -1),
+        level=DOCUMENT_LEVEL,
+        text=f"{filename}\n{outline or lead}",
+    )]
+    for index, section in enumerate(parsed.sections):
+        if not section.text.strip():
+            continue
+        title = " / ".join(part for part in (filename, section.heading) if part)
+        summaries.append(SectionSummary(
+            point_id=make_section_id(doc_id, index),
+            level=SECTION_LEVEL,
+            text=f"{title}\n{section.text[:max_chars]}",
+            heading=section.heading,
+            page=section.page,
+        ))
+    return summaries
+
+
+def rank_documents(hits: Sequence[Dict], limit: int) -> List[str]:
+    """
+    要約索引の検索結果から、スコアの高い順にドキュメントを選ぶ（ドキュメントのスコアは最も近い要約のスコア）
+
+    Args:
+        hits: VectorStore.search の結果（スコア降順）
+        limit: 選ぶドキュメント数
+
+    Returns:
+        ドキュメントID
+    """
+    documents: List[str] = []
+    for hit in hits:
+        doc_id = hit["payload"]["doc_id"]
+        if doc_id not in documents:
+            documents.append(doc_id)
+            if len(documents) >= limit:
+                break
+    return documents
+
+
+def chunk_documents(hits: Sequence[Dict], doc_ids: Sequence[str]) -> List[str]:
+    """
+    選んだドキュメントの本文を含むチャンクのドキュメントID
+
+    重複として別のドキュメントの代表チャンクにまとめられた本文は、そのドキュメントのIDで格納されている
+    ため、要約に記録した chunk_doc_ids も検索対象に含める
+
+    Args:
+        hits: 要約索引の検索結果
+        doc_ids: 選んだドキュメントID
+
+    Returns:
+        チャンクの検索を絞り込むドキュメントID
+    """
+    selected = set(doc_ids)
+    result = list(doc_ids)
+    for hit in hits:
+        payload = hit["payload"]
+        if payload["doc_id"] in selected:
+            result.extend(d for d in payload.get("chunk_doc_ids", ()) if d not in result)
+    return result
+
+
+_store: Optional[VectorStore] = None
+
+
+def get_section_store() -> VectorStore:
+    """要約索引のコレクションを取得"""
+    global _store
+    if _store is None:
+        _store = VectorStore(collection=SECTION_COLLECTION)
+    return _store
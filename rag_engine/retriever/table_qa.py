@@ -0,0 +1,90 @@
+"""
+表への質問応答
+
+検索で表の要約チャンクが見つかった場合に、LLM に表のスキーマから SQL を生成させ、表データストアの
+読み取り専用サンドボックスで実行した結果を回答のコンテキストにする。件数・合計などの集計は
+行を埋め込んだチャンクからは求められないため、この経路で答える
+"""
+
+import asyncio
+import logging
+import re
+from typing import Optional
+
+from ..metrics import QUERY_STAGE_SECONDS
+from ..tracing import span
+from .table_store import TableQueryError, TableStore, get_table_store
+
+logger = logging.getLogger(__name__)
+
+SQL_PROMPT = """次の SQLite のテーブルに対して、質問に答えるための SELECT 文を1つだけ書いてください。
+テーブル名と列名は必ず二重引用符で囲んでください。SQL 以外は出力しないでください。
+表から答えられない質問の場合は NONE とだけ出力してください。
+
+質問: {query}"""
+
+_CODE_BLOCK = re.compile(r"```(?:sql)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+
+
+def extract_sql(text: str) -> Optional[str]:
+    """
+    LLM の出力から SQL を取り出す
+
+    Args:
+        text: LLM の出力（コードブロックで囲まれていてもよい）
+
+    Returns:
+        SQL（SELECT / WITH で始まらない場合や NONE の場合は None）
+    """
+    match = _CODE_BLOCK.search(text)
+    sql = (match.group(1) if match else text).strip().rstrip(";").strip()
+    if not re.match(r"(?is)^(select|with)\b", sql):
+        return None
+    return sql
+
+
+class TableQuestionAnswerer:
+    """表の要約チャンクに対する SQL での質問応答"""
+
+    def __init__(self, table_store: Optional[TableStore] = None):
+        """
+        初期化
+
+        Args:
+            table_store: 表データストア
+        """
+        self.table_store = table_store or get_table_store()
+
+    async def answer_context(self, query: str, doc_id: str, llm_router) -> Optional[str]:
+        """
+        表に SQL を実行して、回答のコンテキストにするテキストを作る
+
+        Args:
+            query: 質問
+            doc_id: 表の要約チャンクのドキュメントID
+            llm_router: SQL の生成に使うLLMルーター（回答と同じプロバイダーを使う）
+
+        Returns:
+            実行した SQL と結果（表から答えられない・失敗した場合は None）
+        """
+        with span("retrieve.table_qa", doc_id=doc_id) as current, QUERY_STAGE_SECONDS.time(stage="table_qa"):
+            try:
+                schema = await asyncio.to_thread(self.table_store.describe, doc_id)
+            except TableQueryError as e:
+                logger.warning(f"Table schema unavailable for {doc_id}: {e}")
+                return None
+
+            sql = extract_sql(await llm_router.generate_response(SQL_PROMPT.format(query=query), schema))
+            if sql is None:
+                current.set_attribute("sql", False)
+                return None
+
+            try:
+                result = await asyncio.to_thread(self.table_store.query, doc_id, sql)
+            except TableQueryError as e:
+                logger.info(f"Generated SQL rejected for {doc_id}: {e}")
+                current.set_attribute("error", str(e))
+                return None
+            current.set_attribute("rows", len(result.rows))
+
+        return f"次の SQL を表に実行した結果:\n{sql}\n\n{result.to_text()}"
@@ -0,0 +1,262 @@
+"""
+表データストア
+
+Excel の表として取り出したシートを、ドキュメントごとの SQLite データベースに格納する。
+行はベクトルストアに入れず（要約だけを埋め込む）、集計の質問には生成した SQL をこのストアで実行して答える。
+
+データベースは保存ファイルと同じく KeyRing で暗号化して保存し、問い合わせのたびにメモリ上で復号する。
+問い合わせは読み取り専用のサンドボックスで実行する（SELECT 以外の文・PRAGMA・ATTACH を拒否し、
+実行時間と返す行数に上限を設ける）
+"""
+
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+from ..security.encryption import KeyRing, decrypt_stream, encrypt_stream
+
+logger = logging.getLogger(__name__)
+
+TABLE_STORE_DIR = os.environ.get("TABLE_STORE_DIR", "/data/tables")
+TABLE_QUERY_TIMEOUT = float(os.environ.get("TABLE_QUERY_TIMEOUT", "2.0"))  # 1回の問い合わせの実行時間の上限（秒）
+TABLE_QUERY_MAX_ROWS = int(os.environ.get("TABLE_QUERY_MAX_ROWS", "50"))  # 問い合わせで返す行数の上限
+TABLE_CACHE_ENTRIES = int(os.environ.get("TABLE_CACHE_ENTRIES", "8"))  # 復号済みのデータベースを保持する数
+
+# サンドボックスで許可する操作（これ以外の文・PRAGMA・ATTACH・書き込みはすべて拒否する）
+_ALLOWED_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    getattr(sqlite3, "SQLITE_RECURSIVE", sqlite3.SQLITE_SELECT),
+}
+_PROGRESS_STEPS = 1000  # 実行時間を確認する間隔（SQLite の仮想マシンの命令数）
+
+
+class TableQueryError(Exception):
+    """表への問い合わせが拒否された、または失敗した"""
+
+
+@dataclass
+class TableQueryResult:
+    """問い合わせの結果"""
+    columns: List[str]
+    rows: List[tuple]
+    truncated: bool
+    elapsed_ms: float
+
+    def to_text(self) -> str:
+        """LLM に渡すための表形式のテキスト"""
+        lines = [" | ".join(self.columns)]
+        lines.extend(" | ".join("" if value is None else str(value) for value in row) for row in self.rows)
+        if self.truncated:
+            lines.append(f"（先頭 {len(self.rows)} 行のみ）")
+        return "\n".join(lines)
+
+
+def quote_identifier(name: str) -> str:
+    """SQLite の識別子として引用符で囲む"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class TableStore:
+    """ドキュメントごとの表データ（暗号化した SQLite データベース）"""
+
+    def __init__(
+        self,
+        root: str = TABLE_STORE_DIR,
+        key_ring: Optional[KeyRing] = None,
+        timeout: float = TABLE_QUERY_TIMEOUT,
+        max_rows: int = TABLE_QUERY_MAX_ROWS,
+        cache_entries: int = TABLE_CACHE_ENTRIES,
+    ):
+        """
+        初期化
+
+        Args:
+            root: 保存先のディレクトリ
+            key_ring: 暗号化に使うキーリング（省略時は環境変数から作成）
+            timeout: 1回の問い合わせの実行時間の上限（秒）
+            max_rows: 問い合わせで返す行数の上限
+            cache_entries: 復号済みのデータベースを保持する数
+        """
+        self.root = Path(root)
+        self._key_ring = key_ring
+        self.timeout = timeout
+        self.max_rows = max_rows
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def key_ring(self) -> KeyRing:
+        if self._key_ring is None:
+            self._key_ring = KeyRing.from_env()
+        return self._key_ring
+
+    def _path(self, doc_id: str) -> Path:
+        return self.root / f"{doc_id}.sqlite.enc"
+
+    def save(self, doc_id: str, tables: Sequence[Any]) -> int:
+        """
+        ドキュメントの表を保存（既存のものは置き換える）
+
+        Args:
+            doc_id: ドキュメントID
+            tables: 表（parsers.utils.tables.TableData）
+
+        Returns:
+            保存したデータベースのサイズ（平文のバイト数）
+        """
+        conn = sqlite3.connect(":memory:")
+        try:
+            for table in tables:
+                columns = ", ".join(
+                    f"{quote_identifier(name)} {column_type}" for name, column_type in zip(table.columns, table.types)
+                )
+                conn.execute(f"CREATE TABLE {quote_identifier(table.name)} ({columns})")
+                placeholders = ", ".join("?" for _ in table.columns)
+                conn.executemany(f"INSERT INTO {quote_identifier(table.name)} VALUES ({placeholders})", table.rows)
+            conn.commit()
+            data = conn.serialize()
+        finally:
+            conn.close()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self._path(doc_id)
+        partial = path.with_suffix(".partial")
+        with open(partial, "wb") as dst:
+            encrypt_stream(io.BytesIO(data), dst, self.key_ring)
+        os.replace(partial, path)
+        with self._lock:
+            self._cache.pop(doc_id, None)
+        return len(data)
+
+    def delete(self, doc_id: str):
+        """ドキュメントの表を削除"""
+        self._path(doc_id).unlink(missing_ok=True)
+        with self._lock:
+            self._cache.pop(doc_id, None)
+
+    def exists(self, doc_id: str) -> bool:
+        return self._path(doc_id).exists()
+
+    def _load(self, doc_id: str) -> bytes:
+        """復号したデータベース（ファイルが更新されていなければ保持しているものを返す）"""
+        path = self._path(doc_id)
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            raise TableQueryError(f"no tables stored for document {doc_id}")
+        with self._lock:
+            cached = self._cache.get(doc_id)
+            if cached is not None and cached[0] == mtime:
+                self._cache.move_to_end(doc_id)
+                return cached[1]
+
+        plain = io.BytesIO()
+        with open(path, "rb") as src:
+            decrypt_stream(src, plain, self.key_ring)
+        data = plain.getvalue()
+        with self._lock:
+            self._cache[doc_id] = (mtime, data)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def _connect(self, doc_id: str) -> sqlite3.Connection:
+        """復号したデータベースをメモリ上に開く（読み取り専用）"""
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        conn.deserialize(self._load(doc_id))
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def describe(self, doc_id: str, sample_rows: int = 3) -> str:
+        """
+        SQL の生成に使うスキーマの説明（CREATE TABLE 文、行数、先頭の数行）
+
+        Args:
+            doc_id: ドキュメントID
+            sample_rows: 例として載せる行数
+
+        Returns:
+            スキーマの説明
+        """
+        conn = self._connect(doc_id)
+        try:
+            parts = []
+            for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' ORDER BY rowid"):
+                table = quote_identifier(name)
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                cursor = conn.execute(f"SELECT * FROM {table} LIMIT ?", (sample_rows,))
+                columns = [column[0] for column in cursor.description]
+                samples = [" | ".join("" if v is None else str(v) for v in row) for row in cursor.fetchall()]
+                parts.append("\n".join([f"{sql};", f"-- {count} rows", "-- " + " | ".join(columns)] + [f"-- {row}" for row in samples]))
+            return "\n\n".join(parts)
+        finally:
+            conn.close()
+
+    def query(self, doc_id: str, sql: str, params: Sequence[Any] = ()) -> TableQueryResult:
+        """
+        読み取り専用のサンドボックスで SELECT 文を1つ実行
+
+        Args:
+            doc_id: ドキュメントID
+            sql: SELECT 文（1文のみ）
+            params: プレースホルダーの値
+
+        Returns:
+            問い合わせの結果（max_rows 行まで）
+
+        Raises:
+            TableQueryError: SELECT 以外の操作、実行時間の超過、SQL の誤りなど
+        """
+        conn = self._connect(doc_id)
+        deadline = time.monotonic() + self.timeout
+
+        def authorize(action, arg1, arg2, database, trigger):
+            if action not in _ALLOWED_ACTIONS:
+                return sqlite3.SQLITE_DENY
+            if action == sqlite3.SQLITE_FUNCTION and arg2 and arg2.lower() in ("load_extension", "readfile", "writefile"):
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+
+        conn.set_authorizer(authorize)
+        # 0 以外を返すと実行が中断される
+        conn.set_progress_handler(lambda: int(time.monotonic() > deadline), _PROGRESS_STEPS)
+        started = time.perf_counter()
+        try:
+            cursor = conn.execute(sql, params)
+            if cursor.description is None:
+                raise TableQueryError("only SELECT statements are allowed")
+            rows = cursor.fetchmany(self.max_rows + 1)
+            columns = [column[0] for column in cursor.description]
+        except sqlite3.Error as e:
+            if time.monotonic() > deadline:
+                raise TableQueryError(f"query exceeded {self.timeout}s")
+            raise TableQueryError(str(e))
+        finally:
+            conn.close()
+        return TableQueryResult(
+            columns=columns,
+            rows=rows[:self.max_rows],
+            truncated=len(rows) > self.max_rows,
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+        )
+
+
+_store: Optional[TableStore] = None
+
+
+def get_table_store() -> TableStore:
+    """共有の表データストアを取得"""
+    global _store
+    if _store is None:
+        _store = TableStore()
+    return _store
@@ -0,0 +1,214 @@
+"""
+ベクトルストア連携
+
+Qdrant にチャンクの埋め込みとペイロードを保存し、類似検索を行う
+
+Qdrant とは gRPC（protobuf）で通信する。REST の JSON では埋め込みの float が1要素あたり20文字前後の
+10進表記になり、エンコード・デコードの時間もサイズも大きいが、protobuf では4バイトのリトルエンディアンの
+並びのまま送られる。接続（HTTP/2 のチャネル）は同じ Qdrant を使うコレクション間で共有して使い回す。
+通信内容を確認したい場合は VECTOR_DB_GRPC=false で REST（JSON）に切り替えられる
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metrics import VECTOR_DB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+VECTOR_DB_URL = os.environ.get("VECTOR_DB_URL", "http://vectordb:6333")
+COLLECTION_NAME = os.environ.get("VECTOR_COLLECTION", "chunks")
+VECTOR_DB_GRPC = os.environ.get("VECTOR_DB_GRPC", "true").lower() == "true"  # false で REST（JSON、デバッグ用）
+VECTOR_DB_GRPC_PORT = int(os.environ.get("VECTOR_DB_GRPC_PORT", "6334"))
+
+_clients: Dict[Tuple[str, bool, int], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _shared_client(url: str, prefer_grpc: bool, grpc_port: int):
+    """接続先ごとに1つの Qdrant クライアント（接続）を共有する"""
+    key = (url, prefer_grpc, grpc_port)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            from qdrant_client import QdrantClient
+
+            client = QdrantClient(url=url, prefer_grpc=prefer_grpc, grpc_port=grpc_port)
+            _clients[key] = client
+            logger.info(f"Connected to vector database at {url} ({'gRPC' if prefer_grpc else 'REST'})")
+        return client
+
+
+class VectorStore:
+    """Qdrant のコレクションを操作する"""
+
+    def __init__(
+        self,
+        url: str = VECTOR_DB_URL,
+        collection: str = COLLECTION_NAME,
+        prefer_grpc: bool = VECTOR_DB_GRPC,
+        grpc_port: int = VECTOR_DB_GRPC_PORT,
+    ):
+        """
+        初期化
+
+        Args:
+            url: Qdrant のURL（REST）
+            collection: コレクション名
+            prefer_grpc: gRPC で通信する（False なら REST）
+            grpc_port: Qdrant の gRPC のポート
+        """
+        self.url = url
+        self.collection = collection
+        self.prefer_grpc = prefer_grpc
+        self.grpc_port = grpc_port
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = _shared_client(self.url, self.prefer_grpc, self.grpc_port)
+        return self._client
+
+    def ensure_collection(self, dimension: int):
+        """
+        コレクションがなければ作成
+
+        Args:
+            dimension: 埋め込みの次元数
+        """
+        from qdrant_client.http import models
+
+        existing = {c.name for c in self.client.get_collections().collections}
+        if self.collection in existing:
+            return
+        self.client.create_collection(
+            collection_name=self.collection,
+            vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE),
+        )
+        self.client.create_payload_index(self.collection, field_name="doc_id", field_schema="keyword")
+        logger.info(f"Created vector collection {self.collection} (dim={dimension})")
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, payloads: Sequence[Dict[str, Any]]):
+        """
+        チャンクを登録
+
+        Args:
+            ids: チャンクID（UUID文字列）
+            vectors: 埋め込み（shape=(len(ids), dimension)）
+            payloads: ペイロード
+        """
+        from qdrant_client.http import models
+
+        # float32 の配列のまま protobuf に渡すより list にしたほうが変換が速い（benchmarks/vector_store_wire.py）
+        points = [
+            models.PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        with VECTOR_DB_SECONDS.time(operation="upsert"):
+            self.client.upsert(collection_name=self.collection, points=points, wait=True)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        limit: int = 20,
+        doc_ids: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        類似チャンクを検索
+
+        Args:
+            vector: 質問の埋め込み
+            limit: 取得件数
+            doc_ids: 検索対象を限定するドキュメントID（オプション）
+
+        Returns:
+            {"id", "score", "payload"} のリスト（スコア降順）
+        """
+        from qdrant_client.http import models
+
+        query_filter = None
+        if doc_ids is not None:
+            query_filter = models.Filter(
+                must=[models.FieldCondition(key="doc_id", match=models.MatchAny(any=list(doc_ids)))]
+            )
+        with VECTOR_DB_SECONDS.time(operation="search"):
+            hits = self.client.search(
+                collection_name=self.collection,
+                query_vector=vector.tolist(),
+                query_filter=query_filter,
+                limit=limit,
+                with_payload=True,
+            )
+        return [{"id": str(hit.id), "score": hit.score, "payload": hit.payload or {}} for hit in hits]
+
+    def count(self, match: Optional[Dict[str, Any]] = None) -> int:
+        """
+        チャンク数を数える
+
+        Args:
+            match: ペイロードのキーと値（すべて一致するものだけを数える、オプション）
+
+        Returns:
+            件数
+        """
+        from qdrant_client.http import models
+
+        count_filter = None
+        if match:
+            count_filter = models.Filter(must=[
+                models.FieldCondition(key=key, match=models.MatchValue(value=value)) for key, value in match.items()
+            ])
+        with VECTOR_DB_SECONDS.time(operation="count"):
+            return self.client.count(collection_name=self.collection, count_filter=count_filter, exact=True).count
+
+    def set_payloads(self, payloads: Dict[str, Dict[str, Any]]):
+        """
+        登録済みのチャンクのペイロードの一部を書き換える（ほかのキーはそのまま）
+
+        Args:
+            payloads: チャンクID → 書き換えるキーと値
+        """
+        if not payloads:
+            return
+        from qdrant_client.http import models
+
+        operations = [
+            models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[point_id]))
+            for point_id, payload in payloads.items()
+        ]
+        with VECTOR_DB_SECONDS.time(operation="set_payload"):
+            self.client.batch_update_points(collection_name=self.collection, update_operations=operations, wait=True)
+
+    def delete_document(self, doc_id: str):
+        """
+        ドキュメントのチャンクをすべて削除
+
+        Args:
+            doc_id: ドキュメントID
+        """
+        from qdrant_client.http import models
+
+        with VECTOR_DB_SECONDS.time(operation="delete"):
+            self.client.delete(
+                collection_name=self.collection,
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(must=[models.FieldCondition(key="doc_id", match=models.MatchValue(value=doc_id))])
+                ),
+            )
+
+
+_store: Optional[VectorStore] = None
+
+
+def get_vector_store() -> VectorStore:
+    """共有のベクトルストアを取得"""
+    global _store
+    if _store is None:
+        _store = VectorStore()
+    return _store
+
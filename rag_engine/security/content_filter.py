@@ -0,0 +1,422 @@
+"""
+コンテンツフィルター
+
+検索候補のチャンクについて、ユーザーのロール・所属グループと使用中のLLMプロバイダーから
+参照可否を判定する。ドキュメントごとの機密レベル、グループACL、送信可能なプロバイダーを
+NumPy配列のビットセットとして保持し、候補全体をベクトル演算で一括判定する
+"""
+
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from ..llm.router import LLMProvider
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+# LLMに送信可能な最大機密レベル（外部プロバイダー向け）
+MAX_CONFIDENTIALITY_LEVEL = int(os.environ.get("MAX_CONFIDENTIALITY_LEVEL", "2"))
+PERMISSION_INDEX_PATH = os.environ.get("PERMISSION_INDEX_PATH", "/data/indexes/permissions")
+
+# ロールごとに参照可能な最大機密レベル
+ROLE_CLEARANCE: Dict[str, int] = {
+    "admin": 3,
+    "manager": 3,
+    "user": 2,
+    "guest": 1,
+}
+
+# プロバイダーごとのビット位置
+PROVIDER_BITS: Dict[str, int] = {provider.value: 1 << i for i, provider in enumerate(LLMProvider)}
+ALL_PROVIDERS = sum(PROVIDER_BITS.values())
+
+_INITIAL_CAPACITY = 1024
+_WORD_BITS = 64
+
+
+def default_allowed_providers(confidentiality: int) -> int:
+    """
+    機密レベルから送信可能なプロバイダーのビットマスクを求める
+
+    ローカルLLMにはすべて送信でき、外部プロバイダーには MAX_CONFIDENTIALITY_LEVEL 以下のみ送信できる
+
+    Args:
+        confidentiality: 機密レベル（0-3）
+
+    Returns:
+        プロバイダーのビットマスク
+    """
+    mask = PROVIDER_BITS[LLMProvider.LOCAL.value]
+    if confidentiality <= MAX_CONFIDENTIALITY_LEVEL:
+        mask = ALL_PROVIDERS
+    return mask
+
+
+@dataclass(frozen=True)
+class AccessContext:
+    """判定に使うユーザー情報"""
+    role: str
+    groups: FrozenSet[str] = field(default_factory=frozenset)
+
+    @property
+    def clearance(self) -> int:
+        return ROLE_CLEARANCE.get(self.role, 0)
+
+    @property
+    def bypasses_acl(self) -> bool:
+        return self.role == "admin"
+
+
+class PermissionIndex:
+    """チャンクIDに揃えたドキュメント権限のビットセット索引"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # ドキュメント単位の属性（ACLの変更はこの1行を書き換えるだけで済む）
+        self._doc_rows: Dict[str, int] = {}
+        self._doc_ids: List[str] = []
+        self._levels = np.zeros(_INITIAL_CAPACITY, dtype=np.uint8)
+        self._providers = np.zeros(_INITIAL_CAPACITY, dtype=np.uint8)
+        self._restricted = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self._groups = np.zeros((_INITIAL_CAPACITY, 1), dtype=np.uint64)
+        self._doc_active = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+
+        # グループ名 → ビット番号
+        self._group_bits: Dict[str, int] = {}
+
+        # チャンク単位の対応表（チャンク行 → ドキュメント行）
+        self._chunk_rows: Dict[str, int] = {}
+        self._chunk_docs = np.full(_INITIAL_CAPACITY, -1, dtype=np.int32)
+        self._chunk_count = 0
+
+    # --------------------------------------------------
+    # 更新
+    # --------------------------------------------------
+    def _grow_docs(self, needed: int):
+        capacity = len(self._levels)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ("_levels", "_providers", "_restricted", "_doc_active"):
+            old = getattr(self, name)
+            new = np.zeros(new_capacity, dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        groups = np.zeros((new_capacity, self._groups.shape[1]), dtype=np.uint64)
+        groups[:capacity] = self._groups
+        self._groups = groups
+
+    def _grow_chunks(self, needed: int):
+        capacity = len(self._chunk_docs)
+        if needed <= capacity:
+            return
+        chunk_docs = np.full(max(needed, capacity * 2), -1, dtype=np.int32)
+        chunk_docs[:capacity] = self._chunk_docs
+        self._chunk_docs = chunk_docs
+
+    def _group_words(self, groups: Iterable[str], create: bool) -> np.ndarray:
+        """グループ集合をビットセット（uint64のワード列）に変換"""
+        bits = []
+        for group in groups:
+            bit = self._group_bits.get(group)
+            if bit is None:
+                if not create:
+                    continue
+                bit = len(self._group_bits)
+                self._group_bits[group] = bit
+            bits.append(bit)
+
+        words_needed = max(1, -(-len(self._group_bits) // _WORD_BITS))
+        if create and words_needed > self._groups.shape[1]:
+            widened = np.zeros((self._groups.shape[0], words_needed), dtype=np.uint64)
+            widened[:, :self._groups.shape[1]] = self._groups
+            self._groups = widened
+
+        words = np.zeros(self._groups.shape[1], dtype=np.uint64)
+        for bit in bits:
+            words[bit // _WORD_BITS] |= np.uint64(1 << (bit % _WORD_BITS))
+        return words
+
+    def upsert_document(
+        self,
+        doc_id: str,
+        confidentiality: int,
+        groups: Optional[Iterable[str]] = None,
+        allowed_providers: Optional[Iterable[str]] = None,
+    ):
+        """
+        ドキュメントの権限を登録または更新（チャンクの対応はそのまま）
+
+        Args:
+            doc_id: ドキュメントID
+            confidentiality: 機密レベル（0-3）
+            groups: 参照を許可するグループ（空または None なら制限なし）
+            allowed_providers: 送信を許可するプロバイダー（None なら機密レベルから決定）
+        """
+        with self._lock:
+            row = self._doc_rows.get(doc_id)
+            if row is None:
+                row = len(self._doc_ids)
+                self._grow_docs(row + 1)
+                self._doc_rows[doc_id] = row
+                self._doc_ids.append(doc_id)
+
+            groups = list(groups or [])
+            if allowed_providers is None:
+                provider_mask = default_allowed_providers(confidentiality)
+            else:
+                provider_mask = 0
+                for provider in allowed_providers:
+                    provider_mask |= PROVIDER_BITS[LLMProvider(provider).value]
+
+            words = self._group_words(groups, create=True)
+            self._levels[row] = confidentiality
+            self._providers[row] = provider_mask
+            self._restricted[row] = bool(groups)
+            self._groups[row] = words
+            self._doc_active[row] = True
+
+    def update_acl(
+        self,
+        doc_id: str,
+        confidentiality: Optional[int] = None,
+        groups: Optional[Iterable[str]] = None,
+        allowed_providers: Optional[Iterable[str]] = None,
+    ):
+        """
+        ドキュメントのACLを部分的に更新（指定した項目のみ）
+
+        Args:
+            doc_id: ドキュメントID
+            confidentiality: 新しい機密レベル
+            groups: 新しい許可グループ
+            allowed_providers: 新しい送信許可プロバイダー
+        """
+        with self._lock:
+            row = self._doc_rows.get(doc_id)
+            if row is None:
+                raise KeyError(f"Document {doc_id} is not in the permission index")
+            if confidentiality is not None:
+                self._levels[row] = confidentiality
+                if allowed_providers is None:
+                    self._providers[row] = default_allowed_providers(confidentiality)
+            if allowed_providers is not None:
+                mask = 0
+                for provider in allowed_providers:
+                    mask |= PROVIDER_BITS[LLMProvider(provider).value]
+                self._providers[row] = mask
+            if groups is not None:
+                groups = list(groups)
+                words = self._group_words(groups, create=True)
+                self._groups[row] = words
+                self._restricted[row] = bool(groups)
+
+    @property
+    def document_count(self) -> int:
+        """有効なドキュメント数"""
+        with self._lock:
+            return int(self._doc_active[:len(self._doc_ids)].sum())
+
+    def add_chunks(self, doc_id: str, chunk_ids: Sequence[str]):
+        """
+        ドキュメントにチャンクを対応付ける
+
+        Args:
+            doc_id: 登録済みのドキュメントID
+            chunk_ids: チャンクID
+        """
+        with self._lock:
+            doc_row = self._doc_rows.get(doc_id)
+            if doc_row is None:
+                raise KeyError(f"Document {doc_id} is not in the permission index")
+            self._grow_chunks(self._chunk_count + len(chunk_ids))
+            for chunk_id in chunk_ids:
+                row = self._chunk_rows.get(chunk_id)
+                if row is None:
+                    row = self._chunk_count
+                    self._chunk_rows[chunk_id] = row
+                    self._chunk_count += 1
+                self._chunk_docs[row] = doc_row
+
+    def remove_document(self, doc_id: str):
+        """
+        ドキュメントを無効化（以後そのチャンクはすべて拒否される）
+
+        Args:
+            doc_id: ドキュメントID
+        """
+        with self._lock:
+            row = self._doc_rows.get(doc_id)
+            if row is not None:
+                self._doc_active[row] = False
+
+    # --------------------------------------------------
+    # 判定
+    # --------------------------------------------------
+    def allowed_mask(self, chunk_ids: Sequence[str], context: AccessContext, provider: str) -> np.ndarray:
+        """
+        候補チャンクの参照可否を一括判定
+
+        Args:
+            chunk_ids: 候補チャンクID（索引にないものは拒否）
+            context: ユーザー情報
+            provider: 使用中のLLMプロバイダー
+
+        Returns:
+            chunk_ids と同じ長さの bool 配列
+        """
+        with span("security.permission_filter", candidates=len(chunk_ids)) as current:
+            chunk_rows = self._chunk_rows
+            rows = np.fromiter((chunk_rows.get(c, -1) for c in chunk_ids), dtype=np.int64, count=len(chunk_ids))
+            mask = self.allowed_rows(rows, context, provider)
+            current.set_attribute("allowed", int(mask.sum()))
+            return mask
+
+    def allowed_rows(self, rows: np.ndarray, context: AccessContext, provider: str) -> np.ndarray:
+        """
+        チャンク行番号の配列で参照可否を一括判定
+
+        Args:
+            rows: チャンク行番号（-1 は未登録として拒否）
+            context: ユーザー情報
+            provider: 使用中のLLMプロバイダー
+
+        Returns:
+            rows と同じ長さの bool 配列
+        """
+        with self._lock:
+            chunk_docs = self._chunk_docs
+        known = rows >= 0
+        doc_rows = np.where(known, chunk_docs[np.where(known, rows, 0)], -1)
+        return self._allowed_doc_rows(doc_rows, context, provider)
+
+    def allowed_documents(self, doc_ids: Sequence[str], context: AccessContext, provider: str) -> np.ndarray:
+        """
+        ドキュメント単位で参照可否を一括判定
+
+        Args:
+            doc_ids: ドキュメントID（索引にないものは拒否）
+            context: ユーザー情報
+            provider: 使用中のLLMプロバイダー
+
+        Returns:
+            doc_ids と同じ長さの bool 配列
+        """
+        doc_rows = self._doc_rows
+        rows = np.fromiter((doc_rows.get(d, -1) for d in doc_ids), dtype=np.int64, count=len(doc_ids))
+        return self._allowed_doc_rows(rows, context, provider)
+
+    def _allowed_doc_rows(self, doc_rows: np.ndarray, context: AccessContext, provider: str) -> np.ndarray:
+        """ドキュメント行番号の配列で参照可否を一括判定（-1 は拒否）"""
+        with self._lock:
+            levels, providers = self._levels, self._providers
+            restricted, groups, active = self._restricted, self._groups, self._doc_active
+            user_words = self._group_words(context.groups, create=False)
+
+        known = doc_rows >= 0
+        doc_rows = np.where(known, doc_rows, 0)
+
+        provider_bit = np.uint8(PROVIDER_BITS[LLMProvider(provider).value])
+        mask = known & active[doc_rows]
+        mask &= levels[doc_rows] <= context.clearance
+        mask &= (providers[doc_rows] & provider_bit) != 0
+
+        if not context.bypasses_acl:
+            shares_group = (groups[doc_rows] & user_words).any(axis=1)
+            mask &= ~restricted[doc_rows] | shares_group
+        return mask
+
+    def filter(self, chunk_ids: Sequence[str], context: AccessContext, provider: str) -> List[str]:
+        """
+        参照可能なチャンクIDだけを順序を保って返す
+
+        Args:
+            chunk_ids: 候補チャンクID
+            context: ユーザー情報
+            provider: 使用中のLLMプロバイダー
+
+        Returns:
+            参照可能なチャンクID
+        """
+        mask = self.allowed_mask(chunk_ids, context, provider)
+        return [chunk_id for chunk_id, allowed in zip(chunk_ids, mask) if allowed]
+
+    # --------------------------------------------------
+    # 永続化
+    # --------------------------------------------------
+    def save(self, path: str = PERMISSION_INDEX_PATH):
+        """
+        索引を保存（配列は .npz、ID対応表は .json）
+
+        一時ファイルに書いてから置き換える。行は追加されるだけなので、.npz を先に、.json を最後に
+        置き換えれば、途中で止まっても .json に載っている行はすべて .npz にある
+
+        Args:
+            path: 拡張子を除いた保存先パス
+        """
+        base = Path(path)
+        base.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            docs = len(self._doc_ids)
+            tmp_path = base.with_suffix(".npz.tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    levels=self._levels[:docs],
+                    providers=self._providers[:docs],
+                    restricted=self._restricted[:docs],
+                    groups=self._groups[:docs],
+                    doc_active=self._doc_active[:docs],
+                    chunk_docs=self._chunk_docs[:self._chunk_count],
+                )
+            os.replace(tmp_path, base.with_suffix(".npz"))
+            chunk_ids = sorted(self._chunk_rows, key=self._chunk_rows.get)
+            tmp_path = base.with_suffix(".json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({"doc_ids": self._doc_ids, "chunk_ids": chunk_ids, "groups": self._group_bits}, f)
+            os.replace(tmp_path, base.with_suffix(".json"))
+
+    @classmethod
+    def load(cls, path: str = PERMISSION_INDEX_PATH) -> "PermissionIndex":
+        """
+        保存した索引を読み込む（存在しなければ空の索引）
+
+        Args:
+            path: 拡張子を除いた保存先パス
+
+        Returns:
+            索引
+        """
+        index = cls()
+        base = Path(path)
+        if not base.with_suffix(".npz").exists():
+            return index
+
+        with open(base.with_suffix(".json"), "r") as f:
+            ids = json.load(f)
+        arrays = np.load(base.with_suffix(".npz"))
+
+        index._doc_ids = ids["doc_ids"]
+        index._doc_rows = {doc_id: row for row, doc_id in enumerate(index._doc_ids)}
+        index._group_bits = ids["groups"]
+        index._chunk_rows = {chunk_id: row for row, chunk_id in enumerate(ids["chunk_ids"])}
+        index._chunk_count = len(ids["chunk_ids"])
+
+        docs = len(index._doc_ids)
+        index._grow_docs(docs)
+        index._groups = np.zeros((len(index._levels), arrays["groups"].shape[1]), dtype=np.uint64)
+        # .npz が .json より新しい場合は、.json に載っている行まで使う
+        for name in ("levels", "providers", "restricted", "groups", "doc_active"):
+            getattr(index, f"_{name}")[:docs] = arrays[name][:docs]
+        index._grow_chunks(index._chunk_count)
+        index._chunk_docs[:index._chunk_count] = arrays["chunk_docs"][:index._chunk_count]
+        logger.info(f"Loaded permission index with {docs} documents and {index._chunk_count} chunks")
+        return index
@@ -0,0 +1,900 @@
+"""
+暗号化ユーティリティ
+
+保存ドキュメントをセグメント単位のAES-GCM（ストリーミングAEAD）で暗号化する。
+ファイルは固定長のセグメントに分割され、各セグメントが独立して認証されるため、
+全体をメモリに載せずに読み書きでき、任意のバイト範囲だけを復号できる
+
+ファイル形式:
+    ヘッダー: magic(4) | version(1) | segment_size(4) | salt(16) | nonce_prefix(7) | key_id_len(1) | key_id
+    セグメント: AES-GCM(ファイル鍵, nonce, 平文セグメント, AAD=ヘッダー) = 暗号文 + タグ(16)
+
+    ファイル鍵 = HKDF-SHA256(マスター鍵, salt, info=key_id)
+    nonce = nonce_prefix(7) | セグメント番号(4, big-endian) | 最終セグメントフラグ(1)
+
+ベクトルストアに保存するチャンク本文はエンベロープ暗号化する。ドキュメントごとのデータ鍵で
+チャンクを暗号化し、データ鍵はマスター鍵（KEK）でラップして保存する。マスター鍵の
+ローテーションではデータ鍵を再ラップするだけで、コーパス全体の再暗号化は不要
+"""
+
+import base64
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from ..tracing import span
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SRAE"
+FORMAT_VERSION = 1
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+TAG_SIZE = 16
+SALT_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+
+_HEADER_FIXED = struct.Struct(">4sBI16s7sB")
+_MAX_SEGMENTS = 2 ** 32
+
+
+class IntegrityError(ValueError):
+    """暗号文の認証に失敗した（改ざん・切り詰め・鍵の不一致）"""
+
+
+class KeyRing:
+    """鍵IDとマスター鍵の対応を保持する"""
+
+    def __init__(self, keys: Dict[str, bytes], active_key_id: str):
+        """
+        初期化
+
+        Args:
+            keys: 鍵ID → マスター鍵
+            active_key_id: 新規暗号化に使う鍵ID
+        """
+        if active_key_id not in keys:
+            raise ValueError(f"Active key id {active_key_id!r} is not in the key ring")
+        for key_id in keys:
+            if not 0 < len(key_id.encode("utf-8")) < 256:
+                raise ValueError(f"Invalid key id length: {key_id!r}")
+        self._keys = dict(keys)
+        self.active_key_id = active_key_id
+        self._keks: Dict[str, AESGCM] = {}
+
+    @classmethod
+    def from_env(cls) -> "KeyRing":
+        """
+        環境変数から鍵を読み込む
+
+        ENCRYPTION_KEY（現行の鍵）、ENCRYPTION_KEY_ID（その鍵ID）に加え、
+        ENCRYPTION_OLD_KEYS に「鍵ID:鍵,鍵ID:鍵」形式で旧鍵を指定できる
+
+        Returns:
+            キーリング
+        """
+        master_key = os.environ.get("ENCRYPTION_KEY")
+        if not master_key:
+            raise ValueError("ENCRYPTION_KEY is not set")
+        active_key_id = os.environ.get("ENCRYPTION_KEY_ID", "default")
+
+        keys = {active_key_id: master_key.encode("utf-8")}
+        for entry in filter(None, os.environ.get("ENCRYPTION_OLD_KEYS", "").split(",")):
+            key_id, _, key = entry.partition(":")
+            keys.setdefault(key_id.strip(), key.strip().encode("utf-8"))
+        return cls(keys, active_key_id)
+
+    def get(self, key_id: str) -> bytes:
+        """鍵IDに対応するマスター鍵を取得"""
+        try:
+            return self._keys[key_id]
+        except KeyError:
+            raise IntegrityError(f"Unknown encryption key id: {key_id!r}") from None
+
+    @property
+    def active_key(self) -> bytes:
+        return self._keys[self.active_key_id]
+
+    def kek(self, key_id: str) -> AESGCM:
+        """データ鍵のラップに使う鍵暗号化鍵（鍵IDごとに1回だけ導出してキャッシュ）"""
+        kek = self._keks.get(key_id)
+        if kek is None:
+            kek = _derive_file_key(self.get(key_id), b"", key_id, purpose="kek")
+            self._keks[key_id] = kek
+        return kek
+
+
+def _derive_file_key(master_key: bytes, salt: bytes, key_id: str, purpose: str = "segment") -> AESGCM:
+    key = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=f"secure-rag/{purpose}/{key_id}".encode("utf-8"),
+    ).derive(master_key)
+    return AESGCM(key)
+
+
+def _segment_nonce(prefix: bytes, index: int, last: bool) -> bytes:
+    if index >= _MAX_SEGMENTS:
+        raise ValueError("File has too many segments")
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+class StreamHeader:
+    """暗号化ファイルのヘッダー"""
+
+    def __init__(self, key_id: str, segment_size: int, salt: bytes, nonce_prefix: bytes):
+        self.key_id = key_id
+        self.segment_size = segment_size
+        self.salt = salt
+        self.nonce_prefix = nonce_prefix
+        key_id_bytes = key_id.encode("utf-8")
+        self.raw = _HEADER_FIXED.pack(
+            MAGIC, FORMAT_VERSION, segment_size, salt, nonce_prefix, len(key_id_bytes)
+        ) + key_id_bytes
+
+    @classmethod
+    def new(cls, key_id: str, segment_size: int = DEFAULT_SEGMENT_SIZE) -> "StreamHeader":
+        if segment_size <= 0:
+            raise ValueError("segment_size must be positive")
+        return cls(key_id, segment_size, os.urandom(SALT_SIZE), os.urandom(NONCE_PREFIX_SIZE))
+
+    @classmethod
+    def read_from(cls, src: BinaryIO) -> "StreamHeader":
+        fixed = src.read(_HEADER_FIXED.size)
+        if len(fixed) != _HEADER_FIXED.size:
+            raise IntegrityError("Encrypted stream header is truncated")
+        magic, version, segment_size, salt, nonce_prefix, key_id_len = _HEADER_FIXED.unpack(fixed)
+        if magic != MAGIC:
+            raise IntegrityError("Not an encrypted document stream")
+        if version != FORMAT_VERSION:
+            raise IntegrityError(f"Unsupported encrypted stream version: {version}")
+        key_id = src.read(key_id_len)
+        if len(key_id) != key_id_len:
+            raise IntegrityError("Encrypted stream header is truncated")
+        return cls(key_id.decode("utf-8"), segment_size, salt, nonce_prefix)
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    @property
+    def ciphertext_segment_size(self) -> int:
+        return self.segment_size + TAG_SIZE
+
+
+class EncryptedWriter:
+    """
+    平文を書き込むと、セグメント単位で暗号化して出力先へ書き出すストリーム
+
+    メモリに保持するのは最大1セグメント分の平文のみ
+    """
+
+    def __init__(
+        self,
+        dst: BinaryIO,
+        key_ring: Optional[KeyRing] = None,
+        segment_size: int = DEFAULT_SEGMENT_SIZE,
+    ):
+        """
+        初期化
+
+        Args:
+            dst: 暗号文の出力先
+            key_ring: キーリング（省略時は環境変数から読み込む）
+            segment_size: 平文セグメントのサイズ（バイト）
+        """
+        key_ring = key_ring or KeyRing.from_env()
+        self._dst = dst
+        self.header = StreamHeader.new(key_ring.active_key_id, segment_size)
+        self._aead = _derive_file_key(key_ring.active_key, self.header.salt, self.header.key_id)
+        self._buffer = bytearray()
+        self._index = 0
+        self._closed = False
+        self.bytes_written = 0
+        dst.write(self.header.raw)
+
+    @classmethod
+    def resume(cls, dst: BinaryIO, key_ring: Optional[KeyRing] = None, hasher=None) -> "EncryptedWriter":
+        """
+        書きかけの（close していない）暗号化ファイルの末尾から書き込みを再開する
+
+        途中で切れた不完全なセグメントは切り詰め、既存のセグメントはすべて認証してから追記する。
+        再開位置は header.segment_size の倍数になる
+
+        Args:
+            dst: 読み書き可能でシーク可能な出力先（"r+b" で開いたファイルなど）
+            key_ring: キーリング（省略時は環境変数から読み込む）
+            hasher: 既存の平文を流し込むハッシュオブジェクト（オプション）
+
+        Returns:
+            再開した EncryptedWriter（bytes_written は再開位置）
+
+        Raises:
+            IntegrityError: 既存のセグメントが改ざん・破損している場合
+        """
+        key_ring = key_ring or KeyRing.from_env()
+        dst.seek(0)
+        header = StreamHeader.read_from(dst)
+        aead = _derive_file_key(key_ring.get(header.key_id), header.salt, header.key_id)
+
+        size = header.ciphertext_segment_size
+        index = 0
+        while True:
+            ciphertext = dst.read(size)
+            if len(ciphertext) < size:
+                break
+            try:
+                plaintext = aead.decrypt(_segment_nonce(header.nonce_prefix, index, False), ciphertext, header.raw)
+            except InvalidTag:
+                raise IntegrityError(f"Segment {index} failed authentication") from None
+            if hasher is not None:
+                hasher.update(plaintext)
+            index += 1
+
+        end = len(header) + index * size
+        dst.seek(end)
+        dst.truncate(end)
+
+        writer = cls.__new__(cls)
+        writer._dst = dst
+        writer.header = header
+        writer._aead = aead
+        writer._buffer = bytearray()
+        writer._index = index
+        writer._closed = False
+        writer.bytes_written = index * header.segment_size
+        return writer
+
+    def write(self, data: bytes) -> int:
+        """
+        平文を書き込む
+
+        Args:
+            data: 平文
+
+        Returns:
+            書き込んだバイト数
+        """
+        if self._closed:
+            raise ValueError("write to closed EncryptedWriter")
+        self._buffer += data
+        segment_size = self.header.segment_size
+        # 最終セグメントは close まで確定できないため、1セグメント分は常に手元に残す
+        while len(self._buffer) > segment_size:
+            self._emit(bytes(self._buffer[:segment_size]), last=False)
+            del self._buffer[:segment_size]
+        self.bytes_written += len(data)
+        return len(data)
+
+    def _emit(self, plaintext: bytes, last: bool):
+        nonce = _segment_nonce(self.header.nonce_prefix, self._index, last)
+        self._dst.write(self._aead.encrypt(nonce, plaintext, self.header.raw))
+        self._index += 1
+
+    def close(self):
+        """最終セグメントを書き出して終了（出力先は閉じない）"""
+        if self._closed:
+            return
+        self._emit(bytes(self._buffer), last=True)
+        self._buffer = bytearray()
+        self._closed = True
+
+    def __enter__(self) -> "EncryptedWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+class EncryptedReader:
+    """暗号化ファイルの復号リーダー（逐次読み出しとバイト範囲指定の読み出し）"""
+
+    def __init__(self, src: BinaryIO, key_ring: Optional[KeyRing] = None):
+        """
+        初期化
+
+        Args:
+            src: 暗号文の入力元（バイト範囲指定の読み出しにはシーク可能である必要がある）
+            key_ring: キーリング（省略時は環境変数から読み込む）
+        """
+        key_ring = key_ring or KeyRing.from_env()
+        self._src = src
+        self.header = StreamHeader.read_from(src)
+        self._aead = _derive_file_key(key_ring.get(self.header.key_id), self.header.salt, self.header.key_id)
+        self._data_start = src.tell() if src.seekable() else len(self.header)
+
+    def _decrypt_segment(self, index: int, ciphertext: bytes, last: bool) -> bytes:
+        nonce = _segment_nonce(self.header.nonce_prefix, index, last)
+        try:
+            return self._aead.decrypt(nonce, ciphertext, self.header.raw)
+        except InvalidTag:
+            raise IntegrityError(f"Segment {index} failed authentication") from None
+
+    def iter_segments(self) -> Iterator[bytes]:
+        """
+        先頭から順に復号したセグメントを返す
+
+        最終セグメントフラグを検証するため、1セグメント先読みする
+
+        Yields:
+            平文セグメント
+        """
+        size = self.header.ciphertext_segment_size
+        index = 0
+        current = self._src.read(size)
+        while True:
+            following = self._src.read(size)
+            last = not following
+            if not current and index == 0:
+                raise IntegrityError("Encrypted stream has no segments")
+            yield self._decrypt_segment(index, current, last)
+            if last:
+                return
+            current = following
+            index += 1
+
+    @property
+    def plaintext_size(self) -> int:
+        """ファイルサイズから平文サイズを算出（シーク可能な入力のみ）"""
+        segment_count, last_size = self._layout()
+        return (segment_count - 1) * self.header.segment_size + last_size
+
+    def _layout(self) -> Tuple[int, int]:
+        """（セグメント数, 最終セグメントの平文サイズ）"""
+        end = self._src.seek(0, os.SEEK_END)
+        body = end - self._data_start
+        size = self.header.ciphertext_segment_size
+        segment_count = max(1, -(-body // size))
+        last_size = body - (segment_count - 1) * size - TAG_SIZE
+        if last_size < 0:
+            raise IntegrityError("Encrypted stream is truncated")
+        return segment_count, last_size
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        """
+        平文の指定範囲だけを、その範囲を含むセグメントのみ復号して返す
+
+        Args:
+            offset: 平文上の開始位置
+            length: 読み出すバイト数
+
+        Returns:
+            平文（ファイル末尾を超える部分は切り詰められる）
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must be non-negative")
+        segment_count, _ = self._layout()
+        segment_size = self.header.segment_size
+        first = offset // segment_size
+        last = min((offset + length - 1) // segment_size, segment_count - 1) if length else first - 1
+        if first >= segment_count:
+            return b""
+
+        parts = []
+        for index in range(first, last + 1):
+            self._src.seek(self._data_start + index * self.header.ciphertext_segment_size)
+            ciphertext = self._src.read(self.header.ciphertext_segment_size)
+            parts.append(self._decrypt_segment(index, ciphertext, index == segment_count - 1))
+
+        data = b"".join(parts)
+        start = offset - first * segment_size
+        return data[start:start + length]
+
+
+def encrypt_stream(
+    src: BinaryIO,
+    dst: BinaryIO,
+    key_ring: Optional[KeyRing] = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+) -> int:
+    """
+    入力ストリームを逐次暗号化して出力
+
+    Args:
+        src: 平文の入力元
+        dst: 暗号文の出力先
+        key_ring: キーリング
+        segment_size: セグメントサイズ
+
+    Returns:
+        暗号化した平文のバイト数
+    """
+    with EncryptedWriter(dst, key_ring, segment_size) as writer:
+        while True:
+            block = src.read(segment_size)
+            if not block:
+                break
+            writer.write(block)
+    return writer.bytes_written
+
+
+def decrypt_stream(src: BinaryIO, dst: BinaryIO, key_ring: Optional[KeyRing] = None) -> int:
+    """
+    暗号化ストリームを逐次復号して出力
+
+    Args:
+        src: 暗号文の入力元
+        dst: 平文の出力先
+        key_ring: キーリング
+
+    Returns:
+        復号した平文のバイト数
+    """
+    total = 0
+    for segment in EncryptedReader(src, key_ring).iter_segments():
+        dst.write(segment)
+        total += len(segment)
+    return total
+
+
+def encrypt_file_parallel(
+    src_path: str,
+    dst_path: str,
+    key_ring: Optional[KeyRing] = None,
+    segment_size: int = DEFAULT_SEGMENT_SIZE,
+    workers: Optional[int] = None,
+) -> int:
+    """
+    大きなファイルのセグメントを複数スレッドで並列に暗号化
+
+    セグメントは独立して暗号化できるため順序を保ったまま並列化できる。
+    同時に保持するセグメント数は workers の2倍までに制限する
+
+    Args:
+        src_path: 平文ファイルのパス
+        dst_path: 暗号化ファイルの出力パス
+        key_ring: キーリング
+        segment_size: セグメントサイズ
+        workers: スレッド数（省略時はCPU数）
+
+    Returns:
+        暗号化した平文のバイト数
+    """
+    key_ring = key_ring or KeyRing.from_env()
+    workers = workers or os.cpu_count() or 1
+    header = StreamHeader.new(key_ring.active_key_id, segment_size)
+    aead = _derive_file_key(key_ring.active_key, header.salt, header.key_id)
+    total_size = os.path.getsize(src_path)
+    segment_count = max(1, -(-total_size // segment_size))
+
+    def encrypt_segment(index: int, plaintext: bytes) -> bytes:
+        nonce = _segment_nonce(header.nonce_prefix, index, index == segment_count - 1)
+        return aead.encrypt(nonce, plaintext, header.raw)
+
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst, ThreadPoolExecutor(workers) as pool:
+        dst.write(header.raw)
+        pending = []
+        for index in range(segment_count):
+            pending.append(pool.submit(encrypt_segment, index, src.read(segment_size)))
+            if len(pending) >= workers * 2:
+                dst.write(pending.pop(0).result())
+        for future in pending:
+            dst.write(future.result())
+    return total_size
+
+
+# --------------------------------------------------
+# エンベロープ暗号化（チャンクペイロード用）
+# --------------------------------------------------
+DATA_KEY_SIZE = 32
+CHUNK_NONCE_SIZE = 12
+DATA_KEY_STORE_PATH = os.environ.get("DATA_KEY_STORE_PATH", "/data/keys/data_keys.json")
+DATA_KEY_CACHE_TTL = float(os.environ.get("DATA_KEY_CACHE_TTL", "300"))  # 秒
+CHUNK_CACHE_ENTRIES = int(os.environ.get("CHUNK_CACHE_ENTRIES", "2048"))
+CHUNK_CACHE_BYTES = int(os.environ.get("CHUNK_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+
+def _zeroize(buffer: bytearray):
+    """バッファの内容を上書き消去する"""
+    buffer[:] = bytes(len(buffer))
+
+
+class DataKeyStore:
+    """ラップ済みデータ鍵の保存先（メモリ上）"""
+
+    def __init__(self):
+        self._keys: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, doc_id: str) -> Optional[bytes]:
+        return self._keys.get(doc_id)
+
+    def update(self, change: Callable[[Dict[str, bytes]], None]):
+        """
+        保存されている鍵をまとめて書き換える
+
+        Args:
+            change: ドキュメントID からラップ済みデータ鍵への辞書を受け取り、その場で書き換える関数
+        """
+        with self._lock:
+            change(self._keys)
+
+    def put(self, doc_id: str, wrapped_key: bytes):
+        self.update(lambda keys: keys.__setitem__(doc_id, wrapped_key))
+
+    def put_many(self, wrapped_keys: Dict[str, bytes]):
+        self.update(lambda keys: keys.update(wrapped_keys))
+
+    def delete(self, doc_id: str):
+        self.update(lambda keys: keys.pop(doc_id, None))
+
+    def items(self) -> Dict[str, bytes]:
+        with self._lock:
+            return dict(self._keys)
+
+
+class FileDataKeyStore(DataKeyStore):
+    """
+    ラップ済みデータ鍵をJSONファイルに保存する
+
+    API・ワーカー・管理スクリプトなど複数のプロセスが同じファイルを使うため、書き換えはロックファイルを
+    flock で排他したうえで、ファイルを読み直してから変更を加えて置き換える（メモリ上の古い内容で
+    ほかのプロセスの変更を上書きしない）
+    """
+
+    def __init__(self, path: str = DATA_KEY_STORE_PATH):
+        """
+        初期化
+
+        Args:
+            path: 保存先ファイルのパス
+        """
+        super().__init__()
+        self.path = Path(path)
+        self._mtime: Optional[float] = None
+        self._reload()
+
+    def _read(self) -> Dict[str, bytes]:
+        try:
+            with open(self.path, "r") as f:
+                return {doc_id: base64.b64decode(blob) for doc_id, blob in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+
+    def _reload(self):
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        keys = self._read()
+        with self._lock:
+            self._keys = keys
+            self._mtime = mtime
+
+    def get(self, doc_id: str) -> Optional[bytes]:
+        # 別プロセスの変更（ワーカーが追加した鍵、ローテーションで再ラップした鍵）を拾う
+        self._reload()
+        return self._keys.get(doc_id)
+
+    def items(self) -> Dict[str, bytes]:
+        self._reload()
+        return super().items()
+
+    def update(self, change: Callable[[Dict[str, bytes]], None]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path.with_suffix(".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # ファイルを閉じると解放される
+            keys = self._read()
+            change(keys)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({doc_id: base64.b64encode(blob).decode("ascii") for doc_id, blob in keys.items()}, f)
+            os.replace(tmp_path, self.path)
+            self._keys = keys
+            self._mtime = self.path.stat().st_mtime
+
+
+class _DataKeyCache:
+    """アンラップ済みデータ鍵の短時間キャッシュ（期限切れで消去）"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, bytearray, AESGCM]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, doc_id: str) -> Optional[AESGCM]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(doc_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= now:
+                self._drop(doc_id)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[2]
+
+    def put(self, doc_id: str, data_key: bytearray) -> AESGCM:
+        aead = AESGCM(bytes(data_key))
+        with self._lock:
+            self._drop(doc_id)
+            self._entries[doc_id] = (time.monotonic() + self.ttl, data_key, aead)
+            self._purge_expired()
+        return aead
+
+    def _drop(self, doc_id: str):
+        entry = self._entries.pop(doc_id, None)
+        if entry is not None:
+            _zeroize(entry[1])
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for doc_id in [d for d, entry in self._entries.items() if entry[0] <= now]:
+            self._drop(doc_id)
+
+    def invalidate(self, doc_id: Optional[str] = None):
+        with self._lock:
+            for key in ([doc_id] if doc_id else list(self._entries)):
+                self._drop(key)
+
+
+class DecryptedChunkCache:
+    """
+    復号済みチャンク本文のLRUキャッシュ
+
+    件数とバイト数の両方で上限を設け、追い出したエントリはバッファを上書き消去する
+    """
+
+    def __init__(self, max_entries: int = CHUNK_CACHE_ENTRIES, max_bytes: int = CHUNK_CACHE_BYTES):
+        """
+        初期化
+
+        Args:
+            max_entries: 最大件数
+            max_bytes: 本文の合計最大バイト数
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytearray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            buffer = self._entries.get(key)
+            if buffer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return buffer.decode("utf-8")
+
+    def put(self, key: tuple, text: str):
+        buffer = bytearray(text.encode("utf-8"))
+        if len(buffer) > self.max_bytes:
+            return
+        with self._lock:
+            self._evict(key)
+            self._entries[key] = buffer
+            self._bytes += len(buffer)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: tuple):
+        buffer = self._entries.pop(key, None)
+        if buffer is not None:
+            self._bytes -= len(buffer)
+            _zeroize(buffer)
+
+    def invalidate_document(self, doc_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == doc_id]:
+                self._evict(key)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._evict(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class LazyChunkText:
+    """
+    暗号化されたチャンク本文の遅延復号ラッパー
+
+    検索・リランキングの間は暗号文のまま扱い、最終的に採用されたチャンクだけが
+    text にアクセスした時点で復号される
+    """
+
+    __slots__ = ("_cipher", "doc_id", "chunk_id", "ciphertext", "_text")
+
+    def __init__(self, cipher: "EnvelopeCipher", doc_id: str, chunk_id: str, ciphertext: bytes):
+        self._cipher = cipher
+        self.doc_id = doc_id
+        self.chunk_id = chunk_id
+        self.ciphertext = ciphertext
+        self._text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self._cipher.decrypt_chunk(self.doc_id, self.chunk_id, self.ciphertext)
+        return self._text
+
+    @property
+    def is_decrypted(self) -> bool:
+        return self._text is not None
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class EnvelopeCipher:
+    """ドキュメントごとのデータ鍵によるチャンクのエンベロープ暗号化"""
+
+    def __init__(
+        self,
+        key_ring: Optional[KeyRing] = None,
+        key_store: Optional[DataKeyStore] = None,
+        data_key_ttl: float = DATA_KEY_CACHE_TTL,
+        chunk_cache: Optional[DecryptedChunkCache] = None,
+    ):
+        """
+        初期化
+
+        Args:
+            key_ring: マスター鍵のキーリング（省略時は環境変数から読み込む）
+            key_store: ラップ済みデータ鍵の保存先（省略時はファイル）
+            data_key_ttl: アンラップ済みデータ鍵をキャッシュする秒数
+            chunk_cache: 復号済みチャンクのキャッシュ（省略時は既定サイズで作成）
+        """
+        self.key_ring = key_ring or KeyRing.from_env()
+        self.key_store = key_store if key_store is not None else FileDataKeyStore()
+        self._data_keys = _DataKeyCache(data_key_ttl)
+        self.chunk_cache = chunk_cache if chunk_cache is not None else DecryptedChunkCache()
+        self._create_lock = threading.Lock()
+
+    def _wrap(self, doc_id: str, data_key: bytes, key_ring: Optional[KeyRing] = None) -> bytes:
+        key_ring = key_ring or self.key_ring
+        key_id = key_ring.active_key_id.encode("utf-8")
+        nonce = os.urandom(CHUNK_NONCE_SIZE)
+        wrapped = key_ring.kek(key_ring.active_key_id).encrypt(nonce, data_key, doc_id.encode("utf-8"))
+        return bytes([len(key_id)]) + key_id + nonce + wrapped
+
+    def _unwrap(self, doc_id: str, blob: bytes) -> bytearray:
+        key_id_len = blob[0]
+        key_id = blob[1:1 + key_id_len].decode("utf-8")
+        nonce = blob[1 + key_id_len:1 + key_id_len + CHUNK_NONCE_SIZE]
+        wrapped = blob[1 + key_id_len + CHUNK_NONCE_SIZE:]
+        try:
+            return bytearray(self.key_ring.kek(key_id).decrypt(nonce, wrapped, doc_id.encode("utf-8")))
+        except InvalidTag:
+            raise IntegrityError(f"Data key for document {doc_id} failed authentication") from None
+
+    def _data_key(self, doc_id: str, create: bool = False) -> AESGCM:
+        aead = self._data_keys.get(doc_id)
+        if aead is not None:
+            return aead
+
+        with self._create_lock, span("security.unwrap_data_key", doc_id=doc_id):
+            blob = self.key_store.get(doc_id)
+            if blob is None:
+                if not create:
+                    raise IntegrityError(f"No data key for document {doc_id}")
+                data_key = bytearray(os.urandom(DATA_KEY_SIZE))
+                self.key_store.put(doc_id, self._wrap(doc_id, bytes(data_key)))
+            else:
+                data_key = self._unwrap(doc_id, blob)
+        return self._data_keys.put(doc_id, data_key)
+
+    @staticmethod
+    def _aad(doc_id: str, chunk_id: str) -> bytes:
+        return f"{doc_id}\x00{chunk_id}".encode("utf-8")
+
+    def encrypt_chunk(self, doc_id: str, chunk_id: str, text: str) -> bytes:
+        """
+        チャンク本文を暗号化（ドキュメントのデータ鍵がなければ作成）
+
+        Args:
+            doc_id: ドキュメントID
+            chunk_id: チャンクID
+            text: チャンク本文
+
+        Returns:
+            nonce + 暗号文
+        """
+        nonce = os.urandom(CHUNK_NONCE_SIZE)
+        aead = self._data_key(doc_id, create=True)
+        return nonce + aead.encrypt(nonce, text.encode("utf-8"), self._aad(doc_id, chunk_id))
+
+    def decrypt_chunk(self, doc_id: str, chunk_id: str, ciphertext: bytes) -> str:
+        """
+        チャンク本文を復号（復号済みキャッシュを優先）
+
+        Args:
+            doc_id: ドキュメントID
+            chunk_id: チャンクID
+            ciphertext: encrypt_chunk の出力
+
+        Returns:
+            チャンク本文
+        """
+        # nonce は暗号化ごとに一意なので、再インジェストされたチャンクと取り違えない
+        cache_key = (doc_id, chunk_id, ciphertext[:CHUNK_NONCE_SIZE])
+        text = self.chunk_cache.get(cache_key)
+        if text is not None:
+            return text
+
+        aead = self._data_key(doc_id)
+        try:
+            plaintext = aead.decrypt(
+                ciphertext[:CHUNK_NONCE_SIZE], ciphertext[CHUNK_NONCE_SIZE:], self._aad(doc_id, chunk_id)
+            )
+        except InvalidTag:
+            raise IntegrityError(f"Chunk {chunk_id} of document {doc_id} failed authentication") from None
+        text = plaintext.decode("utf-8")
+        self.chunk_cache.put(cache_key, text)
+        return text
+
+    @property
+    def data_key_cache(self) -> _DataKeyCache:
+        return self._data_keys
+
+    def lazy(self, doc_id: str, chunk_id: str, ciphertext: bytes) -> LazyChunkText:
+        """復号を必要になるまで遅らせるラッパーを作成"""
+        return LazyChunkText(self, doc_id, chunk_id, ciphertext)
+
+    def forget_document(self, doc_id: str):
+        """
+        ドキュメントのデータ鍵を破棄（暗号文は復号できなくなる）
+
+        Args:
+            doc_id: ドキュメントID
+        """
+        self.key_store.delete(doc_id)
+        self._data_keys.invalidate(doc_id)
+        self.chunk_cache.invalidate_document(doc_id)
+
+    def rotate_master_key(self, new_key_ring: KeyRing) -> int:
+        """
+        マスター鍵をローテーション
+
+        すべてのデータ鍵を現在のキーリングでアンラップし、新しいマスター鍵で再ラップする。
+        チャンクの暗号文は変更しない。セグメント暗号化済みのドキュメントファイルを読むため、
+        新しいキーリングには旧鍵も含めておくこと（ENCRYPTION_OLD_KEYS）
+
+        Args:
+            new_key_ring: 新しいマスター鍵のキーリング
+
+        Returns:
+            再ラップしたデータ鍵の数
+        """
+        rewrapped = 0
+
+        def rewrap(keys: Dict[str, bytes]):
+            # ほかのプロセスが同時に追加・削除した鍵も含めて、保存されている内容を読み直して再ラップする
+            nonlocal rewrapped
+            for doc_id, blob in list(keys.items()):
+                data_key = self._unwrap(doc_id, blob)
+                keys[doc_id] = self._wrap(doc_id, bytes(data_key), new_key_ring)
+                _zeroize(data_key)
+            rewrapped = len(keys)
+
+        self.key_store.update(rewrap)
+        self.key_ring = new_key_ring
+        logger.info(f"Re-wrapped {rewrapped} data keys under key id {new_key_ring.active_key_id}")
+        return rewrapped
+
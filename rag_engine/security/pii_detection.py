@@ -0,0 +1,425 @@
+"""
+個人情報検出
+
+日本語テキストに含まれる個人情報（電話番号、郵便番号、マイナンバー、メールアドレス、住所、氏名）を
+検出・マスキングする。正規表現パターンは1つの結合済み正規表現にまとめ、氏名は辞書から構築した
+Aho-Corasickオートマトンで照合するため、テキストの走査はそれぞれ1回で済む
+"""
+
+import logging
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from enum import Enum
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO
+
+logger = logging.getLogger(__name__)
+
+# 氏名辞書のパス（1行1語）
+NAME_DICTIONARY_PATH = os.environ.get("PII_NAME_DICTIONARY", "/data/settings/pii_names.txt")
+
+# ストリーム走査時のブロックサイズ（文字数）と、ブロック境界をまたぐマッチのための重なり幅
+STREAM_BLOCK_SIZE = 1 << 20
+STREAM_OVERLAP = 1024
+
+
+class PIIType(str, Enum):
+    """検出対象の個人情報の種類"""
+    EMAIL = "email"
+    PHONE = "phone"
+    POSTAL_CODE = "postal_code"
+    MY_NUMBER = "my_number"
+    ADDRESS = "address"
+    NAME = "name"
+
+
+# マスキング時の置換文字列
+MASK_LABELS: Dict[PIIType, str] = {
+    PIIType.EMAIL: "[メールアドレス]",
+    PIIType.PHONE: "[電話番号]",
+    PIIType.POSTAL_CODE: "[郵便番号]",
+    PIIType.MY_NUMBER: "[マイナンバー]",
+    PIIType.ADDRESS: "[住所]",
+    PIIType.NAME: "[氏名]",
+}
+
+
+class PIIMatch(NamedTuple):
+    """検出結果（テキスト中の位置）"""
+    start: int
+    end: int
+    type: PIIType
+
+
+# --------------------------------------------------
+# 結合正規表現
+# --------------------------------------------------
+_D = "[0-9０-９]"
+_H = "[-‐－−ー]"
+_PREFECTURES = (
+    "北海道|東京都|京都府|大阪府|"
+    "青森県|岩手県|宮城県|秋田県|山形県|福島県|茨城県|栃木県|群馬県|埼玉県|千葉県|神奈川県|"
+    "新潟県|富山県|石川県|福井県|山梨県|長野県|岐阜県|静岡県|愛知県|三重県|滋賀県|兵庫県|"
+    "奈良県|和歌山県|鳥取県|島根県|岡山県|広島県|山口県|徳島県|香川県|愛媛県|高知県|福岡県|"
+    "佐賀県|長崎県|熊本県|大分県|宮崎県|鹿児島県|沖縄県"
+)
+_KANJI_KANA = "[一-龥々ぁ-んァ-ヶー]"
+
+# 名前付きグループの順序が優先順位になる（電話番号を郵便番号より先に判定する）
+_PATTERNS = {
+    PIIType.EMAIL: (
+        r"(?<![A-Za-z0-9._%+\-])[A-Za-z0-9._%+\-]{1,64}@[A-Za-z0-9\-]{1,63}(?:\.[A-Za-z0-9\-]{1,63}){1,8}"
+    ),
+    PIIType.MY_NUMBER: rf"(?<!{_D}){_D}{{4}}[ \-]?{_D}{{4}}[ \-]?{_D}{{4}}(?!{_D})",
+    PIIType.PHONE: (
+        rf"(?<!{_D})(?:"
+        rf"(?:0120|0800){_H}?{_D}{{3}}{_H}?{_D}{{3,4}}"
+        rf"|(?:\+81[ \-]?|0)[789]0{_H}?{_D}{{4}}{_H}?{_D}{{4}}"
+        rf"|(?:\+81[ \-]?|0){_D}{{1,4}}(?:{_H}|[（(]){_D}{{1,4}}(?:{_H}|[）)]){_D}{{4}}"
+        # 区切りのない固定電話（市外局番から10桁）
+        rf"|(?:\+81[ \-]?|0){_D}{{9}}"
+        rf")(?!{_D})"
+    ),
+    PIIType.POSTAL_CODE: rf"(?:〒\s?{_D}{{3}}{_H}?{_D}{{4}}|(?<!{_D}){_D}{{3}}{_H}{_D}{{4}})(?!{_D})",
+    PIIType.ADDRESS: (
+        rf"(?:{_PREFECTURES}){_KANJI_KANA}{{1,10}}?[市区町村郡]{_KANJI_KANA}{{0,12}}"
+        rf"(?:{_D}{{1,4}}(?:丁目|番地|番|号|{_H})){{0,4}}{_D}{{0,4}}"
+    ),
+}
+
+# 先頭に来うる文字の先読みを付け、マッチし得ない位置での全パターンの試行を省く
+_FIRST_CHARS = "0-9０-９A-Za-z._%+\\-〒" + "".join(sorted({pref[0] for pref in _PREFECTURES.split("|")}))
+_COMBINED_PATTERN = re.compile(
+    f"(?=[{_FIRST_CHARS}])(?:"
+    + "|".join(f"(?P<{pii_type.name}>{pattern})" for pii_type, pattern in _PATTERNS.items())
+    + ")"
+)
+_GROUP_TYPES = {pii_type.name: pii_type for pii_type in _PATTERNS}
+_FULLWIDTH_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
+
+
+def is_valid_my_number(candidate: str) -> bool:
+    """
+    マイナンバー（個人番号）のチェックデジットを検証
+
+    Args:
+        candidate: 12桁の数字（区切り文字・全角数字を含んでもよい）
+
+    Returns:
+        チェックデジットが正しければ True
+    """
+    digits = [int(c) for c in candidate.translate(_FULLWIDTH_DIGITS) if c.isdigit()]
+    if len(digits) != 12:
+        return False
+
+    body = digits[:11]
+    total = 0
+    for n in range(1, 12):
+        p = body[11 - n]
+        q = n + 1 if n <= 6 else n - 5
+        total += p * q
+    remainder = total % 11
+    check = 0 if remainder <= 1 else 11 - remainder
+    return digits[11] == check
+
+
+# --------------------------------------------------
+# 氏名辞書用 Aho-Corasick オートマトン
+# --------------------------------------------------
+class AhoCorasick:
+    """辞書語を1回の走査で検出するAho-Corasickオートマトン"""
+
+    def __init__(self, words: Iterable[str]):
+        """
+        初期化
+
+        Args:
+            words: 辞書語
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 各状態で終わる最長の辞書語の長さ（0 は出力なし）
+        self._output: List[int] = [0]
+        self.max_length = 0
+
+        for word in words:
+            if word:
+                self._add(word)
+        self._build_failure_links()
+
+        # ルート状態では辞書語の先頭文字まで正規表現で読み飛ばす
+        first_chars = "".join(re.escape(ch) for ch in sorted(self._goto[0]))
+        self._first_chars = re.compile(f"[{first_chars}]") if first_chars else None
+
+    def _add(self, word: str):
+        state = 0
+        for ch in word:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+                self._goto[state][ch] = next_state
+            state = next_state
+        self._output[state] = max(self._output[state], len(word))
+        self.max_length = max(self.max_length, len(word))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail_target = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail_target if fail_target != next_state else 0
+                # 失敗遷移先の出力も引き継ぐ（最長のものだけ保持すれば十分）
+                self._output[next_state] = max(self._output[next_state], self._output[self._fail[next_state]])
+
+    def __bool__(self) -> bool:
+        return self.max_length > 0
+
+    def finditer(self, text: str, pos: int = 0, endpos: Optional[int] = None) -> Iterator[tuple]:
+        """
+        辞書語の出現位置を列挙（同じ終了位置では最長の語のみ）
+
+        Args:
+            text: 対象テキスト
+            pos: 走査開始位置
+            endpos: 走査終了位置
+
+        Yields:
+            (開始位置, 終了位置)
+        """
+        if self._first_chars is None:
+            return
+        goto, fail, output = self._goto, self._fail, self._output
+        skip = self._first_chars.search
+        state = 0
+        end = len(text) if endpos is None else endpos
+        i = pos
+        while i < end:
+            if not state:
+                m = skip(text, i, end)
+                if m is None:
+                    return
+                i = m.start()
+            ch = text[i]
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            length = output[state]
+            if length:
+                yield i + 1 - length, i + 1
+            i += 1
+
+
+# --------------------------------------------------
+# 検出エンジン
+# --------------------------------------------------
+class PIIDetector:
+    """結合正規表現と氏名辞書による個人情報検出エンジン"""
+
+    def __init__(self, names: Optional[Iterable[str]] = None):
+        """
+        初期化
+
+        Args:
+            names: 氏名辞書（オプション）
+        """
+        self._names = sorted({name.strip() for name in names or [] if name.strip()})
+        self._automaton = AhoCorasick(self._names)
+
+    @classmethod
+    def from_dictionary_file(cls, path: str = NAME_DICTIONARY_PATH) -> "PIIDetector":
+        """
+        氏名辞書ファイルから検出エンジンを作成
+
+        Args:
+            path: 辞書ファイルのパス（存在しない場合は辞書なし）
+
+        Returns:
+            検出エンジン
+        """
+        dictionary = Path(path)
+        if not dictionary.exists():
+            logger.info(f"PII name dictionary not found at {path}, name detection disabled")
+            return cls()
+        with open(dictionary, "r", encoding="utf-8") as f:
+            names = [line for line in f.read().splitlines() if line and not line.startswith("#")]
+        logger.info(f"Loaded {len(names)} names from {path}")
+        return cls(names)
+
+    def __reduce__(self):
+        # プロセスプールへは辞書だけを渡し、オートマトンはワーカー側で再構築する
+        return (self.__class__, (self._names,))
+
+    def scan(self, text: str, pos: int = 0, endpos: Optional[int] = None) -> List[PIIMatch]:
+        """
+        テキストから個人情報を検出
+
+        Args:
+            text: 対象テキスト
+            pos: 走査開始位置（テキストのコピーを作らずに部分範囲を走査する）
+            endpos: 走査終了位置
+
+        Returns:
+            開始位置順の重なりのない検出結果
+        """
+        if endpos is None:
+            endpos = len(text)
+
+        matches = []
+        for m in _COMBINED_PATTERN.finditer(text, pos, endpos):
+            pii_type = _GROUP_TYPES[m.lastgroup]
+            if pii_type is PIIType.MY_NUMBER and not is_valid_my_number(m.group()):
+                continue
+            matches.append(PIIMatch(m.start(), m.end(), pii_type))
+
+        if not self._automaton:
+            return matches
+
+        names = [PIIMatch(start, end, PIIType.NAME) for start, end in self._automaton.finditer(text, pos, endpos)]
+        if not names:
+            return matches
+        return _resolve_overlaps(matches + names)
+
+    def scan_stream(self, stream: TextIO, block_size: int = STREAM_BLOCK_SIZE) -> Iterator[PIIMatch]:
+        """
+        大きなテキストをブロック単位で読み込みながら個人情報を検出
+
+        ブロック境界をまたぐ個人情報も検出できるよう、末尾の一部を次のブロックに持ち越す
+
+        Args:
+            stream: テキストストリーム
+            block_size: 1回に読み込む文字数
+
+        Yields:
+            検出結果（位置はストリーム先頭からの文字オフセット）
+        """
+        overlap = max(STREAM_OVERLAP, self._automaton.max_length)
+        buffer = ""
+        base = 0  # buffer[0] のストリーム上の位置
+        start = 0  # buffer 内で次に走査を始める位置（それより前は後読み用の文脈）
+
+        while True:
+            block = stream.read(block_size)
+            at_eof = not block
+            buffer = buffer + block if buffer else block
+
+            # 末尾 overlap 文字から始まるマッチは次のブロックと合わせて判定する
+            limit = len(buffer) if at_eof else max(start, len(buffer) - overlap)
+            consumed = limit
+            for match in self.scan(buffer, start):
+                if match.start >= limit:
+                    break
+                consumed = max(consumed, match.end)
+                yield PIIMatch(base + match.start, base + match.end, match.type)
+
+            if at_eof:
+                return
+
+            # 後読み用に1文字だけ文脈を残して持ち越す
+            keep_from = max(consumed - 1, 0)
+            buffer = buffer[keep_from:]
+            base += keep_from
+            start = consumed - keep_from
+
+    def mask(self, text: str, matches: Optional[List[PIIMatch]] = None) -> str:
+        """
+        個人情報をマスキング
+
+        Args:
+            text: 対象テキスト
+            matches: 検出済みの結果（省略時は検出を実行）
+
+        Returns:
+            マスキング後のテキスト
+        """
+        if matches is None:
+            matches = self.scan(text)
+        if not matches:
+            return text
+
+        parts = []
+        last = 0
+        for match in matches:
+            parts.append(text[last:match.start])
+            parts.append(MASK_LABELS[match.type])
+            last = match.end
+        parts.append(text[last:])
+        return "".join(parts)
+
+
+def _resolve_overlaps(matches: List[PIIMatch]) -> List[PIIMatch]:
+    """開始位置が早いもの、同じなら長いものを優先して重なりを取り除く"""
+    matches.sort(key=lambda m: (m.start, -m.end))
+    resolved = []
+    last_end = -1
+    for match in matches:
+        if match.start >= last_end:
+            resolved.append(match)
+            last_end = match.end
+    return resolved
+
+
+# --------------------------------------------------
+# 一括処理（プロセスプール）
+# --------------------------------------------------
+_worker_detector: Optional[PIIDetector] = None
+
+
+def _init_worker(detector: PIIDetector):
+    global _worker_detector
+    _worker_detector = detector
+
+
+def _scan_in_worker(text: str) -> List[tuple]:
+    return [(m.start, m.end, m.type.value) for m in _worker_detector.scan(text)]
+
+
+def scan_many(
+    texts: List[str],
+    detector: Optional[PIIDetector] = None,
+    processes: Optional[int] = None,
+    chunksize: int = 32,
+) -> List[List[PIIMatch]]:
+    """
+    大量のテキストをプロセスプールで並列に検出（一括インジェスト用）
+
+    Args:
+        texts: 対象テキストのリスト
+        detector: 検出エンジン（省略時は共有インスタンス）
+        processes: ワーカープロセス数（省略時はCPU数、1 の場合は同一プロセスで実行）
+        chunksize: 1回にワーカーへ渡すテキスト数
+
+    Returns:
+        テキストごとの検出結果
+    """
+    detector = detector or get_detector()
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(texts) <= chunksize:
+        return [detector.scan(text) for text in texts]
+
+    # インジェストではスレッドから呼ばれるため、fork ではなく spawn でワーカーを起動する
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(processes, context, initializer=_init_worker, initargs=(detector,)) as pool:
+        return [
+            [PIIMatch(start, end, PIIType(pii_type)) for start, end, pii_type in result]
+            for result in pool.map(_scan_in_worker, texts, chunksize=chunksize)
+        ]
+
+
+_detector: Optional[PIIDetector] = None
+
+
+def get_detector() -> PIIDetector:
+    """共有の検出エンジンを取得（初回呼び出し時に氏名辞書を読み込む）"""
+    global _detector
+    if _detector is None:
+        _detector = PIIDetector.from_dictionary_file()
+    return _detector
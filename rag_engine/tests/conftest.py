@@ -0,0 +1,26 @@
+"""
+rag_engine のテストの共通設定
+
+保存先などはモジュールのインポート時に環境変数から読み込まれるため、テスト対象をインポートする前に
+一時ディレクトリを使う設定にしておく
+"""
+
+import os
+import sys
+import tempfile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="rag-engine-test-")
+for name, value in {
+    "ENCRYPTION_KEY": "test-encryption-key-0123456789abcdef",
+    "TRACE_LOG_DIR": os.path.join(_DATA_DIR, "logs"),
+    "DATA_KEY_STORE_PATH": os.path.join(_DATA_DIR, "keys", "data_keys.json"),
+    "TABLE_STORE_DIR": os.path.join(_DATA_DIR, "tables"),
+    "PERMISSION_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "permissions"),
+    "DEDUP_INDEX_PATH": os.path.join(_DATA_DIR, "indexes", "minhash"),
+    "PII_NAME_DICTIONARY": os.path.join(_DATA_DIR, "settings", "pii_names.txt"),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,206 @@
+import asyncio
+import os
+
+import pytest
+
+from rag_engine.indexer.chunking import make_chunk_id
+from rag_engine.indexer.dedup import MinHasher, NearDuplicateIndex, acl_key
+from rag_engine.indexer.document_processor import DocumentProcessor
+from rag_engine.retriever.table_store import TableStore
+from rag_engine.security.content_filter import PermissionIndex
+from rag_engine.security.encryption import EncryptedWriter, KeyRing
+from rag_engine.security.pii_detection import PIIDetector
+
+KEY_RING = KeyRing({"test": b"k" * 32}, "test")
+PARAGRAPHS = [
+    f"第{n}条 利用者は業務で取得したアクセスログを{n + 10}日以内に管理者へ報告し、"
+    f"報告を受けた管理者は内容を確認したうえで{n + 30}日間保管する。保管期間を過ぎた記録は"
+    "情報システム部の承認を得てから削除しなければならない。"
+    for n in range(12)
+]
+
+
+class FakeEmbedding:
+    batch_size = 8
+
+    def __init__(self):
+        self.fail = False
+
+    def embed_documents(self, texts):
+        if self.fail:
+            raise RuntimeError("embedding failed")
+        return [[float(len(text)), 1.0, 0.0, 0.0] for text in texts]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.points = {}
+
+    def ensure_collection(self, dim):
+        pass
+
+    def delete_document(self, doc_id):
+        self.points = {k: v for k, v in self.points.items() if v["doc_id"] != doc_id}
+
+    def upsert(self, ids, vectors, payloads):
+        self.points.update(zip(ids, payloads))
+
+    def set_payloads(self, payloads):
+        for point_id, fields in payloads.items():
+            self.points[point_id].update(fields)
+
+
+def _encrypted(tmp_path, name, text):
+    path = tmp_path / f"{name}.enc"
+    with open(path, "wb") as f:
+        writer = EncryptedWriter(f, KEY_RING)
+        writer.write(text.encode("utf-8"))
+        writer.close()
+    return str(path)
+
+
+@pytest.fixture
+def processor(tmp_path):
+    return DocumentProcessor(
+        embedding_model=FakeEmbedding(),
+        vector_store=FakeVectorStore(),
+        permission_index=PermissionIndex(),
+        pii_detector=PIIDetector(),
+        key_ring=KEY_RING,
+        table_store=TableStore(str(tmp_path / "tables"), key_ring=KEY_RING),
+        dedup_index=NearDuplicateIndex(),
+        dedup_enabled=True,
+        section_store=FakeVectorStore(),
+    )
+
+
+def _ingest(processor, tmp_path, doc_id, text):
+    path = _encrypted(tmp_path, doc_id, text)
+    return asyncio.run(processor.process(doc_id, path, f"{doc_id}.txt", {"confidentiality": 1}))
+
+
+def _snapshot(index):
+    return (
+        [(chunk_id, index.owner(chunk_id)) for chunk_id in index._chunk_ids],
+        {chunk_id: index.sources(chunk_id) for chunk_id in index._chunk_ids},
+    )
+
+
+def test_duplicate_chunks_are_stored_once(processor, tmp_path):
+    text = "\n\n".join(PARAGRAPHS)
+    first = _ingest(processor, tmp_path, "v1", text)
+    second = _ingest(processor, tmp_path, "v2", text)
+
+    assert first["duplicates"] == 0
+    assert second["duplicates"] == second["chunks"]
+    stored = processor.vector_store.points
+    assert {payload["doc_id"] for payload in stored.values()} == {"v1"}
+    assert all(
+        [source["doc_id"] for source in payload["sources"]] == ["v2"]
+        for payload in stored.values() if len(payload.get("sources", [])) > 0
+    )
+
+
+def test_failed_ingestion_rolls_back_dedup(processor, tmp_path):
+    text = "\n\n".join(PARAGRAPHS)
+    _ingest(processor, tmp_path, "v1", text)
+    before = _snapshot(processor.dedup_index)
+
+    processor.embedding_model.fail = True
+    with pytest.raises(RuntimeError):
+        _ingest(processor, tmp_path, "v2", text)
+    assert _snapshot(processor.dedup_index) == before
+
+    # 代表チャンクのドキュメントの再インジェストが失敗しても、ほかの版の参照元は失われない
+    processor.embedding_model.fail = False
+    _ingest(processor, tmp_path, "v2", text)
+    shared = _snapshot(processor.dedup_index)
+    processor.embedding_model.fail = True
+    with pytest.raises(RuntimeError):
+        _ingest(processor, tmp_path, "v1", "\n\n".join(reversed(PARAGRAPHS)))
+    assert _snapshot(processor.dedup_index) == shared
+    assert NearDuplicateIndex.load()._sources == processor.dedup_index._sources
+
+
+def test_rollback_keeps_concurrent_claims():
+    index = NearDuplicateIndex()
+    hasher = MinHasher()
+    acl = acl_key({"confidentiality": 1})
+    signatures = hasher.signatures(PARAGRAPHS[:2])
+    index.claim(make_chunk_id("a", 0), "a", acl, signatures[0], {"doc_id": "a"})
+
+    journal = []
+    index.claim(make_chunk_id("b", 0), "b", acl, signatures[0], {"doc_id": "b"}, journal)
+    index.claim(make_chunk_id("b", 1), "b", acl, signatures[1], {"doc_id": "b"}, journal)
+    # 別のドキュメントの並行したインジェスト
+    index.claim(make_chunk_id("c", 0), "c", acl, signatures[0], {"doc_id": "c"})
+    index.rollback(journal)
+
+    assert index.sources(make_chunk_id("a", 0)) == [{"doc_id": "c"}]
+    assert index.owner(make_chunk_id("b", 1)) is None
+    assert index.claim(make_chunk_id("d", 1), "d", acl, signatures[1], {"doc_id": "d"}) is None
+    assert len(index) == 2
+
+
+def test_dedup_index_save_interrupted_before_json(tmp_path, monkeypatch):
+    path = str(tmp_path / "minhash")
+    index = NearDuplicateIndex()
+    signatures = MinHasher().signatures(PARAGRAPHS[:2])
+    acl = acl_key({"confidentiality": 1})
+    index.claim(make_chunk_id("a", 0), "a", acl, signatures[0], {"doc_id": "a"})
+    index.save(path)
+
+    index.claim(make_chunk_id("b", 1), "b", acl, signatures[1], {"doc_id": "b"})
+    replace = os.replace
+
+    def crash_on_json(src, dst):
+        if str(dst).endswith(".json"):
+            raise OSError("disk full")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash_on_json)
+    with pytest.raises(OSError):
+        index.save(path)
+    monkeypatch.setattr(os, "replace", replace)
+
+    loaded = NearDuplicateIndex.load(path)
+    assert len(loaded) == 1
+    assert loaded.claim(make_chunk_id("c", 0), "c", acl, signatures[0], {"doc_id": "c"}) == make_chunk_id("a", 0)
+
+
+def test_near_duplicates_only_merge_within_the_same_acl():
+    hasher = MinHasher()
+    index = NearDuplicateIndex()
+    public, restricted = acl_key({"confidentiality": 1}), acl_key({"confidentiality": 1, "groups": ["hr"]})
+    edited = PARAGRAPHS[0].replace("情報システム部", "情報システム課")
+    original, near, unrelated = hasher.signatures([PARAGRAPHS[0], edited, PARAGRAPHS[5]])
+    assert acl_key({"groups": ["b", "a"]}) == acl_key({"groups": ["a", "b"], "confidentiality": 1})
+
+    assert index.claim("a-0", "a", public, original, {"doc_id": "a"}) is None
+    assert index.claim("b-0", "b", public, near, {"doc_id": "b", "chunk_index": 0}) == "a-0"
+    assert index.claim("b-5", "b", public, unrelated, {"doc_id": "b"}) is None
+    # 権限の違うドキュメントのチャンクは同じ内容でもまとめない
+    assert index.claim("c-0", "c", restricted, original, {"doc_id": "c"}) is None
+    assert index.sources("a-0") == [{"doc_id": "b", "chunk_index": 0}]
+    assert len(index) == 3
+
+
+def test_reingested_owner_hands_sources_to_the_new_canonical_chunk():
+    hasher = MinHasher()
+    index = NearDuplicateIndex()
+    acl = acl_key({"confidentiality": 1})
+    signature, = hasher.signatures([PARAGRAPHS[0]])
+    index.claim("a-0", "a", acl, signature, {"doc_id": "a"})
+    index.claim("b-0", "b", acl, signature, {"doc_id": "b"})
+
+    # a の再インジェスト：代表チャンクを外し、同じ内容の新しいチャンクに b の参照元を付け替える
+    orphans, touched = index.remove_document("a")
+    assert list(orphans) == ["a-0"] and touched == set()
+    assert index.owner("a-0") is None
+    index.claim("a-0-new", "a", acl, signature, {"doc_id": "a"})
+    assert index.reattach(orphans) == {"a-0-new"}
+    assert index.sources("a-0-new") == [{"doc_id": "b"}]
+
+    # 参照元のドキュメントを削除すると、代表チャンクの参照元からも外れる
+    assert index.remove_document("b") == ({}, {"a-0-new"})
+    assert index.sources("a-0-new") == []
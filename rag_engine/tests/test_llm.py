@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from rag_engine.llm.local_client import LocalLLMClient
+
+
+def _server(requests):
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        choices = [{"index": i, "text": f"answer:{prompt}"} for i, prompt in enumerate(prompts)]
+        return httpx.Response(200, json={"choices": choices})
+
+    return httpx.MockTransport(handle)
+
+
+def test_concurrent_prompts_are_batched():
+    requests = []
+    client = LocalLLMClient("http://llm", parallel_slots=1, max_wait_ms=50, transport=_server(requests))
+
+    async def scenario():
+        try:
+            return await asyncio.gather(*(client.generate(f"q{n}") for n in range(5)))
+        finally:
+            await client.close()
+
+    assert asyncio.run(scenario()) == [f"answer:q{n}" for n in range(5)]
+    # 最初の1件はすぐ送り、処理中に届いた残りは1つのリクエストにまとめる
+    assert len(requests) < 5
+    assert client.stats["prompts"] == 5
+
+
+def test_client_is_bound_to_one_event_loop():
+    client = LocalLLMClient("http://llm", transport=_server([]))
+    asyncio.run(client.generate("first"))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(client.generate("second"))
+
+
+def test_client_reusable_after_close():
+    client = LocalLLMClient("http://llm", transport=_server([]))
+
+    async def once(prompt):
+        try:
+            return await client.generate(prompt)
+        finally:
+            await client.close()
+
+    assert asyncio.run(once("first")) == "answer:first"
+    assert asyncio.run(once("second")) == "answer:second"
@@ -0,0 +1,80 @@
+import asyncio
+
+from rag_engine.metrics import CallbackMetric, Counter, Histogram, MetricsRegistry, serve_metrics
+
+
+def test_counter_sums_shards_and_folds_extra_label_sets():
+    counter = Counter("jobs_total", "Jobs", ["result"], max_label_sets=2)
+    counter.inc(result="ok")
+    asyncio.run(asyncio.to_thread(counter.inc, 2, result="ok"))
+    counter.inc(result="fail")
+    counter.inc(result="timeout")
+    counter.inc(result="cancelled")
+
+    assert counter.render() == [
+        "# HELP jobs_total Jobs",
+        "# TYPE jobs_total counter",
+        'jobs_total{result="fail"} 1',
+        'jobs_total{result="ok"} 3',
+        'jobs_total{result="other"} 2',
+    ]
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("stage_seconds", "Stage", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="embed")
+
+    assert histogram.render()[2:] == [
+        'stage_seconds_bucket{stage="embed",le="0.1"} 2',
+        'stage_seconds_bucket{stage="embed",le="1"} 3',
+        'stage_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'stage_seconds_sum{stage="embed"} 3.65',
+        'stage_seconds_count{stage="embed"} 4',
+    ]
+
+
+def test_callback_metrics_and_failing_callbacks():
+    registry = MetricsRegistry()
+
+    async def depths():
+        return {("ingestion", "queued"): 3}
+
+    def broken():
+        raise RuntimeError("store down")
+
+    registry.callback("queue_depth", "Depth", depths, ["queue", "state"])
+    registry.callback("broken", "Broken", broken)
+    registry.counter("hits_total", "Hits").inc()
+
+    text = asyncio.run(registry.render())
+    assert 'queue_depth{queue="ingestion",state="queued"} 3' in text.splitlines()
+    assert "hits_total 1" in text.splitlines()
+    # 読み出しに失敗した指標は出力から外し、ほかの指標は公開を続ける
+    assert "broken" not in text
+    assert asyncio.run(CallbackMetric("up", "Up", lambda: 1).render())[-1] == "up 1"
+
+
+def test_serve_metrics_answers_only_metrics_path():
+    registry = MetricsRegistry()
+    registry.counter("hits_total", "Hits").inc()
+
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode("latin-1"))
+        response = await reader.read()
+        writer.close()
+        return response.decode("utf-8")
+
+    async def scenario():
+        server = await serve_metrics(0, registry, host="127.0.0.1")
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await get(port, "/metrics?x=1"), await get(port, "/other")
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    found, missing = asyncio.run(scenario())
+    assert found.startswith("HTTP/1.1 200 OK") and found.endswith("hits_total 1\n")
+    assert missing.startswith("HTTP/1.1 404 Not Found")
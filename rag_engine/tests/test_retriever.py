@@ -0,0 +1,293 @@
+import asyncio
+import base64
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+from rag_engine.security.content_filter import AccessContext, PermissionIndex
+
+USER = AccessContext(role="user", groups=frozenset({"sales"}))
+
+
+def _index(docs):
+    index = PermissionIndex()
+    for doc_id, confidentiality, groups in docs:
+        index.upsert_document(doc_id, confidentiality=confidentiality, groups=groups)
+        index.add_chunks(doc_id, [f"{doc_id}-{n}" for n in range(3)])
+    return index
+
+
+def test_permission_index_round_trip(tmp_path):
+    path = str(tmp_path / "permissions")
+    index = _index([("public", 1, None), ("sales", 1, ["sales"]), ("hr", 1, ["hr"])])
+    index.save(path)
+
+    loaded = PermissionIndex.load(path)
+    chunk_ids = [f"{doc_id}-0" for doc_id in ("public", "sales", "hr")]
+    assert loaded.filter(chunk_ids, USER, "local") == ["public-0", "sales-0"]
+    assert sorted(os.listdir(tmp_path)) == ["permissions.json", "permissions.npz"]
+
+
+def test_permission_index_save_interrupted_before_json(tmp_path, monkeypatch):
+    path = str(tmp_path / "permissions")
+    index = _index([("public", 1, None)])
+    index.save(path)
+
+    index.upsert_document("sales", confidentiality=1, groups=["sales"])
+    index.add_chunks("sales", ["sales-0"])
+    replace = os.replace
+
+    def crash_on_json(src, dst):
+        if str(dst).endswith(".json"):
+            raise OSError("disk full")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", crash_on_json)
+    with pytest.raises(OSError):
+        index.save(path)
+    monkeypatch.setattr(os, "replace", replace)
+
+    # 新しい .npz と前回の .json の組み合わせでも、前回保存した内容として読み込める
+    loaded = PermissionIndex.load(path)
+    assert loaded.document_count == 1
+    assert loaded.filter(["public-0", "sales-0"], USER, "local") == ["public-0"]
+
+
+def test_permission_filter_by_role_group_and_provider():
+    index = _index([("open", 1, None), ("sales", 1, ["sales"]), ("secret", 3, None), ("hr", 2, ["hr"])])
+    chunk_ids = [f"{doc_id}-0" for doc_id in ("open", "sales", "secret", "hr")] + ["unknown-0"]
+
+    assert index.filter(chunk_ids, USER, "local") == ["open-0", "sales-0"]
+    assert index.filter(chunk_ids, AccessContext(role="guest", groups=frozenset({"sales"})), "local") == [
+        "open-0", "sales-0",
+    ]
+    admin = AccessContext(role="admin")
+    assert index.filter(chunk_ids, admin, "local") == ["open-0", "sales-0", "secret-0", "hr-0"]
+    # 機密レベルが MAX_CONFIDENTIALITY_LEVEL を超えるものは外部プロバイダーへ送らない
+    assert index.filter(chunk_ids, admin, "openai") == ["open-0", "sales-0", "hr-0"]
+
+
+def test_permission_updates_apply_to_existing_chunks():
+    index = _index([("doc", 1, None)])
+    chunk_ids = ["doc-0", "doc-1"]
+
+    index.update_acl("doc", groups=["hr"])
+    assert index.filter(chunk_ids, USER, "local") == []
+    index.update_acl("doc", groups=[], allowed_providers=["local"])
+    assert index.filter(chunk_ids, USER, "local") == chunk_ids
+    assert index.filter(chunk_ids, USER, "claude") == []
+
+    index.remove_document("doc")
+    assert index.filter(chunk_ids, USER, "local") == []
+    assert index.document_count == 0
+    with pytest.raises(KeyError):
+        index.update_acl("missing", confidentiality=0)
+
+
+def test_permission_index_with_many_groups():
+    groups = [f"project-{n}" for n in range(130)]
+    index = _index([(group, 1, [group]) for group in groups])
+    member = AccessContext(role="user", groups=frozenset({"project-3", "project-129", "other"}))
+
+    assert index.filter([f"{group}-1" for group in groups], member, "local") == ["project-3-1", "project-129-1"]
+    assert index.allowed_documents(["project-129", "project-0", "missing"], member, "local").tolist() == [
+        True, False, False,
+    ]
+
+
+@pytest.fixture
+def vector_store():
+    from qdrant_client import QdrantClient
+
+    from rag_engine.retriever.vector_store import VectorStore
+
+    store = VectorStore(collection="test_chunks")
+    store._client = QdrantClient(":memory:")
+    store.ensure_collection(4)
+    return store
+
+
+def _point_id(n):
+    return str(uuid.UUID(int=n))
+
+
+def test_vector_store_upsert_and_search(vector_store):
+    vectors = np.eye(4, dtype=np.float32)[:3]
+    payloads = [{"doc_id": doc_id, "chunk_index": n} for n, doc_id in enumerate(["a", "a", "b"])]
+    vector_store.upsert([_point_id(n) for n in range(3)], vectors, payloads)
+
+    hits = vector_store.search(np.array([0.1, 1.0, 0.0, 0.0], dtype=np.float32), limit=2)
+    assert [hit["id"] for hit in hits] == [_point_id(1), _point_id(0)]
+    assert hits[0]["payload"] == {"doc_id": "a", "chunk_index": 1}
+
+    hits = vector_store.search(np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32), doc_ids=["b"])
+    assert [hit["payload"]["doc_id"] for hit in hits] == ["b"]
+
+
+def test_vector_store_payload_updates_and_delete(vector_store):
+    vectors = np.ones((3, 4), dtype=np.float32)
+    payloads = [{"doc_id": doc_id} for doc_id in ["a", "a", "b"]]
+    vector_store.upsert([_point_id(n) for n in range(3)], vectors, payloads)
+
+    vector_store.set_payloads({_point_id(0): {"sources": [{"doc_id": "c"}]}})
+    assert vector_store.count({"doc_id": "a"}) == 2
+    hit = vector_store.search(np.ones(4, dtype=np.float32), doc_ids=["a"], limit=3)
+    assert {"doc_id": "a", "sources": [{"doc_id": "c"}]} in [h["payload"] for h in hit]
+
+    vector_store.delete_document("a")
+    assert vector_store.count() == 1
+    assert vector_store.count({"doc_id": "a"}) == 0
+
+
+def test_vector_stores_share_client(monkeypatch):
+    from rag_engine.retriever import vector_store as module
+
+    created = []
+
+    class FakeQdrantClient:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+    monkeypatch.setattr("qdrant_client.QdrantClient", FakeQdrantClient)
+    monkeypatch.setattr(module, "_clients", {})
+    chunks = module.VectorStore(url="http://qdrant:6333", collection="chunks")
+    sections = module.VectorStore(url="http://qdrant:6333", collection="sections")
+    rest = module.VectorStore(url="http://qdrant:6333", collection="chunks", prefer_grpc=False)
+
+    assert chunks.client is sections.client
+    assert rest.client is not chunks.client
+    assert len(created) == 2
+
+
+def test_section_summaries_and_document_ranking():
+    from parsers.utils.text_extraction import ParsedDocument, TextSection
+    from rag_engine.retriever.section_index import (
+        DOCUMENT_LEVEL,
+        chunk_documents,
+        make_section_id,
+        rank_documents,
+        summarize_sections,
+    )
+
+    parsed = ParsedDocument(sections=[
+        TextSection("第1条 目的" * 10, page=1, heading="総則"),
+        TextSection("   ", page=2, heading="空の節"),
+        TextSection("保管期間は30日とする。", page=3, heading="保管"),
+    ])
+    summaries = summarize_sections("doc1", "規程.pdf", parsed, max_chars=10)
+    assert [(s.level, s.heading, s.page) for s in summaries] == [
+        (DOCUMENT_LEVEL, None, None), ("section", "総則", 1), ("section", "保管", 3),
+    ]
+    assert summaries[0].text == "規程.pdf\n総則\n空の節\n保管"
+    assert summaries[1].text == "規程.pdf / 総則\n第1条 目的第1条 "
+    assert summaries[2].point_id == make_section_id("doc1", 2)
+
+    hits = [{"payload": {"doc_id": d, **extra}} for d, extra in (
+        ("b", {}), ("a", {"chunk_doc_ids": ["old-a"]}), ("b", {"chunk_doc_ids": ["old-b"]}), ("c", {}),
+    )]
+    assert rank_documents(hits, 2) == ["b", "a"]
+    # 重複として別のドキュメントに格納された本文も検索対象にする
+    assert chunk_documents(hits, ["b", "a"]) == ["b", "a", "old-a", "old-b"]
+
+
+def test_coarse_search_narrows_chunks_and_falls_back_to_all(tmp_path):
+    from qdrant_client import QdrantClient
+
+    from rag_engine.retriever.hybrid_search import HybridSearcher
+    from rag_engine.retriever.section_index import DOCUMENT_LEVEL
+    from rag_engine.retriever.vector_store import VectorStore
+    from rag_engine.security.encryption import DataKeyStore, EnvelopeCipher, KeyRing
+
+    class Embedding:
+        def embed_query(self, text):
+            return np.array([1.0, 0.9, 0.0, 0.0], dtype=np.float32)
+
+    def store(collection):
+        store = VectorStore(collection=collection)
+        store._client = QdrantClient(":memory:")
+        store.ensure_collection(4)
+        return store
+
+    cipher = EnvelopeCipher(KeyRing({"test": b"k" * 32}, "test"), DataKeyStore())
+    chunks, sections = store("test_chunks"), store("test_sections")
+    permissions = PermissionIndex()
+    vectors = {"a": [1.0, 0.0, 0.0, 0.0], "b": [1.0, 0.9, 0.0, 0.0]}
+    for n, doc_id in enumerate(("a", "b")):
+        chunk_id = _point_id(n)
+        permissions.upsert_document(doc_id, confidentiality=1)
+        permissions.add_chunks(doc_id, [chunk_id])
+        ciphertext = base64.b64encode(cipher.encrypt_chunk(doc_id, chunk_id, f"{doc_id} の本文")).decode()
+        chunks.upsert([chunk_id], np.array([vectors[doc_id]], dtype=np.float32),
+                      [{"doc_id": doc_id, "filename": f"{doc_id}.pdf", "ciphertext": ciphertext}])
+    # 要約索引では質問に最も近いのは a（b のチャンクのほうが質問には近い）
+    sections.upsert([_point_id(10), _point_id(11)], np.eye(4, dtype=np.float32)[:2],
+                    [{"doc_id": "a", "level": DOCUMENT_LEVEL}, {"doc_id": "b", "level": DOCUMENT_LEVEL}])
+    path = str(tmp_path / "permissions")
+    permissions.save(path)
+
+    searcher = HybridSearcher(Embedding(), chunks, cipher, path, keyword_weight=0.0,
+                              section_store=sections, coarse_documents=1)
+    results = asyncio.run(searcher.search("質問", USER, "local"))
+    assert [(chunk.doc_id, chunk.text) for chunk in results] == [("a", "a の本文")]
+
+    # 要約索引にないドキュメントがある間は全体を検索する
+    permissions.upsert_document("c", confidentiality=1)
+    permissions.save(path)
+    os.utime(path + ".json", (0, 1))
+    results = asyncio.run(searcher.search("質問", USER, "local"))
+    assert [chunk.doc_id for chunk in results] == ["b", "a"]
+
+
+def test_search_decrypts_only_reranked_candidates(tmp_path):
+    from qdrant_client import QdrantClient
+
+    from rag_engine.retriever.hybrid_search import HybridSearcher
+    from rag_engine.retriever.vector_store import VectorStore
+    from rag_engine.security.encryption import DataKeyStore, EnvelopeCipher, KeyRing
+
+    class Embedding:
+        def embed_query(self, text):
+            return np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+
+    chunks = VectorStore(collection="test_chunks")
+    chunks._client = QdrantClient(":memory:")
+    chunks.ensure_collection(4)
+    cipher = EnvelopeCipher(KeyRing({"test": b"k" * 32}, "test"), DataKeyStore())
+    permissions = PermissionIndex()
+    permissions.upsert_document("hr", confidentiality=1, groups=["hr"])
+    permissions.upsert_document("doc", confidentiality=1)
+    # 参照できない hr のチャンクが最も近く、doc のチャンクは番号順に遠くなる。2番目だけが質問の語を含む
+    rows = [("hr", _point_id(100), [1.0, 0.0, 0.0, 0.0], "人事の本文")]
+    rows += [("doc", _point_id(n), [1.0, 0.1 * n, 0.0, 0.0], "保管期間の規定" if n == 1 else f"本文{n}")
+             for n in range(10)]
+    for doc_id, chunk_id, vector, text in rows:
+        permissions.add_chunks(doc_id, [chunk_id])
+        ciphertext = base64.b64encode(cipher.encrypt_chunk(doc_id, chunk_id, text)).decode()
+        chunks.upsert([chunk_id], np.array([vector], dtype=np.float32),
+                      [{"doc_id": doc_id, "filename": f"{doc_id}.pdf", "ciphertext": ciphertext}])
+    path = str(tmp_path / "permissions")
+    permissions.save(path)
+
+    decrypted = []
+    decrypt_chunk = cipher.decrypt_chunk
+
+    def spy(doc_id, chunk_id, ciphertext):
+        decrypted.append(chunk_id)
+        return decrypt_chunk(doc_id, chunk_id, ciphertext)
+
+    cipher.decrypt_chunk = spy
+    searcher = HybridSearcher(Embedding(), chunks, cipher, path, keyword_weight=0.3,
+                              coarse_documents=0, rerank_factor=2)
+    results = asyncio.run(searcher.search("保管期間", USER, "local", limit=2))
+    assert [chunk.text for chunk in results] == ["保管期間の規定", "本文0"]
+    # ベクトルの類似度の上位 4 件（2 件の 2 倍）だけを復号する
+    assert sorted(decrypted) == [_point_id(n) for n in range(4)]
+
+    # キーワードの重みが 0 なら、返すチャンクだけを復号する
+    decrypted.clear()
+    searcher.keyword_weight = 0.0
+    results = asyncio.run(searcher.search("保管期間", USER, "local", limit=2))
+    assert [chunk.text for chunk in results] == ["本文0", "保管期間の規定"]
+    assert sorted(decrypted) == [_point_id(0), _point_id(1)]
@@ -0,0 +1,243 @@
+import io
+import os
+
+import pytest
+
+from rag_engine.security.encryption import (
+    DataKeyStore,
+    DecryptedChunkCache,
+    EncryptedReader,
+    EncryptedWriter,
+    EnvelopeCipher,
+    FileDataKeyStore,
+    IntegrityError,
+    KeyRing,
+    decrypt_stream,
+    encrypt_file_parallel,
+    encrypt_stream,
+)
+from rag_engine.security.pii_detection import PIIDetector, PIIType, is_valid_my_number, scan_many
+
+DETECTOR = PIIDetector(["佐藤太郎", "鈴木花子"])
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("代表 03-1234-5678 まで", PIIType.PHONE),
+    ("代表 0312345678 まで", PIIType.PHONE),
+    ("携帯 09012345678", PIIType.PHONE),
+    ("TEL 03(1234)5678", PIIType.PHONE),
+    ("国際 +81312345678", PIIType.PHONE),
+    ("フリーダイヤル 0120-123-456", PIIType.PHONE),
+    ("〒100-0001", PIIType.POSTAL_CODE),
+    ("個人番号 1234 5678 9018", PIIType.MY_NUMBER),
+    ("taro.sato@example.co.jp", PIIType.EMAIL),
+    ("東京都千代田区千代田1丁目1番1号", PIIType.ADDRESS),
+    ("担当は佐藤太郎です", PIIType.NAME),
+])
+def test_detects_pii(text, expected):
+    assert [match.type for match in DETECTOR.scan(text)] == [expected]
+
+
+@pytest.mark.parametrize("text", ["注文番号 01234567890", "個人番号 1234 5678 9012", "第3章 2024年"])
+def test_ignores_non_pii_numbers(text):
+    assert DETECTOR.scan(text) == []
+
+
+def test_my_number_check_digit():
+    assert is_valid_my_number("123456789018")
+    assert not is_valid_my_number("123456789012")
+
+
+def test_mask():
+    assert DETECTOR.mask("佐藤太郎 0312345678") == "[氏名] [電話番号]"
+
+
+def test_scan_stream_matches_scan_across_blocks():
+    text = "本文です。連絡先 090-1234-5678、担当 鈴木花子。" * 200
+    streamed = list(DETECTOR.scan_stream(io.StringIO(text), block_size=37))
+    assert streamed == DETECTOR.scan(text)
+
+
+def test_scan_many_with_process_pool():
+    texts = [f"文書{n} 連絡先 03-1234-{n:04d} 担当 佐藤太郎" for n in range(80)]
+    assert scan_many(texts, DETECTOR, processes=2, chunksize=16) == [DETECTOR.scan(text) for text in texts]
+
+
+KEY_RING = KeyRing({"old": b"o" * 32, "new": b"n" * 32}, "new")
+SEGMENT = 1024
+
+
+def _encrypt(plaintext, segment_size=SEGMENT):
+    dst = io.BytesIO()
+    encrypt_stream(io.BytesIO(plaintext), dst, KEY_RING, segment_size)
+    return dst.getvalue()
+
+
+@pytest.mark.parametrize("size", [0, 1, SEGMENT, SEGMENT * 3 + 17])
+def test_stream_round_trip(size):
+    plaintext = os.urandom(size)
+    ciphertext = _encrypt(plaintext)
+    out = io.BytesIO()
+    assert decrypt_stream(io.BytesIO(ciphertext), out, KEY_RING) == size
+    assert out.getvalue() == plaintext
+    assert EncryptedReader(io.BytesIO(ciphertext), KEY_RING).plaintext_size == size
+
+
+def test_read_range_decrypts_only_requested_bytes():
+    plaintext = os.urandom(SEGMENT * 5 + 100)
+    reader = EncryptedReader(io.BytesIO(_encrypt(plaintext)), KEY_RING)
+    assert reader.read_range(SEGMENT * 2 - 10, 30) == plaintext[SEGMENT * 2 - 10:SEGMENT * 2 + 20]
+    assert reader.read_range(SEGMENT * 5, 1000) == plaintext[SEGMENT * 5:]
+    assert reader.read_range(SEGMENT * 9, 10) == b""
+
+
+def test_tampered_or_truncated_stream_is_rejected():
+    ciphertext = bytearray(_encrypt(os.urandom(SEGMENT * 3)))
+    ciphertext[-SEGMENT] ^= 1
+    with pytest.raises(IntegrityError):
+        decrypt_stream(io.BytesIO(bytes(ciphertext)), io.BytesIO(), KEY_RING)
+
+    # セグメント境界で切り詰めても、最終セグメントフラグの検証で検出できる
+    ciphertext = _encrypt(os.urandom(SEGMENT * 3))
+    truncated = ciphertext[:len(ciphertext) - (SEGMENT + 16)]
+    with pytest.raises(IntegrityError):
+        decrypt_stream(io.BytesIO(truncated), io.BytesIO(), KEY_RING)
+
+
+def test_old_key_still_decrypts():
+    old_ring = KeyRing({"old": b"o" * 32}, "old")
+    dst = io.BytesIO()
+    encrypt_stream(io.BytesIO(b"legacy"), dst, old_ring)
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(dst.getvalue()), out, KEY_RING)
+    assert out.getvalue() == b"legacy"
+
+
+def test_parallel_encryption_matches_stream_format(tmp_path):
+    plaintext = os.urandom(SEGMENT * 7 + 3)
+    src = tmp_path / "plain.bin"
+    src.write_bytes(plaintext)
+    dst = tmp_path / "cipher.bin"
+    assert encrypt_file_parallel(str(src), str(dst), KEY_RING, SEGMENT, workers=2) == len(plaintext)
+
+    out = io.BytesIO()
+    with open(dst, "rb") as f:
+        decrypt_stream(f, out, KEY_RING)
+    assert out.getvalue() == plaintext
+
+
+def test_writer_resumes_after_interruption():
+    plaintext = os.urandom(SEGMENT * 4 + 5)
+    dst = io.BytesIO()
+    writer = EncryptedWriter(dst, KEY_RING, SEGMENT)
+    writer.write(plaintext[:SEGMENT * 2 + 300])
+    # close せずに中断し、途中まで書かれたセグメントを残す
+    dst.write(b"partial")
+
+    writer = EncryptedWriter.resume(dst, KEY_RING)
+    assert writer.bytes_written == SEGMENT * 2
+    writer.write(plaintext[writer.bytes_written:])
+    writer.close()
+    out = io.BytesIO()
+    decrypt_stream(io.BytesIO(dst.getvalue()), out, KEY_RING)
+    assert out.getvalue() == plaintext
+
+
+def _envelope(key_store=None, **kwargs):
+    return EnvelopeCipher(KEY_RING, key_store if key_store is not None else DataKeyStore(), **kwargs)
+
+
+def test_envelope_round_trip_and_binding():
+    cipher = _envelope()
+    ciphertext = cipher.encrypt_chunk("doc", "c1", "社外秘の本文")
+    assert cipher.decrypt_chunk("doc", "c1", ciphertext) == "社外秘の本文"
+
+    # 別のチャンク・ドキュメントの暗号文として差し替えても復号できない
+    other = _envelope(chunk_cache=DecryptedChunkCache(max_entries=0))
+    other.key_store.put("doc", cipher.key_store.get("doc"))
+    with pytest.raises(IntegrityError):
+        other.decrypt_chunk("doc", "c2", ciphertext)
+    with pytest.raises(IntegrityError):
+        other.decrypt_chunk("other", "c1", ciphertext)
+
+
+def test_lazy_text_decrypts_on_access():
+    cipher = _envelope()
+    lazy = cipher.lazy("doc", "c1", cipher.encrypt_chunk("doc", "c1", "本文"))
+    assert not lazy.is_decrypted
+    assert str(lazy) == "本文"
+    assert lazy.is_decrypted
+
+
+def test_forget_document_discards_data_key():
+    cipher = _envelope()
+    ciphertext = cipher.encrypt_chunk("doc", "c1", "本文")
+    cipher.forget_document("doc")
+    with pytest.raises(IntegrityError):
+        cipher.decrypt_chunk("doc", "c1", ciphertext)
+
+
+def test_rotation_rewraps_data_keys(tmp_path):
+    store = FileDataKeyStore(str(tmp_path / "keys.json"))
+    cipher = _envelope(store)
+    ciphertexts = {doc_id: cipher.encrypt_chunk(doc_id, "c1", doc_id) for doc_id in ("a", "b")}
+
+    new_ring = KeyRing({"next": b"x" * 32}, "next")
+    assert cipher.rotate_master_key(new_ring) == 2
+
+    # 旧マスター鍵を持たないプロセスでも、保存済みのデータ鍵で復号できる
+    rotated = EnvelopeCipher(new_ring, FileDataKeyStore(str(tmp_path / "keys.json")))
+    assert {doc_id: rotated.decrypt_chunk(doc_id, "c1", c) for doc_id, c in ciphertexts.items()} == {"a": "a", "b": "b"}
+
+
+def test_file_key_store_merges_changes_from_other_processes(tmp_path):
+    path = str(tmp_path / "keys.json")
+    worker, admin = FileDataKeyStore(path), FileDataKeyStore(path)
+    worker_cipher = _envelope(worker)
+    ciphertexts = {doc_id: worker_cipher.encrypt_chunk(doc_id, "c1", doc_id) for doc_id in ("a", "b")}
+
+    # 別プロセス（管理スクリプト）でローテーションしても、ワーカーの古い内容で上書きしない
+    assert _envelope(admin).rotate_master_key(KeyRing({"next": b"x" * 32}, "next")) == 2
+    ciphertexts["c"] = worker_cipher.encrypt_chunk("c", "c1", "c")
+    admin.delete("b")
+    worker_cipher.encrypt_chunk("d", "c1", "d")
+
+    # c と d は再起動前のワーカーが旧マスター鍵でラップした
+    rotated = EnvelopeCipher(KeyRing({"next": b"x" * 32, "new": b"n" * 32}, "next"), FileDataKeyStore(path))
+    assert sorted(rotated.key_store.items()) == ["a", "c", "d"]
+    assert rotated.key_store.get("a")[1:5] == b"next"
+    assert {doc_id: rotated.decrypt_chunk(doc_id, "c1", ciphertexts[doc_id]) for doc_id in ("a", "c")} == {
+        "a": "a", "c": "c",
+    }
+
+
+def test_data_key_cache_expires():
+    cipher = _envelope(data_key_ttl=0)
+    ciphertext = cipher.encrypt_chunk("doc", "c1", "本文")
+    cipher.chunk_cache.clear()
+    cipher.decrypt_chunk("doc", "c1", ciphertext)
+    assert cipher.data_key_cache.hits == 0
+
+    cipher = _envelope(data_key_ttl=60)
+    ciphertext = cipher.encrypt_chunk("doc", "c1", "本文")
+    cipher.chunk_cache.clear()
+    cipher.decrypt_chunk("doc", "c1", ciphertext)
+    assert cipher.data_key_cache.hits == 1
+
+
+def test_chunk_cache_bounds():
+    cache = DecryptedChunkCache(max_entries=2, max_bytes=10)
+    cache.put(("a", "1", b""), "aaaa")
+    cache.put(("a", "2", b""), "bbbb")
+    cache.get(("a", "1", b""))
+    cache.put(("b", "1", b""), "cccc")
+    assert len(cache) == 2
+    assert cache.get(("a", "2", b"")) is None
+
+    cache.put(("b", "2", b""), "dddddddd")
+    assert len(cache) == 1
+    cache.put(("b", "3", b""), "x" * 11)
+    assert cache.get(("b", "3", b"")) is None
+
+    cache.invalidate_document("b")
+    assert len(cache) == 0
@@ -0,0 +1,79 @@
+import pytest
+
+from parsers.utils.tables import detect_table, summarize_table
+from rag_engine.retriever.table_store import TableQueryError, TableStore
+from rag_engine.security.encryption import KeyRing
+
+KEY_RING = KeyRing({"test": b"k" * 32}, "test")
+HEADER = ["ID", "テスト名", "担当者", "状態", "工数"]
+
+
+def _table(rows=30, status=lambda i: "未完了" if i % 3 == 0 else "完了"):
+    data = [HEADER] + [[i, f"ケース{i:03d}", "佐藤" if i % 2 else "鈴木", status(i), i * 0.5] for i in range(1, rows + 1)]
+    return detect_table("テストケース", data)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return TableStore(str(tmp_path), key_ring=KEY_RING, max_rows=5)
+
+
+def test_detected_table_is_summarized_and_queried(store, tmp_path):
+    table = _table()
+    assert table.types == ["INTEGER", "TEXT", "TEXT", "TEXT", "REAL"]
+    summary = summarize_table(table, "テスト計画書.xlsx")
+    assert summary.splitlines()[0] == "テスト計画書.xlsx の表「テストケース」（30 行、5 列）"
+    assert "- 状態（2 種類）: 完了 20件、未完了 10件" in summary
+
+    store.save("doc1", [table])
+    # 保存したデータベースは暗号化されている
+    assert "ケース001".encode("utf-8") not in (tmp_path / "doc1.sqlite.enc").read_bytes()
+
+    result = store.query("doc1", 'SELECT COUNT(*) AS n FROM "テストケース" WHERE "状態" = ?', ("未完了",))
+    assert (result.columns, result.rows, result.truncated) == (["n"], [(10,)], False)
+    assert 'CREATE TABLE "テストケース"' in store.describe("doc1")
+    assert "-- 30 rows" in store.describe("doc1")
+
+    rows = store.query("doc1", 'SELECT "ID" FROM "テストケース" ORDER BY "ID"')
+    assert rows.rows == [(1,), (2,), (3,), (4,), (5,)] and rows.truncated
+    assert rows.to_text().splitlines()[-1] == "（先頭 5 行のみ）"
+
+
+def test_sandbox_rejects_anything_but_select(store):
+    store.save("doc1", [_table()])
+
+    for sql in (
+        'DELETE FROM "テストケース"',
+        'UPDATE "テストケース" SET "状態" = \'完了\'',
+        "ATTACH DATABASE 'other.db' AS other",
+        "PRAGMA table_info('テストケース')",
+        "SELECT load_extension('evil')",
+    ):
+        with pytest.raises(TableQueryError):
+            store.query("doc1", sql)
+    assert store.query("doc1", 'SELECT COUNT(*) FROM "テストケース"').rows == [(30,)]
+    with pytest.raises(TableQueryError):
+        store.query("missing", "SELECT 1")
+
+
+def test_long_running_query_is_interrupted(tmp_path):
+    store = TableStore(str(tmp_path), key_ring=KEY_RING, timeout=0.1)
+    store.save("doc1", [_table()])
+
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT COUNT(*) FROM n"
+    with pytest.raises(TableQueryError, match="exceeded"):
+        store.query("doc1", endless)
+
+
+def test_saving_again_replaces_cached_tables(store):
+    store.save("doc1", [_table()])
+    sql = 'SELECT COUNT(*) FROM "テストケース" WHERE "状態" = \'未完了\''
+    assert store.query("doc1", sql).rows == [(10,)]
+
+    store.save("doc1", [_table(status=lambda i: "未完了")])
+    assert store.query("doc1", sql).rows == [(30,)]
+
+    store.delete("doc1")
+    assert not store.exists("doc1")
+    with pytest.raises(TableQueryError):
+        store.query("doc1", sql)
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import pytest
+
+from rag_engine import tracing
+from rag_engine.tracing import Span, Trace, current_trace, span, start_trace
+
+
+def test_spans_outside_a_trace_are_noops():
+    assert start_trace("query") is span("embed")
+    with span("embed") as current:
+        current.set_attribute("tokens", 3)
+    assert current_trace() is None
+
+
+def test_nested_spans_breakdown_and_otel():
+    with start_trace("query", force=True, user="alice") as root:
+        with span("retrieve"):
+            with span("vector_search", limit=20):
+                pass
+
+        def decrypt():
+            with span("decrypt"):
+                pass
+
+        # タスクと asyncio.to_thread はコンテキストを引き継ぐので、別スレッドでも同じトレースの子スパンになる
+        asyncio.run(asyncio.to_thread(decrypt))
+        with pytest.raises(RuntimeError):
+            with span("generate"):
+                raise RuntimeError("llm down")
+
+    trace = root.trace
+    assert current_trace() is None
+    rows = trace.breakdown()
+    assert [(row["name"], row["depth"]) for row in rows] == [
+        ("query", 0), ("retrieve", 1), ("vector_search", 2), ("decrypt", 1), ("generate", 1),
+    ]
+    assert rows[2]["attributes"] == {"limit": 20}
+
+    spans = {s["name"]: s for s in trace.to_otel()["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert spans["generate"]["status"] == {"code": 2, "message": "RuntimeError: llm down"}
+    assert spans["vector_search"]["parentSpanId"] == spans["retrieve"]["spanId"]
+    assert spans["query"]["attributes"] == [{"key": "user", "value": {"stringValue": "alice"}}]
+
+
+def test_slow_sampled_trace_is_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_SLOW_MS", 0.0)
+    monkeypatch.setattr(tracing, "TRACE_LOG_DIR", str(tmp_path))
+
+    with Span(Trace(sampled=True), "query", None, {}):
+        pass
+    with Span(Trace(sampled=False), "query", None, {}):
+        pass
+
+    lines = [line for path in tmp_path.glob("traces-*.jsonl") for line in path.read_text().splitlines()]
+    assert len(lines) == 1
+    assert json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"][0]["name"] == "query"
@@ -0,0 +1,251 @@
+"""
+リクエストのトレース
+
+contextvars で現在のスパンを引き継ぎ、質問応答の各段階（埋め込み、ベクトル検索、権限判定、
+復号、LLM生成など）の所要時間を1つのトレースにまとめる。
+トレース中でなければ span() は何もしない共有オブジェクトを返すだけなので、無効時のコストは
+ContextVar の参照1回で済む。
+記録したトレースは OpenTelemetry（OTLP/JSON）と同じ形式で書き出せ、サンプリングされた
+遅いトレースは TRACE_LOG_DIR に JSON Lines で保存する
+"""
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))  # 記録するリクエストの割合
+TRACE_SLOW_MS = float(os.environ.get("TRACE_SLOW_MS", "2000"))  # これ以上かかったトレースを保存する
+TRACE_LOG_DIR = os.environ.get("TRACE_LOG_DIR", "/data/logs")
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "secure-rag")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_write_lock = threading.Lock()
+
+
+class _NoopSpan:
+    """トレース中でないときに返す何もしないスパン"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """トレース内の1区間"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # 開始したのと別のコンテキストで終了した（切断した SSE のジェネレーターを別のタスクから
+            # aclose() した場合など）。このコンテキストでも現在のスパンなら親に戻す
+            if _current_span.get() is self:
+                parent = self._token.old_value
+                _current_span.set(None if parent is Token.MISSING else parent)
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.trace.finish()
+        return False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Trace:
+    """1リクエスト分のスパンの集まり"""
+
+    def __init__(self, sampled: bool):
+        """
+        初期化
+
+        Args:
+            sampled: 遅い場合にログへ保存する対象か
+        """
+        self.trace_id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.spans: List[Span] = []  # 終了した順（スレッドから追加されても list.append は安全）
+        # perf_counter の値を UNIX 時刻に換算するための基準
+        self._wall_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+
+    def _unix_ns(self, perf_ns: int) -> int:
+        return self._wall_ns + (perf_ns - self._perf_ns)
+
+    @property
+    def root(self) -> Optional[Span]:
+        return next((span for span in self.spans if span.parent_id is None), None)
+
+    def breakdown(self) -> List[Dict[str, Any]]:
+        """
+        開始順の所要時間の内訳
+
+        Returns:
+            {"name", "start_ms"（ルートからの経過）, "duration_ms", "depth", "attributes"} のリスト
+        """
+        root = self.root
+        if root is None:
+            return []
+        depths = {root.span_id: 0}
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s.start_ns):
+            depth = depths.get(span.parent_id, -1) + 1 if span.parent_id else 0
+            depths[span.span_id] = depth
+            rows.append({
+                "name": span.name,
+                "start_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                "duration_ms": round(span.duration_ms, 3),
+                "depth": depth,
+                "attributes": dict(span.attributes),
+            })
+        return rows
+
+    def to_otel(self) -> Dict[str, Any]:
+        """OpenTelemetry の OTLP/JSON（ExportTraceServiceRequest）形式に変換"""
+        spans = []
+        for span in self.spans:
+            otel_span = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(self._unix_ns(span.start_ns)),
+                "endTimeUnixNano": str(self._unix_ns(span.end_ns)),
+                "attributes": [_otel_attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent_id:
+                otel_span["parentSpanId"] = span.parent_id
+            spans.append(otel_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otel_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+    def finish(self):
+        """ルートスパンの終了時に呼ばれ、サンプリング対象の遅いトレースを保存する"""
+        root = self.root
+        if not self.sampled or root is None or root.duration_ms < TRACE_SLOW_MS:
+            return
+        try:
+            write_trace(self)
+        except OSError as e:
+            logger.warning(f"Failed to write slow trace {self.trace_id}: {e}")
+
+
+def _otel_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def write_trace(trace: Trace, log_dir: Optional[str] = None):
+    """
+    トレースを日付ごとの JSON Lines ファイルに追記
+
+    Args:
+        trace: 終了したトレース
+        log_dir: 保存先ディレクトリ（省略時は TRACE_LOG_DIR）
+    """
+    path = Path(log_dir or TRACE_LOG_DIR) / f"traces-{datetime.now(timezone.utc):%Y%m%d}.jsonl"
+    line = json.dumps(trace.to_otel(), ensure_ascii=False)
+    with _write_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    logger.info(f"Slow trace {trace.trace_id} ({trace.root.duration_ms:.0f}ms) written to {path}")
+
+
+def start_trace(name: str, force: bool = False, **attributes: Any):
+    """
+    トレースを開始するルートスパンを作成
+
+    TRACING_ENABLED のときは TRACE_SAMPLE_RATE の割合で、force のときは常に記録する。
+    記録しない場合は何もしないスパンを返す
+
+    Args:
+        name: ルートスパン名
+        force: サンプリングに関わらず記録する（管理者が内訳を要求した場合など）
+        attributes: スパンの属性
+
+    Returns:
+        with 文で使うスパン（記録する場合は Span、trace 属性からトレースを参照できる）
+    """
+    sampled = TRACING_ENABLED and random.random() < TRACE_SAMPLE_RATE
+    if not (sampled or force):
+        return _NOOP
+    return Span(Trace(sampled), name, None, attributes)
+
+
+def span(name: str, **attributes: Any):
+    """
+    現在のトレースに子スパンを作成（トレース中でなければ何もしない）
+
+    Args:
+        name: スパン名
+        attributes: スパンの属性
+
+    Returns:
+        with 文で使うスパン
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return _NOOP
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    """記録中のトレース（なければ None）"""
+    current = _current_span.get()
+    return current.trace if current is not None else None
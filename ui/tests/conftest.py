@@ -0,0 +1,15 @@
+"""
+UI のテストの共通設定
+
+ビューは Streamlit に依存するため、テストの対象は Streamlit を使わない utils の各モジュールに限る。
+ui ディレクトリを import できるようにし、開発用のモック応答は使わない
+"""
+
+import os
+import sys
+
+_UI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _UI_DIR not in sys.path:
+    sys.path.insert(0, _UI_DIR)
+
+os.environ.pop("DEVELOPMENT", None)
@@ -0,0 +1,94 @@
+import httpx
+import pytest
+
+from utils.api_client import APIClient
+from utils.async_runtime import iterate, run
+
+
+def _client(handler, **kwargs) -> APIClient:
+    client = APIClient(base_url="http://api.test", http2=False, retry_backoff=0.0, **kwargs)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+async def _async(function):
+    return function()
+
+
+def test_requests_share_one_pooled_client():
+    client = APIClient(base_url="http://api.test", http2=False)
+    first = run(_async(client._get_client))
+    assert run(_async(client._get_client)) is first
+    assert first.is_closed is False
+
+    run(client.close())
+    assert first.is_closed and client._client is None
+
+
+def test_get_is_retried_on_503_and_transport_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) == 1:
+            raise httpx.ConnectError("connection refused")
+        if len(calls) == 2:
+            return httpx.Response(503, headers={"Retry-After": "0"}, json={"detail": "busy"})
+        return httpx.Response(200, json={"items": []})
+
+    client = _client(handler, get_retries=2)
+    assert run(client._make_request("GET", "/api/history")) == {"items": []}
+    assert calls == ["GET", "GET", "GET"]
+
+
+def test_post_is_not_retried_and_errors_carry_the_detail():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(503, json={"detail": "混雑しています"})
+
+    client = _client(handler, get_retries=3)
+    with pytest.raises(Exception, match="APIエラー: 混雑しています"):
+        run(client._make_request("POST", "/api/query", data={"query": "q"}))
+    assert calls == ["POST"]
+
+
+def test_retry_delay_honours_retry_after():
+    client = APIClient(base_url="http://api.test", http2=False, retry_backoff=0.0)
+    assert client._retry_delay(0, "3") == 3.0
+    assert client._retry_delay(0, "120") == 10.0
+    assert client._retry_delay(5) == 0.0
+
+
+def test_stream_query_parses_server_sent_events():
+    body = (
+        'event: context\ndata: {"context": []}\n\n'
+        'event: token\ndata: {"text": "保管期間は"}\n\n'
+        ': keep-alive\n\n'
+        'event: token\ndata: {"text": "30日です"}\n\n'
+        'event: done\ndata: {"history_id": "h1", "documents": []}\n\n'
+    )
+
+    def handler(request):
+        if request.method == "GET":
+            return httpx.Response(200, json={"items": []})
+        assert request.headers["Accept"] == "text/event-stream"
+        return httpx.Response(200, headers={"Content-Type": "text/event-stream"}, content=body.encode("utf-8"))
+
+    client = _client(handler)
+    client.token = "alice-token"
+    run(client._make_request("GET", "/api/history", cache_ttl=60))
+
+    events = list(iterate(client.stream_query("保管期間は?")))
+    assert [name for name, _ in events] == ["context", "token", "token", "done"]
+    assert "".join(data["text"] for name, data in events if name == "token") == "保管期間は30日です"
+    # 回答は履歴に保存されるので、履歴のキャッシュを破棄する
+    assert len(client.cache) == 0
+
+
+def test_stream_query_raises_api_errors():
+    client = _client(lambda request: httpx.Response(403, json={"detail": "権限がありません"}))
+
+    with pytest.raises(Exception, match="APIエラー: 権限がありません"):
+        list(iterate(client.stream_query("q")))
@@ -0,0 +1,79 @@
+import asyncio
+import threading
+
+import pytest
+
+from utils import async_runtime
+from utils.async_runtime import cancel_session, get_loop, iterate, run, run_async, submit
+
+
+def test_coroutines_run_on_one_shared_loop():
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    loops = {run(current_loop()) for _ in range(3)}
+    assert loops == {get_loop()}
+    # 別の asyncio.run の中からも共有のループで実行される
+    assert asyncio.run(run_async(current_loop())) is get_loop()
+
+    async def nested():
+        with pytest.raises(RuntimeError):
+            run(current_loop())
+        return await run_async(current_loop())
+
+    assert run(nested()) is get_loop()
+
+
+def test_run_cancels_the_task_on_timeout():
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        run(slow(), timeout=0.2)
+    assert cancelled.wait(1)
+
+
+def test_iterate_stops_the_producer_when_the_reader_breaks():
+    finished = threading.Event()
+
+    async def numbers():
+        try:
+            for i in range(100):
+                yield i
+                await asyncio.sleep(0.01)
+        finally:
+            finished.set()
+
+    received = []
+    for number in iterate(numbers()):
+        received.append(number)
+        if number == 2:
+            break
+    assert received == [0, 1, 2]
+    assert finished.wait(1)
+
+    async def failing():
+        yield "first"
+        raise ValueError("stream broken")
+
+    with pytest.raises(ValueError):
+        list(iterate(failing()))
+
+
+def test_disconnected_session_tasks_are_cancelled(monkeypatch):
+    monkeypatch.setattr(async_runtime, "_session_id", lambda: "session-1")
+    monkeypatch.setattr(async_runtime, "_session_active", lambda session_id: False)
+
+    future = submit(asyncio.sleep(10))
+    assert async_runtime.pending_count() == 1
+    assert cancel_session() == 1
+    assert future.cancelled()
+
+    with pytest.raises(async_runtime.SessionDisconnected):
+        run(asyncio.sleep(10))
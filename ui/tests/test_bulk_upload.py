@@ -0,0 +1,90 @@
+import asyncio
+import time
+
+from utils import bulk_upload
+from utils.bulk_upload import FAILED, SUCCEEDED, BulkUpload
+
+
+class File:
+    def __init__(self, name: str, size: int = 100):
+        self.name = name
+        self.size = size
+
+
+class FakeClient:
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.running = 0
+        self.max_running = 0
+        self.upload_ids = []
+        self.invalidated = []
+
+    async def upload_document(self, file, metadata, upload_id=None, on_session=None, on_progress=None):
+        self.upload_ids.append((file.name, upload_id))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            on_session({"upload_id": f"up-{file.name}"})
+            on_progress(file.size // 2)
+            await asyncio.sleep(0.02)
+            if self.failures.get(file.name):
+                self.failures[file.name] -= 1
+                raise Exception("APIリクエストエラー: connection reset")
+            on_progress(file.size)
+            return {"job_id": f"job-{file.name}", "duplicate": file.name == "dup.txt"}
+        finally:
+            self.running -= 1
+
+    async def get_jobs(self, job_ids):
+        return {"items": [
+            {"job_id": job_id, "status": "failed" if "bad" in job_id else "succeeded",
+             "stage": "completed", "progress": 100.0, "error": "parse error" if "bad" in job_id else None}
+            for job_id in job_ids
+        ]}
+
+    def invalidate(self, prefix, all_users=False):
+        self.invalidated.append((prefix, all_users))
+
+
+def _wait(upload: BulkUpload):
+    deadline = time.monotonic() + 5
+    while upload.active and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not upload.active
+
+
+def test_files_upload_in_parallel_up_to_the_limit(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "JOB_POLL_INTERVAL", 0.01)
+    client = FakeClient()
+    files = [File(f"{i}.txt") for i in range(5)] + [File("dup.txt")]
+    upload = BulkUpload(files, {"confidentiality": 1}, client=client, concurrency=2)
+
+    assert [item.progress for item in upload.items] == [0.0] * 6
+    upload.start()
+    _wait(upload)
+
+    assert client.max_running == 2
+    assert upload.counts() == {SUCCEEDED: 6}
+    assert [item.progress for item in upload.items] == [1.0] * 6
+    assert [item.duplicate for item in upload.items] == [False] * 5 + [True]
+    assert client.invalidated[-1] == ("/api/documents", True)
+
+
+def test_failed_file_is_retried_without_stopping_the_others(monkeypatch):
+    monkeypatch.setattr(bulk_upload, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(bulk_upload, "UPLOAD_RETRY_BACKOFF", 0.0)
+    client = FakeClient(failures={"flaky.txt": 1, "down.txt": 3})
+    upload = BulkUpload([File("flaky.txt"), File("down.txt"), File("bad.txt")], {}, client=client, retries=1)
+
+    upload.start()
+    _wait(upload)
+    flaky, down, bad = upload.items
+    assert (flaky.status, flaky.attempts) == (SUCCEEDED, 2)
+    # 再試行では送信済みの位置から再開する
+    assert ("flaky.txt", "up-flaky.txt") in client.upload_ids
+    assert (down.status, down.attempts) == (FAILED, 2)
+    assert (bad.status, bad.error) == (FAILED, "parse error")
+
+    upload.retry(1)
+    _wait(upload)
+    assert down.status == SUCCEEDED and down.error is None
@@ -0,0 +1,25 @@
+from utils.message_window import earlier_messages, keep_latest
+
+
+def test_keep_latest_drops_oldest_items():
+    items = list(range(7))
+    assert keep_latest(items, 5) == 2
+    assert items == [2, 3, 4, 5, 6]
+    assert keep_latest(items, 5) == 0
+    assert items == [2, 3, 4, 5, 6]
+
+
+def test_earlier_messages_are_chronological_and_skip_turns_in_session():
+    # サーバーは新しい順に返す。h3 は直近の質問としてセッションにも残っている
+    page = [
+        {"id": "h3", "query": "質問3", "answer": "回答3"},
+        {"id": "h2", "query": "質問2", "answer": "回答2"},
+        {"id": "h1", "query": "質問1", "answer": "回答1"},
+    ]
+
+    messages = earlier_messages(page, ["h3", None])
+    assert [(m["message"], m["is_user"]) for m in messages] == [
+        ("質問1", True), ("回答1", False), ("質問2", True), ("回答2", False),
+    ]
+    assert [m["history_id"] for m in messages] == [None, "h1", None, "h2"]
+    assert earlier_messages([], ["h1"]) == []
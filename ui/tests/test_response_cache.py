@@ -0,0 +1,85 @@
+import time
+
+import httpx
+
+from utils.api_client import APIClient
+from utils.async_runtime import run
+from utils.response_cache import ResponseCache, scope_for_token
+
+
+def test_entries_are_scoped_per_user_and_bounded():
+    cache = ResponseCache(max_entries=2)
+    alice, bob = scope_for_token("alice-token"), scope_for_token("bob-token")
+    assert alice != bob and scope_for_token(None) is None
+
+    cache.put(alice, "/api/documents", {"limit": 50}, {"items": ["a"]}, '"v1"', 30)
+    cache.put(bob, "/api/documents", {"limit": 50}, {"items": ["b"]}, None, 30)
+    assert cache.get(alice, "/api/documents", {"limit": 50}).value == {"items": ["a"]}
+    assert cache.get(alice, "/api/documents", {"limit": 20}) is None
+
+    # alice のエントリを最後に使ったので、上限を超えると bob のエントリが捨てられる
+    cache.put(alice, "/api/history", None, {"items": []}, None, 30)
+    assert cache.get(bob, "/api/documents", {"limit": 50}) is None
+    assert len(cache) == 2
+
+    assert cache.invalidate("/api/documents", scope=bob) == 0
+    assert cache.invalidate("/api/documents") == 1
+    assert cache.clear_scope(alice) == 1 and len(cache) == 0
+
+
+def test_client_serves_fresh_entries_and_revalidates_with_etag():
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(200, headers={"ETag": '"v1"'}, json={"items": ["doc"]})
+
+    client = APIClient(base_url="http://api.test", http2=False)
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    client.token = "alice-token"
+
+    first = run(client._make_request("GET", "/api/documents", cache_ttl=60))
+    cached = run(client._make_request("GET", "/api/documents", cache_ttl=60))
+    assert first == cached == {"items": ["doc"]}
+    assert requests == [None]
+
+    # 期限切れのエントリは If-None-Match で再検証し、304 ならそのまま使う
+    client.cache.get(scope_for_token("alice-token"), "/api/documents", None).expires_at = time.monotonic()
+    assert run(client._make_request("GET", "/api/documents", cache_ttl=60)) == {"items": ["doc"]}
+    assert requests == [None, '"v1"']
+    assert (client.cache.hits, client.cache.revalidated, client.cache.misses) == (1, 1, 1)
+
+    # ログアウト後や別のユーザーのトークンでは使わない
+    client.token = "bob-token"
+    run(client._make_request("GET", "/api/documents", cache_ttl=60))
+    client.token = None
+    run(client._make_request("GET", "/api/documents", cache_ttl=60))
+    assert requests[2:] == [None, None]
+
+
+def test_sessions_share_the_pool_and_cache_but_not_the_token():
+    requests = []
+
+    def handler(request):
+        requests.append(request.headers.get("Authorization"))
+        return httpx.Response(200, headers={"ETag": '"v1"'}, json={"user": request.headers.get("Authorization")})
+
+    shared = APIClient(base_url="http://api.test", http2=False)
+    shared._client = httpx.AsyncClient(base_url=shared.base_url, transport=httpx.MockTransport(handler))
+    alice, bob = shared.for_session(), shared.for_session()
+    alice.token = "alice-token"
+    bob.token = "bob-token"
+
+    # bob がログインしても、alice のセッションは alice のトークンとキャッシュを使い続ける
+    assert run(alice._make_request("GET", "/api/history", cache_ttl=60)) == {"user": "Bearer alice-token"}
+    assert run(bob._make_request("GET", "/api/history", cache_ttl=60)) == {"user": "Bearer bob-token"}
+    assert run(alice._make_request("GET", "/api/history", cache_ttl=60)) == {"user": "Bearer alice-token"}
+    assert requests == ["Bearer alice-token", "Bearer bob-token"]
+    assert shared.token is None and alice.cache is shared.cache
+    # 接続プールはシングルトンのものだけを使う
+    assert alice._client is None and bob._client is None
+
+    bob.clear_cache()
+    assert shared.cache.get(scope_for_token("alice-token"), "/api/history", None) is not None
@@ -2,33 +2,131 @@
 APIクライアント
 
 バックエンドAPIとの通信を担当するモジュール
+
+接続を使い回すため、httpx.AsyncClient はプロセスで1つだけ作り、UI 共有のイベントループ
+（utils.async_runtime）に結び付ける。リクエストは常にこのループで実行されるため、
+スクリプトの再実行のたびに接続を張り直さない。
+トークンは Streamlit のセッションごとのクライアント（get_api_client）が持ち、接続プールと応答の
+キャッシュだけをプロセスで共有する
+
+一覧などの GET の応答はユーザーごとにキャッシュし（utils.response_cache）、ページを移動する
+たびに取り直さない。アップロードなどの変更後は、影響する一覧のキャッシュを破棄する
 """
 
+import asyncio
+import copy
 import httpx
 import json
-import streamlit as st
 import logging
-from typing import Dict, List, Any, Optional
+import random
+from typing import AsyncIterator, Callable, Dict, List, Any, Optional, Tuple
+from datetime import date
 import os
 
+from utils.async_runtime import run_async
+from utils.response_cache import ResponseCache, scope_for_token
+
 logger = logging.getLogger(__name__)
 
 # API設定
 API_URL = os.environ.get("API_URL", "http://api:8000")
 TIMEOUT = 30.0  # リクエストタイムアウト（秒）
+API_HTTP2 = os.environ.get("API_HTTP2", "true").lower() == "true"  # HTTPS 接続で HTTP/2 を使う
+API_MAX_CONNECTIONS = int(os.environ.get("API_MAX_CONNECTIONS", "20"))
+API_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("API_MAX_KEEPALIVE_CONNECTIONS", "10"))
+API_KEEPALIVE_EXPIRY = float(os.environ.get("API_KEEPALIVE_EXPIRY", "30"))  # 使われていない接続を閉じるまでの秒数
+API_GET_RETRIES = int(os.environ.get("API_GET_RETRIES", "3"))  # GET の再試行回数（GET 以外は再試行しない）
+API_RETRY_BACKOFF = float(os.environ.get("API_RETRY_BACKOFF", "0.2"))  # 再試行の待ち時間の基準（秒）
+RETRY_STATUSES = {502, 503, 504}
+API_CACHE_MAX_ENTRIES = int(os.environ.get("API_CACHE_MAX_ENTRIES", "256"))  # キャッシュする応答数の上限（全ユーザーの合計）
+API_CACHE_TTL_DOCUMENTS = float(os.environ.get("API_CACHE_TTL_DOCUMENTS", "30"))  # ドキュメント一覧を問い合わせずに使う秒数
+API_CACHE_TTL_HISTORY = float(os.environ.get("API_CACHE_TTL_HISTORY", "15"))  # 質問履歴を問い合わせずに使う秒数
+API_CACHE_TTL_SETTINGS = float(os.environ.get("API_CACHE_TTL_SETTINGS", "300"))  # 設定を問い合わせずに使う秒数
+
+
+UPLOAD_STREAM_CHUNK = 256 * 1024  # 分割アップロードのパートを送るときに一度に書き込むバイト数
+
+
+class UploadOffsetMismatch(Exception):
+    """分割アップロードのパートの開始位置がサーバーの受信済みの位置と一致しない"""
+    
+    def __init__(self, offset: int):
+        super().__init__(f"server expects upload offset {offset}")
+        self.offset = offset
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
 
 class APIClient:
     """バックエンドAPIクライアント"""
     
-    def __init__(self, base_url: str = API_URL):
+    def __init__(
+        self,
+        base_url: str = API_URL,
+        max_connections: int = API_MAX_CONNECTIONS,
+        max_keepalive_connections: int = API_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = API_KEEPALIVE_EXPIRY,
+        http2: bool = API_HTTP2,
+        get_retries: int = API_GET_RETRIES,
+        retry_backoff: float = API_RETRY_BACKOFF,
+        cache_max_entries: int = API_CACHE_MAX_ENTRIES,
+    ):
         """
         初期化
         
         Args:
             base_url: APIのベースURL
+            max_connections: 同時に張る接続数の上限
+            max_keepalive_connections: 使い回すために保持する接続数の上限
+            keepalive_expiry: 使われていない接続を閉じるまでの秒数
+            http2: HTTP/2 を使う（h2 がインストールされている場合、HTTPS 接続でのみ有効）
+            get_retries: GET が接続エラーや 502/503/504 で失敗した場合の再試行回数
+            retry_backoff: 再試行の待ち時間の基準（秒、試行ごとに倍にしてランダムに揺らす）
+            cache_max_entries: キャッシュする GET の応答数の上限
         """
         self.base_url = base_url
         self.token = None
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.warning("h2 is not installed, falling back to HTTP/1.1")
+        self.get_retries = get_retries
+        self.retry_backoff = retry_backoff
+        self._client: Optional[httpx.AsyncClient] = None
+        self._shared: Optional["APIClient"] = None  # 接続プールを持つクライアント（セッションごとのクライアントの場合）
+        self.cache = ResponseCache(cache_max_entries)
+    
+    def for_session(self) -> "APIClient":
+        """
+        接続プールと応答のキャッシュを共有し、トークンだけを別に持つクライアントを作成
+        
+        Returns:
+            ログインしていない状態のクライアント（Streamlit のセッションごとに1つ使う）
+        """
+        session = copy.copy(self)
+        session._shared = self._shared or self
+        session._client = None
+        session.token = None
+        return session
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """共有の httpx クライアント（UI 共有のループ内で呼ぶ）"""
+        owner = self._shared or self
+        if owner._client is None:
+            owner._client = httpx.AsyncClient(
+                base_url=owner.base_url, timeout=TIMEOUT, limits=owner.limits, http2=owner.http2
+            )
+        return owner._client
     
     def _get_headers(self) -> Dict[str, str]:
         """
@@ -47,12 +145,20 @@ class APIClient:
         
         return headers
     
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """再試行までの待ち時間（指数的に伸ばした上限までの一様乱数、Retry-After があればそれ以上）"""
+        delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), 10.0))
+        return delay
+    
     async def _make_request(
         self, 
         method: str, 
         endpoint: str, 
         data: Optional[Dict] = None, 
-        params: Optional[Dict] = None
+        params: Optional[Dict] = None,
+        cache_ttl: Optional[float] = None
     ) -> Dict:
         """
         APIリクエストを実行
@@ -62,6 +168,7 @@ class APIClient:
             endpoint: APIエンドポイント
             data: リクエストボディ（オプション）
             params: クエリパラメータ（オプション）
+            cache_ttl: GET の応答をキャッシュして問い合わせずに使う秒数（オプション、ログイン中のみ）
             
         Returns:
             レスポンス（辞書）
@@ -69,24 +176,63 @@ class APIClient:
         Raises:
             Exception: API通信エラー
         """
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
+        if method not in ("GET", "POST", "PUT", "DELETE"):
+            raise ValueError(f"Unsupported HTTP method: {method}")
+        return await run_async(self._send(method, endpoint, data, params, cache_ttl))
+    
+    async def _send(
+        self,
+        method: str,
+        endpoint: str,
+        data: Optional[Dict],
+        params: Optional[Dict],
+        cache_ttl: Optional[float] = None,
+    ) -> Dict:
+        url = f"/{endpoint.lstrip('/')}"
         headers = self._get_headers()
         
+        # キャッシュはトークンごとに分け、期限内ならそのまま返し、期限切れなら ETag で再検証する
+        scope = scope_for_token(self.token) if method == "GET" and cache_ttl is not None else None
+        cached = self.cache.get(scope, url, params) if scope else None
+        if cached is not None:
+            if cached.fresh:
+                self.cache.hits += 1
+                return cached.value
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+        body = data if method in ("POST", "PUT") else None
+        # 冪等な GET だけを再試行する（POST などは二重に処理されるおそれがある）
+        attempts = self.get_retries + 1 if method == "GET" else 1
+        
         try:
-            async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-                if method == "GET":
-                    response = await client.get(url, headers=headers, params=params)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, json=data, params=params)
-                elif method == "PUT":
-                    response = await client.put(url, headers=headers, json=data, params=params)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=headers, params=params)
-                else:
-                    raise ValueError(f"Unsupported HTTP method: {method}")
-                
-                response.raise_for_status()
-                return response.json()
+            for attempt in range(attempts):
+                last = attempt + 1 >= attempts
+                try:
+                    response = await self._get_client().request(method, url, headers=headers, json=body, params=params)
+                except httpx.TransportError as e:
+                    if last:
+                        raise
+                    delay = self._retry_delay(attempt)
+                    logger.warning(f"{method} {url} failed ({e!r}), retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if response.status_code in RETRY_STATUSES and not last:
+                    delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                    logger.warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.2f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                break
+            
+            if response.status_code == 304 and cached is not None:
+                self.cache.revalidated += 1
+                self.cache.touch(cached, cache_ttl)
+                return cached.value
+            response.raise_for_status()
+            result = response.json()
+            if scope:
+                self.cache.misses += 1
+                self.cache.put(scope, url, params, result, response.headers.get("ETag"), cache_ttl)
+            return result
                 
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
@@ -102,6 +248,69 @@ class APIClient:
             logger.error(f"Request error: {str(e)}")
             raise Exception(f"APIリクエストエラー: {str(e)}")
     
+    async def _stream_events(
+        self, method: str, endpoint: str, data: Optional[Dict] = None
+    ) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        server-sent events の応答を受け取った順に返す（UI 共有のループ内で使う）
+        
+        Yields:
+            (イベント名, データ)
+            
+        Raises:
+            Exception: API通信エラー
+        """
+        headers = {**self._get_headers(), "Accept": "text/event-stream"}
+        try:
+            async with self._get_client().stream(method, f"/{endpoint.lstrip('/')}", headers=headers, json=data) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    response.raise_for_status()
+                event, lines = "message", []
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        lines.append(line[5:].strip())
+                    elif not line and lines:
+                        # 空行でイベントの区切り
+                        yield event, json.loads("\n".join(lines))
+                        event, lines = "message", []
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
+            try:
+                error_message = e.response.json().get("detail", str(e))
+            except ValueError:
+                error_message = str(e)
+            raise Exception(f"APIエラー: {error_message}")
+        except httpx.RequestError as e:
+            logger.error(f"Request error: {str(e)}")
+            raise Exception(f"APIリクエストエラー: {str(e)}")
+    
+    def invalidate(self, prefix: str, all_users: bool = False) -> int:
+        """
+        変更のあとに、影響するパスのキャッシュを破棄
+        
+        Args:
+            prefix: APIのパスの先頭（例: "/api/documents"）
+            all_users: 全ユーザーのキャッシュを破棄する（共有の一覧が変わった場合）
+        
+        Returns:
+            破棄したエントリの数
+        """
+        return self.cache.invalidate(prefix, None if all_users else scope_for_token(self.token))
+    
+    def clear_cache(self) -> int:
+        """ログイン中のユーザーのキャッシュをすべて破棄（ログアウト時）"""
+        return self.cache.clear_scope(scope_for_token(self.token))
+    
+    async def close(self):
+        """接続プールを閉じる（共有しているすべてのセッションのクライアントで閉じる）"""
+        owner = self._shared or self
+        if owner._client is not None:
+            client, owner._client = owner._client, None
+            await run_async(client.aclose())
+    
     # 認証関連エンドポイント
     async def login(self, username: str, password: str) -> Dict:
         """
@@ -115,16 +324,16 @@ class APIClient:
             ログイン結果（トークンを含む）
         """
         # 開発環境モック
-        self.token = "mock_token"
-        return {
-            "access_token": "mock_token",
-            "token_type": "bearer",
-            "user": {
-                "username": username,
-                "role": "admin"
+        if os.getenv("DEVELOPMENT") == "1":
+            self.token = "mock_token"
+            return {
+                "access_token": "mock_token",
+                "token_type": "bearer",
+                "user": {
+                    "username": username,
+                    "role": "admin"
+                }
             }
-        }
-        raise Exception("ユーザー名またはパスワードが正しくありません。")
         
         # 実際のAPI呼び出し
         data = {"username": username, "password": password}
@@ -136,60 +345,186 @@ class APIClient:
         return response
     
     # ドキュメント関連エンドポイント
-    async def get_documents(self, search: Optional[str] = None) -> List[Dict]:
+    async def get_documents(
+        self,
+        name: Optional[str] = None,
+        doc_type: Optional[str] = None,
+        confidentiality: Optional[int] = None,
+        uploaded_by: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Dict:
         """
-        ドキュメント一覧を取得
+        ドキュメント一覧を1ページ取得（絞り込みはサーバー側で行う）
         
         Args:
-            search: 検索クエリ（オプション）
+            name: ファイル名に含まれる文字列（オプション）
+            doc_type: 種類（PDF, Word, Excel, Text）（オプション）
+            confidentiality: 機密レベル（オプション）
+            uploaded_by: アップロードしたユーザー（オプション）
+            cursor: 前のページの next_cursor（オプション）
+            limit: 1ページの件数
             
         Returns:
-            ドキュメントリスト
+            {"items": ドキュメントリスト, "next_cursor": 次のページのカーソル, "total": 件数, "facets": 項目ごとの件数}
         """
         # 開発環境モック
-        mock_documents = [
-            {"id": 1, "name": "プロジェクト仕様書.pdf", "uploaded": "2023-03-01", "size": "2.4 MB", "type": "PDF", "confidentiality": 2},
-            {"id": 2, "name": "システム設計書.docx", "uploaded": "2023-03-02", "size": "1.8 MB", "type": "Word", "confidentiality": 2},
-            {"id": 3, "name": "テスト計画書.xlsx", "uploaded": "2023-03-03", "size": "1.2 MB", "type": "Excel", "confidentiality": 1},
-            {"id": 4, "name": "議事録.txt", "uploaded": "2023-03-04", "size": "0.1 MB", "type": "Text", "confidentiality": 1},
-            {"id": 5, "name": "API仕様書.pdf", "uploaded": "2023-03-05", "size": "3.5 MB", "type": "PDF", "confidentiality": 2},
-        ]
-            
-        if search:
-            return [doc for doc in mock_documents if search.lower() in doc["name"].lower()]
-        else:
-            return mock_documents
+        if os.getenv("DEVELOPMENT") == "1":
+            items = [
+                {"id": "1", "name": "プロジェクト仕様書.pdf", "uploaded_at": "2023-03-01T10:00:00+09:00", "size": 2516582, "type": "PDF", "confidentiality": 2, "uploaded_by": "admin", "status": "indexed"},
+                {"id": "2", "name": "システム設計書.docx", "uploaded_at": "2023-03-02T10:00:00+09:00", "size": 1887437, "type": "Word", "confidentiality": 2, "uploaded_by": "admin", "status": "indexed"},
+                {"id": "3", "name": "テスト計画書.xlsx", "uploaded_at": "2023-03-03T10:00:00+09:00", "size": 1258291, "type": "Excel", "confidentiality": 1, "uploaded_by": "admin", "status": "indexed"},
+                {"id": "4", "name": "議事録.txt", "uploaded_at": "2023-03-04T10:00:00+09:00", "size": 104857, "type": "Text", "confidentiality": 1, "uploaded_by": "admin", "status": "indexed"},
+                {"id": "5", "name": "API仕様書.pdf", "uploaded_at": "2023-03-05T10:00:00+09:00", "size": 3670016, "type": "PDF", "confidentiality": 2, "uploaded_by": "admin", "status": "indexed"},
+            ]
+            if name:
+                items = [doc for doc in items if name.lower() in doc["name"].lower()]
+            if doc_type:
+                items = [doc for doc in items if doc["type"] == doc_type]
+            if confidentiality is not None:
+                items = [doc for doc in items if doc["confidentiality"] == confidentiality]
+            return {"items": items, "next_cursor": None, "total": len(items), "facets": None}
         
         # 実際のAPI呼び出し
-        params = {"search": search} if search else None
-        response = await self._make_request("GET", "/api/documents", params=params)
-        return response.get("items", [])
+        params = {"limit": limit}
+        if name:
+            params["name"] = name
+        if doc_type:
+            params["type"] = doc_type
+        if confidentiality is not None:
+            params["confidentiality"] = confidentiality
+        if uploaded_by:
+            params["uploaded_by"] = uploaded_by
+        if cursor:
+            params["cursor"] = cursor
+        return await self._make_request("GET", "/api/documents", params=params, cache_ttl=API_CACHE_TTL_DOCUMENTS)
     
-    async def upload_document(self, file, metadata: Dict) -> Dict:
+    async def upload_document(
+        self,
+        file,
+        metadata: Dict,
+        upload_id: Optional[str] = None,
+        on_session: Optional[Callable[[Dict], None]] = None,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> Dict:
         """
-        ドキュメントをアップロード
+        ドキュメントを分割アップロード
+        
+        ファイル全体をコピーせず、アップロードされたバッファ（st.file_uploader の UploadedFile など）から
+        パートごとに少しずつ読み出して送る。upload_id を渡すと、サーバーが受信済みの位置から再開する
         
         Args:
-            file: アップロードするファイル
-            metadata: ドキュメントのメタデータ
+            file: アップロードするファイル（name と getbuffer() を持つもの）
+            metadata: ドキュメントのメタデータ（confidentiality, tags, description, groups, priority）
+            upload_id: 再開するアップロードのID（オプション）
+            on_session: アップロードの状態が変わるたびに呼ぶ関数（upload_id の記録など）
+            on_progress: 送信済みのバイト数が増えるたびに呼ぶ関数
             
         Returns:
-            アップロード結果
+            アップロード結果（document_id, job_id, status, duplicate）
+        """
+        # アップロードしたユーザー以外の一覧にも載るため、全ユーザーの一覧のキャッシュを破棄する
+        self.invalidate("/api/documents", all_users=True)
+        
+        with memoryview(file.getbuffer()) as buffer:
+            size = len(buffer)
+            
+            # 開発環境モック
+            if os.getenv("DEVELOPMENT") == "1":
+                for sent in range(0, size, UPLOAD_STREAM_CHUNK * 4):
+                    await asyncio.sleep(0.05)
+                    if on_progress:
+                        on_progress(sent)
+                if on_progress:
+                    on_progress(size)
+                return {"document_id": f"mock-{file.name}", "job_id": f"mock-{file.name}", "status": "queued", "duplicate": False}
+            
+            # 実際のAPI呼び出し
+            if upload_id is None:
+                data = {"filename": file.name, "size": size}
+                data.update({key: metadata[key] for key in ("confidentiality", "tags", "description", "groups", "priority") if key in metadata})
+                session = await self._make_request("POST", "/api/documents/uploads", data=data)
+            else:
+                session = await self._make_request("GET", f"/api/documents/uploads/{upload_id}")
+            
+            conflicts = 0
+            while session.get("result") is None:
+                if on_session:
+                    on_session(session)
+                if on_progress:
+                    on_progress(session["offset"])
+                start = session["offset"]
+                end = min(start + session["part_size"], size)
+                try:
+                    session = await run_async(self._send_part(session["upload_id"], start, buffer[start:end], on_progress))
+                except UploadOffsetMismatch as e:
+                    # 前回の送信が途中まで届いていた場合など。サーバーの位置から送り直す
+                    conflicts += 1
+                    if conflicts > 3:
+                        raise Exception("APIエラー: アップロードの位置がサーバーと一致しません")
+                    session = {**session, "offset": e.offset}
+            
+            if on_session:
+                on_session(session)
+            if on_progress:
+                on_progress(size)
+        
+        self.invalidate("/api/documents", all_users=True)
+        return session["result"]
+    
+    async def _send_part(self, upload_id: str, offset: int, part: memoryview, on_progress: Optional[Callable[[int], None]]) -> Dict:
+        """
+        分割アップロードのパートを送る（バッファから UPLOAD_STREAM_CHUNK ずつ読み出して送る）
+        
+        Raises:
+            UploadOffsetMismatch: 開始位置がサーバーの受信済みの位置と一致しない場合
+            Exception: API通信エラー
         """
-        # 開発環境では実際のアップロードは行わない
-        return {
-            "id": 6,
-            "name": file.name,
-            "uploaded": "2023-03-10",
-            "size": f"{file.size / (1024 * 1024):.1f} MB",
-            "type": file.name.split(".")[-1].upper(),
-            "confidentiality": metadata.get("confidentiality", 1)
+        async def chunks():
+            for start in range(0, len(part), UPLOAD_STREAM_CHUNK):
+                yield bytes(part[start:start + UPLOAD_STREAM_CHUNK])
+                if on_progress:
+                    on_progress(offset + min(start + UPLOAD_STREAM_CHUNK, len(part)))
+        
+        headers = {
+            **self._get_headers(),
+            "Content-Type": "application/offset+octet-stream",
+            "Upload-Offset": str(offset),
         }
+        url = f"/api/documents/uploads/{upload_id}"
+        try:
+            response = await self._get_client().patch(url, headers=headers, content=chunks())
+            if response.status_code == 409 and "Upload-Offset" in response.headers:
+                raise UploadOffsetMismatch(int(response.headers["Upload-Offset"]))
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error: {e.response.status_code} - {e.response.text}")
+            try:
+                error_message = e.response.json().get("detail", str(e))
+            except ValueError:
+                error_message = str(e)
+            raise Exception(f"APIエラー: {error_message}")
+        except httpx.RequestError as e:
+            logger.error(f"Request error: {str(e)}")
+            raise Exception(f"APIリクエストエラー: {str(e)}")
+    
+    async def get_jobs(self, job_ids: List[str]) -> Dict:
+        """
+        インジェストジョブの進捗を一括取得
+        
+        Args:
+            job_ids: ジョブIDのリスト（100件まで）
+            
+        Returns:
+            {"items": ジョブの進捗（job_id, status, stage, progress, error など）のリスト}
+        """
+        # 開発環境モック
+        if os.getenv("DEVELOPMENT") == "1":
+            return {"items": [{"job_id": job_id, "status": "succeeded", "stage": "completed", "progress": 100.0, "error": None} for job_id in job_ids]}
         
-        # 実際のAPI呼び出しでは、multipart/form-dataでアップロード
-        # この実装はhttpxのファイルアップロード機能を使用
-        # 実際のAPIエンドポイントに合わせて調整が必要
-        return await self._make_request("POST", "/api/documents/upload", data=metadata)
+        # 実際のAPI呼び出し
+        return await self._make_request("GET", "/api/documents/jobs", params={"ids": ",".join(job_ids)})
     
     # チャット関連エンドポイント
     async def send_query(self, query: str) -> Dict:
@@ -225,31 +560,89 @@ class APIClient:
                 ]
             }
         
-        # 実際のAPI呼び出し
+        # 実際のAPI呼び出し（質問と回答は履歴に保存される）
         data = {"query": query}
-        return await self._make_request("POST", "/api/query", data=data)
+        try:
+            return await self._make_request("POST", "/api/query", data=data)
+        finally:
+            self.invalidate("/api/history")
+    
+    async def stream_query(self, query: str) -> AsyncIterator[Tuple[str, Dict]]:
+        """
+        質問を送信し、回答をストリーミングで受け取る（utils.async_runtime.iterate で回す）
+        
+        Args:
+            query: 質問内容
+            
+        Yields:
+            ("context", {"context": 根拠のチャンク}): 検索が終わった時点
+            ("token", {"text": 回答の断片}): 生成中
+            ("done", {"history_id": 履歴ID, "documents": 参照したドキュメント}): 完了時
+            ("error", {"detail": エラー内容}): 生成中に失敗した場合
+        """
+        # 開発環境モック
+        if os.getenv("DEVELOPMENT") == "1":
+            response = await self.send_query(query)
+            yield "context", {"context": response["context"]}
+            for i in range(0, len(response["answer"]), 4):
+                await asyncio.sleep(0.03)
+                yield "token", {"text": response["answer"][i:i + 4]}
+            yield "done", {"history_id": None, "documents": [c["document"] for c in response["context"]]}
+            return
+        
+        # 実際のAPI呼び出し
+        try:
+            async for event in self._stream_events("POST", "/api/query", data={"query": query}):
+                yield event
+        finally:
+            self.invalidate("/api/history")
     
     # 履歴関連エンドポイント
-    async def get_history(self) -> List[Dict]:
+    async def get_history(
+        self,
+        search: Optional[str] = None,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Dict:
         """
-        質問履歴を取得
+        質問履歴を1ページ取得（検索・日付範囲の絞り込みはサーバー側で行う）
+        
+        Args:
+            search: 質問文に含まれる文字列（オプション）
+            date_from: この日以降（オプション）
+            date_to: この日まで（オプション）
+            cursor: 前のページの next_cursor（オプション）
+            limit: 1ページの件数
         
         Returns:
-            質問履歴リスト
+            {"items": 履歴リスト, "next_cursor": 次のページのカーソル}
         """
         # 開発環境モック
         if os.getenv("DEVELOPMENT") == "1":
-            return [
-                {"id": 1, "query": "プロジェクトの概要について教えてください", "date": "2023-03-10", "documents": ["プロジェクト仕様書.pdf"]},
-                {"id": 2, "query": "システム設計書のセキュリティ要件はどこに記載されていますか？", "date": "2023-03-09", "documents": ["システム設計書.docx"]},
-                {"id": 3, "query": "APIの認証方式は何を使用していますか？", "date": "2023-03-08", "documents": ["API仕様書.pdf", "システム設計書.docx"]},
-                {"id": 4, "query": "テスト計画書の進捗状況はどうなっていますか？", "date": "2023-03-07", "documents": ["テスト計画書.xlsx", "議事録.txt"]},
-                {"id": 5, "query": "プロジェクトのタイムラインを教えてください", "date": "2023-03-06", "documents": ["プロジェクト仕様書.pdf", "議事録.txt"]},
+            items = [
+                {"id": "1", "query": "プロジェクトの概要について教えてください", "answer": "このプロジェクトは、社内ドキュメントを検索・質問できるRAGシステムの開発です。", "created_at": "2023-03-10T10:00:00+09:00", "documents": ["プロジェクト仕様書.pdf"]},
+                {"id": "2", "query": "システム設計書のセキュリティ要件はどこに記載されていますか？", "answer": "システム設計書の第4章に記載されています。", "created_at": "2023-03-09T10:00:00+09:00", "documents": ["システム設計書.docx"]},
+                {"id": "3", "query": "APIの認証方式は何を使用していますか？", "answer": "JWTによるBearer認証を使用しています。", "created_at": "2023-03-08T10:00:00+09:00", "documents": ["API仕様書.pdf", "システム設計書.docx"]},
+                {"id": "4", "query": "テスト計画書の進捗状況はどうなっていますか？", "answer": "単体テストが完了し、結合テストを実施中です。", "created_at": "2023-03-07T10:00:00+09:00", "documents": ["テスト計画書.xlsx", "議事録.txt"]},
+                {"id": "5", "query": "プロジェクトのタイムラインを教えてください", "answer": "要件定義から運用開始まで6か月の計画です。", "created_at": "2023-03-06T10:00:00+09:00", "documents": ["プロジェクト仕様書.pdf", "議事録.txt"]},
             ]
+            if search:
+                items = [h for h in items if search.lower() in h["query"].lower()]
+            return {"items": items, "next_cursor": None}
         
         # 実際のAPI呼び出し
-        response = await self._make_request("GET", "/api/history")
-        return response.get("items", [])
+        params = {"limit": limit}
+        if search:
+            params["search"] = search
+        if date_from:
+            params["date_from"] = date_from.isoformat()
+        if date_to:
+            params["date_to"] = date_to.isoformat()
+        if cursor:
+            params["cursor"] = cursor
+        return await self._make_request("GET", "/api/history", params=params, cache_ttl=API_CACHE_TTL_HISTORY)
     
     # 設定関連エンドポイント
     async def update_llm_settings(self, settings: Dict) -> Dict:
@@ -266,13 +659,30 @@ class APIClient:
         if os.getenv("DEVELOPMENT") == "1":
             return {"status": "success", "message": "設定が更新されました"}
         
-        # 実際のAPI呼び出し
-        return await self._make_request("POST", "/api/settings/llm", data=settings)
+        # 実際のAPI呼び出し（使用できるモデルが変わるため、全ユーザーの設定のキャッシュを破棄する）
+        try:
+            return await self._make_request("POST", "/api/settings/llm", data=settings)
+        finally:
+            self.invalidate("/api/settings", all_users=True)
 
-# シングルトンインスタンス
+# シングルトンインスタンス（接続プールと応答のキャッシュを持つ）
 client = APIClient()
 
 # 簡易アクセス関数
-async def get_api_client() -> APIClient:
-    """APIクライアントのシングルトンインスタンスを取得"""
-    return client
+def get_api_client() -> APIClient:
+    """
+    現在のセッションの APIクライアントを取得
+    
+    トークンはセッションごとのクライアントに保存し、ほかのセッションのトークンやキャッシュを
+    使わないようにする。Streamlit のセッションの外（ベンチマークなど）ではシングルトンを返す
+    """
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return client
+    if get_script_run_ctx() is None:
+        return client
+    if "api_client" not in st.session_state:
+        st.session_state.api_client = client.for_session()
+    return st.session_state.api_client
@@ -0,0 +1,231 @@
+"""
+UI の非同期処理の実行環境
+
+Streamlit はボタン操作などのたびにスクリプトを先頭から実行し直すため、実行のたびに
+イベントループを作るとHTTP接続や実行中のストリーミングがすべて捨てられる。
+ここではサーバープロセスに1つだけイベントループを作ってデーモンスレッドで動かし続け、
+各ビューはスクリプトのスレッドから run() でコルーチンを渡して結果を待つ。
+
+実行中のコルーチンはセッションごとに記録し、ブラウザとの接続が切れたセッションの処理は取り消す
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Dict, Iterator, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+POLL_INTERVAL = 0.1  # 結果を待つ間に接続状態を確認する間隔（秒）
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_pending: Dict[str, Set[concurrent.futures.Future]] = {}
+_pending_lock = threading.Lock()
+
+
+class SessionDisconnected(Exception):
+    """処理の完了を待つ間にセッションの接続が切れた"""
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """共有のイベントループ（初回呼び出し時にデーモンスレッドで起動する）"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="ui-async-runtime", daemon=True).start()
+                asyncio.run_coroutine_threadsafe(_reap_disconnected(), loop)
+                _loop = loop
+    return _loop
+
+
+def _session_id() -> Optional[str]:
+    """現在のスクリプト実行のセッションID（Streamlit の外では None）"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def _session_active(session_id: str) -> bool:
+    try:
+        from streamlit import runtime
+    except ImportError:
+        return True
+    if not runtime.exists():
+        return True
+    return runtime.get_instance().is_active_session(session_id)
+
+
+def _track(session_id: Optional[str], future: concurrent.futures.Future):
+    if session_id is None:
+        return
+    with _pending_lock:
+        _pending.setdefault(session_id, set()).add(future)
+
+    def untrack(done: concurrent.futures.Future):
+        with _pending_lock:
+            futures = _pending.get(session_id)
+            if futures is not None:
+                futures.discard(done)
+                if not futures:
+                    del _pending[session_id]
+
+    future.add_done_callback(untrack)
+
+
+def submit(coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+    """
+    コルーチンを共有のループで開始し、完了を待たずに Future を返す（ストリーミングなど）
+
+    Args:
+        coro: 実行するコルーチン
+
+    Returns:
+        結果を受け取る Future（セッションの接続が切れると取り消される）
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    _track(_session_id(), future)
+    return future
+
+
+def run(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    コルーチンを共有のループで実行し、スクリプトのスレッドで結果を待つ
+
+    Args:
+        coro: 実行するコルーチン
+        timeout: 待つ最大時間（秒、None なら無制限）
+
+    Returns:
+        コルーチンの戻り値
+
+    Raises:
+        RuntimeError: 共有のループのスレッドから呼ばれた場合（await すること）
+        SessionDisconnected: 待つ間にセッションの接続が切れた場合（処理は取り消す）
+        TimeoutError: timeout を過ぎた場合（処理は取り消す）
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run() cannot be called from the UI event loop, await the coroutine instead")
+
+    session_id = _session_id()
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    _track(session_id, future)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        try:
+            return future.result(POLL_INTERVAL)
+        except concurrent.futures.TimeoutError:
+            pass
+        if session_id is not None and not _session_active(session_id):
+            future.cancel()
+            raise SessionDisconnected(session_id)
+        if deadline is not None and time.monotonic() >= deadline:
+            future.cancel()
+            raise TimeoutError(f"UI task did not finish within {timeout}s")
+
+
+def iterate(agen: AsyncIterator[T]) -> Iterator[T]:
+    """
+    非同期イテレーター（ストリーミングの応答など）を共有のループで回し、スクリプトのスレッドで順に受け取る
+
+    受け取る側が途中でやめた場合（break や例外）は、共有のループ側の処理も取り消す
+
+    Args:
+        agen: 非同期イテレーター
+
+    Yields:
+        agen が返した値
+
+    Raises:
+        SessionDisconnected: 受け取る間にセッションの接続が切れた場合
+    """
+    items: "queue.Queue" = queue.Queue()
+    end = object()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(item)
+        finally:
+            items.put(end)
+
+    session_id = _session_id()
+    future = submit(pump())
+    try:
+        while True:
+            try:
+                item = items.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if session_id is not None and not _session_active(session_id):
+                    raise SessionDisconnected(session_id)
+                continue
+            if item is end:
+                break
+            yield item
+        future.result()  # 失敗していれば例外を送出する
+    finally:
+        future.cancel()
+
+
+async def run_async(coro: Awaitable[T]) -> T:
+    """
+    共有のループ以外のループ（asyncio.run など）からコルーチンを共有のループで実行して待つ
+
+    共有のループ上で呼ばれた場合はそのまま await する
+    """
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    # 呼び出し元が取り消されると wrap_future 経由で共有のループのタスクも取り消される
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def cancel_session(session_id: Optional[str] = None) -> int:
+    """
+    セッションの実行中の処理をすべて取り消す（ログアウト時など）
+
+    Args:
+        session_id: 対象のセッション（省略時は現在のセッション）
+
+    Returns:
+        取り消した処理の数
+    """
+    session_id = session_id or _session_id()
+    with _pending_lock:
+        futures = list(_pending.get(session_id, ()))
+    return sum(1 for future in futures if future.cancel())
+
+
+def pending_count() -> int:
+    """実行中の処理の数（全セッションの合計）"""
+    with _pending_lock:
+        return sum(len(futures) for futures in _pending.values())
+
+
+async def _reap_disconnected(interval: float = 5.0):
+    """接続が切れたセッションの処理を定期的に取り消す（submit() で開始した処理など）"""
+    while True:
+        await asyncio.sleep(interval)
+        with _pending_lock:
+            sessions = list(_pending)
+        for session_id in sessions:
+            if not _session_active(session_id):
+                cancelled = cancel_session(session_id)
+                if cancelled:
+                    logger.info(f"Cancelled {cancelled} tasks of disconnected session {session_id}")
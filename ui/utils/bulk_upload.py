@@ -0,0 +1,194 @@
+"""
+複数ファイルの一括アップロード
+
+選択された複数のファイルを同時実行数の上限つきで並行して分割アップロードし、アップロード後は
+サーバーのインジェストジョブの進捗をまとめて取得する。処理は UI 共有のイベントループ
+（utils.async_runtime）で進むため、スクリプトの再実行をまたいで続き、ビューは状態を読んで
+ファイルごとの進捗を表示するだけでよい。
+
+失敗したファイルは、ほかのファイルの処理を止めずに個別に再試行できる（送信済みの分は
+サーバーの受信済みの位置から再開する）
+"""
+
+import asyncio
+import logging
+import os
+import random
+from typing import Dict, List, Optional
+
+from utils.api_client import APIClient, get_api_client
+from utils.async_runtime import submit
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))  # 同時にアップロードするファイル数
+UPLOAD_RETRIES = int(os.environ.get("UPLOAD_RETRIES", "3"))  # 通信エラー時に自動で再試行する回数（ファイルごと）
+UPLOAD_RETRY_BACKOFF = float(os.environ.get("UPLOAD_RETRY_BACKOFF", "1.0"))  # 再試行の待ち時間の基準（秒）
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))  # インジェストジョブの進捗を取得する間隔（秒）
+
+# ファイルの状態
+QUEUED = "queued"  # アップロード待ち
+UPLOADING = "uploading"  # アップロード中
+PROCESSING = "processing"  # サーバーでインジェスト中
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JOB_BATCH_SIZE = 100  # 一度に進捗を取得するジョブ数（API の上限）
+
+
+class FileUpload:
+    """1ファイルのアップロードの状態（共有のループで更新し、スクリプトのスレッドで読む）"""
+
+    def __init__(self, file):
+        self.file = file
+        self.name = file.name
+        self.size = file.size
+        self.status = QUEUED
+        self.sent = 0
+        self.upload_id: Optional[str] = None
+        self.job_id: Optional[str] = None
+        self.stage: Optional[str] = None
+        self.job_progress = 0.0
+        self.duplicate = False
+        self.attempts = 0
+        self.error: Optional[str] = None
+
+    @property
+    def progress(self) -> float:
+        """進捗（0.0-1.0）。アップロード中は送信済みの割合、その後はインジェストの進捗"""
+        if self.status in (QUEUED, UPLOADING):
+            return self.sent / self.size if self.size else 0.0
+        if self.status == SUCCEEDED:
+            return 1.0
+        return min(1.0, self.job_progress / 100)
+
+
+class BulkUpload:
+    """複数ファイルの一括アップロード"""
+
+    def __init__(
+        self,
+        files: List,
+        metadata: Dict,
+        client: Optional[APIClient] = None,
+        concurrency: int = UPLOAD_CONCURRENCY,
+        retries: int = UPLOAD_RETRIES,
+    ):
+        """
+        初期化
+
+        Args:
+            files: アップロードするファイル（st.file_uploader の UploadedFile など）
+            metadata: すべてのファイルに付けるメタデータ
+            client: APIクライアント（省略時は共有のクライアント）
+            concurrency: 同時にアップロードするファイル数
+            retries: 通信エラー時に自動で再試行する回数
+        """
+        self.items = [FileUpload(file) for file in files]
+        self.metadata = metadata
+        self.client = client or get_api_client()
+        self.concurrency = concurrency
+        self.retries = retries
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        """アップロードまたはインジェスト中のファイルがあるか"""
+        return any(item.status in (QUEUED, UPLOADING, PROCESSING) for item in self.items)
+
+    def counts(self) -> Dict[str, int]:
+        """状態ごとのファイル数"""
+        counts: Dict[str, int] = {}
+        for item in self.items:
+            counts[item.status] = counts.get(item.status, 0) + 1
+        return counts
+
+    def start(self):
+        """すべてのファイルのアップロードを開始（完了を待たずに戻る）"""
+        submit(self._run(self.items))
+
+    def retry(self, index: int):
+        """
+        失敗したファイルだけをアップロードし直す（ほかのファイルの処理はそのまま続く）
+
+        Args:
+            index: items の位置
+        """
+        item = self.items[index]
+        if item.status != FAILED:
+            return
+        item.status = QUEUED
+        item.error = None
+        if item.job_id is not None:
+            # インジェストで失敗した場合は、もう一度アップロードし直す
+            item.upload_id = item.job_id = None
+            item.sent = 0
+        submit(self._run([item]))
+
+    async def _run(self, items: List[FileUpload]):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll_jobs())
+        await asyncio.gather(*(self._upload(item) for item in items))
+
+    async def _upload(self, item: FileUpload):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                item.status = UPLOADING
+                item.attempts += 1
+                try:
+                    result = await self.client.upload_document(
+                        item.file,
+                        self.metadata,
+                        upload_id=item.upload_id,
+                        on_session=lambda session: setattr(item, "upload_id", session["upload_id"]),
+                        on_progress=lambda sent: setattr(item, "sent", sent),
+                    )
+                except asyncio.CancelledError:
+                    # ログアウトやセッションの切断で取り消された（送信済みの分から再試行できる）
+                    item.status = FAILED
+                    item.error = "キャンセルされました"
+                    raise
+                except Exception as e:
+                    item.error = str(e)
+                    if attempt >= self.retries:
+                        item.status = FAILED
+                        logger.warning(f"Upload of {item.name} failed after {item.attempts} attempts: {e}")
+                        return
+                    delay = random.uniform(0, UPLOAD_RETRY_BACKOFF * (2 ** attempt))
+                    logger.info(f"Upload of {item.name} failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                item.error = None
+                item.job_id = result["job_id"]
+                item.duplicate = result.get("duplicate", False)
+                item.status = PROCESSING
+                return
+
+    async def _poll_jobs(self):
+        """インジェスト中のファイルのジョブの進捗をまとめて取得する（処理中のファイルがなくなるまで）"""
+        while self.active:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            processing = {item.job_id: item for item in self.items if item.status == PROCESSING}
+            job_ids = list(processing)
+            for start in range(0, len(job_ids), JOB_BATCH_SIZE):
+                try:
+                    jobs = await self.client.get_jobs(job_ids[start:start + JOB_BATCH_SIZE])
+                except Exception as e:
+                    logger.warning(f"Failed to poll ingestion jobs: {e}")
+                    continue
+                for job in jobs["items"]:
+                    item = processing.get(job["job_id"])
+                    if item is None:
+                        continue
+                    item.stage = job.get("stage")
+                    item.job_progress = job.get("progress", 0.0)
+                    if job["status"] == "succeeded":
+                        item.status = SUCCEEDED
+                    elif job["status"] in ("failed", "cancelled"):
+                        item.status = FAILED
+                        item.error = job.get("error") or job["status"]
+        # 取り込みが終わったドキュメントが一覧に反映されるよう、キャッシュを破棄する
+        self.client.invalidate("/api/documents", all_users=True)
@@ -0,0 +1,47 @@
+"""
+チャットと履歴の表示範囲
+
+セッションに保持するメッセージ・履歴の件数を抑え、古いやり取りはサーバーの履歴から読み直す。
+Streamlit に依存しない部分（件数の上限での切り詰めと、サーバーの履歴のページをチャットの
+メッセージに変換する処理）をまとめる
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+
+def keep_latest(items: List, limit: int) -> int:
+    """
+    リストを末尾（新しい側）の limit 件に切り詰める（リストをそのまま書き換える）
+
+    Args:
+        items: 古い順のリスト
+        limit: 残す件数
+
+    Returns:
+        捨てた件数
+    """
+    overflow = max(0, len(items) - limit)
+    if overflow:
+        del items[:overflow]
+    return overflow
+
+
+def earlier_messages(page_items: List[Dict], shown_ids: Iterable[Optional[str]]) -> List[Dict]:
+    """
+    サーバーの履歴の1ページをチャットのメッセージ（古い順）に変換
+
+    Args:
+        page_items: /api/history の items（新しい順）
+        shown_ids: セッションに残っている回答の履歴ID（直近の質問はサーバーとセッションの両方にある）
+
+    Returns:
+        質問と回答のメッセージのリスト（セッションに残っている質問は除く）
+    """
+    shown = {history_id for history_id in shown_ids if history_id}
+    messages = []
+    for item in reversed(page_items):
+        if item["id"] in shown:
+            continue
+        messages.append({"message": item["query"], "is_user": True, "history_id": None})
+        messages.append({"message": item["answer"], "is_user": False, "history_id": item["id"]})
+    return messages
@@ -0,0 +1,141 @@
+"""
+API応答のキャッシュ
+
+ページを移動するたびに同じ一覧を取り直さないよう、GET の応答をユーザーごとに保持する。
+有効期限（TTL）内はAPIに問い合わせずに返し、期限が切れたら ETag を If-None-Match で送って
+変更がなければ（304）保持している応答を使い続ける。
+
+エントリはログイン中のトークンから作るスコープで分けるため、別のユーザーやセッションの応答が
+返ることはない。アップロードや設定の変更のあとは、影響するパスのエントリを破棄する
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """キャッシュした応答"""
+
+    __slots__ = ("value", "etag", "expires_at")
+
+    def __init__(self, value: Any, etag: Optional[str], expires_at: float):
+        self.value = value
+        self.etag = etag
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+
+def scope_for_token(token: Optional[str]) -> Optional[str]:
+    """トークンからキャッシュのスコープを作る（未ログインなら None でキャッシュしない）"""
+    if not token:
+        return None
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:32]
+
+
+class ResponseCache:
+    """ユーザーごとに分けた GET 応答の LRU キャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_entries: int = 256):
+        """
+        初期化
+
+        Args:
+            max_entries: 保持するエントリ数の上限（全ユーザーの合計、超えたら古いものから捨てる）
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, Hashable], CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    @staticmethod
+    def _params_key(params: Optional[Dict]) -> Hashable:
+        return tuple(sorted((params or {}).items()))
+
+    def get(self, scope: str, path: str, params: Optional[Dict] = None) -> Optional[CacheEntry]:
+        """
+        エントリを取得（期限切れでも返す。fresh で判定し、etag で再検証する）
+
+        Args:
+            scope: ユーザーのスコープ
+            path: APIのパス
+            params: クエリパラメータ
+
+        Returns:
+            エントリ（なければ None）
+        """
+        key = (scope, path, self._params_key(params))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, scope: str, path: str, params: Optional[Dict], value: Any, etag: Optional[str], ttl: float):
+        """
+        応答を保存
+
+        Args:
+            scope: ユーザーのスコープ
+            path: APIのパス
+            params: クエリパラメータ
+            value: 応答（JSON を読み込んだもの）
+            etag: 応答の ETag（なければ None）
+            ttl: 問い合わせずに使う秒数
+        """
+        key = (scope, path, self._params_key(params))
+        with self._lock:
+            self._entries[key] = CacheEntry(value, etag, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def touch(self, entry: CacheEntry, ttl: float):
+        """304 で変更がないと分かったエントリの期限を延ばす"""
+        entry.expires_at = time.monotonic() + ttl
+
+    def invalidate(self, prefix: str, scope: Optional[str] = None) -> int:
+        """
+        パスが prefix で始まるエントリを破棄
+
+        Args:
+            prefix: APIのパスの先頭（例: "/api/documents"）
+            scope: 対象のユーザーのスコープ（None なら全ユーザー。共有の一覧が変わった場合など）
+
+        Returns:
+            破棄したエントリの数
+        """
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if key[1].startswith(prefix) and (scope is None or key[0] == scope)
+            ]
+            for key in keys:
+                del self._entries[key]
+        if keys:
+            logger.debug(f"Invalidated {len(keys)} cached responses under {prefix}")
+        return len(keys)
+
+    def clear_scope(self, scope: Optional[str]) -> int:
+        """ユーザーのエントリをすべて破棄（ログアウト時など）"""
+        if scope is None:
+            return 0
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == scope]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
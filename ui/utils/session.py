@@ -2,12 +2,22 @@
 セッション状態の管理モジュール
 """
 
+import os
 import streamlit as st
 from datetime import datetime
 import logging
 
+from utils.api_client import get_api_client
+from utils.async_runtime import cancel_session
+from utils.message_window import keep_latest
+
 logger = logging.getLogger(__name__)
 
+# チャット履歴はすべての質問・回答がサーバーに保存されるため、セッションには直近の分だけを保持する
+CHAT_MAX_MESSAGES = int(os.environ.get("CHAT_MAX_MESSAGES", "100"))  # セッションに保持するメッセージ数の上限
+CHAT_WINDOW = int(os.environ.get("CHAT_WINDOW", "20"))  # チャット画面に一度に表示するメッセージ数
+HISTORY_MAX_ITEMS = int(os.environ.get("HISTORY_MAX_ITEMS", "100"))  # 履歴ページに保持する履歴の件数の上限
+
 def init_session_state():
     """アプリケーション全体で使用するセッション状態の初期化"""
     
@@ -43,23 +53,42 @@ def set_authenticated(username, role):
     logger.info(f"User authenticated: {username}, role: {role}")
 
 def logout():
-    """ログアウト処理"""
+    """ログアウト処理（実行中の通信は取り消す）"""
+    cancel_session()
+    # サーバーから読み込んだユーザーごとの履歴とキャッシュは破棄する
+    api_client = get_api_client()
+    api_client.clear_cache()
+    api_client.token = None
+    for key in ("chat_earlier", "chat_window", "history_state"):
+        st.session_state.pop(key, None)
     st.session_state.authenticated = False
     st.session_state.username = None
     st.session_state.user_role = None
     st.session_state.current_page = "login"
     logger.info("User logged out")
 
-def add_chat_message(message, is_user=True):
-    """チャット履歴にメッセージを追加"""
+def add_chat_message(message, is_user=True, history_id=None):
+    """
+    チャット履歴にメッセージを追加
+    
+    上限を超えた古いメッセージはセッションから捨てる（サーバーの履歴から読み直せる）
+    
+    Args:
+        message: メッセージ
+        is_user: ユーザーのメッセージかどうか
+        history_id: サーバーに保存された履歴のID（回答のみ）
+    """
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
     
-    st.session_state.chat_history.append({
+    history = st.session_state.chat_history
+    history.append({
         "message": message,
         "is_user": is_user,
+        "history_id": history_id,
         "timestamp": datetime.now().isoformat()
     })
+    keep_latest(history, CHAT_MAX_MESSAGES)
 
 def get_chat_history():
     """チャット履歴を取得"""
@@ -82,19 +111,3 @@ def get_documents():
         st.session_state.documents = []
     
     return st.session_state.documents
-
-def filter_documents(search_query=None, doc_type=None, confidentiality=None):
-    """条件に基づいてドキュメントをフィルタリング"""
-    docs = get_documents()
-    
-    if search_query:
-        docs = [doc for doc in docs if search_query.lower() in doc["name"].lower()]
-    
-    if doc_type and doc_type != "すべて":
-        docs = [doc for doc in docs if doc["type"] == doc_type]
-    
-    if confidentiality and confidentiality != "すべて":
-        level = int(confidentiality[0])
-        docs = [doc for doc in docs if doc["confidentiality"] == level]
-    
-    return docs
\ No newline at end of file
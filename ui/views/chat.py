@@ -3,11 +3,14 @@
 ドキュメントに対する質問応答インターフェース
 """
 
+from functools import lru_cache
+
 import streamlit as st
-import asyncio
 from utils.ui_components import card_container, close_card_container, section_header  # chat_message は下記で定義
-from utils.session import add_chat_message, get_chat_history
+from utils.session import CHAT_MAX_MESSAGES, CHAT_WINDOW, add_chat_message, get_chat_history
 from utils.api_client import get_api_client
+from utils.async_runtime import iterate, run
+from utils.message_window import earlier_messages
 
 # --------------------------------------------------
 # カスタム CSS の適用（ChatGPT 風デザイン）
@@ -55,43 +58,152 @@ st.markdown(
 # --------------------------------------------------
 # メッセージ表示用の関数（ChatGPT 風に整形）
 # --------------------------------------------------
-def chat_message(message, is_user):
+@lru_cache(maxsize=2048)
+def message_html(message, is_user):
+    # 再実行のたびに同じメッセージを整形し直さないよう、プロセス内でメモ化する
     css_class = "user-message" if is_user else "assistant-message"
-    st.markdown(f'<div class="chat-container {css_class}">{message}</div>', unsafe_allow_html=True)
+    return f'<div class="chat-container {css_class}">{message}</div>'
+
+def chat_message(message, is_user):
+    st.markdown(message_html(message, is_user), unsafe_allow_html=True)
 
 # --------------------------------------------------
-# 質問処理：API からレスポンスを取得
+# 履歴のウィンドウ表示：直近のメッセージだけを描画し、古いものはサーバーから読み込む
 # --------------------------------------------------
-async def process_query(query):
+def get_earlier_state():
+    """サーバーから読み込んだ過去の質問・回答（古い順）とページングの状態"""
+    if "chat_earlier" not in st.session_state:
+        st.session_state.chat_earlier = {"messages": [], "next_cursor": None, "exhausted": False}
+    return st.session_state.chat_earlier
+
+def load_earlier_messages():
+    """
+    サーバーの履歴から、セッションに残っていない過去の質問・回答を1ページ読み込む
+    
+    セッションが保持しているメッセージの数は CHAT_MAX_MESSAGES までに抑える
+    """
+    state = get_earlier_state()
+    if state["exhausted"] or len(state["messages"]) >= CHAT_MAX_MESSAGES:
+        return
+    try:
+        page = run(get_api_client().get_history(cursor=state["next_cursor"]))
+    except Exception as e:
+        st.error(f"履歴取得エラー: {str(e)}")
+        return
+    
+    # 直近の質問はセッションにもあるため除く
+    older = earlier_messages(page["items"], (chat.get("history_id") for chat in get_chat_history()))
+    state["messages"] = older + state["messages"]
+    state["next_cursor"] = page.get("next_cursor")
+    state["exhausted"] = not state["next_cursor"]
+
+def can_load_earlier(loaded_count):
+    """表示していない古いメッセージが（セッションまたはサーバーに）残っているか"""
+    if st.session_state.get("chat_window", CHAT_WINDOW) < loaded_count:
+        return True
+    state = get_earlier_state()
+    return not state["exhausted"] and len(state["messages"]) < CHAT_MAX_MESSAGES
+
+def show_earlier_messages(loaded_count):
+    """表示するメッセージを CHAT_WINDOW 件増やし、足りない分をサーバーから読み込む"""
+    window = st.session_state.get("chat_window", CHAT_WINDOW) + CHAT_WINDOW
+    st.session_state.chat_window = window
+    if window > loaded_count:
+        load_earlier_messages()
+
+def render_history():
     """
-    質問を処理してレスポンスを取得
+    チャット履歴のうち直近 chat_window 件を1つの HTML ブロックとして表示
+    
+    メッセージごとに要素を作らないため、履歴が長くても再実行時の描画量は表示件数分で済む
+    """
+    messages = get_earlier_state()["messages"] + get_chat_history()
+    window = st.session_state.get("chat_window", CHAT_WINDOW)
+    
+    if can_load_earlier(len(messages)):
+        if st.button("以前のメッセージを読み込む", key="load_earlier"):
+            show_earlier_messages(len(messages))
+            st.experimental_rerun()
+    elif len(get_earlier_state()["messages"]) >= CHAT_MAX_MESSAGES:
+        st.caption("これより前のやり取りは履歴ページで確認できます。")
+    
+    visible = messages[-window:]
+    if visible:
+        st.markdown(
+            "".join(message_html(chat["message"], chat["is_user"]) for chat in visible),
+            unsafe_allow_html=True,
+        )
+
+# --------------------------------------------------
+# 参照コンテキストの表示
+# --------------------------------------------------
+def render_context(context):
+    """
+    回答の根拠になったチャンクを表示
     
     Args:
-        query: ユーザーの質問
+        context: APIが返したチャンクのリスト
+    """
+    if not context:
+        st.write("参照できる関連ドキュメントは見つかりませんでした。")
+        return
+    st.info("以下のドキュメントが参照されました：")
+    for chunk in context:
+        page = f" (ページ: {chunk['page']})" if chunk.get("page") else ""
+        st.markdown(f"🔍 **{chunk['document']}**{page}")
+        if chunk.get("sources"):
+            st.caption("同じ内容を含むドキュメント: " + "、".join(chunk["sources"]))
+        st.markdown(f"```\n{chunk['text']}\n```")
+    scores = [chunk["score"] for chunk in context if chunk.get("score") is not None]
+    if scores:
+        st.markdown("### 回答の信頼性")
+        best = min(1.0, max(0.0, max(scores)))
+        st.progress(best, text=f"{best:.0%} 一致")
+        st.caption("この回答は複数のドキュメントからの情報に基づいています。")
+
+# --------------------------------------------------
+# 質問処理：API から回答をストリーミングで受け取る
+# --------------------------------------------------
+def process_query(query, history_container, context_slot):
+    """
+    質問を送信し、回答を受け取りながら表示する
     
-    Returns:
-        APIからのレスポンス
+    履歴全体は描き直さず、新しい質問と回答だけを履歴の末尾に追加する。
+    検索が終わった時点で参照コンテキストを表示し、回答は生成された分から順に表示する
+    
+    Args:
+        query: ユーザーの質問
+        history_container: チャット履歴のコンテナ
+        context_slot: 参照コンテキストを表示する st.empty()
     """
-    # チャット履歴にユーザーの質問を追加
     add_chat_message(query, is_user=True)
+    with history_container:
+        chat_message(query, is_user=True)
+        answer_slot = st.empty()
+    answer_slot.markdown(message_html("回答を生成中...", is_user=False), unsafe_allow_html=True)
     
-    # スピナーを表示しながら API 呼び出し
-    with st.spinner("回答を生成中..."):
-        # API クライアントの取得
-        client = await get_api_client()
-        
-        try:
-            # 質問を API に送信
-            response = await client.send_query(query)
-            
-            # API の回答をチャット履歴に追加
-            add_chat_message(response["answer"], is_user=False)
-            return response
-        except Exception as e:
-            # エラー発生時はエラーメッセージを追加
-            error_message = f"エラーが発生しました: {str(e)}"
-            add_chat_message(error_message, is_user=False)
-            return {"error": str(e)}
+    parts = []
+    history_id = None
+    try:
+        # 通信は UI 共有のイベントループで行い、届いたイベントから順に受け取る
+        for event, data in iterate(get_api_client().stream_query(query)):
+            if event == "context":
+                st.session_state.last_context = data["context"]
+                with context_slot.container():
+                    render_context(data["context"])
+            elif event == "token":
+                parts.append(data["text"])
+                answer_slot.markdown(message_html("".join(parts) + "▌", is_user=False), unsafe_allow_html=True)
+            elif event == "done":
+                history_id = data.get("history_id")
+            elif event == "error":
+                parts.append(f"\n\nエラーが発生しました: {data['detail']}")
+        answer = "".join(parts)
+    except Exception as e:
+        answer = f"エラーが発生しました: {str(e)}"
+    
+    add_chat_message(answer, is_user=False, history_id=history_id)
+    answer_slot.markdown(message_html(answer, is_user=False), unsafe_allow_html=True)
 
 # --------------------------------------------------
 # チャットページ表示
@@ -103,56 +215,25 @@ def display_chat_page():
     # レイアウト: 左側にチャット、右側に参照情報
     col1, col2 = st.columns([2, 1])
     
-    # 左側：チャットインターフェース
-    with col1:
-        chat_container = card_container("チャットインターフェース", "ドキュメントに関する質問を入力してください")
-        with chat_container:
-            # チャット履歴の表示
-            history_container = st.container()
-            with history_container:
-                for chat in get_chat_history():
-                    chat_message(chat["message"], chat["is_user"])
-            
-            # 入力フォーム
-            with st.form(key="chat_form", clear_on_submit=True):
-                user_input = st.text_area("質問を入力", placeholder="ドキュメントについて質問してください...", height=100)
-                submit_button = st.form_submit_button("送信", use_container_width=True)
-                
-                if submit_button and user_input:
-                    # 非同期処理の実行（同期的に実行）
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(process_query(user_input))
-                    loop.close()
-                    st.experimental_rerun()
-        close_card_container()
-    
-    # 右側：参照コンテキスト
+    # 右側：参照コンテキスト（回答の生成中に検索結果を表示するため先に枠を作る）
     with col2:
         context_container = card_container("参照コンテキスト", "質問に関連するドキュメント")
         with context_container:
-            history = get_chat_history()
-            if len(history) > 0:
-                st.info("以下のドキュメントが参照されました：")
-                st.markdown("🔍 **プロジェクト仕様書.pdf** (ページ: 5-7)")
-                st.markdown("```\n機能要件には、ドキュメント管理機能、検索・質問応答機能、LLM連携機能が含まれる。\n```")
-                st.markdown("🔍 **システム設計書.docx** (ページ: 12)")
-                st.markdown("```\nシステムは4つのコンポーネントで構成：UI、API、RAGエンジン、ベクトルDB\n```")
-                st.markdown("### 回答の信頼性")
-                st.progress(0.87, text="87% 一致")
-                st.caption("この回答は複数のドキュメントからの情報に基づいています。")
-            else:
-                st.write("まだ質問がありません。何か質問してみてください。")
-                st.markdown("### サンプル質問")
-                sample_questions = [
-                    "プロジェクトの概要について教えてください",
-                    "システム設計書のセキュリティ要件はどこに記載されていますか？",
-                    "APIの認証方式は何を使用していますか？"
-                ]
-                for q in sample_questions:
-                    if st.button(q, key=f"sample_{hash(q)}"):
-                        asyncio.run(process_query(q))
-                        st.experimental_rerun()
+            context_slot = st.empty()
+            with context_slot.container():
+                if get_chat_history():
+                    render_context(st.session_state.get("last_context", []))
+                else:
+                    st.write("まだ質問がありません。何か質問してみてください。")
+                    st.markdown("### サンプル質問")
+                    sample_questions = [
+                        "プロジェクトの概要について教えてください",
+                        "システム設計書のセキュリティ要件はどこに記載されていますか？",
+                        "APIの認証方式は何を使用していますか？"
+                    ]
+                    for q in sample_questions:
+                        if st.button(q, key=f"sample_{hash(q)}"):
+                            st.session_state.pending_query = q
         close_card_container()
         
         # LLM 情報表示
@@ -164,3 +245,22 @@ def display_chat_page():
                 st.session_state.current_page = "設定"
                 st.experimental_rerun()
         close_card_container()
+    
+    # 左側：チャットインターフェース
+    with col1:
+        chat_container = card_container("チャットインターフェース", "ドキュメントに関する質問を入力してください")
+        with chat_container:
+            # チャット履歴の表示
+            history_container = st.container()
+            with history_container:
+                render_history()
+            
+            # 入力フォーム
+            with st.form(key="chat_form", clear_on_submit=True):
+                user_input = st.text_area("質問を入力", placeholder="ドキュメントについて質問してください...", height=100)
+                submit_button = st.form_submit_button("送信", use_container_width=True)
+            
+            query = user_input if submit_button and user_input else st.session_state.pop("pending_query", None)
+            if query:
+                process_query(query, history_container, context_slot)
+        close_card_container()
@@ -4,38 +4,137 @@
 ドキュメント管理インターフェース
 """
 
+import time
 import streamlit as st
-import asyncio
 from datetime import datetime
 from utils.ui_components import card_container, close_card_container, document_item, section_header
-from utils.session import get_documents, add_document, filter_documents
 from utils.api_client import get_api_client
+from utils.async_runtime import run
+from utils.bulk_upload import FAILED, PROCESSING, QUEUED, SUCCEEDED, UPLOADING, BulkUpload
 
-async def upload_document(file, metadata):
+# 一覧の絞り込みの表示名 → APIのパラメータ
+DOCUMENT_TYPE_OPTIONS = {"すべて": None, "PDF": "PDF", "Excel": "Excel", "Word": "Word", "テキスト": "Text"}
+CONFIDENTIALITY_OPTIONS = {"すべて": None, "1 - 社内": 1, "2 - 社外秘": 2, "3 - 極秘": 3}
+UPLOAD_REFRESH_INTERVAL = 0.5  # 一括アップロードの進捗の表示を更新する間隔（秒）
+UPLOAD_STATUS_LABELS = {
+    QUEUED: "待機中",
+    UPLOADING: "アップロード中",
+    PROCESSING: "取り込み中",
+    SUCCEEDED: "完了",
+    FAILED: "失敗",
+}
+
+def start_bulk_upload(files, metadata):
     """
-    ドキュメントをアップロード
+    選択されたファイルの一括アップロードを開始
+    
+    処理は UI 共有のイベントループで進むため、再実行をまたいで続く。状態はセッションに保持する
     
     Args:
-        file: アップロードされたファイル
-        metadata: ドキュメントのメタデータ
+        files: アップロードされたファイルのリスト
+        metadata: すべてのファイルに付けるメタデータ
+    """
+    batch = BulkUpload(files, metadata)
+    batch.start()
+    st.session_state.bulk_upload = batch
     
-    Returns:
-        アップロード結果
+    # 一覧を取り直す
+    st.session_state.pop("documents_state", None)
+
+def display_bulk_upload(batch):
+    """
+    一括アップロードのファイルごとの進捗を表示（処理中は一定間隔で再実行して更新する）
+    
+    Args:
+        batch: 一括アップロード
+    """
+    counts = batch.counts()
+    st.caption(" / ".join(f"{UPLOAD_STATUS_LABELS[status]} {count}" for status, count in counts.items()))
+    
+    for index, item in enumerate(batch.items):
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            label = f"{item.name}: {UPLOAD_STATUS_LABELS[item.status]}"
+            if item.status == PROCESSING and item.stage:
+                label += f"（{item.stage}）"
+            if item.duplicate:
+                label += "（同じ内容の既存ドキュメント）"
+            if item.status == FAILED and item.error:
+                label += f" - {item.error}"
+            st.progress(item.progress, text=label)
+        with col2:
+            if item.status == FAILED:
+                if st.button("再試行", key=f"upload_retry_{index}"):
+                    batch.retry(index)
+                    st.experimental_rerun()
+    
+    if batch.active:
+        time.sleep(UPLOAD_REFRESH_INTERVAL)
+        st.experimental_rerun()
+    
+    if counts.get(SUCCEEDED) == len(batch.items):
+        st.success(f"{len(batch.items)} 件のファイルの処理が完了しました！")
+    if st.button("一覧に戻る", key="upload_clear"):
+        st.session_state.pop("bulk_upload", None)
+        st.session_state.pop("documents_state", None)
+        st.experimental_rerun()
+
+def get_documents_page(name=None, doc_type=None, confidentiality=None, cursor=None):
     """
-    # APIクライアントを取得
-    client = await get_api_client()
+    ドキュメント一覧を1ページ取得
     
+    Returns:
+        {"items", "next_cursor", "total", "facets"}
+    """
     try:
-        # ドキュメントをアップロード
-        response = await client.upload_document(file, metadata)
-        
-        # セッションのドキュメントリストに追加
-        add_document(response)
-        
-        return response
+        return run(get_api_client().get_documents(name=name, doc_type=doc_type, confidentiality=confidentiality, cursor=cursor))
     except Exception as e:
-        st.error(f"アップロードエラー: {str(e)}")
-        return None
+        st.error(f"ドキュメント取得エラー: {str(e)}")
+        return {"items": [], "next_cursor": None, "total": 0, "facets": None}
+
+def load_documents(name, doc_type, confidentiality, more=False):
+    """
+    条件に合うドキュメントを取得してセッションに保持（条件が変わったら先頭から取り直す）
+    
+    Args:
+        name: ファイル名の検索語
+        doc_type: 種類（None はすべて）
+        confidentiality: 機密レベル（None はすべて）
+        more: 次のページを追加で読み込むかどうか
+    
+    Returns:
+        読み込み済みの一覧の状態
+    """
+    filters = (name or "", doc_type, confidentiality)
+    state = st.session_state.get("documents_state")
+    
+    if state is None or state["filters"] != filters:
+        page = get_documents_page(name or None, doc_type, confidentiality)
+        state = {
+            "filters": filters,
+            "items": page["items"],
+            "next_cursor": page.get("next_cursor"),
+            "total": page.get("total"),
+            "facets": page.get("facets"),
+        }
+    elif more and state["next_cursor"]:
+        page = get_documents_page(name or None, doc_type, confidentiality, state["next_cursor"])
+        state["items"] = state["items"] + page["items"]
+        state["next_cursor"] = page.get("next_cursor")
+    
+    st.session_state.documents_state = state
+    return state
+
+def format_size(size):
+    """バイト数を表示用にする"""
+    return f"{size / 1024 / 1024:.1f} MB" if size >= 1024 * 1024 else f"{size / 1024:.1f} KB"
+
+def format_uploaded_at(uploaded_at):
+    """ISO形式のアップロード日時を表示用の日付にする"""
+    try:
+        return datetime.fromisoformat(uploaded_at.replace("Z", "+00:00")).strftime("%Y-%m-%d")
+    except (AttributeError, ValueError):
+        return str(uploaded_at)
 
 def document_detail(doc_id):
     """
@@ -44,9 +143,9 @@ def document_detail(doc_id):
     Args:
         doc_id: ドキュメントID
     """
-    # セッションからドキュメントを検索
-    documents = get_documents()
-    doc = next((d for d in documents if d["id"] == doc_id), None)
+    # 読み込み済みの一覧から検索
+    state = st.session_state.get("documents_state") or {"items": []}
+    doc = next((d for d in state["items"] if d["id"] == doc_id), None)
     
     if not doc:
         st.error(f"ドキュメントID {doc_id} が見つかりません")
@@ -61,8 +160,8 @@ def document_detail(doc_id):
         with detail_container:
             st.write(f"**ファイル名:** {doc['name']}")
             st.write(f"**ファイルタイプ:** {doc['type']}")
-            st.write(f"**サイズ:** {doc['size']}")
-            st.write(f"**アップロード日:** {doc['uploaded']}")
+            st.write(f"**サイズ:** {format_size(doc['size'])}")
+            st.write(f"**アップロード日:** {format_uploaded_at(doc['uploaded_at'])}")
             st.write(f"**機密レベル:** {doc['confidentiality']}")
             
             # タグ（実際のAPIレスポンスに合わせて調整）
@@ -120,15 +219,26 @@ def display_documents_page():
             with search_col1:
                 search_query = st.text_input("ドキュメント検索", placeholder="ファイル名を入力...")
             with search_col2:
-                doc_type = st.selectbox("ファイルタイプ", ["すべて", "PDF", "Excel", "Word", "テキスト"])
+                doc_type = st.selectbox("ファイルタイプ", list(DOCUMENT_TYPE_OPTIONS))
             with search_col3:
-                confidence_level = st.selectbox("機密レベル", ["すべて", "1 - 社内", "2 - 社外秘", "3 - 極秘"])
+                confidence_level = st.selectbox("機密レベル", list(CONFIDENTIALITY_OPTIONS))
             
             # ドキュメント一覧
             section_header("ドキュメント一覧")
             
-            # ドキュメントのフィルタリング
-            filtered_docs = filter_documents(search_query, doc_type, confidence_level)
+            # 絞り込みとページングはサーバー側で行う
+            documents_state = load_documents(
+                search_query,
+                DOCUMENT_TYPE_OPTIONS[doc_type],
+                CONFIDENTIALITY_OPTIONS[confidence_level]
+            )
+            filtered_docs = documents_state["items"]
+            
+            if documents_state.get("total") is not None:
+                # 絞り込み項目ごとの件数（先頭ページの取得時にサーバー側で集計済み）
+                facets = documents_state.get("facets") or {}
+                type_counts = " / ".join(f"{f['value']} {f['count']}" for f in facets.get("type", []))
+                st.caption(f"{documents_state['total']} 件" + (f"（{type_counts}）" if type_counts else ""))
             
             if not filtered_docs:
                 st.warning("条件に一致するドキュメントがありません。")
@@ -136,10 +246,21 @@ def display_documents_page():
                 for doc in filtered_docs:
                     # ドキュメントアイテムの表示
                     document_item(
-                        doc,
+                        {**doc, "size": format_size(doc["size"])},
                         on_detail=lambda d=doc: document_detail(d["id"]),
                         on_delete=lambda d=doc: st.warning(f"削除機能はまだ実装されていません: {d['name']}")
                     )
+                
+                # 次のページ
+                if documents_state["next_cursor"]:
+                    if st.button("さらに読み込む", key="documents_more"):
+                        load_documents(
+                            search_query,
+                            DOCUMENT_TYPE_OPTIONS[doc_type],
+                            CONFIDENTIALITY_OPTIONS[confidence_level],
+                            more=True
+                        )
+                        st.experimental_rerun()
         
         close_card_container()
     
@@ -148,46 +269,43 @@ def display_documents_page():
         upload_container = card_container("ドキュメントアップロード", "新しいドキュメントをアップロードします")
         
         with upload_container:
-            # アップロードフォーム
-            uploaded_file = st.file_uploader("ファイルを選択", type=["pdf", "xlsx", "xls", "docx", "txt"])
-            
-            if uploaded_file is not None:
-                # ファイル情報表示
-                file_details = {
-                    "ファイル名": uploaded_file.name,
-                    "ファイルタイプ": uploaded_file.type,
-                    "サイズ": f"{uploaded_file.size / 1024:.1f} KB"
-                }
-                
-                st.json(file_details)
+            batch = st.session_state.get("bulk_upload")
+            if batch is not None:
+                display_bulk_upload(batch)
+            else:
+                # アップロードフォーム（複数のファイルをまとめて選択できる）
+                uploaded_files = st.file_uploader(
+                    "ファイルを選択",
+                    type=["pdf", "xlsx", "xls", "docx", "txt"],
+                    accept_multiple_files=True
+                )
                 
-                # メタデータ入力
-                with st.form(key="upload_form"):
-                    st.subheader("メタデータ")
-                    conf_level = st.radio("機密レベル", ["1 - 社内", "2 - 社外秘", "3 - 極秘"], horizontal=True)
-                    tags = st.text_input("タグ (カンマ区切り)", "ドキュメント, 仕様書")
-                    description = st.text_area("説明", placeholder="ドキュメントの説明を入力...", height=100)
+                if uploaded_files:
+                    # ファイル情報表示
+                    total_size = sum(file.size for file in uploaded_files)
+                    st.caption(f"{len(uploaded_files)} 件 / {format_size(total_size)}")
                     
-                    # アップロード実行
-                    submit_button = st.form_submit_button("処理開始", type="primary")
-                    
-                    if submit_button:
-                        with st.spinner("ドキュメントを処理中..."):
+                    # メタデータ入力（選択したすべてのファイルに付ける）
+                    with st.form(key="upload_form"):
+                        st.subheader("メタデータ")
+                        conf_level = st.radio("機密レベル", ["1 - 社内", "2 - 社外秘", "3 - 極秘"], horizontal=True)
+                        tags = st.text_input("タグ (カンマ区切り)", "ドキュメント, 仕様書")
+                        description = st.text_area("説明", placeholder="ドキュメントの説明を入力...", height=100)
+                        
+                        # アップロード実行
+                        submit_button = st.form_submit_button("処理開始", type="primary")
+                        
+                        if submit_button:
                             # メタデータの準備
                             metadata = {
                                 "confidentiality": int(conf_level[0]),
-                                "tags": [tag.strip() for tag in tags.split(",")],
+                                "tags": [tag.strip() for tag in tags.split(",") if tag.strip()],
                                 "description": description
                             }
                             
-                            # 非同期でアップロード処理
-                            result = asyncio.run(upload_document(uploaded_file, metadata))
-                            
-                            if result:
-                                st.success(f"ファイル「{uploaded_file.name}」の処理が完了しました！")
-                                
-                                # アップロード後にドキュメント一覧タブに切り替え
-                                st.markdown('<script>document.querySelector("button[data-baseweb=\\"tab\\"]").click()</script>', unsafe_allow_html=True)
+                            # アップロード処理（並行して分割アップロードする）
+                            start_bulk_upload(uploaded_files, metadata)
+                            st.experimental_rerun()
         
         close_card_container()
         
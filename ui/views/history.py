@@ -5,47 +5,90 @@
 """
 
 import streamlit as st
-import asyncio
 from datetime import datetime
 from utils.ui_components import card_container, close_card_container, section_header
-from utils.session import add_chat_message
+from utils.session import HISTORY_MAX_ITEMS, add_chat_message
 from utils.api_client import get_api_client
+from utils.async_runtime import run
+from utils.message_window import keep_latest
 
-async def get_history_data():
+def get_history_page(search=None, date_from=None, date_to=None, cursor=None):
     """
-    質問履歴データを取得
+    質問履歴を1ページ取得
+    
+    Args:
+        search: 質問文の検索語
+        date_from: 開始日
+        date_to: 終了日
+        cursor: 前のページの next_cursor
     
     Returns:
-        履歴リスト
+        {"items": 履歴リスト, "next_cursor": 次のページのカーソル}
     """
-    # APIクライアントを取得
-    client = await get_api_client()
-    
     try:
-        # 履歴を取得
-        return await client.get_history()
+        # 履歴を取得（絞り込みとページングはサーバー側で行う）
+        return run(get_api_client().get_history(search=search, date_from=date_from, date_to=date_to, cursor=cursor))
     except Exception as e:
         st.error(f"履歴取得エラー: {str(e)}")
-        return []
+        return {"items": [], "next_cursor": None}
+
+def load_history(search, date_from, date_to, more=False):
+    """
+    条件に合う履歴を取得してセッションに保持（条件が変わったら先頭から取り直す）
+    
+    保持する件数は HISTORY_MAX_ITEMS までとし、超えた分は新しい側から捨てる
+    （捨てた件数を skipped に記録し、先頭に戻るときはサーバーから取り直す）
+    
+    Args:
+        search: 質問文の検索語
+        date_from: 開始日
+        date_to: 終了日
+        more: 次のページを追加で読み込むかどうか
+    
+    Returns:
+        読み込み済みの履歴の状態
+    """
+    filters = (search or "", date_from, date_to)
+    state = st.session_state.get("history_state")
+    
+    if state is None or state["filters"] != filters:
+        page = get_history_page(search or None, date_from, date_to)
+        state = {"filters": filters, "items": page["items"], "next_cursor": page.get("next_cursor"), "skipped": 0}
+    elif more and state["next_cursor"]:
+        page = get_history_page(search or None, date_from, date_to, state["next_cursor"])
+        items = state["items"] + page["items"]
+        state["skipped"] = state.get("skipped", 0) + keep_latest(items, HISTORY_MAX_ITEMS)
+        state["items"] = items
+        state["next_cursor"] = page.get("next_cursor")
+    
+    st.session_state.history_state = state
+    return state
 
-async def recreate_query(query):
+def format_history_date(created_at):
+    """ISO形式の作成日時を表示用の日付にする"""
+    try:
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M")
+    except (AttributeError, ValueError):
+        return str(created_at)
+
+def recreate_query(query):
     """
     過去の質問を再度実行
     
     Args:
         query: 再実行する質問内容
     """
-    # APIクライアントを取得
-    client = await get_api_client()
-    
     try:
         # 質問を送信し、回答を取得
-        response = await client.send_query(query)
+        response = run(get_api_client().send_query(query))
         
         # チャット履歴に追加
         add_chat_message(query, is_user=True)
         add_chat_message(response["answer"], is_user=False)
         
+        # 新しい履歴が先頭に来るよう、読み込み済みの履歴を破棄
+        st.session_state.pop("history_state", None)
+        
         # チャットページに遷移
         st.session_state.current_page = "チャット"
         
@@ -65,36 +108,35 @@ def display_history_page():
     with search_col2:
         date_range = st.date_input("日付", value=[])
     
-    # 履歴リストを取得（非同期）
-    history_data = asyncio.run(get_history_data())
-    
-    # 検索フィルタリング
-    if history_search:
-        history_data = [h for h in history_data if history_search.lower() in h["query"].lower()]
+    # 日付範囲（両端が選択されている場合のみ）
+    date_from, date_to = (date_range[0], date_range[1]) if date_range and len(date_range) == 2 else (None, None)
     
-    # 日付フィルタリング（日付範囲が選択されている場合）
-    if date_range and len(date_range) == 2:
-        start_date, end_date = date_range
-        # 実装注意: ここでは日付文字列形式に依存しているため、APIレスポンスの日付形式に合わせて調整が必要
-        history_data = [h for h in history_data if start_date <= datetime.strptime(h["date"], "%Y-%m-%d").date() <= end_date]
+    # 履歴リストを取得（検索・日付の絞り込みはサーバー側で行う）
+    history_state = load_history(history_search, date_from, date_to)
+    history_data = history_state["items"]
     
     # 履歴一覧
     history_container = card_container("質問履歴", "過去の質問と回答の履歴")
     
     with history_container:
+        if history_state.get("skipped"):
+            st.caption(f"新しい {history_state['skipped']} 件は表示を省略しています。")
+            if st.button("最新の履歴に戻る"):
+                st.session_state.pop("history_state", None)
+                st.experimental_rerun()
+        
         if not history_data:
             st.info("履歴がありません。チャットページで質問してみましょう。")
         else:
             for item in history_data:
-                with st.expander(f"Q: {item['query']} ({item['date']})"):
+                with st.expander(f"Q: {item['query']} ({format_history_date(item['created_at'])})"):
                     # 質問
                     st.write("**質問:**")
                     st.info(item["query"])
                     
-                    # 回答（実際のAPIレスポンスでは回答内容が含まれるはず）
+                    # 回答
                     st.write("**回答:**")
-                    sample_response = "このプロジェクトは、社内ドキュメントを検索・質問できるRAGシステムの開発です。仕様書によると、Excelやテキストなど様々な形式のドキュメントをインデックス化し、自然言語で質問できる機能を提供します。"
-                    st.success(sample_response)
+                    st.success(item["answer"])
                     
                     # 参照ドキュメント
                     st.write("**参照ドキュメント:**")
@@ -108,12 +150,18 @@ def display_history_page():
                             st.info("この機能はまだ実装されていません。")
                     with col2:
                         if st.button("再質問する", key=f"retry_{item['id']}"):
-                            # 非同期で質問を再実行
-                            asyncio.run(recreate_query(item["query"]))
+                            # 質問を再実行
+                            recreate_query(item["query"])
                             st.experimental_rerun()
                     with col3:
                         if st.button("ダウンロード", key=f"download_{item['id']}"):
                             st.info("この機能はまだ実装されていません。")
+            
+            # 次のページ
+            if history_state["next_cursor"]:
+                if st.button("さらに読み込む"):
+                    load_history(history_search, date_from, date_to, more=True)
+                    st.experimental_rerun()
     
     close_card_container()
     
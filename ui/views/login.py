@@ -3,12 +3,12 @@
 """
 
 import streamlit as st
-import asyncio
 from utils.api_client import get_api_client
+from utils.async_runtime import run
 from utils.session import set_authenticated
 from utils.ui_components import card_container, close_card_container, section_header
 
-async def attempt_login(username, password):
+def attempt_login(username, password):
     """
     ログイン試行
     
@@ -20,8 +20,7 @@ async def attempt_login(username, password):
         (成功したかどうか, エラーメッセージ)
     """
     try:
-        client = await get_api_client()
-        response = await client.login(username, password)
+        response = run(get_api_client().login(username, password))
         
         # ログイン成功
         set_authenticated(
@@ -59,8 +58,8 @@ def display_login_page():
             else:
                 # ログイン処理
                 with st.spinner("認証中..."):
-                    # streamlitではAsyncIOの直接実行ができないため、syncに変換
-                    success, error = asyncio.run(attempt_login(username, password))
+                    # 通信は UI 共有のイベントループで実行し、完了を待つ
+                    success, error = attempt_login(username, password)
                     
                     if success:
                         st.success("ログインに成功しました！")